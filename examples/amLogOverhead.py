@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+'''Measure the time the AM method context (the wrapper around every
+AM API call in gcf-am) spends per call, most of which is logging the
+call's arguments and result. Each call passes credentials and an RSpec
+of about the given size and returns an RSpec of that size, and logs
+at INFO to a file: directly, from a background thread (as with
+gcf-am --background-logging), and not at all (INFO disabled). Use
+--sinkDelayMs to see the effect of slow log storage (a network file
+system, say), which is what background logging is for.
+
+There is no delegate AM or authorizer, and the caller certificate is
+not parsed, so only the overhead of the context is measured.
+
+Usage: amLogOverhead.py [-n calls] [--rspecKB KB] [--credKB KB] [--sinkDelayMs MS]
+'''
+
+import logging
+import optparse
+import os
+import sys
+import tempfile
+import time
+
+import gcf.geni.am.am_method_context as amc
+from gcf.geni.util.log_util import start_background_logging
+
+################################################################################
+# Requires that you have gcf installed or the path to gcf/src in your
+# PYTHONPATH.
+#
+# For example put the following in your bashrc:
+#     export PYTHONPATH=${PYTHONPATH}:path/to/gcf/src
+#
+################################################################################
+
+class FakeGID(object):
+  def get_urn(self):
+    return 'urn:publicid:IDN+geni:gpo:gcf+user+alice'
+
+class FakeServer(object):
+  def get_pem_cert(self):
+    return 'caller certificate'
+
+class FakeDelegate(object):
+  _my_urn = 'urn:publicid:IDN+geni:gpo:gcf+authority+am'
+  _server = FakeServer()
+
+class FakeAM(object):
+  _delegate = FakeDelegate()
+
+class SlowFileHandler(logging.FileHandler):
+  '''A FileHandler that takes delay more seconds to write each record.'''
+
+  def __init__(self, filename, delay):
+    logging.FileHandler.__init__(self, filename)
+    self.delay = delay
+
+  def emit(self, record):
+    if self.delay:
+      time.sleep(self.delay)
+    logging.FileHandler.emit(self, record)
+
+def time_calls(logger, calls, credentials, rspec):
+  '''Return the mean seconds the caller waits per call through the AM
+  method context.'''
+  am = FakeAM()
+  start = time.time()
+  for i in range(calls):
+    args = {'slice_urn': 'urn:publicid:IDN+geni:gpo:gcf+slice+s%d' % i,
+            'credentials': credentials, 'rspec': rspec}
+    options = {'geni_rspec_version': {'type': 'geni', 'version': '3'}}
+    with amc.AMMethodContext(am, 'Allocate', logger, None, None,
+                             credentials, args, options) as context:
+      context._result = {'code': {'geni_code': 0}, 'value': rspec, 'output': ''}
+  elapsed = time.time() - start
+  # Not counted: waiting for a background handler to catch up
+  for handler in logger.handlers:
+    handler.flush()
+  return elapsed / calls
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("-n", "--calls", type="int", default=2000,
+                    help="Number of calls to time. Default %default")
+  parser.add_option("--rspecKB", type="int", default=50,
+                    help="Size of the request and manifest RSpecs. Default %default")
+  parser.add_option("--credKB", type="int", default=10,
+                    help="Size of the credential. Default %default")
+  parser.add_option("--sinkDelayMs", type="float", default=0,
+                    help="Extra milliseconds to take writing each log message. Default %default")
+  options, args = parser.parse_args(argv)
+
+  # The caller certificate is not parsed, and there is no speaks-for
+  amc.get_cached_gid = lambda cert: FakeGID()
+  amc.determine_speaks_for = lambda logger, creds, gid, options, roots: gid
+
+  rspec = '<rspec>%s</rspec>' % ('<node client_id="n"/>' * (options.rspecKB * 1024 / 21))
+  credentials = ['<signed-credential>%s</signed-credential>' % ('x' * options.credKB * 1024)]
+
+  (fd, logfile) = tempfile.mkstemp(suffix='.log')
+  os.close(fd)
+  try:
+    for (label, background, level) in (("to a file", False, logging.INFO),
+                                        ("in the background", True, logging.INFO),
+                                        ("not at all", False, logging.WARNING)):
+      logger = logging.getLogger('amLogOverhead')
+      logger.propagate = False
+      for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+      logger.addHandler(SlowFileHandler(logfile, options.sinkDelayMs / 1000.0))
+      logger.setLevel(level)
+      if background:
+        start_background_logging(logger)
+      seconds = time_calls(logger, options.calls, credentials, rspec)
+      print "Logging %s: %.1f microseconds per call" % (label, seconds * 1000000)
+      for handler in list(logger.handlers):
+        handler.close()
+        logger.removeHandler(handler)
+    print "Log file grew to %d bytes" % os.path.getsize(logfile)
+  finally:
+    os.unlink(logfile)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+'''Time how the AM API v3 reference aggregate manager finds expired
+slivers (expire_slivers, which every AM method calls first) and looks
+up sliver and slice URNs (decode_urns) with many slivers: by default
+1000 and 20000. Their cost per call should not grow with the number
+of slivers.
+
+The slivers are written to a sliver store (as set by sliver_db in the
+[aggregate_manager] section of gcf_config) in slices of --perSlice
+slivers, --expired of them already expired, and the AM is started on
+that store. No certificates are needed.
+
+Exits 1 if --maxRatio is given and a call took more than that many
+times as long with the most slivers as with the fewest.
+
+Usage: amSliverStoreScaling.py [--sizes N,N...] [-n calls] [--perSlice N] [--expired N] [--maxRatio X]
+'''
+
+import datetime
+import logging
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from gcf.geni.am.am3 import ReferenceAggregateManager
+from gcf.geni.am.fakevm import FakeVM
+from gcf.geni.am.sliver_store import SliverStore
+from gcf.geni.util.urn_util import publicid_to_urn
+
+################################################################################
+# Requires that you have gcf installed or the path to gcf/src in your
+# PYTHONPATH.
+#
+# For example put the following in your bashrc:
+#     export PYTHONPATH=${PYTHONPATH}:path/to/gcf/src
+#
+################################################################################
+
+AUTHORITY = 'geni//gpo//gcf'
+
+def make_store(path, slivers, per_slice, expired):
+  '''Write the given number of slivers, and a resource for each, to a
+  new sliver store at path. Return the URNs of the slices, and of the
+  slivers of the last slice.'''
+  store = SliverStore(path)
+  now = datetime.datetime.utcnow()
+  resources = list()
+  for i in range(slivers):
+    resource = FakeVM(None)
+    resource.available = False
+    resources.append(resource)
+  slice_urns = list()
+  sliver_rows = list()
+  with store.transaction():
+    store.put_resources(resources)
+    for i, resource in enumerate(resources):
+      if i % per_slice == 0:
+        slice_urn = publicid_to_urn('IDN %s slice s%d' % (AUTHORITY, i / per_slice))
+        store.put_slice(slice_urn, str(uuid.uuid4()))
+        slice_urns.append(slice_urn)
+        sliver_urns = list()
+      if i < expired:
+        expiration = now - datetime.timedelta(minutes=1)
+      else:
+        expiration = now + datetime.timedelta(days=1)
+      sliver_urn = publicid_to_urn('IDN %s sliver %s' % (AUTHORITY, uuid.uuid4()))
+      sliver_urns.append(sliver_urn)
+      sliver_rows.append(dict(sliver_id=sliver_urn, slice_urn=slice_urn,
+                              resource_id=resource.id, client_id='n%d' % i,
+                              expiration=expiration, start_time=now,
+                              end_time=expiration,
+                              allocation_state='geni_allocated',
+                              operational_state='geni_pending_allocation'))
+    store.put_slivers(sliver_rows)
+  return slice_urns, sliver_urns
+
+def time_call(calls, fn, *args):
+  '''Return the mean seconds per call of fn(*args).'''
+  start = time.time()
+  for i in range(calls):
+    fn(*args)
+  return (time.time() - start) / calls
+
+def run(slivers, options, tmpdir):
+  '''Return a dict of the mean seconds of each timed call with the
+  given number of slivers.'''
+  path = os.path.join(tmpdir, 'slivers%d.db' % slivers)
+  slice_urns, sliver_urns = make_store(path, slivers, options.perSlice, options.expired)
+  am = ReferenceAggregateManager(tmpdir, AUTHORITY, 'https://localhost:8001',
+                                 sliver_db=path)
+  result = dict()
+  start = time.time()
+  # Loads the AM from the store, and deletes the expired slivers
+  am.expire_slivers()
+  result['load'] = time.time() - start
+  result['expire_slivers'] = time_call(options.calls, am.expire_slivers)
+  result['decode_urns slivers'] = time_call(options.calls, am.decode_urns, sliver_urns)
+  result['decode_urns slice'] = time_call(options.calls, am.decode_urns, slice_urns[-1:])
+  return result
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--sizes", default="1000,20000",
+                    help="Comma separated numbers of slivers to try. Default %default")
+  parser.add_option("-n", "--calls", type="int", default=1000,
+                    help="Number of calls to time. Default %default")
+  parser.add_option("--perSlice", type="int", default=10,
+                    help="Slivers in each slice. Default %default")
+  parser.add_option("--expired", type="int", default=10,
+                    help="Slivers that have already expired. Default %default")
+  parser.add_option("--maxRatio", type="float", default=None,
+                    help="Fail if a call takes more than this many times as long with the most slivers")
+  options, args = parser.parse_args(argv)
+  sizes = sorted(int(size) for size in options.sizes.split(','))
+
+  # Not the AM log messages about each call
+  logging.getLogger('gcf.am3').setLevel(logging.WARNING)
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    results = [run(size, options, tmpdir) for size in sizes]
+  finally:
+    shutil.rmtree(tmpdir)
+
+  failed = False
+  for size, result in zip(sizes, results):
+    print "%d slivers: loaded in %.2f seconds" % (size, result['load'])
+  for name in ('expire_slivers', 'decode_urns slivers', 'decode_urns slice'):
+    times = [result[name] for result in results]
+    print "  %-20s %s (%.2fx from %d to %d slivers)" % \
+        (name, ", ".join("%.1f" % (t * 1000000) for t in times) + " microseconds",
+         times[-1] / times[0], sizes[0], sizes[-1])
+    if options.maxRatio is not None and times[-1] > options.maxRatio * times[0]:
+      print "FAIL: %s took %.2fx as long with %d slivers as with %d" % \
+          (name, times[-1] / times[0], sizes[-1], sizes[0])
+      failed = True
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
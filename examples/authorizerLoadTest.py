@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+'''Load test the authorizer server (gcf/geni/auth/authorizer_server.py)
+on this host with 1, 2, 4, ... worker processes, and report the
+authorize calls per second it handles with each.
+
+The server runs BusyAuthorizer below, which spends about --workMs of
+pure python CPU time on each call, as proving ABAC policy and checking
+credentials does, so no certificates or policy files are needed.
+Many client processes call it at once for --seconds each time.
+
+Exits 1 if --minSpeedup is given and the most workers did not handle
+at least that many times the calls per second of one.
+
+Usage: authorizerLoadTest.py [--maxWorkers N] [--clients N] [--seconds S] [--workMs MS] [--minSpeedup X]
+'''
+
+import multiprocessing
+import optparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import xmlrpclib
+
+import gcf.geni.auth
+from gcf.geni.auth.base_authorizer import Base_Authorizer
+
+################################################################################
+# Requires that you have gcf installed or the path to gcf/src in your
+# PYTHONPATH.
+#
+# For example put the following in your bashrc:
+#     export PYTHONPATH=${PYTHONPATH}:path/to/gcf/src
+#
+################################################################################
+
+# Environment variable giving the BusyAuthorizer's milliseconds per call
+WORK_ENV = 'AUTHORIZER_LOAD_TEST_WORK_MS'
+
+class BusyAuthorizer(Base_Authorizer):
+  '''An authorizer that allows every call, after spending a fixed
+  amount of CPU time on it.'''
+
+  def __init__(self, root_cert, opts, argument_guard=None):
+    Base_Authorizer.__init__(self, root_cert, opts)
+    self._work_seconds = float(os.environ.get(WORK_ENV, 10)) / 1000
+    # Calibrate the loop count for that time once, as a real authorizer
+    # would load its policies once
+    count = 0
+    start = time.time()
+    while time.time() - start < 0.2:
+      self._work(1000)
+      count += 1000
+    self._iterations = int(count * self._work_seconds / 0.2)
+
+  def _work(self, iterations):
+    total = 0
+    for i in xrange(iterations):
+      total += i * i % 7
+    return total
+
+  def authorize(self, method, caller, creds, args, opts,
+                requested_allocation_state):
+    self._work(self._iterations)
+
+def client(url, seconds, results):
+  '''Call authorize on the server at url for the given seconds, and
+  put the number of calls made on the results queue.'''
+  proxy = xmlrpclib.ServerProxy(url, allow_none=True)
+  calls = 0
+  deadline = time.time() + seconds
+  while time.time() < deadline:
+    proxy.authorize('Allocate_V3', 'caller cert', ['credential'],
+                    {'slice_urn': 'urn:publicid:IDN+geni:gpo:gcf+slice+load'},
+                    {}, [])
+    calls += 1
+  results.put(calls)
+
+def free_port():
+  sock = socket.socket()
+  sock.bind(('localhost', 0))
+  port = sock.getsockname()[1]
+  sock.close()
+  return port
+
+def start_server(workers, work_ms):
+  '''Start the authorizer server with the given number of workers.
+  Return the process and its URL once it accepts connections.'''
+  port = free_port()
+  server_script = os.path.join(os.path.dirname(gcf.geni.auth.__file__),
+                               'authorizer_server.py')
+  env = dict(os.environ)
+  env[WORK_ENV] = str(work_ms)
+  # So the server can load BusyAuthorizer from this file
+  env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.abspath(__file__))] + sys.path)
+  devnull = open(os.devnull, 'w')
+  server = subprocess.Popen([sys.executable, server_script,
+                             '--port', str(port), '--trusted_roots', '.',
+                             '--authorizer', 'authorizerLoadTest.BusyAuthorizer',
+                             '--workers', str(workers)],
+                            env=env, stdout=devnull, stderr=devnull)
+  deadline = time.time() + 30
+  while True:
+    try:
+      socket.create_connection(('localhost', port), 1).close()
+      break
+    except socket.error:
+      if server.poll() is not None or time.time() > deadline:
+        sys.exit("Authorizer server did not start")
+      time.sleep(0.1)
+  return server, "http://localhost:%d" % port
+
+def run(workers, options):
+  '''Return the calls per second the server handled with the given
+  number of workers.'''
+  server, url = start_server(workers, options.workMs)
+  try:
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=client, args=(url, options.seconds, results))
+               for _ in range(options.clients)]
+    start = time.time()
+    for c in clients:
+      c.start()
+    calls = sum(results.get() for _ in clients)
+    elapsed = time.time() - start
+    for c in clients:
+      c.join()
+  finally:
+    server.terminate()
+    server.wait()
+  return calls / elapsed
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--maxWorkers", type="int", default=multiprocessing.cpu_count(),
+                    help="Most worker processes to try. Default is the number of cores: %default")
+  parser.add_option("--clients", type="int", default=None,
+                    help="Client processes calling at once. Default is 2 per worker")
+  parser.add_option("--seconds", type="float", default=5,
+                    help="Seconds to run each test. Default %default")
+  parser.add_option("--workMs", type="float", default=10,
+                    help="CPU milliseconds the authorizer spends per call. Default %default")
+  parser.add_option("--minSpeedup", type="float", default=None,
+                    help="Fail unless the most workers handle this many times the calls of one")
+  options, args = parser.parse_args(argv)
+  if options.clients is None:
+    options.clients = 2 * max(1, options.maxWorkers)
+
+  counts = [1]
+  while counts[-1] * 2 <= options.maxWorkers:
+    counts.append(counts[-1] * 2)
+  if counts[-1] < options.maxWorkers:
+    counts.append(options.maxWorkers)
+
+  print "Authorizer load test: %d clients, %.1f ms CPU per call, %d cores" % \
+      (options.clients, options.workMs, multiprocessing.cpu_count())
+  rates = []
+  for workers in counts:
+    rate = run(workers, options)
+    rates.append(rate)
+    print "  %2d workers: %7.1f calls/second (%.2fx one worker)" % (workers, rate, rate / rates[0])
+
+  if options.minSpeedup is not None and rates[-1] < options.minSpeedup * rates[0]:
+    print "FAIL: %d workers handled %.2fx the calls of one, less than %.2fx" % \
+        (counts[-1], rates[-1] / rates[0], options.minSpeedup)
+    return 1
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
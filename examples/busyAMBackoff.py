@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+
+'''Show the time omni spends retrying busy aggregates, with the fixed
+20 second pauses omni used to make and with the backoff and circuit
+breaker of gcf/omnilib/util/amhealth.py.
+
+Two fake AMs run locally: one that is always busy, and one that is
+busy twice before answering each call. Each of --invocations omni runs
+(as a script calling omni over and over would make) calls GetVersion
+on both through _do_ssl, with --maxBusyRetries 4. Pauses are really
+slept for only --timeScale of their length, so the test is quick, but
+the times reported are what omni runs would take.
+
+Exits 1 if the backoff and circuit breaker do not take less time in
+total than the fixed pauses.
+
+Usage: busyAMBackoff.py [--invocations N] [--timeScale X] [--seed N]
+'''
+
+import logging
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+
+import gcf.omnilib.util.dossl as dossl
+from gcf.omnilib.util.amhealth import ServerHealth
+from gcf.omnilib.xmlrpc.client import make_client
+
+################################################################################
+# Requires that you have gcf installed or the path to gcf/src in your
+# PYTHONPATH.
+#
+# For example put the following in your bashrc:
+#     export PYTHONPATH=${PYTHONPATH}:path/to/gcf/src
+#
+################################################################################
+
+BUSY = {'code': {'geni_code': 14}, 'value': '', 'output': 'AM is busy'}
+OK = {'code': {'geni_code': 0}, 'value': {'geni_api': 3}, 'output': ''}
+
+class FakeAM(object):
+  '''An AM whose GetVersion is busy busy_calls times, then answers,
+  over and over. With busy_calls None it is always busy.'''
+
+  def __init__(self, busy_calls):
+    self.busy_calls = busy_calls
+    self.calls = 0
+    self.server = SimpleXMLRPCServer(('127.0.0.1', 0), logRequests=False)
+    self.server.register_function(self.GetVersion)
+    thread = threading.Thread(target=self.server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+  def GetVersion(self):
+    self.calls += 1
+    if self.busy_calls is None or self.calls <= self.busy_calls:
+      return BUSY
+    self.calls = 0
+    return OK
+
+class ScaledTime(object):
+  '''Stands in for the time module in dossl: sleeps only scale of each
+  pause, and adds up the full pauses.'''
+
+  def __init__(self, scale):
+    self.scale = scale
+    self.slept = 0
+
+  def sleep(self, seconds):
+    self.slept += seconds
+    time.sleep(seconds * self.scale)
+
+  def __getattr__(self, name):
+    return getattr(time, name)
+
+class Options(object):
+  maxBusyRetries = 4
+  noCircuitBreaker = False
+  traceFile = None
+  amHealthCacheName = None
+
+class FakeFramework(object):
+  def __init__(self, opts):
+    self.opts = opts
+    self.logger = logging.getLogger('busyAMBackoff')
+
+def invocation(opts, am):
+  '''Return the seconds one omni run calling GetVersion on the AM
+  would take.'''
+  # A new omni process reads the health file afresh
+  ServerHealth._instances.clear()
+  clock = ScaledTime(opts.timeScale)
+  dossl.time = clock
+  start = time.time()
+  dossl._do_ssl(FakeFramework(opts), None, "GetVersion at %s" % am.url,
+                make_client(am.url, None, None).GetVersion)
+  return time.time() - start + clock.slept
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("--invocations", type="int", default=6,
+                    help="Number of omni runs to simulate. Default %default")
+  parser.add_option("--timeScale", type="float", default=0.001,
+                    help="Fraction of each pause to really sleep. Default %default")
+  parser.add_option("--seed", type="int", default=0,
+                    help="Seed for the random jitter of the pauses. Default %default")
+  options, args = parser.parse_args(argv)
+  random.seed(options.seed)
+  logging.basicConfig(level=logging.ERROR)
+
+  ams = [("always busy", FakeAM(None)), ("busy twice per call", FakeAM(2))]
+  tmpdir = tempfile.mkdtemp()
+  busy_pause = dossl.busy_pause
+  try:
+    totals = dict(old=0, new=0)
+    print "Seconds each of %d omni runs spends calling GetVersion, --maxBusyRetries 4" % options.invocations
+    for (label, am) in ams:
+      print "AM %s:" % label
+      for (mode, description) in (('old', "fixed 20s pauses"), ('new', "backoff + breaker")):
+        opts = Options()
+        opts.timeScale = options.timeScale
+        if mode == 'old':
+          # No memory between calls, and a fixed pause, as omni had
+          dossl.busy_pause = lambda attempt: 20
+        else:
+          dossl.busy_pause = busy_pause
+          opts.amHealthCacheName = os.path.join(tmpdir, 'am_health.json')
+        am.calls = 0
+        times = [invocation(opts, am) for _ in range(options.invocations)]
+        totals[mode] += sum(times)
+        print "  %-18s %-30s total %4.0f" % (description + ":", " ".join("%3.0f" % t for t in times),
+                                             sum(times))
+    print "Total: fixed 20s pauses %.0f seconds, backoff + breaker %.0f seconds" % (totals['old'], totals['new'])
+  finally:
+    dossl.busy_pause = busy_pause
+    dossl.time = time
+    shutil.rmtree(tmpdir)
+
+  if totals['new'] >= totals['old']:
+    print "FAIL: backoff and circuit breaker took no less time than fixed pauses"
+    return 1
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+
+'''Check that credentials signed in process (by a CredentialSigner, as
+the sample CH does) pass xmlsec1 --verify, and that the in process
+verification agrees with xmlsec1 on good and tampered credentials.
+
+Makes a throwaway authority and users, issues -n user credentials
+through cred_util.create_credentials, verifies each with both
+Credential.verify (xmlsec1) and CredentialSigner.verify, and reports
+the time per credential of each. Exits 1 on any disagreement, or 2 if
+xmlsec1 is not installed.
+
+Usage: credentialSigningCheck.py [-n credentials]
+'''
+
+import datetime
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from gcf.geni.util import cert_util, cred_util
+from gcf.sfa.trust.credential import Credential, find_xmlsec_path
+from gcf.sfa.trust.credential_signer import CredentialSigner
+
+################################################################################
+# Requires that you have gcf installed or the path to gcf/src in your
+# PYTHONPATH.
+#
+# For example put the following in your bashrc:
+#     export PYTHONPATH=${PYTHONPATH}:path/to/gcf/src
+#
+################################################################################
+
+def verifies(verify, cred, roots):
+  '''Return True if verify(cred, roots) accepts the credential.'''
+  try:
+    return bool(verify(cred, roots))
+  except Exception:
+    return False
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  parser = optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("-n", "--credentials", type="int", default=20,
+                    help="Number of credentials to issue. Default %default")
+  options, args = parser.parse_args(argv)
+
+  if not find_xmlsec_path():
+    print "xmlsec1 not found: cannot check in process signatures against it"
+    return 2
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    ca_gid, ca_keys = cert_util.create_cert('urn:publicid:IDN+signing-check+authority+ca', ca=True)
+    ca_certfile = os.path.join(tmpdir, 'ca-cert.pem')
+    ca_keyfile = os.path.join(tmpdir, 'ca-key.pem')
+    ca_gid.save_to_file(ca_certfile)
+    ca_keys.save_to_file(ca_keyfile)
+    roots = [ca_certfile]
+    other_gid, other_keys = cert_util.create_cert('urn:publicid:IDN+other+authority+ca', ca=True)
+    other_root = os.path.join(tmpdir, 'other-cert.pem')
+    other_gid.save_to_file(other_root)
+
+    users = [cert_util.create_cert('urn:publicid:IDN+signing-check+user+user%d' % i,
+                                   issuer_key=ca_keys, issuer_cert=ca_gid)[0]
+             for i in range(options.credentials)]
+    expiration = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    signer = CredentialSigner(ca_keyfile, ca_certfile)
+
+    start = time.time()
+    creds = cred_util.create_credentials([(u, u, expiration) for u in users],
+                                         'user', signer, roots)
+    sign_seconds = (time.time() - start) / len(creds)
+
+    failures = 0
+    xmlsec_seconds = 0
+    inprocess_seconds = 0
+    for cred in creds:
+      # A fresh copy, as a relying party would see it
+      cred = Credential(string=cred.save_to_string())
+      start = time.time()
+      by_xmlsec = verifies(lambda c, r: c.verify(r), cred, roots)
+      xmlsec_seconds += time.time() - start
+      start = time.time()
+      in_process = verifies(signer.verify, cred, roots)
+      inprocess_seconds += time.time() - start
+      if not (by_xmlsec and in_process):
+        print "FAIL: %s xmlsec1 %s, in process %s" % (cred.get_gid_caller().get_urn(),
+                                                      by_xmlsec, in_process)
+        failures += 1
+
+    # Both must reject a changed credential, and one from an untrusted root
+    xml = creds[0].save_to_string()
+    expires = creds[0].get_expiration().strftime('%Y-%m-%dT%H:%M:%S')
+    later = (creds[0].get_expiration() + datetime.timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S')
+    tampered = Credential(string=xml.replace(expires, later, 1))
+    for (label, cred, cred_roots) in (("tampered", tampered, roots),
+                                      ("untrusted root", creds[0], [other_root])):
+      by_xmlsec = verifies(lambda c, r: c.verify(r), cred, cred_roots)
+      in_process = verifies(signer.verify, cred, cred_roots)
+      if by_xmlsec or in_process:
+        print "FAIL: %s credential accepted: xmlsec1 %s, in process %s" % (label, by_xmlsec,
+                                                                           in_process)
+        failures += 1
+
+    print "Signed %d credentials in process: %.1f ms each" % (len(creds), sign_seconds * 1000)
+    print "Verified with xmlsec1: %.1f ms each; in process: %.1f ms each" % \
+        (xmlsec_seconds * 1000 / len(creds), inprocess_seconds * 1000 / len(creds))
+    if failures:
+      print "FAIL: %d checks failed" % failures
+      return 1
+    print "OK: all in process signatures pass xmlsec1 --verify"
+    return 0
+  finally:
+    shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+  sys.exit(main())
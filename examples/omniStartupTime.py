@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+'''Time how long a fresh omni process takes to run a quick command
+(by default `omni.py --noCacheFiles nicknames`), and check that the
+command did not load modules it does not need: stitching or more than
+one control framework, for commands that need no framework (like
+nicknames) the SSL and SFA trust libraries or the call handlers, and
+for print_slice_expiration with --slicecredfile the AM call handler, the
+SSL and SFA trust libraries, or the gcf servers and credential verifier.
+
+Scripts that run omni many times pay this start up cost on every call,
+so run this before and after changes to what omni imports. Exits 1 if
+the command loaded a module it should not, or if the median time is
+over --maxSeconds.
+
+Usage: omniStartupTime.py [-n runs] [--maxSeconds S] [-- omni options and command]
+For example:
+  omniStartupTime.py -n 20 -- -c omni_config print_slice_expiration --slicecredfile cred.xml myslice
+'''
+
+import json
+import optparse
+import subprocess
+import sys
+import time
+
+import gcf.oscript as omni
+
+################################################################################
+# Requires that you have omni installed or the path to gcf/src in your
+# PYTHONPATH.
+#
+# For example put the following in your bashrc:
+#     export PYTHONPATH=${PYTHONPATH}:path/to/gcf/src
+#
+################################################################################
+
+# Modules a quick command should never need
+UNWANTED_MODULES = ('gcf.omnilib.stitchhandler',)
+# Modules that commands that need no framework should not need either
+UNWANTED_LOCAL_MODULES = ('M2Crypto', 'OpenSSL', 'gcf.sfa.trust.credential',
+                          'gcf.omnilib.amhandler', 'gcf.omnilib.chhandler')
+# Commands that can read a saved credential (--slicecredfile) instead of
+# calling the clearinghouse, and the modules they should not need then
+CACHED_CRED_COMMANDS = ('print_slice_expiration',)
+UNWANTED_CACHED_CRED_MODULES = ('gcf.omnilib.amhandler', 'M2Crypto', 'OpenSSL',
+                                'gcf.sfa.trust.credential', 'gcf.geni.ch',
+                                'gcf.geni.am1', 'gcf.geni.util.cred_util')
+
+# Run in a new python process: run omni with the given args, and print
+# how long that took and the modules it loaded, as JSON
+CHILD = '''
+import json, sys, time
+start = time.time()
+import gcf.oscript as omni
+try:
+    omni.call(sys.argv[1:])
+except SystemExit:
+    pass
+elapsed = time.time() - start
+sys.stdout.write("\\n" + json.dumps(dict(seconds=elapsed, modules=sorted(m for m in sys.modules if sys.modules[m] is not None))) + "\\n")
+'''
+
+def run_once(omniargs):
+  '''Run omni in a new process. Return the seconds from process
+  start to exit, the seconds omni took once python was running,
+  and the list of modules loaded.'''
+  start = time.time()
+  proc = subprocess.Popen([sys.executable, '-c', CHILD] + omniargs,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  (out, err) = proc.communicate()
+  wall = time.time() - start
+  try:
+    result = json.loads(out.strip().splitlines()[-1])
+  except (IndexError, ValueError):
+    sys.exit("omni did not run: %s" % (err or out))
+  return (wall, result['seconds'], result['modules'])
+
+def median(values):
+  values = sorted(values)
+  return values[len(values) / 2]
+
+def main(argv=None):
+  if argv is None:
+    argv = sys.argv[1:]
+  parser = optparse.OptionParser(usage="%prog [options] [-- omni options and command]")
+  parser.add_option("-n", "--runs", type="int", default=10,
+                    help="Number of times to run omni. Default %default")
+  parser.add_option("--maxSeconds", type="float", default=None,
+                    help="Fail if the median time to run omni is longer than this")
+  options, omniargs = parser.parse_args(argv)
+  if not omniargs:
+    omniargs = ['--noCacheFiles', 'nicknames']
+
+  walls = []
+  omnis = []
+  modules = None
+  for i in range(max(1, options.runs)):
+    (wall, seconds, modules) = run_once(omniargs)
+    walls.append(wall)
+    omnis.append(seconds)
+
+  print "omni %s: %d runs" % (" ".join(omniargs), len(walls))
+  print "  process time: median %.3f, min %.3f, max %.3f seconds" % (median(walls), min(walls), max(walls))
+  print "  omni time:    median %.3f, min %.3f, max %.3f seconds" % (median(omnis), min(omnis), max(omnis))
+  print "  modules loaded: %d (%d from gcf)" % (len(modules), len([m for m in modules if m.startswith('gcf')]))
+
+  failed = False
+  unwanted = list(UNWANTED_MODULES)
+  parsed, args = omni.parse_args(omniargs)
+  if args and args[0].lower() in omni.LOCAL_COMMANDS:
+    unwanted += UNWANTED_LOCAL_MODULES
+  elif args and args[0].lower() in CACHED_CRED_COMMANDS and parsed.slicecredfile:
+    unwanted += UNWANTED_CACHED_CRED_MODULES
+  unwanted = [m for m in unwanted if m in modules]
+  frameworks = [m for m in modules if m.startswith('gcf.omnilib.frameworks.framework_')
+                and m != 'gcf.omnilib.frameworks.framework_base']
+  if len(frameworks) > 1:
+    unwanted += frameworks
+  if unwanted:
+    print "FAIL: loaded modules it does not need: %s" % ", ".join(unwanted)
+    failed = True
+  if options.maxSeconds is not None and median(walls) > options.maxSeconds:
+    print "FAIL: median time %.3f is over %.3f seconds" % (median(walls), options.maxSeconds)
+    failed = True
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
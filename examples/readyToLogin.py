@@ -27,6 +27,10 @@ import copy
 import string
 import sys, platform
 import os.path
+import shutil
+import tempfile
+import threading
+import Queue
 from optparse import OptionParser
 import xml.etree.ElementTree as etree
 import re
@@ -50,6 +54,7 @@ from gcf.omnilib.util.handler_utils import _lookupAggNickURLFromURNInNicknames a
 options = None
 slicename = None
 config = None
+omniSession = None # (framework, config) shared by all omni calls
 geni_username = None
 NSPrefix = None
 VALID_NS = ['{http://www.geni.net/resources/rspec/3}',
@@ -100,7 +105,7 @@ def getFileName(filename, defaultAnswer):
 
 def setNSPrefix(prefix):
   ''' Helper function for parsing rspecs. It sets the global variabl NSPrefix to
-  the currently parsed rspec namespace. 
+  the currently parsed rspec namespace, and returns it.
   '''
   global NSPrefix
   if prefix not in VALID_NS:
@@ -108,12 +113,15 @@ def setNSPrefix(prefix):
     sys.exit(-1)
 
   NSPrefix = prefix
+  return prefix
 
-def tag(tag):
-  ''' Helper function for parsing rspecs. It gets a tag and uses the global
-  NSPrefix to return the full name
+def tag(tag, prefix=None):
+  ''' Helper function for parsing rspecs. It gets a tag and uses the given
+  prefix (by default the global NSPrefix) to return the full name
   '''
-  return "%s%s" %(NSPrefix,tag)
+  if prefix is None:
+    prefix = NSPrefix
+  return "%s%s" %(prefix,tag)
 
 def getInfoFromManifest(manifestStr):
   ''' Function that takes as input a manifest rspec in a string and parses the
@@ -127,18 +135,20 @@ def getInfoFromManifest(manifestStr):
     print "Couldn't parse the manifest RSpec."
     sys.exit(-1)
 
-  setNSPrefix(re.findall(r'\{.*\}', dom.tag)[0])
+  # Manifests from several AMs may be parsed at once, so use our own
+  # copy of the namespace prefix rather than the global
+  prefix = setNSPrefix(re.findall(r'\{.*\}', dom.tag)[0])
   gsiNS = "{http://groups.geni.net/exogeni/attachment/wiki/RspecExtensions/sliver-info/1}" # Use to look up sliverstatus in RSpec for EG
   loginInfo = []
-  for node_el in dom.findall(tag("node")):
+  for node_el in dom.findall(tag("node", prefix)):
     # Try to get the per node status from the EG specific geni_sliver_info RSpec extension
     geni_status = "unknown"
     for gsi_el in node_el.findall("%s%s" % (gsiNS, "geni_sliver_info")):
         if 'state' in gsi_el.keys():
             # print "Got a geni_sliver_info that says state is: %s" % (gsi_el.attrib['state'])
             geni_status = gsi_el.attrib['state']
-    for serv_el in node_el.findall(tag("services")):
-      for login_el in serv_el.findall(tag("login")):
+    for serv_el in node_el.findall(tag("services", prefix)):
+      for login_el in serv_el.findall(tag("login", prefix)):
          # print "Looking in login tag: %s with attribute %s in node %s" % (login_el, login_el.attrib, node_el.attrib["client_id"])
          try:
            loginInfo.append(login_el.attrib)
@@ -180,6 +190,16 @@ def findUsersAndKeys( ):
         #print "Found %d keys for %s" % (len(keyList[username]), username)
     return keyList
 
+def callOmni( argv, opts ) :
+    '''Run the given omni command (without options) with the given options,
+    using the omni session set up by main_no_print rather than re-initializing
+    omni for each call. Safe to call from several threads, as long as each
+    passes its own copy of the options.'''
+    if omniSession is None:
+      return omni.call( argv, opts )
+    framework, omniConfig = omniSession
+    return omni.API_call( framework, omniConfig, argv, opts )
+
 def getInfoFromSliceManifest( amUrl ) :
     tmpoptions = copy.deepcopy(options)
     tmpoptions.aggregate = [amUrl]
@@ -193,7 +213,7 @@ def getInfoFromSliceManifest( amUrl ) :
 
     argv = [apicall, slicename]
     try:
-      text, apicallout = omni.call( argv, tmpoptions )
+      text, apicallout = callOmni( argv, tmpoptions )
     except (oe.AMAPIError, oe.OmniError) as err:
       print "ERROR: There was an error executing %s, review the logs." % apicall
       #print "error was: %s" % err
@@ -281,7 +301,7 @@ def getSliverStatus( amUrl, amType ) :
         argv = ['sliverstatus', slicename]
         
     try:
-      text, sliverStatus = omni.call( argv, tmpoptions )
+      text, sliverStatus = callOmni( argv, tmpoptions )
     except (oe.AMAPIError, oe.OmniError) :
       print "ERROR: There was an error executing sliverstatus, review the logs."
       sys.exit(-1)
@@ -366,6 +386,10 @@ def getParser() :
                     dest="no_ansible_username",
                     help="Never include the username to use in the ansible inventory file.",
                     action="store_true", default=False)
+  parser.add_option("--threads",
+                    dest="threads",
+                    action="store", type="int", default=10,
+                    help="Query up to this many aggregates at once (default 10).")
   return parser
 
 
@@ -572,10 +596,8 @@ def getKeysForUser( amType, username, keyList ):
 
   return userKeyList
     
-def printLoginInfo( loginInfoDict, keyList ) :
-  global options
-  '''Prints the Login Information from all AMs, all Users and all hosts '''
-  
+def openLoginInfoFile( ) :
+  '''Returns the file to print Login Information to'''
   # Check if the output option is set
   defaultAnswer = not options.donotoverwrite
   prefix = ""
@@ -587,79 +609,91 @@ def printLoginInfo( loginInfoDict, keyList ) :
     print "Login info saved at: %s" % filename
   else :
     f = sys.stdout
+  return f
 
-  firstTime = {}
-
+def printLoginInfo( loginInfoDict, keyList ) :
+  global options
+  '''Prints the Login Information from all AMs, all Users and all hosts '''
+  
+  f = openLoginInfoFile()
   for amUrl, amInfo in loginInfoDict.items() :
-    f.write("\n")
-    f.write("="*80+"\n")
-    f.write("LOGIN INFO for AM: %s\n" % amUrl)
-    f.write("="*80+"\n")
+    printAMLoginInfo( f, amUrl, amInfo, keyList )
 
-    f.write( "\nFor more login info, see the section entitled:\n\t 'Providing a private key to ssh' in 'readyToLogin.py -h'\n")
+def printAMLoginInfo( f, amUrl, amInfo, keyList ) :
+  '''Prints the Login Information from one AM, all Users and all hosts '''
 
-    sortedAMInfo = {}
-    for item in amInfo['info']:
-      if not sortedAMInfo.has_key( item['client_id'] ):
-          sortedAMInfo[ item['client_id'] ] = []
-      sortedAMInfo[ item['client_id'] ].append(item)
+  firstTime = {}
 
-    for client_id, itemList in sortedAMInfo.items():
-      for item in itemList:
-          if not firstTime.has_key( amUrl ):
-              firstTime[amUrl] = {}
-          if not firstTime[amUrl].has_key( item['client_id'] ):
-              firstTime[amUrl][item['client_id'] ] = True
-          #    print "This is first time for %s" % item['client_id']
-          output = ""
-          if options.readyonly :
-            try:
-              if item['geni_status'] != "ready" :
-                  #print "%s is not ready: %s" % (item['client_id'], item['geni_status'])
-                  continue
-            except KeyError:
-              sys.stderr.write("There is no status information for node %s. Print login info." % item['client_id'])
-          # If there are status info print it, if not just skip it
+  f.write("\n")
+  f.write("="*80+"\n")
+  f.write("LOGIN INFO for AM: %s\n" % amUrl)
+  f.write("="*80+"\n")
+
+  f.write( "\nFor more login info, see the section entitled:\n\t 'Providing a private key to ssh' in 'readyToLogin.py -h'\n")
+
+  sortedAMInfo = {}
+  for item in amInfo['info']:
+    if not sortedAMInfo.has_key( item['client_id'] ):
+        sortedAMInfo[ item['client_id'] ] = []
+    sortedAMInfo[ item['client_id'] ].append(item)
+
+  for client_id, itemList in sortedAMInfo.items():
+    for item in itemList:
+        if not firstTime.has_key( amUrl ):
+            firstTime[amUrl] = {}
+        if not firstTime[amUrl].has_key( item['client_id'] ):
+            firstTime[amUrl][item['client_id'] ] = True
+        #    print "This is first time for %s" % item['client_id']
+        output = ""
+        if options.readyonly :
           try:
-            if firstTime[amUrl][item['client_id'] ]:
-                gsOut = ""
-                amsOut = ""
-                if item.has_key('geni_status') and item['geni_status'].strip()!="":
-                    gsOut = "geni_status is: %s" % item['geni_status']
-                if item.has_key('am_status') and item['am_status'].strip()!="":
-                    amsOut = "am_status: %s" % item['am_status']
-                if gsOut:
-                    # if amsOut:
-                    #    output += "\n%s's geni_status is: %s (am_status:%s) \n" % (item['client_id'], item['geni_status'], item['am_status'])
-                    #else:
-                    output += "\n%s's geni_status is: %s \n" % (item['client_id'], item['geni_status'])
-                elif amsOut:
-                        output += "\n%s's am_status is: %s \n" % (item['client_id'], item['am_status'])
-                else:
-                        output += "\n%s's geni_status is: unknown \n" % (item['client_id'])
-                # Check if node is in ready state
-            firstTime[amUrl][ item['client_id'] ]=False
-          except KeyError as ke:
-              #print "Got error looking in firstTime for %s: %s" % (item['client_id'], ke)
-              pass
-
-          keys = getKeysForUser(amInfo["amType"], item["username"], keyList)
-          usrLoginMsg = "User %s logs in to %s using:\n" % (item['username'], item['client_id'])      
-          if options.include_keys:
-              if len(keys)>0:
-                  output += usrLoginMsg
-              #else:
-              #    print "User %s has no keys" % item['username']
-              for key in keys: 
-                  output += printLoginInfoForOneUser( item, key=key )
+            if item['geni_status'] != "ready" :
+                #print "%s is not ready: %s" % (item['client_id'], item['geni_status'])
+                continue
+          except KeyError:
+            sys.stderr.write("There is no status information for node %s. Print login info." % item['client_id'])
+        # If there are status info print it, if not just skip it
+        try:
+          if firstTime[amUrl][item['client_id'] ]:
+              gsOut = ""
+              amsOut = ""
+              if item.has_key('geni_status') and item['geni_status'].strip()!="":
+                  gsOut = "geni_status is: %s" % item['geni_status']
+              if item.has_key('am_status') and item['am_status'].strip()!="":
+                  amsOut = "am_status: %s" % item['am_status']
+              if gsOut:
+                  # if amsOut:
+                  #    output += "\n%s's geni_status is: %s (am_status:%s) \n" % (item['client_id'], item['geni_status'], item['am_status'])
+                  #else:
+                  output += "\n%s's geni_status is: %s \n" % (item['client_id'], item['geni_status'])
+              elif amsOut:
+                      output += "\n%s's am_status is: %s \n" % (item['client_id'], item['am_status'])
+              else:
+                      output += "\n%s's geni_status is: unknown \n" % (item['client_id'])
+              # Check if node is in ready state
+          firstTime[amUrl][ item['client_id'] ]=False
+        except KeyError as ke:
+            #print "Got error looking in firstTime for %s: %s" % (item['client_id'], ke)
+            pass
+
+        keys = getKeysForUser(amInfo["amType"], item["username"], keyList)
+        usrLoginMsg = "User %s logs in to %s using:\n" % (item['username'], item['client_id'])      
+        if options.include_keys:
+            if len(keys)>0:
+                output += usrLoginMsg
+            #else:
+            #    print "User %s has no keys" % item['username']
+            for key in keys: 
+                output += printLoginInfoForOneUser( item, key=key )
 
-          else:
-              output += usrLoginMsg
-              output += printLoginInfoForOneUser( item )
+        else:
+            output += usrLoginMsg
+            output += printLoginInfoForOneUser( item )
 
-          f.write(output)
-    if options.include_keys:
-        f.write("\nNOTE: If your user is not listed, try using the --no-keys option.\n")
+        f.write(output)
+  if options.include_keys:
+      f.write("\nNOTE: If your user is not listed, try using the --no-keys option.\n")
+  f.flush()
 
 def printLoginInfoForOneUser( item, key=None ):
     output = "\t"
@@ -741,8 +775,100 @@ def get_geni_username( handler, framework):
     return username
 
 
-def main_no_print(argv=None, opts=None, slicen=None):
-  global slicename, options, config, geni_username
+def getAMLoginInfo(amUrl, amType):
+  '''Returns the login info dictionary for the given AM, or None if it has no
+  login information'''
+  if amType == "foam" :
+    print "No login information for FOAM! Skip %s" %amUrl
+    return None
+  # XXX Although ProtoGENI returns the service tag in the manifest
+  # it does not contain information for all the users, so we will 
+  # stick with the sliverstatus until this is fixed
+  if amType == "sfa": 
+    amLoginInfo = getInfoFromSliverStatus(amUrl, amType)
+  else:
+    # Getting login info from manifest"
+    amLoginInfo = getInfoFromSliceManifest(amUrl)
+    # Get the status only if we care
+    if len(amLoginInfo) > 0 :
+      if options.readyonly or (amType == "protogeni") or (amType == "GRAM"):
+        amLoginInfo = addNodeStatus(amUrl, amType, amLoginInfo)
+    #else:
+    #    print "Not getting node status for %s" % amUrl
+  if len(amLoginInfo) == 0 :
+    return None
+  return {'amType' : amType,
+          'info' : amLoginInfo
+         }
+
+def collectLoginInfo(amTypes, amCallback=None):
+  '''Gets the login info from all the given AMs (a dictionary of AM type by
+  AM URL), querying up to options.threads AMs at once. If given, amCallback is
+  called with the AM URL and login info of each AM with login info, in the
+  order in which the AMs finish. Returns the login info dictionary by AM URL.
+  '''
+  pending = Queue.Queue()
+  for amUrl, amType in amTypes.items():
+    pending.put((amUrl, amType))
+  results = Queue.Queue()
+
+  def worker():
+    while True:
+      try:
+        amUrl, amType = pending.get_nowait()
+      except Queue.Empty:
+        return
+      try:
+        results.put((amUrl, getAMLoginInfo(amUrl, amType), None))
+      except BaseException:
+        # Including the SystemExit from an error exit; re-raised below
+        results.put((amUrl, None, sys.exc_info()))
+
+  for i in range(max(1, min(options.threads, len(amTypes)))):
+    t = threading.Thread(target=worker, name="readyToLogin-%d" % i)
+    t.daemon = True
+    t.start()
+
+  loginInfoDict = {}
+  for i in range(len(amTypes)):
+    # Wait with a timeout so that ^C still works
+    while True:
+      try:
+        amUrl, amInfo, excInfo = results.get(True, 1)
+        break
+      except Queue.Empty:
+        pass
+    if excInfo is not None:
+      raise excInfo[0], excInfo[1], excInfo[2]
+    if amInfo is None:
+      continue
+    loginInfoDict[amUrl] = amInfo
+    if amCallback is not None:
+      amCallback(amUrl, amInfo)
+  return loginInfoDict
+
+def getSliceCredFile(tmpdir):
+  '''Fetches the slice credential once, saving it in the given directory so
+  that the per AM calls do not each get it again. Returns the file name.'''
+  tmpoptions = copy.deepcopy(options)
+  tmpoptions.output = True
+  tmpoptions.slicecredfile = os.path.join(tmpdir, "%s-cred" % slicename)
+  try:
+    text, slicecred = callOmni( ['getslicecred', slicename], tmpoptions )
+  except (oe.AMAPIError, oe.OmniError) :
+    print "ERROR: There was an error executing getslicecred, review the logs."
+    sys.exit(-1)
+  if not slicecred or not os.listdir(tmpdir):
+    print "ERROR: Got no slice credential for %s: %s" % (slicename, text)
+    sys.exit(-1)
+  # Omni adds the .xml or .json extension
+  return os.path.join(tmpdir, os.listdir(tmpdir)[0])
+
+def main_no_print(argv=None, opts=None, slicen=None, amCallback=None):
+  '''Returns the login info dictionary by AM URL and the key list.
+  If given, amCallback is called with the AM URL, login info and key list
+  as soon as each AM's login info is in.'''
+  global slicename, options, config, geni_username, omniSession
 
   slicename = slicen
   parseArguments(argv=argv, opts=opts)
@@ -754,6 +880,8 @@ def main_no_print(argv=None, opts=None, slicen=None):
   options.warn = True
   framework, config, args, opts = omni.initialize( [], options )
   handler = CallHandler(framework,config,options)
+  # Make all the omni calls below in this omni session
+  omniSession = (framework, config)
   
   # If creating an ansible inventory don't check the keys
   if options.ansible_inventory:
@@ -771,7 +899,7 @@ def main_no_print(argv=None, opts=None, slicen=None):
       # Run equivalent of 'omni.py listslivers'
       argv = ['listslivers', slicename]
       try:
-          text, slivers = omni.call( argv, options )
+          text, slivers = callOmni( argv, options )
       except (oe.AMAPIError, oe.OmniError) :
           print "ERROR: There was an error executing listslivers, review the logs."
           sys.exit(-1)
@@ -794,10 +922,12 @@ def main_no_print(argv=None, opts=None, slicen=None):
   # Disable useSliceAggregates at this point, because we already have the list - don't fetch it again
   options.useSliceAggregates = False
       
-  # Run equivalent of 'omni.py getversion'
-  argv = ['--ForceUseGetVersionCache', 'getversion']
+  # Run equivalent of 'omni.py --ForceUseGetVersionCache getversion'
+  argv = ['getversion']
+  tmpoptions = copy.deepcopy(options)
+  tmpoptions.useGetVersionCache = True
   try:
-    text, getVersion = omni.call( argv, options )
+    text, getVersion = callOmni( argv, tmpoptions )
   except (oe.AMAPIError, oe.OmniError) :
     print "ERROR: There was an error executing getVersion, review the logs."
     sys.exit(-1)
@@ -806,38 +936,29 @@ def main_no_print(argv=None, opts=None, slicen=None):
     print "ERROR: Got no GetVersion output; review the logs."
     sys.exit(-1)
 
-  loginInfoDict = {}
+  amTypes = {}
   for amUrl, amOutput in getVersion.items() :
     if not amOutput :
       print "%s returned an error on getVersion, skip!" % amUrl
       continue
-    amType = getAMTypeFromGetVersionOut(amUrl, amOutput) 
+    amTypes[amUrl] = getAMTypeFromGetVersionOut(amUrl, amOutput) 
 
-    if amType == "foam" :
-      print "No login information for FOAM! Skip %s" %amUrl
-      continue
-    # XXX Although ProtoGENI returns the service tag in the manifest
-    # it does not contain information for all the users, so we will 
-    # stick with the sliverstatus until this is fixed
-    if amType == "sfa": 
-      amLoginInfo = getInfoFromSliverStatus(amUrl, amType)
-      if len(amLoginInfo) > 0 :
-        loginInfoDict[amUrl] = {'amType' : amType,
-                                'info' : amLoginInfo
-                               }
-      continue
-    else:
-      # Getting login info from manifest"
-      amLoginInfo = getInfoFromSliceManifest(amUrl)
-      # Get the status only if we care
-      if len(amLoginInfo) > 0 :
-        if options.readyonly or (amType == "protogeni") or (amType == "GRAM"):
-          amLoginInfo = addNodeStatus(amUrl, amType, amLoginInfo)
-        loginInfoDict[amUrl] = {'amType':amType,
-                                'info':amLoginInfo
-                               }
-      #else:
-      #    print "Not getting node status for %s" % amUrl
+  # Get the slice credential once, unless the user supplied one
+  slicecredfile = options.slicecredfile
+  tmpdir = None
+  if not slicecredfile or not os.path.exists(slicecredfile):
+    tmpdir = tempfile.mkdtemp(prefix="readyToLogin-")
+  try:
+    if tmpdir is not None:
+      options.slicecredfile = getSliceCredFile(tmpdir)
+    amInfoCallback = None
+    if amCallback is not None:
+      amInfoCallback = lambda amUrl, amInfo: amCallback(amUrl, amInfo, keyList)
+    loginInfoDict = collectLoginInfo(amTypes, amInfoCallback)
+  finally:
+    options.slicecredfile = slicecredfile
+    if tmpdir is not None:
+      shutil.rmtree(tmpdir, ignore_errors=True)
         
   return loginInfoDict, keyList
 
@@ -902,7 +1023,17 @@ def inventoryInfoForOneUser( item, key=None, username=None ):
 def main(argv=None):
     if not argv:
         argv = sys.argv[1:]
-    loginInfoDict, keyList = main_no_print(argv=argv)
+
+    # Print the login info of each AM as soon as we have it
+    loginInfoFile = []
+    def printAMLoginInfoNow(amUrl, amInfo, keyList):
+        if options.ansible_inventory:
+            return
+        if not loginInfoFile:
+            loginInfoFile.append(openLoginInfoFile())
+        printAMLoginInfo(loginInfoFile[0], amUrl, amInfo, keyList)
+
+    loginInfoDict, keyList = main_no_print(argv=argv, amCallback=printAMLoginInfoNow)
 
     if not options.ansible_inventory:
         printSSHConfigInfo(loginInfoDict, keyList)
@@ -910,7 +1041,6 @@ def main(argv=None):
         #        print "+++ "+am+" +++"
         #        for info in amInfo["info"]:
         #            print "+++ "+ info['username']+" on "+ info['hostname']+":"+info['port'] +" +++"
-        printLoginInfo(loginInfoDict, keyList)
     else:
         createAnsibleInventory(loginInfoDict, keyList)
     if not loginInfoDict:
@@ -66,6 +66,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/geni/am/__init__.py
 %{python_sitelib}/gcf/geni/am/__init__.pyc
 %{python_sitelib}/gcf/geni/am/__init__.pyo
+%{python_sitelib}/gcf/geni/am/advert_cache.py
+%{python_sitelib}/gcf/geni/am/advert_cache.pyc
+%{python_sitelib}/gcf/geni/am/advert_cache.pyo
 %{python_sitelib}/gcf/geni/am/aggregate.py
 %{python_sitelib}/gcf/geni/am/aggregate.pyc
 %{python_sitelib}/gcf/geni/am/aggregate.pyo
@@ -90,6 +93,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/geni/am/resource.py
 %{python_sitelib}/gcf/geni/am/resource.pyc
 %{python_sitelib}/gcf/geni/am/resource.pyo
+%{python_sitelib}/gcf/geni/am/sliver_store.py
+%{python_sitelib}/gcf/geni/am/sliver_store.pyc
+%{python_sitelib}/gcf/geni/am/sliver_store.pyo
 %{python_sitelib}/gcf/geni/am/test_ams.py
 %{python_sitelib}/gcf/geni/am/test_ams.pyc
 %{python_sitelib}/gcf/geni/am/test_ams.pyo
@@ -159,6 +165,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/geni/util/error_util.py
 %{python_sitelib}/gcf/geni/util/error_util.pyc
 %{python_sitelib}/gcf/geni/util/error_util.pyo
+%{python_sitelib}/gcf/geni/util/log_util.py
+%{python_sitelib}/gcf/geni/util/log_util.pyc
+%{python_sitelib}/gcf/geni/util/log_util.pyo
 %{python_sitelib}/gcf/geni/util/rspec_schema.py
 %{python_sitelib}/gcf/geni/util/rspec_schema.pyc
 %{python_sitelib}/gcf/geni/util/rspec_schema.pyo
@@ -168,6 +177,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/geni/util/secure_xmlrpc_client.py
 %{python_sitelib}/gcf/geni/util/secure_xmlrpc_client.pyc
 %{python_sitelib}/gcf/geni/util/secure_xmlrpc_client.pyo
+%{python_sitelib}/gcf/geni/util/slice_registry.py
+%{python_sitelib}/gcf/geni/util/slice_registry.pyc
+%{python_sitelib}/gcf/geni/util/slice_registry.pyo
 %{python_sitelib}/gcf/geni/util/speaksfor_util.py
 %{python_sitelib}/gcf/geni/util/speaksfor_util.pyc
 %{python_sitelib}/gcf/geni/util/speaksfor_util.pyo
@@ -237,6 +249,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/omnilib/stitch/__init__.py
 %{python_sitelib}/gcf/omnilib/stitch/__init__.pyc
 %{python_sitelib}/gcf/omnilib/stitch/__init__.pyo
+%{python_sitelib}/gcf/omnilib/stitch/benchmark.py
+%{python_sitelib}/gcf/omnilib/stitch/benchmark.pyc
+%{python_sitelib}/gcf/omnilib/stitch/benchmark.pyo
 %{python_sitelib}/gcf/omnilib/stitch/defs.py
 %{python_sitelib}/gcf/omnilib/stitch/defs.pyc
 %{python_sitelib}/gcf/omnilib/stitch/defs.pyo
@@ -246,6 +261,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/omnilib/stitch/launcher.py
 %{python_sitelib}/gcf/omnilib/stitch/launcher.pyc
 %{python_sitelib}/gcf/omnilib/stitch/launcher.pyo
+%{python_sitelib}/gcf/omnilib/stitch/localscs.py
+%{python_sitelib}/gcf/omnilib/stitch/localscs.pyc
+%{python_sitelib}/gcf/omnilib/stitch/localscs.pyo
 %{python_sitelib}/gcf/omnilib/stitch/objects.py
 %{python_sitelib}/gcf/omnilib/stitch/objects.pyc
 %{python_sitelib}/gcf/omnilib/stitch/objects.pyo
@@ -267,6 +285,12 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/omnilib/util/abac.py
 %{python_sitelib}/gcf/omnilib/util/abac.pyc
 %{python_sitelib}/gcf/omnilib/util/abac.pyo
+%{python_sitelib}/gcf/omnilib/util/amhealth.py
+%{python_sitelib}/gcf/omnilib/util/amhealth.pyc
+%{python_sitelib}/gcf/omnilib/util/amhealth.pyo
+%{python_sitelib}/gcf/omnilib/util/calltrace.py
+%{python_sitelib}/gcf/omnilib/util/calltrace.pyc
+%{python_sitelib}/gcf/omnilib/util/calltrace.pyo
 %{python_sitelib}/gcf/omnilib/util/credparsing.py
 %{python_sitelib}/gcf/omnilib/util/credparsing.pyc
 %{python_sitelib}/gcf/omnilib/util/credparsing.pyo
@@ -297,6 +321,12 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/omnilib/util/paths.py
 %{python_sitelib}/gcf/omnilib/util/paths.pyc
 %{python_sitelib}/gcf/omnilib/util/paths.pyo
+%{python_sitelib}/gcf/omnilib/util/rspec_stream.py
+%{python_sitelib}/gcf/omnilib/util/rspec_stream.pyc
+%{python_sitelib}/gcf/omnilib/util/rspec_stream.pyo
+%{python_sitelib}/gcf/omnilib/util/sliverinfo.py
+%{python_sitelib}/gcf/omnilib/util/sliverinfo.pyc
+%{python_sitelib}/gcf/omnilib/util/sliverinfo.pyo
 %{python_sitelib}/gcf/omnilib/xmlrpc/__init__.py
 %{python_sitelib}/gcf/omnilib/xmlrpc/__init__.pyc
 %{python_sitelib}/gcf/omnilib/xmlrpc/__init__.pyo
@@ -328,6 +358,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/sfa/trust/credential_legacy.py
 %{python_sitelib}/gcf/sfa/trust/credential_legacy.pyc
 %{python_sitelib}/gcf/sfa/trust/credential_legacy.pyo
+%{python_sitelib}/gcf/sfa/trust/credential_signer.py
+%{python_sitelib}/gcf/sfa/trust/credential_signer.pyc
+%{python_sitelib}/gcf/sfa/trust/credential_signer.pyo
 %{python_sitelib}/gcf/sfa/trust/gid.py
 %{python_sitelib}/gcf/sfa/trust/gid.pyc
 %{python_sitelib}/gcf/sfa/trust/gid.pyo
@@ -352,6 +385,9 @@ rm -rf $RPM_BUILD_ROOT
 %{python_sitelib}/gcf/sfa/util/sfatime.py
 %{python_sitelib}/gcf/sfa/util/sfatime.pyc
 %{python_sitelib}/gcf/sfa/util/sfatime.pyo
+%{python_sitelib}/gcf/sfa/util/xmlschema.py
+%{python_sitelib}/gcf/sfa/util/xmlschema.pyc
+%{python_sitelib}/gcf/sfa/util/xmlschema.pyo
 %{python_sitelib}/gcf/sfa/util/xrn.py
 %{python_sitelib}/gcf/sfa/util/xrn.pyc
 %{python_sitelib}/gcf/sfa/util/xrn.pyo
@@ -378,6 +414,21 @@ rm -rf $RPM_BUILD_ROOT
 %doc %{_docdir}/%{name}/TROUBLESHOOTING.txt
 %doc %{_docdir}/%{name}/copyright
 %{_datadir}/%{name}/agg_nick_cache.base
+%{_datadir}/%{name}/amLogOverhead.py
+%{_datadir}/%{name}/amLogOverhead.pyc
+%{_datadir}/%{name}/amLogOverhead.pyo
+%{_datadir}/%{name}/amSliverStoreScaling.py
+%{_datadir}/%{name}/amSliverStoreScaling.pyc
+%{_datadir}/%{name}/amSliverStoreScaling.pyo
+%{_datadir}/%{name}/authorizerLoadTest.py
+%{_datadir}/%{name}/authorizerLoadTest.pyc
+%{_datadir}/%{name}/authorizerLoadTest.pyo
+%{_datadir}/%{name}/busyAMBackoff.py
+%{_datadir}/%{name}/busyAMBackoff.pyc
+%{_datadir}/%{name}/busyAMBackoff.pyo
+%{_datadir}/%{name}/credentialSigningCheck.py
+%{_datadir}/%{name}/credentialSigningCheck.pyc
+%{_datadir}/%{name}/credentialSigningCheck.pyo
 %{_datadir}/%{name}/clear-passphrases.py
 %{_datadir}/%{name}/clear-passphrases.pyc
 %{_datadir}/%{name}/clear-passphrases.pyo
@@ -393,6 +444,9 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/%{name}/gcf-ch.py
 %{_datadir}/%{name}/gcf-ch.pyc
 %{_datadir}/%{name}/gcf-ch.pyo
+%{_datadir}/%{name}/gcf-scs.py
+%{_datadir}/%{name}/gcf-scs.pyc
+%{_datadir}/%{name}/gcf-scs.pyo
 %{_datadir}/%{name}/gcf-test.py
 %{_datadir}/%{name}/gcf-test.pyc
 %{_datadir}/%{name}/gcf-test.pyo
@@ -403,6 +457,9 @@ rm -rf $RPM_BUILD_ROOT
 %{_datadir}/%{name}/myscript.py
 %{_datadir}/%{name}/myscript.pyc
 %{_datadir}/%{name}/myscript.pyo
+%{_datadir}/%{name}/omniStartupTime.py
+%{_datadir}/%{name}/omniStartupTime.pyc
+%{_datadir}/%{name}/omniStartupTime.pyo
 %{_datadir}/%{name}/omni_config.sample
 %{_datadir}/%{name}/omni_log_conf_sample.conf
 %{_datadir}/%{name}/remote-execute.py
@@ -47,6 +47,7 @@ import gcf.geni.am.am2
 import gcf.geni.am.am3
 from gcf.geni.config import read_config
 from gcf.geni.auth.util import getInstanceFromClassname
+from gcf.geni.util.log_util import start_background_logging
 
 
 def parse_args(argv):
@@ -68,6 +69,9 @@ def parse_args(argv):
                       help="server port", metavar="PORT")
     parser.add_option("--debug", action="store_true", default=False,
                        help="enable debugging output")
+    parser.add_option("--background-logging", action="store_true",
+                      dest="background_logging", default=None,
+                      help="write log messages from a background thread, so calls do not wait on logging")
     parser.add_option("-V", "--api-version", type=int,
                       help="AM API Version", default=2)
     parser.add_option("-D", "--delegate", metavar="DELEGATE",
@@ -111,6 +115,9 @@ def main(argv=None):
     if getattr(opts,'rootcadir') is None:
         setattr(opts,'rootcadir',config['global']['rootcadir'])        
 
+    if str(opts.background_logging).lower() in ('true', 'yes', '1'):
+        start_background_logging()
+
     if opts.rootcadir is None:
         sys.exit('Missing path to trusted root certificate directory (-r argument)')
     
@@ -190,7 +197,9 @@ def main(argv=None):
                                                      base_name=config['global']['base_name'], 
                                                      authorizer=authorizer,
                                                      resource_manager=resource_manager,
-                                                     delegate=delegate)
+                                                     delegate=delegate,
+                                                     sliver_db=getattr(opts, 'sliver_db', None),
+                                                     fake_resources=getattr(opts, 'fake_resources', None))
     elif opts.api_version == 3:
         ams = gcf.geni.am.am3.AggregateManagerServer((opts.host, int(opts.port)),
                                                      keyfile=keyfile,
@@ -200,7 +209,9 @@ def main(argv=None):
                                                      base_name=config['global']['base_name'],
                                                      authorizer=authorizer,
                                                      resource_manager=resource_manager,
-                                                     delegate=delegate)
+                                                     delegate=delegate,
+                                                     sliver_db=getattr(opts, 'sliver_db', None),
+                                                     fake_resources=getattr(opts, 'fake_resources', None))
     else:
         msg = "Unknown API version: %d. Valid choices are \"1\", \"2\", or \"3\""
         sys.exit(msg % (opts.api_version))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+"""
+Run a local stand in for the Stitching Computation Service (SCS),
+computing stitching paths from a JSON topology file. Serves plain
+HTTP XML-RPC, for testing stitcher without the real SCS:
+  stitcher.py --scsURL http://localhost:8081/geni/xmlrpc ...
+
+Run with "-h" flag to see usage and command line options.
+"""
+
+import sys
+
+# Check python version. Requires 2.6 or greater, but less than 3.
+if sys.version_info < (2, 6):
+    raise Exception('Must use python 2.6 or greater.')
+elif sys.version_info >= (3,):
+    raise Exception('Not python 3 ready')
+
+import logging
+import optparse
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+from gcf.omnilib.stitch.localscs import LocalSCS, Topology
+from gcf.omnilib.stitch.utils import StitchingError
+
+class SCSRequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/geni/xmlrpc', '/', '/RPC2')
+
+def parse_args(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("-t", "--topology",
+                      help="JSON topology file of aggregates, hops and wires", metavar="FILE")
+    parser.add_option("-H", "--host", default="localhost",
+                      help="server ip (default %default)", metavar="HOST")
+    parser.add_option("-p", "--port", type=int, default=8081,
+                      help="server port (default %default)", metavar="PORT")
+    parser.add_option("--debug", action="store_true", default=False,
+                       help="enable debugging output")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    opts = parse_args(argv)[0]
+    level = logging.INFO
+    if opts.debug:
+        level = logging.DEBUG
+    logging.basicConfig(level=level)
+    logger = logging.getLogger('gcf-scs')
+
+    if opts.topology is None:
+        sys.exit('Missing topology file (-t argument)')
+    try:
+        topology = Topology.fromFile(opts.topology)
+    except StitchingError, e:
+        sys.exit(str(e))
+
+    server = SimpleXMLRPCServer((opts.host, opts.port), requestHandler=SCSRequestHandler,
+                                logRequests=opts.debug, allow_none=True)
+    server.register_instance(LocalSCS(topology))
+    logger.info("Local SCS with %d aggregates and %d hops listening on http://%s:%d/geni/xmlrpc",
+                len(topology.aggregates), len(topology.hops), opts.host, opts.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    sys.exit(main())
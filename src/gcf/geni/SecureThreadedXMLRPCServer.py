@@ -39,6 +39,7 @@ import SocketServer
 
 from .SecureXMLRPCServer import SecureXMLRPCServer
 from .SecureXMLRPCServer import SecureXMLRPCRequestHandler
+from ..sfa.trust.gid import get_verified_gid
 
 
 class SecureThreadedXMLRPCRequestHandler(SecureXMLRPCRequestHandler):
@@ -82,6 +83,16 @@ class SecureThreadedXMLRPCRequestHandler(SecureXMLRPCRequestHandler):
     def get_pem_cert() :
         return SecureThreadedXMLRPCRequestHandler.request_specific_info.pem_cert
 
+    @staticmethod
+    def get_der_cert() :
+        return SecureThreadedXMLRPCRequestHandler.request_specific_info.der_cert
+
+    @staticmethod
+    def get_verified_gid(trusted_roots, chain_suffix=''):
+        return get_verified_gid(
+            SecureThreadedXMLRPCRequestHandler.get_pem_cert() + chain_suffix,
+            trusted_roots)
+
 class SecureThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SecureXMLRPCServer):
     """An extension to SecureMLRPCServer that adds multi-threading per RPC"""
 
@@ -102,3 +113,6 @@ class SecureThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SecureXMLRPCServer
     def get_pem_cert(self) :
         return SecureThreadedXMLRPCRequestHandler.get_pem_cert()
 
+    def get_der_cert(self) :
+        return SecureThreadedXMLRPCRequestHandler.get_der_cert()
+
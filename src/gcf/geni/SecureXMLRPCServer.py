@@ -38,6 +38,8 @@ import os
 from SimpleXMLRPCServer import SimpleXMLRPCServer
 from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler
 
+from ..sfa.trust.gid import get_verified_gid
+
 class SecureXMLRPCRequestHandler(SimpleXMLRPCRequestHandler):
     """A request handler that grabs the socket peer's certificate and
     makes it available while the request is handled.
@@ -113,3 +115,15 @@ class SecureXMLRPCServer(SimpleXMLRPCServer):
     # This method for the threaded case
     def get_pem_cert(self):
         return self.pem_cert
+
+    # Return the DER cert for current XMLRPC client connection
+    def get_der_cert(self):
+        return self.der_cert
+
+    # Return the GID of the current XMLRPC client, with chain_suffix
+    # (eg an MA cert) appended to its cert, verified against the given
+    # trusted roots. Verification is only done the first time a given
+    # client cert is seen (see gid.get_verified_gid).
+    def get_verified_gid(self, trusted_roots, chain_suffix=''):
+        return get_verified_gid(self.get_pem_cert() + chain_suffix,
+                                trusted_roots)
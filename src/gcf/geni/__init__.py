@@ -23,9 +23,52 @@
 
 from __future__ import absolute_import
 
-from .ch import Clearinghouse
-from .am1 import ReferenceAggregateManager, AggregateManagerServer
-from .util.cred_util import *
-from .util.urn_util import *
-from .util.cert_util import *
-from .util.secure_xmlrpc_client import *
+import imp
+import importlib
+import sys
+import types
+
+# The names this package exports (geni.Clearinghouse,
+# geni.CredentialVerifier, geni.URN and the like), by the module they come
+# from: the given names, or (for None) all the public names in the
+# module, later modules winning. These modules load the SSL and
+# credential libraries, so they are only imported when one of these
+# names is first used: importing a light helper such as
+# gcf.geni.util.urn_util (as omni does) then loads just that module.
+_EXPORTS = (('.ch', ('Clearinghouse',)),
+            ('.am1', ('ReferenceAggregateManager', 'AggregateManagerServer')),
+            ('.util.cred_util', None),
+            ('.util.urn_util', None),
+            ('.util.cert_util', None),
+            ('.util.secure_xmlrpc_client', None))
+
+class _LazyPackage(types.ModuleType):
+    """This package, importing its submodules and the modules in
+    _EXPORTS on first use of one of their names."""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            imp.find_module(name, self.__path__)
+        except ImportError:
+            pass
+        else:
+            return importlib.import_module('.' + name, self.__name__)
+        for (modname, names) in reversed(_EXPORTS):
+            if (names is None and name.startswith('_')) or \
+                    (names is not None and name not in names):
+                continue
+            module = importlib.import_module(modname, self.__name__)
+            if hasattr(module, name):
+                value = getattr(module, name)
+                setattr(self, name, value)
+                return value
+        raise AttributeError("'module' object has no attribute '%s'" % name)
+
+# Replace this module with a _LazyPackage, keeping this module alive:
+# its globals are those of the functions above.
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
@@ -0,0 +1,99 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''
+The advertisement RSpec of a reference aggregate manager, rendered
+once and kept until resources change.
+'''
+
+from __future__ import absolute_import
+
+import base64
+import threading
+import zlib
+
+class AdvertisementCache(object):
+    """The advertisement RSpec, plain and compressed, of all resources
+    or only the available ones.
+
+    The XML of each resource is kept, and an RSpec is put together from
+    them only the first time it is asked for after a change. The AM's
+    Aggregate calls resource_changed() when a resource's availability
+    changes; only those resources are rendered again."""
+
+    def __init__(self, header, resource_xml, footer, resources):
+        # Functions rendering the RSpec header, a resource, and the footer
+        self._header = header
+        self._resource_xml = resource_xml
+        self._footer = footer
+        # Function returning all the resources to advertise
+        self._resources = resources
+        # Getting the resources may load them, which tells us of each
+        self._lock = threading.RLock()
+        # XML by resource id
+        self._nodes = dict()
+        # Finished RSpecs by (available only, compressed)
+        self._rspecs = dict()
+
+    def invalidate(self):
+        """Forget the RSpecs and the XML of all resources."""
+        with self._lock:
+            self._nodes.clear()
+            self._rspecs.clear()
+
+    def resource_changed(self, resource):
+        """Forget the RSpecs, and the XML of the given resource."""
+        with self._lock:
+            self._nodes.pop(resource.id, None)
+            self._rspecs.clear()
+
+    def _rspec(self, available, compressed):
+        key = (bool(available), bool(compressed))
+        result = self._rspecs.get(key)
+        if result is not None:
+            return result
+        if compressed:
+            result = base64.b64encode(zlib.compress(self._rspec(available, False)))
+        else:
+            xml = list()
+            for r in self._resources():
+                if available and not r.available:
+                    continue
+                node = self._nodes.get(r.id)
+                if node is None:
+                    node = self._resource_xml(r)
+                    self._nodes[r.id] = node
+                xml.append(node)
+            result = self._header() + ''.join(xml) + self._footer()
+        self._rspecs[key] = result
+        return result
+
+    def rspec(self, available=False):
+        """Return the advertisement of all resources, or of only the
+        available ones."""
+        with self._lock:
+            return self._rspec(available, False)
+
+    def compressed(self, available=False):
+        """Return the advertisement zlib compressed and base64 encoded."""
+        with self._lock:
+            return self._rspec(available, True)
@@ -23,21 +23,77 @@
 
 from __future__ import absolute_import
 
+import collections
+import itertools
+
 from .resource import Resource
 
 class Aggregate(object):
+    """The resources of an aggregate, and the containers (slices and
+    users) they are allocated to.
+
+    Resources are indexed by id, and the available ones by type, so
+    allocating, freeing and finding available resources take time in
+    proportion to the number of resources involved, not the size of
+    the aggregate.
 
-    def __init__(self):
+    If given, on_availability_changed is called with each resource
+    whose availability is set (as when it is added, allocated or
+    freed), say to forget a rendered advertisement."""
+
+    def __init__(self, on_availability_changed=None):
         self.resources = []
-        self.containers = {} # of resources, not slivers
+        self.containers = {} # of resources, not slivers; by resource id
+        # Resources by id
+        self._by_id = {}
+        # Available resources by type, by id
+        self._available = {}
+        # Containers by resource id
+        self._containers_of = {}
+        self._on_availability_changed = on_availability_changed
 
     def add_resources(self, resources):
         self.resources.extend(resources)
+        for r in resources:
+            self._by_id[r.id] = r
+            r._pool = self
+            self._availability_changed(r)
+
+    def _availability_changed(self, resource):
+        """Called by a resource when its availability is set."""
+        available = self._available.setdefault(resource.type, collections.OrderedDict())
+        if resource.available:
+            available[resource.id] = resource
+        else:
+            available.pop(resource.id, None)
+        if self._on_availability_changed is not None:
+            self._on_availability_changed(resource)
+
+    def resource(self, resource_id):
+        """Return the resource with the given id, or None."""
+        return self._by_id.get(resource_id)
+
+    def available_count(self, rtype=None):
+        """Return the number of available resources, of the given type
+        or of any type."""
+        if rtype is not None:
+            return len(self._available.get(rtype, ()))
+        return sum(len(available) for available in self._available.values())
+
+    def available_resources(self, rtype=None, count=None):
+        """Return a list of available resources, of the given type or
+        of any type. If count is given, return at most that many."""
+        if rtype is not None:
+            pools = [self._available.get(rtype, {})]
+        else:
+            pools = self._available.values()
+        resources = itertools.chain(*[available.itervalues() for available in pools])
+        return list(itertools.islice(resources, count))
 
     def catalog(self, container=None):
         if container:
             if container in self.containers:
-                return self.containers[container]
+                return self.containers[container].values()
             else:
                 return []
         else:
@@ -45,9 +101,18 @@ class Aggregate(object):
 
     def allocate(self, container, resources):
         if container not in self.containers:
-            self.containers[container] = []
+            self.containers[container] = collections.OrderedDict()
         for r in resources:
-            self.containers[container].append(r)
+            self.containers[container][r.id] = r
+            self._containers_of.setdefault(r.id, set()).add(container)
+
+    def _remove(self, container, resource):
+        self.containers[container].pop(resource.id, None)
+        containers = self._containers_of.get(resource.id)
+        if containers is not None:
+            containers.discard(container)
+            if not containers:
+                del self._containers_of[resource.id]
 
     def deallocate(self, container, resources):
         if container and not self.containers.has_key(container):
@@ -56,29 +121,30 @@ class Aggregate(object):
             return
         if container and resources:
             # deallocate the given resources from the container
+            touched = [container]
             for r in resources:
-                self.containers[container].remove(r)
+                self._remove(container, r)
         elif container:
             # deallocate all the resources in the container
-            container_resources = list(self.containers[container])
-            for r in container_resources:
-                self.containers[container].remove(r)
+            touched = [container]
+            for r in self.containers[container].values():
+                self._remove(container, r)
         elif resources:
             # deallocate the resources from their container
+            touched = set()
             for r in resources:
-                for c in self.containers.values():
-                    if r in c:
-                        c.remove(r)
-        # Finally, check if container is empty. If so, delete it.
-        # Note cache the keys because we will be modifying the dict
-        # inside the loop
-        allkeys = self.containers.keys()
-        for k in allkeys:
-            if not self.containers[k]:
+                for c in list(self._containers_of.get(r.id, ())):
+                    self._remove(c, r)
+                    touched.add(c)
+        else:
+            return
+        # Finally, delete any container that is now empty
+        for k in touched:
+            if k in self.containers and not self.containers[k]:
                 del self.containers[k]
 
     def stop(self, container):
         # Mark the resources as 'SHUTDOWN'
         if container in self.containers:
-            for r in self.containers[container]:
+            for r in self.containers[container].values():
                 r.status = Resource.STATUS_SHUTDOWN
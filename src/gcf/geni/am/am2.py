@@ -47,8 +47,10 @@ import xmlrpclib
 import zlib
 
 from .resource import Resource
+from .advert_cache import AdvertisementCache
 from .aggregate import Aggregate
 from .fakevm import FakeVM
+from .sliver_store import SliverStore
 from ... import geni
 from ..util.urn_util import publicid_to_urn, URN
 from ..util.tz_util import tzd
@@ -77,6 +79,9 @@ RESOURCE_NAMESPACE = 'geni//gpo//gcf'
 
 REFAM_MAXLEASE_DAYS = 365
 
+# Number of fake resources in a new aggregate
+NUM_FAKE_RESOURCES = 3
+
 
 class Slice(object):
     """A slice has a URN, a list of resources, and an expiration time in UTC."""
@@ -127,9 +132,21 @@ class ReferenceAggregateManager(object):
         self._url = url
         self._api_version = 2
         self._am_type = "gcf"
-        self._slices = dict()
-        self._agg = Aggregate()
-        self._agg.add_resources([FakeVM(self._agg) for _ in range(3)])
+        # Slices and resources are recorded in the store given by the
+        # sliver_db option (else in memory), and loaded from there when
+        # first used
+        self._store = SliverStore(kwargs.get('sliver_db'),
+                                  on_rollback=self._forget)
+        # How many fake resources a new aggregate gets
+        self._num_resources = int(kwargs.get('fake_resources') or NUM_FAKE_RESOURCES)
+        self._aggregate = None
+        self._slice_map = None
+        # Rendered advertisement RSpecs, cleared as the availability
+        # of resources changes
+        self._advert = AdvertisementCache(self.advert_header,
+                                          self.advert_resource,
+                                          self.advert_footer,
+                                          lambda: self._agg.catalog(None))
         self._cred_verifier = geni.CredentialVerifier(root_cert)
         self._urn_authority = urn_authority
         self._my_urn = publicid_to_urn("%s %s %s" % (self._urn_authority, 'authority', 'am'))
@@ -137,6 +154,71 @@ class ReferenceAggregateManager(object):
         self.logger = logging.getLogger('gcf.am2')
         self.logger.info("Running %s AM v%d code version %s", self._am_type, self._api_version, GCF_VERSION)
 
+    @property
+    def _slices(self):
+        self._load()
+        return self._slice_map
+
+    @property
+    def _agg(self):
+        self._load()
+        return self._aggregate
+
+    def _load(self):
+        """Build the resources and slices from the store, the first
+        time they are needed. An empty store gets a new set of fake
+        resources."""
+        if self._aggregate is not None:
+            return
+        agg = Aggregate(on_availability_changed=self._advert.resource_changed)
+        rows = self._store.resources()
+        if rows:
+            resources = list()
+            for row in rows:
+                resource = FakeVM(agg)
+                resource.id = row['resource_id']
+                resource.available = row['available']
+                resource.external_id = row['external_id']
+                resource.status = row['status']
+                resources.append(resource)
+        else:
+            resources = [FakeVM(agg) for _ in range(self._num_resources)]
+            self._store.put_resources(resources)
+        agg.add_resources(resources)
+        resources_by_id = dict((r.id, r) for r in resources)
+
+        slices = dict()
+        for row in self._store.slices():
+            the_slice = Slice(row['slice_urn'], row['expiration'])
+            the_slice.id = row['slice_id']
+            slices[the_slice.urn] = the_slice
+        # In v2 each sliver is a resource of the slice
+        for row in self._store.slivers():
+            the_slice = slices.get(row['slice_urn'])
+            resource = resources_by_id.get(row['resource_id'])
+            if the_slice is None or resource is None:
+                self.logger.warning("Ignoring stored sliver %s of unknown slice %s",
+                                    row['sliver_id'], row['slice_urn'])
+                continue
+            the_slice.resources[row['client_id']] = resource.id
+            agg.allocate(the_slice.urn, [resource])
+            if row['user_urn']:
+                agg.allocate(row['user_urn'], [resource])
+        self._slice_map = slices
+        self._aggregate = agg
+        self.logger.info("Loaded %d resources and %d slices from %s",
+                         len(resources), len(slices), self._store.path)
+
+    def _forget(self):
+        """Drop the resources and slices in memory, after a change
+        to the store failed and was rolled back, so that they are
+        loaded again as the store has them."""
+        self.logger.warning("Store change failed: reloading resources and slices from %s",
+                            self._store.path)
+        self._aggregate = None
+        self._slice_map = None
+        self._advert.invalidate()
+
     def GetVersion(self, options):
         '''Specify version information about this AM. That could
         include API version information, RSpec format and version
@@ -242,19 +324,18 @@ class ReferenceAggregateManager(object):
                 # return an empty rspec
                 return self._no_such_slice(slice_urn)
         else:
-            all_resources = self._agg.catalog(None)
+            # The advertisement is only rendered again once resources
+            # have been allocated or freed
             available = 'geni_available' in options and options['geni_available']
-            resource_xml = ""
-            for r in all_resources:
-                if available and not r.available:
-                    continue
-                resource_xml = resource_xml + self.advert_resource(r)
-            result = self.advert_header() + resource_xml + self.advert_footer()
+            result = self._advert.rspec(available)
         self.logger.debug("Result is now \"%s\"", result)
         # Optionally compress the result
         if 'geni_compressed' in options and options['geni_compressed']:
             try:
-                result = base64.b64encode(zlib.compress(result))
+                if slice_urn:
+                    result = base64.b64encode(zlib.compress(result))
+                else:
+                    result = self._advert.compressed(available)
             except Exception, exc:
                 import traceback
                 self.logger.error("Error compressing and encoding resource list: %s", traceback.format_exc())
@@ -300,7 +381,7 @@ class ReferenceAggregateManager(object):
             raise xmlrpclib.Fault('Insufficient privileges', str(e))
 
         # Grab the user_urn
-        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
+        user_urn = gid.get_cached_gid(options['geni_true_caller_cert']).get_urn()
 
         # If we get here, the credentials give the caller
         # all needed privileges to act on the given target.
@@ -321,27 +402,18 @@ class ReferenceAggregateManager(object):
         # EG if both V1 and V2 are supported, and the user gives V2 request,
         # then you must return a V2 request and not V1
 
-        allresources = self._agg.catalog()
-        allrdict = dict()
-        for r in allresources:
-            if r.available:
-                allrdict[r.id] = r
-
         # Note: This only handles unbound nodes. Any attempt by the client
         # to specify a node is ignored.
         resources = dict()
         unbound = list()
         for elem in rspec_dom.documentElement.getElementsByTagName('node'):
             unbound.append(elem)
-        for elem in unbound:
+        available = self._agg.available_resources(count=len(unbound))
+        if len(unbound) > len(available):
+            return self.errorResult(6, 'Too Big: insufficient resources to fulfill request')
+        for elem, r in zip(unbound, available):
             client_id = elem.getAttribute('client_id')
-            keys = allrdict.keys()
-            if keys:
-                rid = keys[0]
-                resources[client_id] = allrdict[rid]
-                del allrdict[rid]
-            else:
-                return self.errorResult(6, 'Too Big: insufficient resources to fulfill request')
+            resources[client_id] = r
 
         # determine max expiration time from credentials
         # do not create a sliver that will outlive the slice!
@@ -359,6 +431,13 @@ class ReferenceAggregateManager(object):
             r.status = Resource.STATUS_READY
             r.available = False
         self._slices[slice_urn] = newslice
+        with self._store.transaction():
+            self._store.put_resources(resources.values())
+            self._store.put_slice(slice_urn, newslice.id, expiration)
+            self._store.put_slivers([dict(sliver_id=r.id, slice_urn=slice_urn,
+                                          resource_id=r.id, client_id=cid,
+                                          user_urn=user_urn, expiration=expiration)
+                                     for cid, r in resources.items()])
 
         self.logger.info("Created new slice %s" % slice_urn)
         result = self.manifest_rspec(slice_urn)
@@ -397,7 +476,7 @@ class ReferenceAggregateManager(object):
             raise xmlrpclib.Fault('Insufficient privileges', str(e))
 
         # Grab the user_urn
-        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
+        user_urn = gid.get_cached_gid(options['geni_true_caller_cert']).get_urn()
 
 
         # If we get here, the credentials give the caller
@@ -412,6 +491,9 @@ class ReferenceAggregateManager(object):
 
             for r in resources:
                 r.reset()
+            with self._store.transaction():
+                self._store.put_resources(resources)
+                self._store.delete_slice(slice_urn)
 
             self._agg.deallocate(slice_urn, None)
             self._agg.deallocate(user_urn, None)
@@ -470,18 +552,18 @@ class ReferenceAggregateManager(object):
             for cid, sliver_uuid in theSlice.resources.items():
                 resource = None
                 sliver_urn = None
-                for res in self._agg.resources:
-                    if res.id == sliver_uuid:
-                        self.logger.debug('Resource = %s', str(res))
-                        resources.append(res)
-                        sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
-                        # Gather the status of all the resources
-                        # in the sliver. This could be actually
-                        # communicating with the resources, or simply
-                        # reporting the state of initialized, started, stopped, ...
-                        res_status.append(dict(geni_urn=sliver_urn,
-                                               geni_status=res.status,
-                                               geni_error=''))
+                res = self._agg.resource(sliver_uuid)
+                if res is not None:
+                    self.logger.debug('Resource = %s', str(res))
+                    resources.append(res)
+                    sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
+                    # Gather the status of all the resources
+                    # in the sliver. This could be actually
+                    # communicating with the resources, or simply
+                    # reporting the state of initialized, started, stopped, ...
+                    res_status.append(dict(geni_urn=sliver_urn,
+                                           geni_status=res.status,
+                                           geni_error=''))
             self.logger.info("Calculated and returning slice %s status", slice_urn)
             result = dict(geni_urn=slice_urn,
                           geni_status=theSlice.status(resources),
@@ -543,6 +625,7 @@ class ReferenceAggregateManager(object):
                     return self.errorResult(19, "Out of range: Expiration %s is out of range (AM policy limits renewals to %s)." % (expiration_time, self.max_lease))
                     
             sliver.expiration = requested
+            self._store.put_slice(slice_urn, sliver.id, requested)
             return self.successResult(True, requested)
 
         else:
@@ -566,6 +649,7 @@ class ReferenceAggregateManager(object):
             resources = self._agg.catalog(slice_urn)
             for resource in resources:
                 resource.status = Resource.STATUS_SHUTDOWN
+            self._store.put_resources(resources)
             self.logger.info("Sliver %r shut down" % slice_urn)
             return self.successResult(True)
         else:
@@ -672,10 +756,10 @@ class ReferenceAggregateManager(object):
         for cid, res_uuid in self._slices[slice_urn].resources.items():
             resource = None
             sliver_urn = None
-            for res in self._agg.resources:
-                if res.id == res_uuid:
-                    sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
-                    resource_urn = res.urn(self._urn_authority)
+            res = self._agg.resource(res_uuid)
+            if res is not None:
+                sliver_urn = res.sliver_urn(self._urn_authority, slivername) 
+                resource_urn = res.urn(self._urn_authority)
             result = result + tmpl % (cid, resource_urn, self._my_urn, sliver_urn)
         return result
 
@@ -854,7 +938,7 @@ class AggregateManagerServer(object):
                  trust_roots_dir=None,
                  ca_certs=None, base_name=None,
                  authorizer=None, resource_manager=None,
-                 delegate=None):
+                 delegate=None, sliver_db=None, fake_resources=None):
         # ca_certs arg here must be a file of concatenated certs
         if ca_certs is None:
             raise Exception('Missing CA Certs')
@@ -864,8 +948,9 @@ class AggregateManagerServer(object):
         # Decode the addr into a URL. Is there a pythonic way to do this?
         server_url = "https://%s:%d/" % addr
         if delegate is None:
-            delegate = ReferenceAggregateManager(trust_roots_dir, base_name, 
-                                                 server_url)
+            delegate = ReferenceAggregateManager(trust_roots_dir, base_name,
+                                                 server_url, sliver_db=sliver_db,
+                                                 fake_resources=fake_resources)
         # FIXME: set logRequests=true if --debug
         self._server = SecureXMLRPCServer(addr, keyfile=keyfile,
                                           certfile=certfile, ca_certs=ca_certs)
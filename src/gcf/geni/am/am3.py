@@ -47,8 +47,10 @@ import xml.dom.minidom as minidom
 import xmlrpclib
 import zlib
 
+from .advert_cache import AdvertisementCache
 from .aggregate import Aggregate
 from .fakevm import FakeVM
+from .sliver_store import SliverStore
 from ... import geni
 from ..util.tz_util import tzd
 from ..util.urn_util import publicid_to_urn
@@ -93,6 +95,9 @@ REFAM_MAXLEASE_MINUTES = 7 * 24 * 60
 # Expiration on Allocated resources is 10 minutes.
 ALLOCATE_EXPIRATION_SECONDS = 10 * 60
 
+# Number of fake resources in a new aggregate
+NUM_FAKE_RESOURCES = 20
+
 # GENI Allocation States
 STATE_GENI_UNALLOCATED = 'geni_unallocated'
 STATE_GENI_ALLOCATED = 'geni_allocated'
@@ -283,15 +288,142 @@ class ReferenceAggregateManager(object):
         self._cred_verifier = geni.CredentialVerifier(root_cert)
         self._api_version = 3
         self._am_type = "gcf"
-        self._slices = dict()
-        self._agg = Aggregate()
-        self._agg.add_resources([FakeVM(self._agg) for _ in range(20)])
+        # Slices, slivers and resources are recorded in the store given
+        # by the sliver_db option (else in memory), and loaded from there
+        # when first used
+        self._store = SliverStore(kwargs.get('sliver_db'),
+                                  on_rollback=self._forget)
+        # How many fake resources a new aggregate gets
+        self._num_resources = int(kwargs.get('fake_resources') or NUM_FAKE_RESOURCES)
+        self._aggregate = None
+        self._slice_map = None
+        # Slivers by sliver URN
+        self._sliver_map = None
+        # Rendered advertisement RSpecs, cleared as the availability
+        # of resources changes
+        self._advert = AdvertisementCache(self.advert_header,
+                                          self.advert_resource,
+                                          self.advert_footer,
+                                          lambda: self._agg.catalog(None))
         self._my_urn = publicid_to_urn("%s %s %s" % (self._urn_authority, 'authority', 'am'))
         self.max_lease = datetime.timedelta(minutes=REFAM_MAXLEASE_MINUTES)
         self.max_alloc = datetime.timedelta(seconds=ALLOCATE_EXPIRATION_SECONDS)
         self.logger = logging.getLogger('gcf.am3')
         self.logger.info("Running %s AM v%d code version %s", self._am_type, self._api_version, GCF_VERSION)
 
+    @property
+    def _slices(self):
+        self._load()
+        return self._slice_map
+
+    @property
+    def _agg(self):
+        self._load()
+        return self._aggregate
+
+    def _load(self):
+        """Build the resources, slices and slivers from the store, the
+        first time they are needed. An empty store gets a new set of
+        fake resources."""
+        if self._aggregate is not None:
+            return
+        agg = Aggregate(on_availability_changed=self._advert.resource_changed)
+        rows = self._store.resources()
+        if rows:
+            resources = list()
+            for row in rows:
+                resource = FakeVM(agg)
+                resource.id = row['resource_id']
+                resource.available = row['available']
+                resource.external_id = row['external_id']
+                resource.status = row['status']
+                resources.append(resource)
+        else:
+            resources = [FakeVM(agg) for _ in range(self._num_resources)]
+            self._store.put_resources(resources)
+        agg.add_resources(resources)
+        resources_by_id = dict((r.id, r) for r in resources)
+
+        slices = dict()
+        shutdown = list()
+        for row in self._store.slices():
+            the_slice = Slice(row['slice_urn'])
+            the_slice.id = row['slice_id']
+            slices[the_slice.urn] = the_slice
+            if row['shutdown']:
+                shutdown.append(the_slice)
+        slivers = dict()
+        for row in self._store.slivers():
+            the_slice = slices.get(row['slice_urn'])
+            resource = resources_by_id.get(row['resource_id'])
+            if the_slice is None or resource is None:
+                self.logger.warning("Ignoring stored sliver %s of unknown slice %s or resource %s",
+                                    row['sliver_id'], row['slice_urn'], row['resource_id'])
+                continue
+            sliver = the_slice.add_resource(resource)
+            sliver._urn = row['sliver_id']
+            sliver._id = urn.URN(urn=row['sliver_id']).getName()
+            sliver.setExpiration(row['expiration'])
+            sliver.setStartTime(row['start_time'])
+            sliver.setEndTime(row['end_time'])
+            sliver.setAllocationState(row['allocation_state'])
+            sliver.setOperationalState(row['operational_state'])
+            agg.allocate(the_slice.urn, [resource])
+            if row['user_urn']:
+                agg.allocate(row['user_urn'], [resource])
+            slivers[sliver.urn()] = sliver
+        for the_slice in shutdown:
+            the_slice.shutdown()
+        self._slice_map = slices
+        self._sliver_map = slivers
+        self._aggregate = agg
+        self.logger.info("Loaded %d resources, %d slices and %d slivers from %s",
+                         len(resources), len(slices), len(slivers), self._store.path)
+
+    def _forget(self):
+        """Drop the resources, slices and slivers in memory, after a change
+        to the store failed and was rolled back, so that they are
+        loaded again as the store has them."""
+        self.logger.warning("Store change failed: reloading resources, slices and slivers from %s",
+                            self._store.path)
+        self._aggregate = None
+        self._slice_map = None
+        self._sliver_map = None
+        self._advert.invalidate()
+
+    def _sliver_record(self, sliver):
+        return dict(sliver_id=sliver.urn(),
+                    slice_urn=sliver.slice().urn,
+                    resource_id=sliver.resource().id,
+                    client_id=sliver.resource().external_id,
+                    expiration=sliver.expiration(),
+                    start_time=sliver.startTime(),
+                    end_time=sliver.endTime(),
+                    allocation_state=sliver.allocationState(),
+                    operational_state=sliver.operationalState())
+
+    def _save_slivers(self, slivers):
+        """Record the new times and states of the given slivers."""
+        self._store.update_slivers([self._sliver_record(s) for s in slivers])
+
+    def _delete_slivers(self, slivers):
+        """Delete the given slivers, and any slices left empty."""
+        with self._store.transaction():
+            resources = [sliver.resource() for sliver in slivers]
+            for sliver in slivers:
+                slyce = sliver.slice()
+                slyce.delete_sliver(sliver)
+                self._sliver_map.pop(sliver.urn(), None)
+                # If slice is now empty, delete it.
+                if not slyce.slivers() and slyce.urn in self._slice_map:
+                    self.logger.debug("Deleting empty slice %r", slyce.urn)
+                    del self._slice_map[slyce.urn]
+                    self._store.delete_slice(slyce.urn)
+            self._store.delete_slivers([sliver.urn() for sliver in slivers])
+            self._store.put_resources(resources)
+        # Expired slivers are still in their slice and user's containers
+        self._agg.deallocate(None, resources)
+
     def GetVersion(self, options):
         '''Specify version information about this AM. That could
         include API version information, RSpec format and version
@@ -398,18 +530,14 @@ class ReferenceAggregateManager(object):
 #                # return an empty rspec
 #                return self._no_such_slice(slice_urn)
 #        else:
-        all_resources = self._agg.catalog(None)
+        # The advertisement is only rendered again once resources have
+        # been allocated or freed
         available = 'geni_available' in options and options['geni_available']
-        resource_xml = ""
-        for r in all_resources:
-            if available and not r.available:
-                continue
-            resource_xml = resource_xml + self.advert_resource(r)
-        result = self.advert_header() + resource_xml + self.advert_footer()
+        result = self._advert.rspec(available)
         # Optionally compress the result
         if 'geni_compressed' in options and options['geni_compressed']:
             try:
-                result = base64.b64encode(zlib.compress(result))
+                result = self._advert.compressed(available)
             except Exception, exc:
                 self.logger.error("Error compressing and encoding resource list: %s", traceback.format_exc())
                 raise Exception("Server error compressing resource list", exc)
@@ -438,7 +566,7 @@ class ReferenceAggregateManager(object):
         # all needed privileges to act on the given target.
 
         # Grab the user_urn
-        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
+        user_urn = gid.get_cached_gid(options['geni_true_caller_cert']).get_urn()
 
 
         rspec_dom = None
@@ -455,13 +583,12 @@ class ReferenceAggregateManager(object):
         # EG if both V1 and V2 are supported, and the user gives V2 request,
         # then you must return a V2 manifest and not V1
 
-        available = self.resources(available=True)
-
         # Note: This only handles unbound nodes. Any attempt by the client
         # to specify a node is ignored.
         unbound = list()
         for elem in rspec_dom.documentElement.getElementsByTagName('node'):
             unbound.append(elem)
+        available = self._agg.available_resources(count=len(unbound))
         if len(unbound) > len(available):
             # There aren't enough resources
             self.logger.error('Too big: requesting %d resources but I only have %d',
@@ -470,9 +597,8 @@ class ReferenceAggregateManager(object):
                                     'Too Big: insufficient resources to fulfill request')
 
         resources = list()
-        for elem in unbound:
+        for elem, resource in zip(unbound, available):
             client_id = elem.getAttribute('client_id')
-            resource = available.pop(0)
             resource.external_id = client_id
             resource.available = False
             resources.append(resource)
@@ -533,15 +659,23 @@ class ReferenceAggregateManager(object):
         else:
             newslice = Slice(slice_urn)
 
+        new_slivers = list()
         for resource in resources:
             sliver = newslice.add_resource(resource)
             sliver.setExpiration(expiration)
             sliver.setStartTime(start_time)
             sliver.setEndTime(end_time)
             sliver.setAllocationState(STATE_GENI_ALLOCATED)
+            new_slivers.append(sliver)
+            self._sliver_map[sliver.urn()] = sliver
         self._agg.allocate(slice_urn, newslice.resources())
         self._agg.allocate(user_urn, newslice.resources())
         self._slices[slice_urn] = newslice
+        with self._store.transaction():
+            self._store.put_resources(resources)
+            self._store.put_slice(slice_urn, newslice.id, shutdown=newslice.isShutdown())
+            self._store.put_slivers([dict(self._sliver_record(s), user_urn=user_urn)
+                                     for s in new_slivers])
 
         # Log the allocation
         self.logger.info("Allocated new slice %s" % slice_urn)
@@ -622,6 +756,7 @@ class ReferenceAggregateManager(object):
             sliver.setExpiration(expiration)
             sliver.setAllocationState(STATE_GENI_PROVISIONED)
             sliver.setOperationalState(OPSTATE_GENI_NOT_READY)
+        self._save_slivers(slivers)
         result = dict(geni_rspec=self.manifest_rspec(the_slice.urn),
                       geni_slivers=[s.status() for s in slivers])
         return self.successResult(result)
@@ -638,7 +773,7 @@ class ReferenceAggregateManager(object):
         self.getVerifiedCredentials(the_slice.urn, credentials, options, privileges)
 
         # Grab the user_urn
-        user_urn = gid.GID(string=options['geni_true_caller_cert']).get_urn()
+        user_urn = gid.get_cached_gid(options['geni_true_caller_cert']).get_urn()
 
         # If we get here, the credentials give the caller
         # all needed privileges to act on the given target.
@@ -651,13 +786,7 @@ class ReferenceAggregateManager(object):
         resources = [sliver.resource() for sliver in slivers]
         self._agg.deallocate(the_slice.urn, resources)
         self._agg.deallocate(user_urn, resources)
-        for sliver in slivers:
-            slyce = sliver.slice()
-            slyce.delete_sliver(sliver)
-            # If slice is now empty, delete it.
-            if not slyce.slivers():
-                self.logger.debug("Deleting empty slice %r", slyce.urn)
-                del self._slices[slyce.urn]
+        self._delete_slivers(slivers)
         return self.successResult([s.status() for s in slivers])
 
     def PerformOperationalAction(self, urns, credentials, action, options):
@@ -732,6 +861,7 @@ class ReferenceAggregateManager(object):
                 # This should have been caught above
                 msg = "Unsupported: action %s is not supported" % (action)
                 raise ApiErrorException(AM_API.UNSUPPORTED, msg)
+        self._save_slivers(slivers)
         return self.successResult([s.status(errors[s.urn()])
                                    for s in slivers])
 
@@ -884,6 +1014,7 @@ class ReferenceAggregateManager(object):
                 sliver.setExpiration(requested)
                 end_time = max(sliver.endTime(), requested)
                 sliver.setEndTime(end_time)
+            self._save_slivers(slivers)
 
         geni_slivers = [s.status() for s in slivers]
         return self.successResult(geni_slivers)
@@ -905,6 +1036,7 @@ class ReferenceAggregateManager(object):
             self.logger.error('Slice %s is already shut down.', slice_urn)
             return self.errorResult(AM_API.FORBIDDEN, "Already shut down.")
         the_slice.shutdown()
+        self._store.put_slice(the_slice.urn, the_slice.id, shutdown=True)
         return self.successResult(True)
 
     def successResult(self, value):
@@ -1061,6 +1193,8 @@ class ReferenceAggregateManager(object):
         it is interpreted as boolean and only resources whose availability
         matches will be included in the returned list.
         """
+        if available is True:
+            return self._agg.available_resources()
         result = self._agg.catalog()
         if available is not None:
             result = [r for r in result if r.available is available]
@@ -1079,24 +1213,20 @@ class ReferenceAggregateManager(object):
         should be run by a daemon, but until then, it is called at the
         beginning of all methods.
         """
-        expired = list()
+        self._load()
         now = datetime.datetime.utcnow()
-        for slyce in self._slices.values():
-            for sliver in slyce.slivers():
-                self.logger.debug('Checking sliver %s (expiration = %r) at %r',
-                                  sliver.urn(), sliver.expiration(), now)
-                if sliver.expiration() < now:
-                    self.logger.debug('Expring sliver %s (expiration = %r) at %r',
-                                      sliver.urn(), sliver.expiration(), now)
-                    expired.append(sliver)
+        # Find the expired slivers by the index on expiration in the
+        # store, rather than checking every sliver
+        expired = list()
+        for sliver_urn in self._store.expired_slivers(now):
+            sliver = self._sliver_map.get(sliver_urn)
+            if sliver is not None:
+                self.logger.debug('Expiring sliver %s (expiration = %r) at %r',
+                                  sliver_urn, sliver.expiration(), now)
+                expired.append(sliver)
         self.logger.info('Expiring %d slivers', len(expired))
-        for sliver in expired:
-            slyce = sliver.slice()
-            slyce.delete_sliver(sliver)
-            # If slice is now empty, delete it.
-            if not slyce.slivers():
-                self.logger.debug("Deleting empty slice %r", slyce.urn)
-                del self._slices[slyce.urn]
+        if expired:
+            self._delete_slivers(expired)
 
     def decode_urns(self, urns, **kwargs):
         """Several methods need to map URNs to slivers and/or deduce
@@ -1110,6 +1240,7 @@ class ReferenceAggregateManager(object):
 
         Returns a slice and a list of slivers.
         """
+        self._load()
         slivers = list()
         for urn_str in urns:
             myurn = urn.URN(urn=urn_str)
@@ -1122,15 +1253,7 @@ class ReferenceAggregateManager(object):
                     raise ApiErrorException(AM_API.SEARCH_FAILED,
                                             'Unknown slice "%s"' % (urn_str))
             elif urn_type == 'sliver':
-                # Gross linear search. Maybe keep a map of known sliver urns?
-                needle = None
-                for a_slice in self._slices.values():
-                    for sliver in a_slice.slivers():
-                        if sliver.urn() == urn_str:
-                            needle = sliver
-                            break
-                    if needle:
-                        break
+                needle = self._sliver_map.get(urn_str)
                 if needle:
                     slivers.append(needle)
                 else:
@@ -1386,7 +1509,7 @@ class AggregateManagerServer(object):
                  trust_roots_dir=None,
                  ca_certs=None, base_name=None,
                  authorizer=None, resource_manager=None,
-                 delegate=None):
+                 delegate=None, sliver_db=None, fake_resources=None):
         # ca_certs arg here must be a file of concatenated certs
         if ca_certs is None:
             raise Exception('Missing CA Certs')
@@ -1397,7 +1520,8 @@ class AggregateManagerServer(object):
         server_url = "https://%s:%d/" % addr
         if delegate is None:
             delegate = ReferenceAggregateManager(trust_roots_dir, base_name,
-                                                 server_url)
+                                                 server_url, sliver_db=sliver_db,
+                                                 fake_resources=fake_resources)
 
         # FIXED: set logRequests=true if --debug
         logRequest=logging.getLogger().getEffectiveLevel()==logging.DEBUG
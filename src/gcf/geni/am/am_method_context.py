@@ -26,10 +26,11 @@ from __future__ import absolute_import
 import os
 import traceback
 
-from ...sfa.trust.gid import GID
+from ...sfa.trust.gid import get_cached_gid
 from ...sfa.trust.credential import Credential
 from ...sfa.trust.certificate import Certificate
 from ...sfa.trust.abac_credential import ABACCredential
+from ..util.log_util import LogSummary
 from ..util.speaksfor_util import determine_speaks_for
 from ..SecureThreadedXMLRPCServer import SecureThreadedXMLRPCRequestHandler
 from .api_error_exception import ApiErrorException
@@ -59,7 +60,7 @@ class AMMethodContext:
         self._options = options
 #        self._caller_cert = self._aggregate_manager._delegate._server.pem_cert
         self._caller_cert = aggregate_manager._delegate._server.get_pem_cert()
-        self._caller_urn = GID(string=self._caller_cert).get_urn()
+        self._caller_urn = get_cached_gid(self._caller_cert).get_urn()
         self._is_v3 = is_v3
         self._resource_bindings = resource_bindings
         self._result = None
@@ -68,9 +69,11 @@ class AMMethodContext:
     # This method is called prior to the 'with AMMethodContext' block
     def __enter__(self):
         try:
-            self._logger.info("AM Invocation: %s %s %s %s" % \
-                                  (self._method_name, self._caller_urn, 
-                                   self._args, self._options))
+            # Arguments include whole credentials and RSpecs: log a
+            # summary, and only render it if the message is logged
+            self._logger.info("AM Invocation: %s %s %s %s",
+                              self._method_name, self._caller_urn,
+                              LogSummary(self._args), LogSummary(self._options))
             credentials = self._credentials
 
 
@@ -84,7 +87,7 @@ class AMMethodContext:
 #                                      (self._args, self._options))
 
             # Change client cert if valid speaks-for invocation
-            caller_gid = GID(string=self._caller_cert)
+            caller_gid = get_cached_gid(self._caller_cert)
             new_caller_gid = determine_speaks_for(self._logger,
                                                    credentials,
                                                    caller_gid,
@@ -160,8 +163,8 @@ class AMMethodContext:
             self._logger.error("Generic Error in %s" % self._method_name)
             self._handleError(value)
 
-        self._logger.info("Result from %s: %s", self._method_name, 
-                          self._result)
+        self._logger.info("Result from %s: %s", self._method_name,
+                          LogSummary(self._result))
 
     # Return a GENI_style error return for given exception/traceback
     def _errorReturn(self, e):
@@ -47,8 +47,11 @@ deleteSliver = 'deleteSliver.sh'      # shell script that deletes sliver
 # Files in the sliceSpecificScripts subdirectory
 sliceSpecificScriptsDir = gibDirectory + '/sliceSpecificScripts'
 manifestFile = 'gib-manifest.rspec'   # Slice manifest is written to this file
-shellScriptFile = 'createSliver.sh'   # Shell script generated to create and
-                                      #     configure the sliver
+shellScriptFile = 'createSliver.sh'   # Shell scripts generated to create and
+                                      #     configure the sliver are named
+                                      #     after this (createSliver-*.sh)
+provisioningThreads = 3               # Max number of scripts creating the
+                                      #     sliver to run at once
 
 # Figure out the Linux distribution: Red Hat Fedora or Ubuntu
 _version = open('/proc/version').read()
@@ -25,11 +25,14 @@ from __future__ import absolute_import
 
 import logging
 import os
-import subprocess
 
 from . import resources
 from . import rspec_handler
 from . import config
+from .provisioner import Provisioner
+
+# Runs the scripts that create and delete slivers in the background
+_provisioner = Provisioner(config.provisioningThreads)
 
 # GENI-in-a-box specific createSliver
 def createSliver(slice_urn, requestRspec, users) :
@@ -38,13 +41,18 @@ def createSliver(slice_urn, requestRspec, users) :
     """
     config.logger.info("createSliver called")
 
+    # Wait for any earlier sliver to finish being deleted, since the scripts
+    #    that deleted it are about to be rewritten
+    _provisioner.wait()
+
     # Parse the request rspec
     rspec_handler.parseRequestRspec(slice_urn, requestRspec)
 
     # Provision the sliver i.e. assign resource as specifed in the request rspec
     #    The sliver isn't created yet.  The shell commands used to create
-    #    the sliver are written into the file named in config.py
-    resources.provisionSliver(users)
+    #    the sliver are written into the files named in config.py
+    if not resources.provisionSliver(users) :
+        return 'Failed to write the scripts that create the sliver'
 
     # Generate the manifest rspec.  The manifest is written to the file named
     #    in config.py
@@ -55,28 +63,22 @@ def createSliver(slice_urn, requestRspec, users) :
     #    such as manifest rspec, slice name, etc.
     resources.specialFiles()
 
-    ## Execute the shell script that create a new sliver
-    pathToFile = config.sliceSpecificScriptsDir + '/' + config.shellScriptFile
-    command = 'echo \"%s\" | sudo -S %s' % (config.rootPwd, pathToFile)
-    print command
-    os.system(command)
+    ## Execute the shell scripts that create a new sliver.  This returns
+    #    at once; the hosts are 'configuring' until their scripts finish.
+    _provisioner.createSliver(resources.provisioningSteps())
 
 
 def deleteSliver() :
     """
        Delete the sliver created on this aggregate.
     """
-    config.logger.info("createSliver called")
+    config.logger.info("deleteSliver called")
 
-    # Invoke the deleteSliver script in the standardScipts directory
+    # Invoke the deleteSliver script in the standardScipts directory, in
+    #    the background once any script creating the sliver finishes
     pathToFile = config.standardScriptsDir + '/' + config.deleteSliver
-    command = 'echo \"%s\" | sudo -S %s %s %s' % (config.rootPwd,
-                                                  pathToFile,
-                                                  config.homeDirectory,
-                                                  config.sliceSpecificScriptsDir
-                                               )
-    print command
-    os.system(command)
+    _provisioner.deleteSliver(pathToFile, config.homeDirectory,
+                              config.sliceSpecificScriptsDir)
 
     # Delete the file containing the manifest rspec
     pathToFile = config.sliceSpecificScriptsDir + '/' + config.manifestFile
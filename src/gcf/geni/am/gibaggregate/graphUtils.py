@@ -21,6 +21,8 @@
 # IN THE WORK.
 #----------------------------------------------------------------------
 
+import collections
+
 
 class GraphNode(object) :
     """ This is the base class for all the objects that correspond to 
@@ -38,30 +40,93 @@ class GraphNode(object) :
         pass
 
 
-def findShortestPath(startNode, endNode, pathSoFar =[]) :
-    """ Find the shortest path between the specified GraphNode objects 
-        that form the nodes of a graph.
+class ShortestPaths(object) :
+    """ Finds shortest paths between the GraphNode objects of a graph.
+
+        The neighbors of every node reachable from the given nodes are
+        indexed once, when this object is created.  Each breadth first
+        search from a node gives the shortest paths from that node to all
+        others, and is remembered, so asking for many paths from the same
+        nodes costs one search per start node.  For small graphs the
+        searches from every node are done up front.
     """
-    # Add this node to the path explored so far
-    pathSoFar = pathSoFar + [startNode]
+    # Graphs with at most this many nodes get all their paths precomputed
+    ALL_PAIRS_MAX_NODES = 200
+
+    def __init__(self, nodes, allPairs=None) :
+        self._neighbors = {}     # Map of node to list of its neighbors
+        self._predecessors = {}  # Map of start node to the map of each
+                                 #    node reachable from it to the node
+                                 #    before it on a shortest path
+        for node in nodes :
+            self._index(node)
+        if allPairs is None :
+            allPairs = len(self._neighbors) <= self.ALL_PAIRS_MAX_NODES
+        if allPairs :
+            for node in self._neighbors.keys() :
+                self._search(node)
 
-    if startNode == endNode :
-        # Found path to the endNode!
-        return pathSoFar
+    def _index(self, startNode) :
+        """ Index the neighbors of the given node and all nodes reachable
+            from it.
+        """
+        toVisit = [startNode]
+        while toVisit :
+            node = toVisit.pop()
+            if node in self._neighbors :
+                continue
+            neighbors = [neighbor for neighbor in (node.getNeighbors() or [])
+                         if neighbor is not None]
+            self._neighbors[node] = neighbors
+            toVisit.extend(neighbors)
 
-    # Path from here to the endNode.  We currently don't have such a path
-    pathFromHere =  None
+    def _search(self, startNode, avoid=None) :
+        """ Breadth first search from the given node, not going through
+            any of the nodes to avoid.  Returns the map of reachable nodes
+            to their predecessors.
+        """
+        if not avoid and startNode in self._predecessors :
+            return self._predecessors[startNode]
+        self._index(startNode)
+        predecessors = {startNode : None}
+        queue = collections.deque([startNode])
+        while queue :
+            node = queue.popleft()
+            for neighbor in self._neighbors[node] :
+                if neighbor not in predecessors and \
+                        (not avoid or neighbor not in avoid) :
+                    predecessors[neighbor] = node
+                    queue.append(neighbor)
+        if not avoid :
+            self._predecessors[startNode] = predecessors
+        return predecessors
 
-    # See if we can get to the endNode through one of our neighbors
-    neighbors = startNode.getNeighbors() 
-    for i in range(len(neighbors)) :
-        if neighbors[i] not in pathSoFar :
-            pathThruNeighbor = findShortestPath(neighbors[i], endNode, \
-                                                    pathSoFar)
-            if pathThruNeighbor != None :
-                if (pathFromHere == None) or (len(pathThruNeighbor) < \
-                                                  len(pathFromHere)) :
-                    # Found a new or shorter path to the endNode 
-                    pathFromHere = pathThruNeighbor
+    def findShortestPath(self, startNode, endNode, avoid=None) :
+        """ Return the list of nodes on a shortest path from startNode to
+            endNode (including both), or None if there is no such path.
+        """
+        predecessors = self._search(startNode, avoid)
+        if endNode not in predecessors :
+            return None
+        path = []
+        node = endNode
+        while node is not None :
+            path.append(node)
+            node = predecessors[node]
+        path.reverse()
+        return path
 
-    return pathFromHere
+
+def findShortestPath(startNode, endNode, pathSoFar=None) :
+    """ Find the shortest path between the specified GraphNode objects 
+        that form the nodes of a graph.  If pathSoFar is given, the path
+        found does not go through those nodes and is appended to them.
+
+        To find many paths in the same graph, use a ShortestPaths object.
+    """
+    pathSoFar = pathSoFar or []
+    path = ShortestPaths([startNode], allPairs=False).findShortestPath( \
+        startNode, endNode, set(pathSoFar))
+    if path is None :
+        return None
+    return pathSoFar + path
@@ -0,0 +1,155 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# Runs the scripts that create and delete GENI-in-a-box slivers in the
+#    background, so that the aggregate manager can answer other calls
+#    (e.g. SliverStatus) while containers are being set up.
+
+from __future__ import absolute_import
+
+import Queue
+import subprocess
+import threading
+
+from . import config
+
+class Provisioner(object) :
+    """ Runs sliver operations (creating or deleting a sliver) one at a
+        time, in the order they are requested, on a background thread.
+        Creating a sliver is a series of steps (see 
+        resources.provisioningSteps); the scripts within a step run
+        concurrently on a bounded pool of threads.
+
+        Each host's status is kept on its VMNode: 'configuring' from when
+        the sliver is requested, then 'ready' or 'failed' as its scripts 
+        finish.
+    """
+    def __init__(self, numThreads) :
+        self._operations = Queue.Queue()  # Sliver operations to run in order
+        self._tasks = Queue.Queue()       # Scripts for the pool to run
+        self._generation = 0              # Changed to cancel earlier operations
+        self._lock = threading.Lock()
+
+        thread = threading.Thread(target=self._runOperations, 
+                                  name='gib-provisioner')
+        thread.daemon = True
+        thread.start()
+        for i in range(max(1, numThreads)) :
+            thread = threading.Thread(target=self._runTasks, 
+                                      name='gib-provisioner-%d' % i)
+            thread.daemon = True
+            thread.start()
+
+    def createSliver(self, steps) :
+        """ Run the given steps in the background to create a sliver.
+            Returns at once.
+        """
+        for step in steps :
+            for (hostObject, script) in step :
+                if hostObject is not None :
+                    hostObject.status = 'configuring'
+        with self._lock :
+            generation = self._generation
+        self._operations.put((self._createSliver, (steps, generation)))
+
+    def deleteSliver(self, script, *args) :
+        """ Run the given script in the background to delete the sliver,
+            once any script already running finishes.  Steps not yet started
+            to create the sliver are skipped.  Returns at once.
+        """
+        with self._lock :
+            self._generation += 1
+        self._operations.put((self._runScript, (script,) + args))
+
+    def wait(self) :
+        """ Wait for all requested sliver operations to finish. """
+        self._operations.join()
+
+    def _runOperations(self) :
+        while True :
+            (operation, args) = self._operations.get()
+            try :
+                operation(*args)
+            except Exception, e :
+                config.logger.exception("Sliver operation failed: %s" % e)
+            finally :
+                self._operations.task_done()
+
+    def _runTasks(self) :
+        while True :
+            (hostObject, script, results) = self._tasks.get()
+            try :
+                results.put((hostObject, self._runScript(script)))
+            except Exception, e :
+                config.logger.exception("Script %s failed: %s" % (script, e))
+                results.put((hostObject, -1))
+
+    def _createSliver(self, steps, generation) :
+        allHosts = set()
+        for step in steps :
+            for (hostObject, script) in step :
+                if hostObject is not None :
+                    allHosts.add(hostObject)
+        failedHosts = set()
+        for step in steps :
+            with self._lock :
+                if generation != self._generation :
+                    config.logger.info("Sliver deleted before it was created")
+                    return
+            # Skip scripts for hosts that have already failed
+            step = [(hostObject, script) for (hostObject, script) in step 
+                    if hostObject not in failedHosts]
+            results = Queue.Queue()
+            for (hostObject, script) in step :
+                self._tasks.put((hostObject, script, results))
+            for i in range(len(step)) :
+                (hostObject, returnCode) = results.get()
+                if returnCode == 0 :
+                    continue
+                if hostObject is None :
+                    # A script for all hosts failed: so does every host
+                    failedHosts.update(allHosts)
+                else :
+                    failedHosts.add(hostObject)
+            for hostObject in failedHosts :
+                hostObject.status = 'failed'
+        for hostObject in allHosts - failedHosts :
+            hostObject.status = 'ready'
+
+    def _runScript(self, script, *args) :
+        """ Run the given script as root.  Return its exit status. """
+        command = ['sudo', '-S', script] + list(args)
+        config.logger.info("Running %s" % ' '.join(command))
+        try :
+            process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+            output = process.communicate(config.rootPwd + '\n')[0]
+        except OSError, e :
+            config.logger.error("Failed to run %s: %s" % (script, e))
+            return -1
+        config.logger.debug("%s output:\n%s" % (script, output))
+        if process.returncode != 0 :
+            config.logger.error("%s exited with status %d" % 
+                                (script, process.returncode))
+        return process.returncode
@@ -55,6 +55,8 @@ class VMNode(GraphNode) :
         self.executeList = [] # List of commands to be executed on startup
         self.componentID = '' # component ID for the resource
         self.sliverURN = ''   # sliver urn
+        self.status = 'unknown' # sliver status: unknown, configuring, ready
+                                #    or failed. Set by the provisioner.
 
     def getNeighbors(self) :
         return self.NICs 
@@ -136,6 +138,86 @@ class executeItem :
         self.shell = 'sh'      # Shell used to execute command
 
 
+class SliverScripts(object) :
+    """
+        The bash scripts that create and set up the sliver.  Steps that
+        involve all hosts (deleting any old sliver, setting up the bridges
+        that make up the links) go in the 'setup' and 'network' scripts.
+        Each host gets a script that creates its container and one that
+        configures it once the network is up, so that the hosts can be set
+        up concurrently (see provisioner.py).
+
+        write() writes to the script last chosen with select().
+    """
+    SETUP = 'setup'
+    NETWORK = 'network'
+    CREATE = 'create'
+    CONFIGURE = 'configure'
+
+    def __init__(self) :
+        self.scriptFiles = {}    # Map of script names to open files
+        self.scriptFile = None   # The script being written
+
+    @staticmethod
+    def scriptPath(name) :
+        return '%s/%s-%s.sh' % (config.sliceSpecificScriptsDir,
+                                os.path.splitext(config.shellScriptFile)[0],
+                                name)
+
+    @staticmethod
+    def hostScriptName(hostObject, phase) :
+        return 'pc%s-%s' % (hostObject.containerName, phase)
+
+    def select(self, name, hostObject=None) :
+        """ Choose the script to write: SETUP or NETWORK, or CREATE or
+            CONFIGURE for the given host.  Raises IOError if the script
+            file cannot be created.
+        """
+        if hostObject is not None :
+            name = self.hostScriptName(hostObject, name)
+        if name not in self.scriptFiles :
+            pathToFile = self.scriptPath(name)
+            self.scriptFiles[name] = open(pathToFile, 'w')
+            os.chmod(pathToFile, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+            self._writeHeader(self.scriptFiles[name], name)
+        self.scriptFile = self.scriptFiles[name]
+
+    def _writeHeader(self, scriptFile, name) :
+        scriptFile.write('#!/bin/bash \n\n')
+        scriptFile.write('# This script is auto-generated by the aggregate\n')
+        scriptFile.write('#    manager in response to a createSliver call \n\n')
+        if not name.endswith(self.CONFIGURE) :
+            return
+        scriptFile.write('## Function definitions\n')
+        scriptFile.write('pingNode () {  # pings specified PC to check if it is alive \n')
+        scriptFile.write('    pingAttempts=0 \n')
+        scriptFile.write('    echo \"Pinging VM 10.0.1.$1...\" \n')
+        scriptFile.write('    ping -c2 10.0.1.$1 \n')
+        scriptFile.write('    while [ $? -ne 0 ] && [ $pingAttempts -le 50 ] \n')
+        scriptFile.write('    do \n')
+        scriptFile.write('        sleep 10  # sleep for 10 more seconds \n')
+        scriptFile.write('        let \"pingAttempts += 1\" \n')
+        scriptFile.write('        echo \"Pinging VM 10.0.1.$1...\" \n')
+        scriptFile.write('        ping -c2 10.0.1.$1 \n')
+        scriptFile.write('    done \n')
+        scriptFile.write('    if [ $pingAttempts -gt 20 ] \n')
+        scriptFile.write('    then \n')
+        scriptFile.write('        return 1  # failed to ping PC \n')
+        scriptFile.write('    else \n')
+        scriptFile.write('        return 0  # success \n')
+        scriptFile.write('    fi \n')
+        scriptFile.write('} \n\n')
+
+    def write(self, text) :
+        self.scriptFile.write(text)
+
+    def close(self) :
+        for scriptFile in self.scriptFiles.values() :
+            scriptFile.close()
+        self.scriptFiles = {}
+        self.scriptFile = None
+
+
 experimentHosts = {}    # Map of container names (e.g. 101) to corresponding
                         #    VMNode objects
 experimentLinks = []    # List of links specified by the experimenter 
@@ -237,90 +319,60 @@ def _annotateGraph() :
 
 
 def _generateBashScript(users) :
-    ''' Generate the Bash script that is run to actually create and set up the
-            Virtual Machines and networks used in the experiment.
+    ''' Generate the Bash scripts that are run to actually create and set up
+            the Virtual Machines and networks used in the experiment.
+            Return False if they could not be written.
     '''
-    # Create the file into which the script will be written
-    pathToFile = config.sliceSpecificScriptsDir + '/' + config.shellScriptFile
+    scriptFile = SliverScripts()
     try:
-        scriptFile = open(pathToFile, 'w')
-    except IOError:
-        config.logger.error("Failed to open file that creates sliver: %s" %
-                            pathToFile)
-        return None
-
-    # Make this file executable
-    os.chmod(pathToFile, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-    
-    # Start creating the script
-    scriptFile.write('#!/bin/bash \n\n')
-
-    scriptFile.write('# This script is auto-generated by the aggregate\n')
-    scriptFile.write('#    manager in response to a createSliver call \n\n')
-
-    scriptFile.write('## Function definitions\n')
-    scriptFile.write('pingNode () {  # pings specified PC to check if it is alive \n')
-    scriptFile.write('    pingAttempts=0 \n')
-    scriptFile.write('    echo \"Pinging VM 10.0.1.$1...\" \n')
-    scriptFile.write('    ping -c2 10.0.1.$1 \n')
-    scriptFile.write('    while [ $? -ne 0 ] && [ $pingAttempts -le 50 ] \n')
-    scriptFile.write('    do \n')
-    scriptFile.write('        sleep 10  # sleep for 10 more seconds \n')
-    scriptFile.write('        let \"pingAttempts += 1\" \n')
-    scriptFile.write('        echo \"Pinging VM 10.0.1.$1...\" \n')
-    scriptFile.write('        ping -c2 10.0.1.$1 \n')
-    scriptFile.write('    done \n')
-    scriptFile.write('    if [ $pingAttempts -gt 20 ] \n')
-    scriptFile.write('    then \n')
-    scriptFile.write('        return 1  # failed to ping PC \n')
-    scriptFile.write('    else \n')
-    scriptFile.write('        return 0  # success \n')
-    scriptFile.write('    fi \n')
-    scriptFile.write('} \n')
-
+        _writeScripts(scriptFile, users)
+    except IOError, e:
+        config.logger.error("Failed to write scripts that create sliver: %s" %
+                            e)
+        return False
+    finally:
+        scriptFile.close()
+    return True
+
+
+def _writeScripts(scriptFile, users) :
+    scriptFile.select(SliverScripts.SETUP)
     scriptFile.write('\n## Delete any existing sliver. \n')
     scriptFile.write('%s/%s %s %s\n' % (config.standardScriptsDir,
                                         config.deleteSliver,
                                         config.homeDirectory,
                                         config.sliceSpecificScriptsDir))
 
-    hostNames = experimentHosts.keys()
+    scriptFile.write('\n# Turn off firewall on host \n')
+    scriptFile.write('/etc/init.d/iptables stop \n')
 
-    # Set the sliver status for each host to "unknown"
-    scriptFile.write('\n# Setting sliver status of hosts to unknown \n')
-    for i in range(len(hostNames)) :
-        hostObject = experimentHosts[hostNames[i]]
-        statusFileName = '%s/pc%s.status' % (config.sliceSpecificScriptsDir, 
-                                             hostObject.containerName)
-        scriptFile.write('echo \"unknown\" > %s \n' % statusFileName)
-    
+    hostNames = experimentHosts.keys()
 
     # Create container templates
-    scriptFile.write('\n## Define containers for each of the hosts in the experiment.\n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CREATE, hostObject)
+        scriptFile.write('\n## Define container for host %s\n' %
+                         hostObject.nodeName)
 
         if config.distro == 'UBUNTU10-STD' : 
             scriptFile.write('vzctl create %s --ostemplate ubuntu-10.04-x86\n' % hostObject.containerName)
         else :
             scriptFile.write('vzctl create %s --ostemplate fedora-15-x86 --config basic\n' % hostObject.containerName)
             
-    scriptFile.write('\n## Set up host names and control network IP addresses for the containers. \n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CREATE, hostObject)
+        scriptFile.write('\n## Set up host name and control network IP address for the container. \n')
         scriptFile.write('vzctl set %s --hostname %s --save \n' % 
                          (hostObject.containerName, hostObject.nodeName))
         scriptFile.write('vzctl set %s --ipadd 10.0.1.%s --save\n' %
                          (hostObject.containerName, hostObject.containerName))
 
-
-    scriptFile.write('\n# Turn off firewall on host \n')
-    scriptFile.write('/etc/init.d/iptables stop \n')
-
-    scriptFile.write('\n## Set up interfaces on the hosts and connect them to the appropriate bridges \n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
-        scriptFile.write('# Set up interfaces for host %s \n' % 
+        scriptFile.select(SliverScripts.CREATE, hostObject)
+        scriptFile.write('\n## Set up interfaces on host %s and connect them to the appropriate bridges \n' % 
                          hostObject.nodeName)
         
         # for each NIC on host set up the interface
@@ -329,11 +381,13 @@ def _generateBashScript(users) :
             scriptFile.write('vzctl set %d --netif_add eth%d,%s,%s,FE:FF:FF:FF:FF:FF,%s --save \n' % (hostObject.containerName, nicObject.deviceNumber, nicObject.macAddress, nicObject.virtualEthName, nicObject.link.bridgeID))
         scriptFile.write('\n')
 
-    scriptFile.write('\n## Start up the hosts (containers) \n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CREATE, hostObject)
+        scriptFile.write('\n## Start up the host (container) \n')
         scriptFile.write('vzctl start %s \n' % hostObject.containerName)
         
+    scriptFile.select(SliverScripts.NETWORK)
     scriptFile.write('\n## Configure bridges on host \n')
     for i in range(len(experimentLinks)) :
         linkObject = experimentLinks[i]
@@ -347,28 +401,36 @@ def _generateBashScript(users) :
         
         scriptFile.write('ifconfig %s 0 \n\n' % linkObject.bridgeID)
                              
+    # Turn on forwarding and arp proxing on the virtual eth devices created
+    #    in the host OS (container 0)
+    scriptFile.write('\n# Turn on forwarding and arp proxing on the virtual eth devices created on the host OS \n')
+    nicNames = experimentNICs.keys()
+    for i in range(len(nicNames)) :
+        nicObject = experimentNICs[nicNames[i]]
+        scriptFile.write('ifconfig %s 0 \n' % nicObject.virtualEthName)
+        scriptFile.write('echo 1 > /proc/sys/net/ipv4/conf/%s/forwarding \n' \
+                             % nicObject.virtualEthName)
+        scriptFile.write('echo 1 > /proc/sys/net/ipv4/conf/%s/proxy_arp \n' \
+                             % nicObject.virtualEthName)
+        scriptFile.write('\n')
+
     scriptFile.write('\n## Give the hosts 30 seconds to start up \n')
     scriptFile.write('sleep 30 \n\n')
-    scriptFile.write('# Ping hosts to make sure they are up.  Give them more time if necessary.\n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CONFIGURE, hostObject)
+        scriptFile.write('# Ping host to make sure it is up.  Give it more time if necessary.\n')
         scriptFile.write('pingNode %d \n' % hostObject.containerName)
         scriptFile.write('if [ $? -ne 0 ] \n')
         scriptFile.write('then \n')
         scriptFile.write('    echo \"Container %d failed to start up.\" \n' % hostObject.containerName)
-        statusFileName = '%s/pc%s.status' % (config.sliceSpecificScriptsDir, 
-                                             hostObject.containerName)
-        scriptFile.write('    echo \"failed\" > %s \n' % statusFileName)
-        scriptFile.write('else \n')
-        statusFileName = '%s/pc%s.status' % (config.sliceSpecificScriptsDir, 
-                                             hostObject.containerName)
-        scriptFile.write('    echo \"configuring\" > %s \n' % statusFileName)
+        scriptFile.write('    exit 1 \n')
         scriptFile.write('fi \n')
         
-    scriptFile.write('\n## Set up interfaces on each host (container) \n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
-        scriptFile.write('# Set up interfaces on PC %s\n' % hostObject.nodeName)
+        scriptFile.select(SliverScripts.CONFIGURE, hostObject)
+        scriptFile.write('\n## Set up interfaces on PC %s\n' % hostObject.nodeName)
         
         # Set up ethernet devices on the container
         for j in range(len(hostObject.NICs)) :
@@ -389,11 +451,12 @@ def _generateBashScript(users) :
 
 
     # Now we are ready to set up the IP routing tables on each container
-    scriptFile.write('\n## Set up IP routing tables on each host \n');
+    paths = graphUtils.ShortestPaths(experimentHosts.values())
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CONFIGURE, hostObject)
     
-        scriptFile.write('# Set up IP routing table for %s\n' % \
+        scriptFile.write('\n## Set up IP routing table for %s\n' % \
                              hostObject.nodeName)
 
         # Turn on IP forwarding so host (container) can forward IP packets
@@ -451,7 +514,7 @@ def _generateBashScript(users) :
             linkObject = notDirectlyConnectedLinks[j]
 
             # Find the shortest path from this host to this subnet (linkObject)
-            path = graphUtils.findShortestPath(hostObject, linkObject)
+            path = paths.findShortestPath(hostObject, linkObject)
             if path != None :
                 # We found a path from this host to the subnet (link)
                 #    Path is a NIC -> Link -> NIC -> Host (gateway) -> ...
@@ -464,30 +527,18 @@ def _generateBashScript(users) :
 
         scriptFile.write('\n')
 
-    # Turn on forwarding and arp proxing on the virtual eth devices created
-    #    in the host OS (container 0)
-    scriptFile.write('\n# Turn on forwarding and arp proxing on the virtual eth devices created on the host OS \n')
-    nicNames = experimentNICs.keys()
-    for i in range(len(nicNames)) :
-        nicObject = experimentNICs[nicNames[i]]
-        scriptFile.write('ifconfig %s 0 \n' % nicObject.virtualEthName)
-        scriptFile.write('echo 1 > /proc/sys/net/ipv4/conf/%s/forwarding \n' \
-                             % nicObject.virtualEthName)
-        scriptFile.write('echo 1 > /proc/sys/net/ipv4/conf/%s/proxy_arp \n' \
-                             % nicObject.virtualEthName)
-        scriptFile.write('\n')
-
     # Set up DNS entries on the containers so they can reference one another
     #    by name and can also reference hosts on the external network by name
-    scriptFile.write('\n# Set up DNS on the hosts.  Use Google DNS.\n')
-    scriptFile.write('PRIMARYDNS=\"nameserver 8.8.8.8\" \n')
-    scriptFile.write('SECONDARYDNS=\"nameserver 8.8.4.4\" \n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CONFIGURE, hostObject)
+        scriptFile.write('\n# Set up DNS on the host.  Use Google DNS.\n')
+        scriptFile.write('PRIMARYDNS=\"nameserver 8.8.8.8\" \n')
+        scriptFile.write('SECONDARYDNS=\"nameserver 8.8.4.4\" \n')
         scriptFile.write('vzctl exec %s \"echo order host,bind >> /etc/host.conf\" \n' % hostObject.containerName)
         scriptFile.write('vzctl exec %s \"echo $PRIMARYDNS >> /etc/resolv.conf\" \n' % hostObject.containerName)
         scriptFile.write('vzctl exec %s \"echo $SECONDARYDNS >> /etc/resolv.conf\" \n' % hostObject.containerName)
-    scriptFile.write('\n')
+        scriptFile.write('\n')
 
     # Add hostname and IP addresses to /etc/hosts.  For each host we pick
     #    IP address to add to this file.  We arbitrarily pick the IP address
@@ -495,9 +546,10 @@ def _generateBashScript(users) :
     #    with the host.  Examples of how hosts can be addressed: client_id,
     #    pc101, client_id.sliceName.geni-in-a-box.net or 
     #    pc101.geni-in-a-box.net.
-    scriptFile.write('# Add host names and IP addresses to /etc/hosts \n')
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CONFIGURE, hostObject)
+        scriptFile.write('# Add host names and IP addresses to /etc/hosts \n')
         # In the /etc/hosts for this host add an entry for every host
         for j in range(len(hostNames)) :
             hostObject2 = experimentHosts[hostNames[j]]
@@ -531,6 +583,7 @@ def _generateBashScript(users) :
     # Go through each host and find out what needs to be installed
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+        scriptFile.select(SliverScripts.CONFIGURE, hostObject)
         installList = hostObject.installList
         if len(installList) != 0 :
             scriptFile.write('# Install experimenter specified software on host %s \n' % hostObject.nodeName)
@@ -678,23 +731,23 @@ def _generateBashScript(users) :
             
         scriptFile.write('\n')
 
-    scriptFile.close()
-
 
 def specialFiles() :
-    # Re-open the file containing the bash script in append mode
-    pathToFile = config.sliceSpecificScriptsDir + '/' + config.shellScriptFile
-    try:
-        scriptFile = open(pathToFile, 'a')
-    except IOError:
-        config.logger.error("Failed to re-open file that creates sliver: %s" %
-                            pathToFile)
-        return None
-
-    scriptFile.write('\n# Set up special files that contain slice info. \n')
     hostNames = experimentHosts.keys()
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
+
+        # Re-open the host's configuration script in append mode
+        pathToFile = SliverScripts.scriptPath( \
+            SliverScripts.hostScriptName(hostObject, SliverScripts.CONFIGURE))
+        try:
+            scriptFile = open(pathToFile, 'a')
+        except IOError:
+            config.logger.error("Failed to re-open file that creates sliver: %s" %
+                                pathToFile)
+            return None
+
+        scriptFile.write('\n# Set up special files that contain slice info. \n')
         
         # Put the slice manifest in the VMs 
         # Figure out name of destination directory for manifest.  Create that
@@ -721,15 +774,9 @@ def specialFiles() :
                                                     sliceName)
         scriptFile.write('echo \"%s\" > %s/nickname \n' % (fileContents, dest))
 
-        # Set status of the node to ready
-        scriptFile.write('# Set node status to ready \n')
-        statusFileName = '%s/pc%s.status' % (config.sliceSpecificScriptsDir, 
-                                             hostObject.containerName)
-        scriptFile.write('echo \"ready\" > %s \n' % statusFileName)
-
-        scriptFile.write('\n')
-        
-    scriptFile.close()
+        # The host is ready when this script exits successfully
+        scriptFile.write('exit 0 \n')
+        scriptFile.close()
 
 
 def freeResources() :
@@ -758,33 +805,46 @@ def getResourceStatus() :
     hostNames = experimentHosts.keys()
     for i in range(len(hostNames)) :
         hostObject = experimentHosts[hostNames[i]]
-        resStatusFile = '%s/pc%s.status' % (config.sliceSpecificScriptsDir, 
-                                             hostObject.containerName)
-        try :
-            f = open(resStatusFile, 'r')
-            resStatus.append(dict(geni_urn = hostObject.sliverURN,
-                                  geni_status = f.readline().strip('\n'),
-                                  geni_error = ''))
-            f.close()
-        except :
-            resStatus.append(dict(geni_urn = hostObject.sliverURN,
-                                  geni_status = "unknown",
-                                  geni_error = ''))
+        resStatus.append(dict(geni_urn = hostObject.sliverURN,
+                              geni_status = hostObject.status,
+                              geni_error = ''))
 
     return resStatus
 
 
+def provisioningSteps() :
+    """
+        Return the steps that create the sliver, in the order they must
+        be run.  Each step is a list of (VMNode, script) pairs whose
+        scripts may run concurrently.  The VMNode is None for scripts
+        that involve all hosts.
+    """
+    hosts = [experimentHosts[hostName] for hostName in 
+             sorted(experimentHosts.keys())]
+    return [[(None, SliverScripts.scriptPath(SliverScripts.SETUP))],
+            [(hostObject, SliverScripts.scriptPath( \
+                        SliverScripts.hostScriptName(hostObject, 
+                                                     SliverScripts.CREATE)))
+             for hostObject in hosts],
+            [(None, SliverScripts.scriptPath(SliverScripts.NETWORK))],
+            [(hostObject, SliverScripts.scriptPath( \
+                        SliverScripts.hostScriptName(hostObject, 
+                                                     SliverScripts.CONFIGURE)))
+             for hostObject in hosts]]
+
+
 
 def provisionSliver(users) :
     """
         Provision the sliver.  First fill in missing information in the
         VMNode, NIC and Link objects created when parsing the request rspec.
-        Then generate the bash script that, when run, will create and configure
-        the OpenVZ containers.
+        Then generate the bash scripts that, when run, will create and 
+        configure the OpenVZ containers.  Return False if the scripts could
+        not be written.
     """
     # Fill in missing information in VMNode, NIC and Link objects
     _annotateGraph()
 
-    # Generate the bash script
-    _generateBashScript(users)
+    # Generate the bash scripts
+    return _generateBashScript(users)
     
@@ -52,6 +52,9 @@ class Resource(object):
     def __init__(self, rid, rtype):
         self.id = rid
         self.type = rtype
+        # The Aggregate this resource was added to, told when the
+        # resource's availability changes
+        self._pool = None
         self.available = True
         self.external_id = None
         # For V2 AMs
@@ -60,6 +63,16 @@ class Resource(object):
         self.state = Resource.STATE_GENI_UNALLOCATED
         self.operational_state = None
 
+    @property
+    def available(self):
+        return self._available
+
+    @available.setter
+    def available(self, value):
+        self._available = value
+        if self._pool is not None:
+            self._pool._availability_changed(self)
+
     def urn(self, auth="geni//gpo//gcf"):
         publicid = 'IDN %s %s %s' % (auth, self.type, str(self.id))
         return geni.publicid_to_urn(publicid)
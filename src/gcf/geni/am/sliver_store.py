@@ -0,0 +1,254 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''
+Resource, slice and sliver state of the reference aggregate managers,
+backed by sqlite.
+'''
+
+from __future__ import absolute_import
+
+import calendar
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+
+class SliverStore(object):
+    """The resources, slices and slivers of a reference aggregate
+    manager, with slivers indexed by slice URN and expiration.
+
+    The AM keeps working from its objects in memory; it records each
+    change here, and rebuilds its objects from here when it starts.
+    With no path the store lives in memory, so nothing survives a
+    restart, as has always been the case. Given a path, the state is
+    kept in a sqlite database (in WAL mode), so an AM can be restarted
+    without losing allocations.
+
+    In AM API v2 a slice's slivers are its resources, so there the
+    sliver_id is the resource id. In v3 it is the sliver URN.
+
+    A change that fails is rolled back, and then on_rollback (if given)
+    is called with no arguments: the AM has already changed its objects
+    in memory, so it drops them to load them again from here."""
+
+    def __init__(self, path=None, on_rollback=None):
+        self.logger = logging.getLogger('gcf.am.slivers')
+        self._on_rollback = on_rollback
+        if path:
+            path = os.path.expanduser(path)
+        else:
+            path = ':memory:'
+        self.path = path
+        self._lock = threading.RLock()
+        # How many transaction() blocks we are inside
+        self._depth = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # With WAL a commit is still atomic and durable against an AM
+            # crash without syncing to disk on every commit
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS resources (
+                                resource_id TEXT PRIMARY KEY,
+                                type TEXT NOT NULL,
+                                available INTEGER NOT NULL,
+                                external_id TEXT,
+                                status TEXT)''')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS slices (
+                                slice_urn TEXT PRIMARY KEY,
+                                slice_id TEXT NOT NULL,
+                                expiration INTEGER,
+                                shutdown INTEGER NOT NULL DEFAULT 0)''')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS slivers (
+                                sliver_id TEXT PRIMARY KEY,
+                                slice_urn TEXT NOT NULL,
+                                resource_id TEXT NOT NULL,
+                                client_id TEXT,
+                                user_urn TEXT,
+                                expiration INTEGER,
+                                start_time INTEGER,
+                                end_time INTEGER,
+                                allocation_state TEXT,
+                                operational_state TEXT)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slivers_slice ON slivers (slice_urn)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slivers_expiration ON slivers (expiration)')
+        self._conn.commit()
+
+    @staticmethod
+    def _timestamp(dt):
+        """Microseconds since the epoch of the given naive UTC datetime."""
+        if dt is None:
+            return None
+        return calendar.timegm(dt.timetuple()) * 1000000 + dt.microsecond
+
+    @staticmethod
+    def _datetime(timestamp):
+        if timestamp is None:
+            return None
+        return datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=timestamp)
+
+    def transaction(self):
+        """Return a context manager in which all changes are committed
+        together (or not at all) when the block ends."""
+        return _Transaction(self)
+
+    def _rollback(self):
+        try:
+            self._conn.rollback()
+        finally:
+            if self._on_rollback is not None:
+                self._on_rollback()
+
+    def _execute(self, sql, args=()):
+        with self.transaction():
+            return self._conn.execute(sql, args)
+
+    def _executemany(self, sql, rows):
+        with self.transaction():
+            return self._conn.executemany(sql, rows)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def put_resources(self, resources):
+        """Record (or replace) the given Resource objects."""
+        self._executemany('INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?)',
+                          [(str(r.id), r.type, int(bool(r.available)),
+                            r.external_id, r.status) for r in resources])
+
+    def resources(self):
+        """Return a list of dicts of the recorded resources."""
+        rows = self._query('SELECT resource_id, type, available, external_id, status FROM resources')
+        return [dict(resource_id=str(row[0]), type=str(row[1]), available=bool(row[2]),
+                     external_id=row[3], status=row[4]) for row in rows]
+
+    def put_slice(self, slice_urn, slice_id, expiration=None, shutdown=False):
+        """Record (or replace) a slice."""
+        self._execute('INSERT OR REPLACE INTO slices VALUES (?, ?, ?, ?)',
+                      (slice_urn, slice_id, self._timestamp(expiration), int(bool(shutdown))))
+
+    def delete_slice(self, slice_urn):
+        """Remove the given slice and its slivers."""
+        with self.transaction():
+            self._execute('DELETE FROM slivers WHERE slice_urn = ?', (slice_urn,))
+            self._execute('DELETE FROM slices WHERE slice_urn = ?', (slice_urn,))
+
+    def slices(self):
+        """Return a list of dicts of the recorded slices."""
+        rows = self._query('SELECT slice_urn, slice_id, expiration, shutdown FROM slices')
+        return [dict(slice_urn=str(row[0]), slice_id=str(row[1]),
+                     expiration=self._datetime(row[2]), shutdown=bool(row[3]))
+                for row in rows]
+
+    def put_slivers(self, slivers):
+        """Record (or replace) slivers, each a dict with the sliver_id,
+        slice_urn, resource_id, client_id, user_urn, expiration,
+        start_time, end_time, allocation_state and operational_state."""
+        self._executemany('INSERT OR REPLACE INTO slivers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                          [(s['sliver_id'], s['slice_urn'], str(s['resource_id']),
+                            s.get('client_id'), s.get('user_urn'),
+                            self._timestamp(s.get('expiration')),
+                            self._timestamp(s.get('start_time')),
+                            self._timestamp(s.get('end_time')),
+                            s.get('allocation_state'), s.get('operational_state'))
+                           for s in slivers])
+
+    def update_slivers(self, slivers):
+        """Record the new times and states of the given slivers, each a
+        dict as for put_slivers. The slice, resource, client_id and
+        user_urn of a sliver do not change."""
+        self._executemany('''UPDATE slivers SET expiration = ?, start_time = ?, end_time = ?,
+                                                allocation_state = ?, operational_state = ?
+                             WHERE sliver_id = ?''',
+                          [(self._timestamp(s.get('expiration')),
+                            self._timestamp(s.get('start_time')),
+                            self._timestamp(s.get('end_time')),
+                            s.get('allocation_state'), s.get('operational_state'),
+                            s['sliver_id'])
+                           for s in slivers])
+
+    def delete_slivers(self, sliver_ids):
+        self._executemany('DELETE FROM slivers WHERE sliver_id = ?',
+                          [(sliver_id,) for sliver_id in sliver_ids])
+
+    def _sliver_dicts(self, rows):
+        return [dict(sliver_id=str(row[0]), slice_urn=str(row[1]), resource_id=str(row[2]),
+                     client_id=row[3], user_urn=row[4],
+                     expiration=self._datetime(row[5]),
+                     start_time=self._datetime(row[6]),
+                     end_time=self._datetime(row[7]),
+                     allocation_state=row[8], operational_state=row[9])
+                for row in rows]
+
+    def slivers(self, slice_urn=None):
+        """Return a list of dicts of the recorded slivers, of the given
+        slice or of all slices."""
+        sql = 'SELECT * FROM slivers'
+        args = ()
+        if slice_urn is not None:
+            sql += ' WHERE slice_urn = ?'
+            args = (slice_urn,)
+        return self._sliver_dicts(self._query(sql, args))
+
+    def expired_slivers(self, now=None):
+        """Return the ids of the slivers that expired before now."""
+        if now is None:
+            now = datetime.datetime.utcnow()
+        rows = self._query('SELECT sliver_id FROM slivers WHERE expiration < ?',
+                           (self._timestamp(now),))
+        return [str(row[0]) for row in rows]
+
+    def __len__(self):
+        """The number of slivers."""
+        return self._query('SELECT COUNT(*) FROM slivers')[0][0]
+
+class _Transaction(object):
+    """Commits when the outermost block ends, or rolls back (and tells
+    the store's owner) if it ends with an exception."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __enter__(self):
+        self._store._lock.acquire()
+        self._store._depth += 1
+        return self._store
+
+    def __exit__(self, exc_type, exc_value, tb):
+        store = self._store
+        try:
+            store._depth -= 1
+            if store._depth == 0:
+                if exc_type is None:
+                    try:
+                        store._conn.commit()
+                    except:
+                        store._rollback()
+                        raise
+                else:
+                    store._rollback()
+        finally:
+            store._lock.release()
+        return False
@@ -89,7 +89,7 @@ class ABAC_Authorizer(Base_Authorizer):
 
     # Find the correct set of rules for the given caller based on authority
     def lookup_rules_for_caller(self, caller):
-        caller_urn = gid.GID(string=caller).get_urn()
+        caller_urn = gid.get_cached_gid(caller).get_urn()
         caller_authority = convert_user_urn_to_authority_urn(caller_urn)
         caller_authority_name = caller_authority.split('+')[1]
         rules = self._DEFAULT_RULES
@@ -340,7 +340,7 @@ class ABAC_Authorizer(Base_Authorizer):
     @staticmethod
     def _compute_keyid(cert_string=None, cert_filename=None):
         if cert_string:
-            cert_gid = gid.GID(string=cert_string)
+            cert_gid = gid.get_cached_gid(cert_string)
         else:
             cert_gid = gid.GID(filename=cert_filename)
         extension_names = [ext[0] for ext in cert_gid.get_extensions()]
@@ -24,7 +24,10 @@
 from __future__ import absolute_import
 
 import optparse
+import os
+import signal
 import sys
+import time
 import SocketServer
 import SimpleXMLRPCServer
 
@@ -32,7 +35,71 @@ from util import getInstanceFromClassname
 
 class AsyncXMLRPCServer(SocketServer.ThreadingMixIn,
                         SimpleXMLRPCServer.SimpleXMLRPCServer):
-    pass
+    # Connections waiting to be accepted, by any worker
+    request_queue_size = 128
+
+# Restart a worker that dies no sooner than this many seconds after it
+# was started, so a worker that fails on start up does not spin
+WORKER_RESTART_SECONDS = 1
+
+def _start_worker(server):
+    """Fork a worker process that serves requests on the server's
+    socket until it is killed. Return its pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+    # In the worker
+    status = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        server.serve_forever()
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+def serve_workers(server, workers):
+    """Serve requests from the given number of worker processes, which
+    all accept connections on the server's listening socket. Each
+    worker has its own copy of the authorizer, so its caches stay warm
+    across the calls it handles. Workers that die are restarted. Runs
+    until this process is interrupted or terminated, then stops the
+    workers."""
+    def terminate(signum, frame):
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, terminate)
+
+    started = dict() # start time by worker pid
+    try:
+        for _ in range(workers):
+            started[_start_worker(server)] = time.time()
+        while True:
+            pid, status = os.wait()
+            if pid not in started:
+                continue
+            if os.WIFSIGNALED(status):
+                print "Authorizer worker %d was killed by signal %d" % (pid, os.WTERMSIG(status))
+            else:
+                print "Authorizer worker %d exited with status %d" % (pid, os.WEXITSTATUS(status))
+            if time.time() - started.pop(pid) < WORKER_RESTART_SECONDS:
+                time.sleep(WORKER_RESTART_SECONDS)
+            started[_start_worker(server)] = time.time()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in started:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in started:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
 
 def parse_args(argv):
     parser = optparse.OptionParser()
@@ -48,6 +115,10 @@ def parse_args(argv):
     parser.add_option("--argument_guard",
                       help="class name for argument guard",
                       default=None)
+    parser.add_option("--workers", type="int", default=1,
+                      help="number of worker processes to serve requests. " + \
+                          "Authorization is CPU bound, so use one per core. " + \
+                          "Default is 1: serve from threads of this process")
 
     opts = parser.parse_args()[0]
     if not opts.port and \
@@ -55,6 +126,8 @@ def parse_args(argv):
             not opts.trusted_roots:
         parser.print_help()
         sys.exit()
+    if opts.workers > 1 and not hasattr(os, 'fork'):
+        sys.exit("--workers is not supported on this platform")
 
     return opts
 
@@ -79,7 +152,15 @@ def main():
     server.register_instance(authorizer)
     print "Authorizer Server [%s] [%s] running on port %s..." % \
         (opts.authorizer, opts.authorizer_policy_map_file, opts.port)
-    server.serve_forever()
+    sys.stdout.flush()
+    if opts.workers > 1:
+        # The authorizer is set up once here, and each worker
+        # starts with a copy
+        print "Serving from %d worker processes" % opts.workers
+        sys.stdout.flush()
+        serve_workers(server, opts.workers)
+    else:
+        server.serve_forever()
 
 
 if __name__ == "__main__":
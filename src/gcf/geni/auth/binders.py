@@ -63,7 +63,7 @@ class Standard_Binder(Base_Binder):
 
         bindings['$METHOD'] = method
 
-        caller_urn = gid.GID(string=caller).get_urn()
+        caller_urn = gid.get_cached_gid(caller).get_urn()
         bindings['$CALLER'] = caller_urn
 
         if 'slice_urn' in args:
@@ -58,7 +58,7 @@ class Resource_Binder(Base_Binder):
     def generate_bindings(self, method, caller, creds, args, opts,
                           requested_state = []):
         measurement_states = {}
-        self._user_urn = gid.GID(string=caller).get_urn()
+        self._user_urn = gid.get_cached_gid(caller).get_urn()
         self._authority_urn = \
             convert_user_urn_to_authority_urn(self._user_urn)
 
@@ -42,6 +42,7 @@ from .util import cred_util
 from .util import cert_util
 from .util.tz_util import tzd
 from .util import urn_util
+from .util.slice_registry import SliceRegistry
 from ..sfa.trust import gid
 
 # Variable to turn on multi-threaded CH server
@@ -111,13 +112,29 @@ class SampleClearinghouseServer(object):
     def CreateUserCredential(self, cert):
         return self._delegate.CreateUserCredential(cert)
 
+    def CreateUserCredentials(self, certs):
+        '''Return a user credential for each of the given user certs,
+        in order.'''
+        return self._delegate.CreateUserCredentials(certs)
+
+    def ListSliverInfo(self, urn):
+        '''List the slivers recorded for the given slice URN, returning
+        a dict by sliver URN of SLIVER_INFO_* fields.'''
+        return self._delegate.ListSliverInfo(urn)
+
+    def UpdateSliverInfo(self, changes):
+        '''Create, update and delete many sliver records in one call.
+        Return a list with the result of each change.'''
+        return self._delegate.UpdateSliverInfo(changes)
+
 
 class Clearinghouse(object):
 
     def __init__(self):
         self.logger = cred_util.logging.getLogger('gcf-ch')
-        self.slices = {}
+        self.slices = SliceRegistry()
         self.aggs = []
+        self.signer = None
 
     def load_aggregates(self):
         """Loads aggregates from the clearinghouse section of the config file.
@@ -150,6 +167,17 @@ class Clearinghouse(object):
             self.logger.info("Registering AM %s at %s", urn, url)
             self.aggs.append((urn, url))
         
+    def load_slice_registry(self):
+        """Keep slices in the sqlite database named by slice_db in the
+        clearinghouse section of the config file, if any, so they
+        survive a restart. Otherwise slices are kept in memory."""
+        slice_db = self.config['clearinghouse'].get('slice_db')
+        if slice_db:
+            self.slices = SliceRegistry(slice_db)
+            self.logger.info("Loaded %d slices from %s", len(self.slices), self.slices.path)
+        purge_interval = int(self.config['clearinghouse'].get('slice_purge_interval', 300))
+        self.slices.start_purger(purge_interval)
+
     def runserver(self, addr, keyfile=None, certfile=None,
                   ca_certs=None, authority=None,
                   user_len=None, slice_len=None, config=None):
@@ -172,6 +200,11 @@ class Clearinghouse(object):
             self.logger.info("Using only my CH cert as a trusted root cert")
 
         self.trusted_root_files = cred_util.CredentialVerifier(ca_certs).root_cert_files
+
+        # Load the CH key once to sign credentials in process
+        self.signer = cred_util.make_credential_signer(keyfile, certfile)
+
+        self.load_slice_registry()
             
         if not os.path.exists(os.path.expanduser(ca_certs)):
             raise Exception("Missing CA cert(s): %s" % ca_certs)
@@ -247,10 +280,12 @@ class Clearinghouse(object):
         self.logger.info("Called CreateSlice URN REQ %r" % urn_req)
         slice_gid = None
 
-        if urn_req and self.slices.has_key(urn_req):
+        slice_cred = None
+        if urn_req:
+            slice_cred = self.slices.get(urn_req)
+        if slice_cred is not None:
             # If the Slice has expired, treat this as
             # a request to renew
-            slice_cred = self.slices[urn_req]
             slice_exp = self._naiveUTC(slice_cred.expiration)
             if slice_exp <= datetime.datetime.utcnow():
                 # Need to renew this slice
@@ -333,13 +368,14 @@ class Clearinghouse(object):
             raise Exception('CreateSlice failed to get slice credential for user %r, slice %r' % (user_gid.get_hrn(), slice_gid.get_hrn()), exc)
         self.logger.info('Created slice %r' % (urn))
         
-        self.slices[urn] = slice_cred
+        self.slices.put(slice_cred)
         
         return slice_cred.save_to_string()
     
     def RenewSlice(self, slice_urn, expire_str):
         self.logger.info("Called RenewSlice(%s, %s)", slice_urn, expire_str)
-        if not self.slices.has_key(slice_urn):
+        slice_cred = self.slices.get(slice_urn)
+        if slice_cred is None:
             self.logger.warning('Slice %s was not found', slice_urn)
             return False
         try:
@@ -366,7 +402,6 @@ class Clearinghouse(object):
         else:
             user_gid = gid.GID(string=self._server.pem_cert)
 
-        slice_cred = self.slices[slice_urn]
         slice_gid = slice_cred.get_gid_object()
         # if original slice' privileges were all delegatable,
         # make all the privs here delegatable
@@ -377,13 +412,12 @@ class Clearinghouse(object):
         slice_cred = self.create_slice_credential(user_gid, slice_gid,
                                                   in_expiration, delegatable=dgatable)
         self.logger.info("Slice %s renewed to %s", slice_urn, expire_str)
-        self.slices[slice_urn] = slice_cred
+        self.slices.put(slice_cred)
         return True
 
     def DeleteSlice(self, urn_req):
         self.logger.info("Called DeleteSlice %r" % urn_req)
-        if self.slices.has_key(urn_req):
-            self.slices.pop(urn_req)
+        if self.slices.delete(urn_req):
             self.logger.info("Deleted slice")
             return True
         self.logger.info('Slice was not found')
@@ -400,31 +434,56 @@ class Clearinghouse(object):
         '''List slices owned by the user URN provided, returning a list of slice URNs.
         Expired slices are deleted (and not returned).'''
 
-        ret = list()
         self.logger.debug("Looking for slices owned by %s", urn)
 
         # We could take hrn or return hrn too. Or return hrn and uuid.
         # Here we take a URN and return a URN
-        if not self.slices:
-#            self.logger.debug("Returning from lms early")
-            return ret
-
-        for slicecred in self.slices.values():
-            if slicecred.get_gid_caller().get_urn() == urn:
-                # Confirm it has not expired. If it has, remove it from the list of slices
-                slice_exp = self._naiveUTC(slicecred.expiration)
-                sliceurn = slicecred.get_gid_object().get_urn()
-#                self.logger.debug("Matching slice %s", sliceurn)
-                if slice_exp <= datetime.datetime.utcnow():
-                    self.logger.info("Removing expired slice %s", sliceurn)
-                    self.slices.pop(sliceurn)
-                    continue
-                ret.append(sliceurn)
-            else:
-                self.logger.debug("Found slice %s owned by different user %s", slicecred.get_gid_object().get_urn(), slicecred.get_gid_caller().get_urn())
- 
-        return ret
+        return self.slices.list_owned(urn)
     
+    def _caller_urn(self, method):
+        '''Return the URN of the caller, from its SSL client certificate.'''
+        try:
+            if THREADED:
+                user_gid = gid.GID(string=SecureThreadedXMLRPCRequestHandler.get_pem_cert())
+            else:
+                user_gid = gid.GID(string=self._server.pem_cert)
+            return user_gid.get_urn()
+        except Exception, exc:
+            self.logger.error("%s failed to create user_gid from SSL client cert: %s", method, traceback.format_exc())
+            raise Exception("%s failed. Cant get user GID from SSL client certificate." % method, exc)
+
+    def ListSliverInfo(self, slice_urn):
+        '''List the slivers recorded for the given slice URN, returning
+        a dict by sliver URN of SLIVER_INFO_* fields. Only the slice
+        owner may list them.'''
+        self.logger.info("Called ListSliverInfo %r" % slice_urn)
+        user_urn = self._caller_urn('ListSliverInfo')
+        owner_urn = self.slices.slice_owner(slice_urn)
+        if owner_urn is None:
+            return dict()
+        if owner_urn != user_urn:
+            self.logger.warning("%s may not list slivers of slice %s, owned by %s", user_urn, slice_urn, owner_urn)
+            raise Exception("Not authorized: %s does not own slice %s" % (user_urn, slice_urn))
+        return self.slices.list_slivers(slice_urn)
+
+    def UpdateSliverInfo(self, changes):
+        '''Apply a list of sliver record changes in one call. Each
+        change is a dict with an 'operation' of create, update or delete,
+        and 'fields' of SLIVER_INFO_* values naming the sliver in
+        SLIVER_INFO_URN. A create must give SLIVER_INFO_SLICE_URN of an
+        existing slice. Only slivers of slices the caller owns are
+        changed. Return a list of dicts with the sliver_urn, a success
+        flag and any error output for each change, in order.'''
+        self.logger.info("Called UpdateSliverInfo with %d changes", len(changes))
+        user_urn = self._caller_urn('UpdateSliverInfo')
+        results = []
+        for (change, (sliver_urn, output)) in zip(changes, self.slices.update_slivers(changes, user_urn)):
+            if output:
+                self.logger.info("Sliver %s %s failed: %s", sliver_urn, change.get('operation'), output)
+            results.append(dict(sliver_urn=sliver_urn, success=not output,
+                                output=output))
+        return results
+
     def CreateUserCredential(self, user_gid):
         '''Return string representation of a user credential
         issued by this CH with caller/object this user_gid (string)
@@ -434,15 +493,35 @@ class Clearinghouse(object):
         self.logger.info("Called CreateUserCredential for GID %s" % user_gid.get_hrn())
         expiration = datetime.datetime.utcnow() + datetime.timedelta(seconds=USER_CRED_LIFE)
         try:
-            ucred = cred_util.create_credential(user_gid, user_gid, expiration, 'user', self.keyfile, self.certfile, self.trusted_root_files)
+            ucred = cred_util.create_credential(user_gid, user_gid, expiration, 'user', self.keyfile, self.certfile, self.trusted_root_files, signer=self.signer)
         except Exception, exc:
             self.logger.error("Failed to create user credential for %s: %s", user_gid.get_hrn(), traceback.format_exc())
             raise Exception("Failed to create user credential for %s" % user_gid.get_hrn(), exc)
         return ucred.save_to_string()
+
+    def CreateUserCredentials(self, user_gids):
+        '''Return a list of string representations of user credentials
+        issued by this CH, one for each user_gid (string) given, as
+        CreateUserCredential does for one. The batch is signed and
+        verified with the CH key loaded once.'''
+        if self.signer is None:
+            return [self.CreateUserCredential(user_gid) for user_gid in user_gids]
+        user_gids = [gid.GID(string=user_gid) for user_gid in user_gids]
+        self.logger.info("Called CreateUserCredentials for %d GIDs", len(user_gids))
+        expiration = datetime.datetime.utcnow() + datetime.timedelta(seconds=USER_CRED_LIFE)
+        try:
+            ucreds = cred_util.create_credentials([(user_gid, user_gid, expiration)
+                                                   for user_gid in user_gids],
+                                                  'user', self.signer,
+                                                  self.trusted_root_files)
+        except Exception, exc:
+            self.logger.error("Failed to create user credentials: %s", traceback.format_exc())
+            raise Exception("Failed to create user credentials", exc)
+        return [ucred.save_to_string() for ucred in ucreds]
     
     def create_slice_credential(self, user_gid, slice_gid, expiration, delegatable=False):
         '''Create a Slice credential object for this user_gid (object) on given slice gid (object)'''
         # FIXME: Validate the user_gid and slice_gid
         # are my user and slice
-        return cred_util.create_credential(user_gid, slice_gid, expiration, 'slice', self.keyfile, self.certfile, self.trusted_root_files, delegatable)
+        return cred_util.create_credential(user_gid, slice_gid, expiration, 'slice', self.keyfile, self.certfile, self.trusted_root_files, delegatable, signer=self.signer)
 
@@ -428,6 +428,11 @@ class PGClearinghouse(Clearinghouse):
             self.logger.info("Using only my CH cert as a trusted root cert")
 
         self.trusted_root_files = cred_util.CredentialVerifier(ca_certs).root_cert_files
+
+        # Load the CH key once to sign credentials in process
+        self.signer = cred_util.make_credential_signer(keyfile, certfile)
+
+        self.load_slice_registry()
             
         if not os.path.exists(os.path.expanduser(ca_certs)):
             raise Exception("Missing CA cert(s): %s" % ca_certs)
@@ -489,6 +494,34 @@ class PGClearinghouse(Clearinghouse):
         f.close()
         return x
 
+    def get_verified_user_gid(self, method):
+        '''Return the cert chain of the current client (with the MA cert
+        appended, as SSL doesn't give us the chain) and its GID, verified
+        against our trusted roots. The XMLRPC server remembers the result
+        per client cert, so repeat calls only re-check expiration.'''
+        if THREADED:
+            client_certstr = SecureThreadedXMLRPCRequestHandler.get_pem_cert()
+            get_verified_gid = SecureThreadedXMLRPCRequestHandler.get_verified_gid
+        else:
+            client_certstr = self._server.pem_cert
+            get_verified_gid = self._server.get_verified_gid
+
+        user_certstr = addMACert(client_certstr, self.logger, self.macert)
+
+        try:
+            user_gid = gid.get_cached_gid(user_certstr)
+        except Exception, exc:
+            self.logger.error("%s failed to create user_gid from SSL client cert: %s", method, traceback.format_exc())
+            raise Exception("Failed to %s. Cant get user GID from SSL client certificate: %s" % (method, exc))
+
+        try:
+            user_gid = get_verified_gid(self.trusted_roots,
+                                        user_certstr[len(client_certstr):])
+        except Exception, exc:
+            self.logger.error("%s got unverifiable experimenter cert: %s", method, exc)
+            raise
+        return user_certstr, user_gid
+
     def split_chain(self, chain):
         x = chain.split('\n')
         sep = '-----END CERTIFICATE-----'
@@ -547,33 +580,7 @@ class PGClearinghouse(Clearinghouse):
             uuid = args['uuid']
         self.logger.debug("In getCred")
         
-        if THREADED:
-            client_certstr=SecureThreadedXMLRPCRequestHandler.get_pem_cert()
-        else:
-            client_certstr = self._server.pem_cert
-
-        # Construct cert, pulling in the intermediate signer cert if any (SSL doesn't give us the chain)
-        user_certstr = addMACert(client_certstr, self.logger, self.macert)
-
-        # Construct the GID
-        try:
-            user_gid = gid.GID(string=user_certstr)
-            # FIXME: Next 3 lines for debugging only
-            #username = user_gid.get_hrn().split('.')[-1]
-            #if args and args.has_key('cert') and not username in args['cert']:
-                #self.logger.error("GetCred got arg of user cert %s, server.pem_cert for user %s" % (args['cert'], user_gid.get_hrn()))
-        except Exception, exc:
-            self.logger.error("GetCredential failed to create user_gid from SSL client cert: %s", traceback.format_exc())
-            raise Exception("Failed to GetCredential. Cant get user GID from SSL client certificate." % exc)
-
-        self.logger.debug("Constructed user_gid")
-
-        # Validate the GID is trusted by our roots
-        try:
-            user_gid.verify_chain(self.trusted_roots)
-        except Exception, exc:
-            self.logger.error("GetCredential got unverifiable experimenter cert: %s", exc)
-            raise
+        user_certstr, user_gid = self.get_verified_user_gid("GetCredential")
 
         if not user_gid:
             raise Exception("user_gid is None")
@@ -707,27 +714,7 @@ class PGClearinghouse(Clearinghouse):
         # type is Slice or User
         # Return is dict: (see above)
 
-        if THREADED:
-            client_certstr=SecureThreadedXMLRPCRequestHandler.get_pem_cert()
-        else:
-            client_certstr = self._server.pem_cert
-
-        # Get full user cert chain (append MA if any)
-        user_certstr = addMACert(client_certstr, self.logger, self.macert)
-
-        # Construct GID
-        try:
-            user_gid = gid.GID(string=user_certstr)
-        except Exception, exc:
-            self.logger.error("GetCredential failed to create user_gid from SSL client cert: %s", traceback.format_exc())
-            raise Exception("Failed to GetCredential. Cant get user GID from SSL client certificate." % exc)
-
-        # Validate GID
-        try:
-            user_gid.verify_chain(self.trusted_roots)
-        except Exception, exc:
-            self.logger.error("GetCredential got unverifiable experimenter cert: %s", exc)
-            raise
+        user_certstr, user_gid = self.get_verified_user_gid("GetCredential")
 
         credential = None
         if args and args.has_key('credential'):
@@ -788,8 +775,8 @@ class PGClearinghouse(Clearinghouse):
             if self.gcf:
                 # FIXME: Handle uuid input
                 # For type slice, error means no known slice. Else the slice exists.
-                if self.slices.has_key(urn):
-                    slice_cred = self.slices[urn]
+                slice_cred = self.slices.get(urn)
+                if slice_cred is not None:
                     slice_cert = slice_cred.get_gid_object()
                     slice_uuid = ""
                     try:
@@ -979,24 +966,7 @@ class PGClearinghouse(Clearinghouse):
         # cred is user cred, type must be Slice
         # returns slice cred
 
-        if THREADED:
-            client_certstr=SecureThreadedXMLRPCRequestHandler.get_pem_cert()
-        else:
-            client_certstr = self._server.pem_cert
-
-        user_certstr = addMACert(client_certstr, self.logger, self.macert)
-
-        try:
-            user_gid = gid.GID(string=user_certstr)
-        except Exception, exc:
-            self.logger.error("GetCredential failed to create user_gid from SSL client cert: %s", traceback.format_exc())
-            raise Exception("Failed to GetCredential. Cant get user GID from SSL client certificate." % exc)
-
-        try:
-            user_gid.verify_chain(self.trusted_roots)
-        except Exception, exc:
-            self.logger.error("GetCredential got unverifiable experimenter cert: %s", exc)
-            raise
+        user_certstr, user_gid = self.get_verified_user_gid("GetCredential")
 
         credential = None
         if args and args.has_key('credential'):
@@ -1145,23 +1115,7 @@ class PGClearinghouse(Clearinghouse):
         # cred is user cred
         # returns renewed slice credential
 
-        if THREADED:
-            client_certstr=SecureThreadedXMLRPCRequestHandler.get_pem_cert()
-        else:
-            client_certstr = self._server.pem_cert
-
-        user_certstr = addMACert(client_certstr, self.logger, self.macert)
-        try:
-            user_gid = gid.GID(string=user_certstr)
-        except Exception, exc:
-            self.logger.error("RenewSlice failed to create user_gid from SSL client cert: %s", traceback.format_exc())
-            raise Exception("Failed to RenewSlice. Cant get user GID from SSL client certificate." % exc)
-
-        try:
-            user_gid.verify_chain(self.trusted_roots)
-        except Exception, exc:
-            self.logger.error("RenewSlice got unverifiable experimenter cert: %s", exc)
-            raise
+        user_certstr, user_gid = self.get_verified_user_gid("RenewSlice")
 
         expiration = None
         if args and args.has_key('expiration'):
@@ -1197,7 +1151,7 @@ class PGClearinghouse(Clearinghouse):
             urn = sfacredential.Credential(string=credential).get_gid_object().get_urn()            
             if self.RenewSlice(urn, expiration):
                 # return the new slice credential
-                return self.slices[urn]
+                return self.slices.get(urn).save_to_string()
             else:
                 # error
                 raise "Failed to renew slice %s until %s" % (urn, expiration)
@@ -1253,24 +1207,7 @@ class PGClearinghouse(Clearinghouse):
         # cred is user cred
         # return list( of dict(type='ssh', key=$key))
 
-        if THREADED:
-            client_certstr=SecureThreadedXMLRPCRequestHandler.get_pem_cert()
-        else:
-            client_certstr = self._server.pem_cert
-
-        user_certstr = addMACert(client_certstr, self.logger, self.macert)
-
-        try:
-            user_gid = gid.GID(string=user_certstr)
-        except Exception, exc:
-            self.logger.error("GetCredential failed to create user_gid from SSL client cert: %s", traceback.format_exc())
-            raise Exception("Failed to GetCredential. Cant get user GID from SSL client certificate." % exc)
-
-        try:
-            user_gid.verify_chain(self.trusted_roots)
-        except Exception, exc:
-            self.logger.error("GetCredential got unverifiable experimenter cert: %s", exc)
-            raise
+        user_certstr, user_gid = self.get_verified_user_gid("GetCredential")
 
         if credential is None:
             raise Exception("Resolve missing credential")
@@ -1366,24 +1303,7 @@ class PGClearinghouse(Clearinghouse):
         # return list( of dict(gid=<cert>, hrn=<hrn>, url=<AM URL>))
         # Matt seems to say hrn is not critical, and can maybe even skip cert
 
-        if THREADED:
-            client_certstr=SecureThreadedXMLRPCRequestHandler.get_pem_cert()
-        else:
-            client_certstr = self._server.pem_cert
-
-        user_certstr = addMACert(client_certstr, self.logger, self.macert)
-
-        try:
-            user_gid = gid.GID(string=user_certstr)
-        except Exception, exc:
-            self.logger.error("GetCredential failed to create user_gid from SSL client cert: %s", traceback.format_exc())
-            raise Exception("Failed to GetCredential. Cant get user GID from SSL client certificate." % exc)
-
-        try:
-            user_gid.verify_chain(self.trusted_roots)
-        except Exception, exc:
-            self.logger.error("GetCredential got unverifiable experimenter cert: %s", exc)
-            raise
+        user_certstr, user_gid = self.get_verified_user_gid("GetCredential")
 
         if credential is None:
             raise Exception("Resolve missing credential")
@@ -40,6 +40,7 @@ from ...sfa.util.xrn import hrn_authfor_hrn
 from ...sfa.trust.credential_factory import CredentialFactory
 from ...sfa.trust.abac_credential import ABACCredential
 from ...sfa.trust.certificate import Certificate
+from ...sfa.trust.credential_signer import CredentialSigner
 
 from .speaksfor_util import determine_speaks_for
 
@@ -138,7 +139,7 @@ class CredentialVerifier(object):
             [Certificate(filename=root_cert_file) \
                  for root_cert_file in self.root_cert_files]
 
-        caller_gid = gid.GID(string=gid_string)
+        caller_gid = gid.get_cached_gid(gid_string)
 
         # Potentially, change gid_string to be the cert of the actual user 
         # if this is a 'speaks-for' invocation
@@ -318,11 +319,15 @@ class CredentialVerifier(object):
 #            raise xmlrpclib.Fault(fault_code, fault_string)
             raise Exception(fault_string)
 
-def create_credential(caller_gid, object_gid, expiration, typename, issuer_keyfile, issuer_certfile, trusted_roots, delegatable=False):
+def create_credential(caller_gid, object_gid, expiration, typename, issuer_keyfile, issuer_certfile, trusted_roots, delegatable=False, signer=None, verify=True):
     '''Create and Return a Credential object issued by given key/cert for the given caller
     and object GID objects, given life in seconds, and given type.
     Privileges are determined by type per sfa/trust/rights.py
-    Privileges are delegatable if requested.'''
+    Privileges are delegatable if requested.
+    If a CredentialSigner for the issuer is supplied, sign in process with
+    its already loaded key instead of calling out to xmlsec1.
+    Verify the new credential against the trusted roots unless verify is False,
+    in process if there is a signer and otherwise via xmlsec1.'''
     # FIXME: Validate args: my gids, >0 life,
     # type of cred one I can issue
     # and readable key and cert files
@@ -346,13 +351,16 @@ def create_credential(caller_gid, object_gid, expiration, typename, issuer_keyfi
     if typename not in ("user", "sa", "ma", "authority", "slice", "component"):
         raise ValueError("Unknown credential type %s" % typename)
 
-    if not os.path.isfile(issuer_keyfile):
-        raise ValueError("Cant read issuer key file %s" % issuer_keyfile)
+    if signer is not None:
+        issuer_gid = signer.issuer_gid
+    else:
+        if not os.path.isfile(issuer_keyfile):
+            raise ValueError("Cant read issuer key file %s" % issuer_keyfile)
 
-    if not os.path.isfile(issuer_certfile):
-        raise ValueError("Cant read issuer cert file %s" % issuer_certfile)
+        if not os.path.isfile(issuer_certfile):
+            raise ValueError("Cant read issuer cert file %s" % issuer_certfile)
 
-    issuer_gid = gid.GID(filename=issuer_certfile)
+        issuer_gid = gid.GID(filename=issuer_certfile)
     
     if not (object_gid.get_urn() == issuer_gid.get_urn() or 
         (issuer_gid.get_type().find('authority') == 0 and
@@ -382,14 +390,47 @@ def create_credential(caller_gid, object_gid, expiration, typename, issuer_keyfi
     privileges.delegate_all_privileges(delegatable)
     ucred.set_privileges(privileges)
     ucred.encode()
-    ucred.set_issuer_keys(issuer_keyfile, issuer_certfile)
-    ucred.sign()
-    
-    try:
-        ucred.verify(trusted_roots)
-    except Exception, exc:
-        raise Exception("Create Credential failed to verify new credential from trusted roots: %s" % exc)
+    if signer is not None:
+        ucred.sign(signer)
+    else:
+        ucred.set_issuer_keys(issuer_keyfile, issuer_certfile)
+        ucred.sign()
+
+    if verify:
+        try:
+            if signer is not None:
+                signer.verify(ucred, trusted_roots)
+            else:
+                ucred.verify(trusted_roots)
+        except Exception, exc:
+            raise Exception("Create Credential failed to verify new credential from trusted roots: %s" % exc)
 
     return ucred
 
+def create_credentials(requests, typename, signer, trusted_roots, delegatable=False):
+    '''Create and Return a list of Credential objects of the given type, all
+    issued by the given CredentialSigner, one for each
+    (caller_gid, object_gid, expiration) tuple in requests.
+    The issuer key is loaded, and its chain to the trusted roots verified,
+    once for the whole batch; each credential is signed and verified in
+    process, so no process is forked per credential.'''
+    creds = []
+    for (caller_gid, object_gid, expiration) in requests:
+        creds.append(create_credential(caller_gid, object_gid, expiration,
+                                       typename, signer.privkey_file,
+                                       signer.gid_file, trusted_roots,
+                                       delegatable, signer=signer))
+    return creds
+
+def make_credential_signer(issuer_keyfile, issuer_certfile):
+    '''Return a CredentialSigner that signs credentials in process with the
+    given issuer key and cert, or None if that is not possible here
+    (no lxml, or the key can't be loaded), in which case callers should
+    fall back to signing via xmlsec1.'''
+    try:
+        return CredentialSigner(issuer_keyfile, issuer_certfile)
+    except Exception, exc:
+        logging.getLogger('cred-verifier').warn("Cannot sign credentials in process, will use xmlsec1: %s", exc)
+        return None
+
 
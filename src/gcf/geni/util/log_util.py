@@ -0,0 +1,188 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+"""
+Logging of server calls whose arguments and results may be large
+(credentials, RSpecs): summaries rendered only if the message is
+actually logged, and a handler that writes log records from a
+background thread.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import Queue
+import threading
+import zlib
+
+# Strings longer than this are logged as their start, length and checksum
+LOG_STRING_LIMIT = 200
+# The whole summary of a value is cut off after this many characters
+LOG_SUMMARY_LIMIT = 2000
+
+class LogSummary(object):
+    """A value (like the arguments or result of an AM call) to pass to
+    a logger, as in logger.info("Result: %s", LogSummary(result)).
+
+    It is only rendered if the message is logged, and then long strings
+    are replaced by their start, length and CRC32 checksum (enough to
+    tell whether two calls passed the same credential or RSpec), and
+    the whole is cut off after LOG_SUMMARY_LIMIT characters."""
+
+    def __init__(self, value, string_limit=LOG_STRING_LIMIT,
+                 summary_limit=LOG_SUMMARY_LIMIT):
+        self._value = value
+        self._string_limit = string_limit
+        self._summary_limit = summary_limit
+        self._text = None
+
+    def _render(self, value, out, budget):
+        # Append the summary of value to out. Return the characters of
+        # the budget left, stopping once it is used up.
+        if budget <= 0:
+            return budget
+        if isinstance(value, basestring):
+            if len(value) > self._string_limit:
+                if isinstance(value, unicode):
+                    checksum = zlib.crc32(value.encode('utf-8'))
+                else:
+                    checksum = zlib.crc32(value)
+                text = "%r...<%d chars, crc32 %08x>" % (value[:self._string_limit / 2],
+                                                        len(value), checksum & 0xffffffff)
+            else:
+                text = repr(value)
+            out.append(text)
+            return budget - len(text)
+        if isinstance(value, dict):
+            (start, end, items) = ('{', '}', value.items())
+        elif isinstance(value, list):
+            (start, end, items) = ('[', ']', value)
+        elif isinstance(value, tuple):
+            (start, end, items) = ('(', ')', value)
+        else:
+            text = repr(value)
+            out.append(text)
+            return budget - len(text)
+        out.append(start)
+        budget -= 1
+        for i, item in enumerate(items):
+            if i:
+                out.append(', ')
+                budget -= 2
+            if budget <= 0:
+                break
+            if isinstance(value, dict):
+                budget = self._render(item[0], out, budget)
+                out.append(': ')
+                budget = self._render(item[1], out, budget - 2)
+            else:
+                budget = self._render(item, out, budget)
+        if isinstance(value, tuple) and len(value) == 1:
+            out.append(',')
+        out.append(end)
+        return budget - 1
+
+    def __str__(self):
+        if self._text is None:
+            out = []
+            self._render(self._value, out, self._summary_limit)
+            text = ''.join(out)
+            if len(text) > self._summary_limit:
+                text = text[:self._summary_limit] + '...<truncated>'
+            self._text = text
+        return self._text
+
+    __repr__ = __str__
+
+class BackgroundLogHandler(logging.Handler):
+    """A handler that passes records to another handler (writing to a
+    file, say) from a background thread, so the thread that logs does
+    not wait on the write.
+
+    The message is put together in the logging thread, so that
+    arguments which later change (or a LogSummary) are logged as they
+    were. If more than max_queued records are waiting, new records are
+    dropped, and the number dropped is logged once the queue drains."""
+
+    def __init__(self, target, max_queued=10000):
+        logging.Handler.__init__(self, target.level)
+        self.target = target
+        self.dropped = 0
+        self._queue = Queue.Queue(max_queued)
+        self._thread = threading.Thread(target=self._run,
+                                        name='BackgroundLogHandler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                # Render the traceback now; it cannot be kept for later
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self._queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                if self.dropped and self._queue.empty():
+                    dropped, self.dropped = self.dropped, 0
+                    self.target.handle(logging.makeLogRecord(
+                            dict(name=record.name, levelno=logging.WARNING,
+                                 levelname='WARNING',
+                                 msg="Dropped %d log messages while the log was busy" % dropped)))
+                self.target.handle(record)
+            except Exception:
+                self.handleError(record)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until the queued records have been written."""
+        self._queue.join()
+        self.target.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self.target.close()
+        logging.Handler.close(self)
+
+def start_background_logging(logger=None):
+    """Replace each handler of the given logger (by default the root
+    logger) with a BackgroundLogHandler writing to it."""
+    if logger is None:
+        logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        if isinstance(handler, BackgroundLogHandler):
+            continue
+        logger.removeHandler(handler)
+        logger.addHandler(BackgroundLogHandler(handler))
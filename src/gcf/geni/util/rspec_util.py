@@ -29,12 +29,15 @@ RSpec validation and printing utilities.
 from __future__ import absolute_import
 
 import xml.etree.ElementTree as etree 
+import re
 import subprocess
 import tempfile
+import threading
 import xml.parsers.expat
 import xml.dom.minidom as md
 
 from .rspec_schema import *
+from ...sfa.util import xmlschema
 
 RSPECLINT = "rspeclint" 
 
@@ -249,7 +252,15 @@ def has_child_ids( xml, check_comp_id_list, version="GENI 3" ):
 #     return newxml1 == newxml2
 
 def rspeclint_exists():
-    """Try to run 'rspeclint' to see if we can find it."""
+    """Raise an Exception if RSpecs cannot be validated here: there is
+    neither lxml with a local copy of the GENI v3 schemas (see
+    xmlschema.SCHEMA_DIR) nor 'rspeclint'."""
+    if xmlschema.HAVELXML:
+        try:
+            xmlschema.local_schema_file(GENI_3_REQ_SCHEMA)
+            return
+        except xmlschema.SchemaError:
+            pass
     # TODO: Hum....better way (or place) to do this? (wrapper? rspec_util?)
     try:
         cmd = [RSPECLINT]
@@ -260,7 +271,34 @@ def rspeclint_exists():
 
 
 # add some utility functions for testing various namespaces and schemas
-def validate_rspec( ad, namespace=GENI_3_NAMESPACE, schema=GENI_3_REQ_SCHEMA ):
+def validate_rspec( ad, namespace=GENI_3_NAMESPACE, schema=GENI_3_REQ_SCHEMA, logger=None ):
+    """Validate an RSpec against the given schema.
+    ad - a string containing an RSpec
+    Validates in process with lxml, using the compiled schema registry
+    (the schema is compiled once per process, from a local copy under
+    xmlschema.SCHEMA_DIR). Falls back to running 'rspeclint' if lxml or
+    a local copy of the schema is not available.
+    Raises xmlschema.SchemaError if the RSpec cannot be validated at all.
+    """
+    if isinstance(ad, unicode):
+        ad = ad.encode('utf-8')
+    if not xmlschema.HAVELXML:
+        return validate_rspec_rspeclint( ad, namespace, schema )
+    try:
+        valid, message = xmlschema.validate( ad, schema, namespace )
+    except xmlschema.SchemaError, e:
+        if logger is not None:
+            logger.debug("Cannot validate in process, trying %s: %s", RSPECLINT, e)
+        try:
+            return validate_rspec_rspeclint( ad, namespace, schema )
+        except OSError:
+            # No rspeclint either
+            raise e
+    if not valid and logger is not None:
+        logger.debug("RSpec does not validate against %s: %s", schema, message)
+    return valid
+
+def validate_rspec_rspeclint( ad, namespace=GENI_3_NAMESPACE, schema=GENI_3_REQ_SCHEMA ):
     """Run 'rspeclint' on a file.
     ad - a string containing an RSpec
     """
@@ -306,12 +344,67 @@ def rspec_available_only( rspec, namespace=GENI_3_NAMESPACE, schema=GENI_3_REQ_S
             return available
     return available
     
+# Characters at the start of an RSpec examined when sniffing for its root element
+RSPEC_SNIFF_LENGTH = 4096
+
+# XML declaration, then any comments, doctype, processing instructions or whitespace
+_XML_PROLOG_RE = re.compile(r'(?:\xef\xbb\xbf)?\s*(?:<\?xml\s[^>]*\?>)?(?:\s+|<!--.*?-->|<!DOCTYPE[^>]*>|<\?(?![xX][mM][lL]\s).*?\?>)*', re.DOTALL)
+_RSPEC_ROOT_RE = re.compile(r'<(?:[\w.-]+:)?(?:resv_)?rspec[\s/>]', re.IGNORECASE)
+_RSPEC_ELEMENT_RE = re.compile(r'<(?:resv_)?rspec', re.IGNORECASE)
+_RSPEC_END_RE = re.compile(r'</(?:[\w.-]+:)?(?:resv_)?rspec\s*>\s*$', re.IGNORECASE)
+
+# Recent results of is_wellformed_xml, keyed by the XML string itself
+# (the same RSpec is often checked several times). Bounded, as RSpecs can be large.
+_WELLFORMED_CACHE_SIZE = 8
+_wellformed_cache = {}
+_wellformed_keys = []
+_wellformed_lock = threading.Lock()
+
+def is_wellformed_xml_cached( string, logger=None ):
+    """Like is_wellformed_xml, but remember the result for recently checked strings"""
+    with _wellformed_lock:
+        if string in _wellformed_cache:
+            return _wellformed_cache[string]
+    retVal = is_wellformed_xml( string, logger )
+    with _wellformed_lock:
+        if string not in _wellformed_cache:
+            if len(_wellformed_keys) >= _WELLFORMED_CACHE_SIZE:
+                del _wellformed_cache[_wellformed_keys.pop(0)]
+            _wellformed_keys.append(string)
+            _wellformed_cache[string] = retVal
+    return retVal
+
+def sniff_rspec_string( rspec, logger=None ):
+    """Does this string look like an XML rspec, judging by its start and end?
+    Checks that the root element (after any XML declaration and comments) is
+    an rspec or resv_rspec element, and that the string ends by closing it,
+    without parsing the whole string.
+    Returns: True/False, or None if a full parse is needed to tell (the start
+    of the string was all comments, or it ends some other way)."""
+    prefix = rspec[:RSPEC_SNIFF_LENGTH]
+    if isinstance(prefix, unicode):
+        prefix = prefix.encode('utf-8')
+    prolog = _XML_PROLOG_RE.match(prefix)
+    rest = prefix[prolog.end():]
+    if not _RSPEC_ROOT_RE.match(rest):
+        if len(rspec) > RSPEC_SNIFF_LENGTH and (rest == '' or rest.startswith('<!') or rest.startswith('<?')):
+            return None
+        if logger:
+            logger.debug("RSpec string invalid: root element is not rspec")
+        return False
+    if not _RSPEC_END_RE.search(rspec[-256:]):
+        return None
+    return True
+
 #def is_valid_rspec(): 
 # Call is_rspec_string()
 # Call validate_rspec()
 def is_rspec_string( rspec, rspec_namespace=None, rspec_schema=None, 
-                     logger=None ):
+                     logger=None, sniff=False ):
     '''Could this string be part of an XML-based rspec?
+    If sniff, only check the root element from the start of the string
+    (see sniff_rspec_string) rather than fully parsing the string
+    (unless the schema check is also requested).
     Returns: True/False'''
 
     if rspec is None or not(isinstance(rspec, str) or isinstance(rspec, unicode)):
@@ -319,21 +412,23 @@ def is_rspec_string( rspec, rspec_namespace=None, rspec_schema=None,
             logger.debug("rspec is none or not a string")
         return False
 
+    if sniff and not (rspec_namespace and rspec_schema):
+        sniffed = sniff_rspec_string( rspec, logger )
+        if sniffed is not None:
+            return sniffed
+
     if isinstance(rspec, unicode):
         rspec = rspec.encode('utf-8')
 
-    # do all comparisons as lowercase
-    rspec = rspec.lower()
-
     # (1) Check if rspec is a well-formed XML document
-    if not is_wellformed_xml( rspec, logger ):
+    if not is_wellformed_xml_cached( rspec, logger ):
         return False
     
     # (2) Check if rspec is a valid XML document
     #   (a) a snippet of XML starting with <rspec>, or
     #   (b) a snippet of XML starting with <resv_rspec>
-    if ('<rspec' not in rspec) and \
-        ('<resv_rspec' not in rspec):
+    #   (in any case)
+    if not _RSPEC_ELEMENT_RE.search(rspec):
         if logger:
             logger.debug("RSpec string invalid: no rspec element")
         return False
@@ -425,6 +520,10 @@ if __name__ == "__main__":
             print "is_rspec_str() is TRUE"
         else:
             print "is_rspec_str() is FALSE"                
+        if is_rspec_string( test_str, sniff=True ):
+            print "is_rspec_str(sniff=True) is TRUE"
+        else:
+            print "is_rspec_str(sniff=True) is FALSE"
 
 #        print is_wellformed_xml( test_str )
 
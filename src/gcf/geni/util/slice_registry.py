@@ -0,0 +1,260 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''
+Slice registry for the sample clearinghouse, backed by sqlite.
+'''
+
+from __future__ import absolute_import
+
+import calendar
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from ...sfa.trust import credential as cred
+from .cred_util import naiveUTC
+
+class SliceRegistry(object):
+    """Slice credentials issued by the sample clearinghouse, indexed by
+    slice URN, owner URN and expiration, and the records of slivers in
+    those slices (CHAPI SLIVER_INFO_* fields), indexed by slice URN.
+
+    With no path the registry lives in memory, as the CH's slices always
+    have. Given a path, slices and their slivers are kept in a sqlite
+    database (in WAL mode) and survive a CH restart."""
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger('gcf-ch.slices')
+        if path:
+            path = os.path.expanduser(path)
+        else:
+            path = ':memory:'
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS slices (
+                                slice_urn TEXT PRIMARY KEY,
+                                owner_urn TEXT NOT NULL,
+                                expiration INTEGER NOT NULL,
+                                credential TEXT NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slices_owner ON slices (owner_urn, expiration)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slices_expiration ON slices (expiration)')
+        # Sliver records, with their SLIVER_INFO_* fields as JSON
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS slivers (
+                                sliver_urn TEXT PRIMARY KEY,
+                                slice_urn TEXT NOT NULL,
+                                fields TEXT NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS slivers_slice ON slivers (slice_urn)')
+        self._conn.commit()
+        self._purger = None
+        self._stop_purger = threading.Event()
+
+    @staticmethod
+    def _timestamp(dt):
+        return calendar.timegm(naiveUTC(dt).timetuple())
+
+    def _now(self):
+        return self._timestamp(datetime.datetime.utcnow())
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, args)
+            self._conn.commit()
+            return cursor
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def put(self, slice_cred):
+        """Record (or replace) the given slice credential object."""
+        slice_urn = slice_cred.get_gid_object().get_urn()
+        self._execute('INSERT OR REPLACE INTO slices VALUES (?, ?, ?, ?)',
+                      (slice_urn, slice_cred.get_gid_caller().get_urn(),
+                       self._timestamp(slice_cred.get_expiration()),
+                       slice_cred.save_to_string()))
+
+    def get(self, slice_urn):
+        """Return the credential object for the given slice, or None."""
+        rows = self._query('SELECT credential FROM slices WHERE slice_urn = ?',
+                           (slice_urn,))
+        if not rows:
+            return None
+        return cred.Credential(string=str(rows[0][0]))
+
+    def has_slice(self, slice_urn):
+        return len(self._query('SELECT 1 FROM slices WHERE slice_urn = ?',
+                               (slice_urn,))) > 0
+
+    def slice_owner(self, slice_urn):
+        """Return the URN of the owner of the given slice, or None."""
+        rows = self._query('SELECT owner_urn FROM slices WHERE slice_urn = ?',
+                           (slice_urn,))
+        if not rows:
+            return None
+        return str(rows[0][0])
+
+    def delete(self, slice_urn):
+        """Remove the given slice and its slivers. Return True if it was there."""
+        with self._lock:
+            deleted = self._conn.execute('DELETE FROM slices WHERE slice_urn = ?',
+                                         (slice_urn,)).rowcount > 0
+            self._conn.execute('DELETE FROM slivers WHERE slice_urn = ?', (slice_urn,))
+            self._conn.commit()
+        return deleted
+
+    def _purge_slivers(self):
+        # Remove the slivers of slices that are gone. Caller holds the lock.
+        self._conn.execute('DELETE FROM slivers WHERE slice_urn NOT IN (SELECT slice_urn FROM slices)')
+
+    def list_owned(self, owner_urn):
+        """Return the URNs of unexpired slices owned by the given user.
+        Expired slices of that user are removed."""
+        now = self._now()
+        with self._lock:
+            purged = self._conn.execute('DELETE FROM slices WHERE owner_urn = ? AND expiration <= ?',
+                                        (owner_urn, now)).rowcount
+            if purged > 0:
+                self._purge_slivers()
+            self._conn.commit()
+        if purged > 0:
+            self.logger.info("Removed %d expired slice(s) of %s", purged, owner_urn)
+        rows = self._query('SELECT slice_urn FROM slices WHERE owner_urn = ? AND expiration > ?',
+                           (owner_urn, now))
+        return [str(row[0]) for row in rows]
+
+    def purge_expired(self):
+        """Remove all expired slices and their slivers, returning how
+        many slices were removed."""
+        with self._lock:
+            purged = self._conn.execute('DELETE FROM slices WHERE expiration <= ?',
+                                        (self._now(),)).rowcount
+            if purged > 0:
+                self._purge_slivers()
+            self._conn.commit()
+        return purged
+
+    def list_slivers(self, slice_urn):
+        """Return a dict by sliver URN of the SLIVER_INFO_* fields of
+        the slivers recorded in the given slice."""
+        rows = self._query('SELECT sliver_urn, fields FROM slivers WHERE slice_urn = ?',
+                           (slice_urn,))
+        return dict((str(row[0]), json.loads(row[1])) for row in rows)
+
+    def update_slivers(self, changes, owner_urn=None):
+        """Apply a list of sliver record changes in one transaction. Each
+        change is a dict with an 'operation' of create, update or delete,
+        and 'fields' of SLIVER_INFO_* values naming the sliver in
+        SLIVER_INFO_URN. A create must give SLIVER_INFO_SLICE_URN of a
+        slice in the registry. If owner_urn is given, only slivers of
+        slices it owns are changed. Return a list of (sliver URN, error
+        message or '') for each change, in order."""
+        results = []
+        with self._lock:
+            for change in changes:
+                fields = change.get('fields', dict())
+                sliver_urn = fields.get('SLIVER_INFO_URN', '')
+                operation = change.get('operation')
+                output = ''
+                if not sliver_urn:
+                    output = 'Missing SLIVER_INFO_URN'
+                elif owner_urn is not None and not self._owns_sliver(owner_urn, operation, sliver_urn, fields):
+                    output = 'Not authorized: %s does not own the slice of sliver %s' % (owner_urn, sliver_urn)
+                elif operation == 'create':
+                    slice_urn = fields.get('SLIVER_INFO_SLICE_URN')
+                    if not slice_urn or not self._conn.execute('SELECT 1 FROM slices WHERE slice_urn = ?',
+                                                               (slice_urn,)).fetchall():
+                        output = 'Unknown slice urn %s' % slice_urn
+                    else:
+                        self._conn.execute('INSERT OR REPLACE INTO slivers VALUES (?, ?, ?)',
+                                           (sliver_urn, slice_urn, json.dumps(fields)))
+                elif operation == 'update':
+                    rows = self._conn.execute('SELECT fields FROM slivers WHERE sliver_urn = ?',
+                                              (sliver_urn,)).fetchall()
+                    if not rows:
+                        output = 'Unknown sliver urn %s' % sliver_urn
+                    else:
+                        record = json.loads(rows[0][0])
+                        # A sliver stays in the slice it was created in
+                        fields = dict((k, v) for (k, v) in fields.items()
+                                      if k != 'SLIVER_INFO_SLICE_URN')
+                        record.update(fields)
+                        self._conn.execute('UPDATE slivers SET fields = ? WHERE sliver_urn = ?',
+                                           (json.dumps(record), sliver_urn))
+                elif operation == 'delete':
+                    if self._conn.execute('DELETE FROM slivers WHERE sliver_urn = ?',
+                                          (sliver_urn,)).rowcount == 0:
+                        output = 'Unknown sliver urn %s' % sliver_urn
+                else:
+                    output = 'Unknown operation %r' % operation
+                results.append((sliver_urn, output))
+            self._conn.commit()
+        return results
+
+    def _owns_sliver(self, owner_urn, operation, sliver_urn, fields):
+        # Whether owner_urn owns the slice the sliver is (or, for a
+        # create, will be) in. An unknown sliver or slice is left for
+        # update_slivers to report. Caller holds the lock.
+        if operation == 'create':
+            rows = self._conn.execute('SELECT owner_urn FROM slices WHERE slice_urn = ?',
+                                      (fields.get('SLIVER_INFO_SLICE_URN'),)).fetchall()
+        else:
+            rows = self._conn.execute('''SELECT slices.owner_urn FROM slivers
+                                         JOIN slices ON slices.slice_urn = slivers.slice_urn
+                                         WHERE slivers.sliver_urn = ?''',
+                                      (sliver_urn,)).fetchall()
+        return not rows or str(rows[0][0]) == owner_urn
+
+    def start_purger(self, interval=300):
+        """Purge expired slices every interval seconds in a daemon thread."""
+        if self._purger is not None:
+            return
+        def purge_loop():
+            while not self._stop_purger.wait(interval):
+                try:
+                    purged = self.purge_expired()
+                    if purged > 0:
+                        self.logger.info("Purged %d expired slice(s)", purged)
+                except Exception, exc:
+                    self.logger.error("Failed to purge expired slices: %s", exc)
+        self._purger = threading.Thread(target=purge_loop, name='slice-purger')
+        self._purger.daemon = True
+        self._purger.start()
+
+    def stop_purger(self):
+        if self._purger is not None:
+            self._stop_purger.set()
+            self._purger.join()
+            self._purger = None
+            self._stop_purger.clear()
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM slices')[0][0]
+
+    def __nonzero__(self):
+        return len(self) > 0
@@ -51,12 +51,14 @@ try:
     from ...sfa.trust.credential import Credential, signature_template, HAVELXML
     from ...sfa.trust.credential_factory import CredentialFactory
     from ...sfa.trust.gid import GID
+    from ...sfa.util.xmlschema import get_schema
 except:
     from gcf.sfa.trust.abac_credential import ABACCredential, ABACElement
     from gcf.sfa.trust.certificate import Certificate
     from gcf.sfa.trust.credential import Credential, signature_template, HAVELXML
     from gcf.sfa.trust.credential_factory import CredentialFactory
     from gcf.sfa.trust.gid import GID
+    from gcf.sfa.util.xmlschema import get_schema
 
 # Routine to validate that a speaks-for credential 
 # says what it claims to say:
@@ -213,11 +215,9 @@ def verify_speaks_for(cred, tool_gid, speaking_for_urn, \
     if HAVELXML and schema and os.path.exists(schema):
         from lxml import etree
         tree = etree.parse(StringIO(cred.xml))
-        schema_doc = etree.parse(schema)
-        xmlschema = etree.XMLSchema(schema_doc)
-        if not xmlschema.validate(tree):
-            error = xmlschema.error_log.last_error
-            message = "%s: %s (line %s)" % (cred.get_summary_tostring(), error.message, error.line)
+        valid, message = get_schema(schema).validate(tree)
+        if not valid:
+            message = "%s: %s" % (cred.get_summary_tostring(), message)
             return False, None, ("XML Credential schema invalid: %s" % message)
 
     if trusted_roots:
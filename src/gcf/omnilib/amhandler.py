@@ -39,6 +39,7 @@ import os
 import pprint
 import re
 import string
+import threading
 import zlib
 
 from .util import OmniError, NoSliceCredError, RefusedError, naiveUTC, AMAPIError
@@ -49,8 +50,10 @@ from .util.handler_utils import _listaggregates, validate_url, _get_slice_cred,
     _derefRSpecNick, _get_user_urn, \
     _print_slice_expiration, _construct_output_filename, \
     _getRSpecOutput, _writeRSpec, _printResults, _load_cred, _lookupAggNick, \
-    expires_from_rspec, expires_from_status
+    expires_from_rspec, expires_from_status, \
+    _getRSpecHeader, _writeRSpecStream, _writeJSONWithRSpecStream, expires_from_rspec_stream
 from .util.json_encoding import DateTimeAwareJSONEncoder, DateTimeAwareJSONDecoder
+from .util.sliverinfo import SliverInfoChanges, reconcile
 from .xmlrpc import client as xmlrpcclient
 from .util.files import *
 from .util.credparsing import *
@@ -58,6 +61,9 @@ from .util.credparsing import *
 from ..geni.util.tz_util import tzd
 from ..geni.util import rspec_util, urn_util
 
+# Serializes updates of the GetVersion cache file by handlers in different
+# threads (eg stitcher fetching GetVersion from many AMs at once)
+_getversion_cache_lock = threading.Lock()
 
 class BadClientException(Exception):
     ''' Internal only exception thrown if AM speaks wrong AM API version'''
@@ -539,25 +545,28 @@ class AMCallHandler(object):
         else:
             res['url'] = "unspecified_AM_URL"
         res['error'] = error
-        if self.GetVersionCache is None:
-            # Read the file as serialized JSON
-            self._load_getversion_cache()
-        if error:
-            # On error, leave existing data alone - just record the last error
-            if self.GetVersionCache.has_key(client.url):
-                self.GetVersionCache[client.url]['lasterror'] = error
-            self.logger.debug("Added GetVersion error output to cache for %s: %s", client.url, error)
-        else:
-            self.GetVersionCache[client.url] = res
-            self.logger.debug("Added GetVersion success output to cache for %s", client.url)
+        with _getversion_cache_lock:
+            if self.GetVersionCache is None or not self.opts.noCacheFiles:
+                # Read the file as serialized JSON
+                # Re-read it so we keep entries other handlers added since we last read it
+                self._load_getversion_cache()
+            if error:
+                # On error, leave existing data alone - just record the last error
+                if self.GetVersionCache.has_key(client.url):
+                    self.GetVersionCache[client.url]['lasterror'] = error
+                self.logger.debug("Added GetVersion error output to cache for %s: %s", client.url, error)
+            else:
+                self.GetVersionCache[client.url] = res
+                self.logger.debug("Added GetVersion success output to cache for %s", client.url)
 
-        # Write the file as serialized JSON
-        self._save_getversion_cache()
+            # Write the file as serialized JSON
+            self._save_getversion_cache()
 
     def _get_cached_getversion(self, client):
         '''Get GetVersion from cache or this AM, if any.'''
         if self.GetVersionCache is None:
-            self._load_getversion_cache()
+            with _getversion_cache_lock:
+                self._load_getversion_cache()
         if self.GetVersionCache is None:
             return None
         self.logger.debug("Checking cache for %s", client.url)
@@ -1030,6 +1039,11 @@ class AMCallHandler(object):
         return (options, mymessage)
     # End of _selectRSpecVersion
 
+    def _streamRSpecs(self, rspec):
+        '''Should this RSpec be decoded straight into its output file (see --streamRSpecs)?'''
+        return self.opts.output and self.opts.streamRSpecs and \
+            (isinstance(rspec, str) or isinstance(rspec, unicode)) and rspec.strip() != ""
+
     def _maybeDecompressRSpec(self, options, rspec):
         '''Helper to decompress an RSpec string if necessary'''
         if rspec is None or rspec.strip() == "":
@@ -1039,16 +1053,16 @@ class AMCallHandler(object):
             try:
                 rspec = zlib.decompress(rspec.decode('base64'))
             except Exception, e:
-                if rspec and rspec_util.is_rspec_string(rspec, None, None, logger=self.logger):
+                if rspec and rspec_util.is_rspec_string(rspec, None, None, logger=self.logger, sniff=True):
                     self.logger.debug("AM returned uncompressed RSpec when compressed was requested")
                 else:
                     self.logger.error("Failed to decompress RSpec: %s", e);
                 self.logger.debug("RSpec begins: '%s'", rspec[:min(40, len(rspec))])
         # In experimenter mode, maybe notice if the rspec appears compressed anyhow and try to decompress?
-        elif not self.opts.devmode and rspec and not rspec_util.is_rspec_string(rspec, None, None, logger=self.logger):
+        elif not self.opts.devmode and rspec and not rspec_util.is_rspec_string(rspec, None, None, logger=self.logger, sniff=True):
             try:
                 rspec2 = zlib.decompress(rspec.decode('base64'))
-                if rspec2 and rspec_util.is_rspec_string(rspec2, None, None, logger=self.logger):
+                if rspec2 and rspec_util.is_rspec_string(rspec2, None, None, logger=self.logger, sniff=True):
                     rspec = rspec2
             except Exception, e:
                 pass
@@ -1277,10 +1291,15 @@ class AMCallHandler(object):
                     origRSpec = resp['value']
                 else:
                     origRSpec = resp
+                if self._streamRSpecs(origRSpec):
+                    # listresources decodes this straight into the output file
+                    successCnt += 1
+                    rspecs[(client.urn, client.url)] = resp
+                    continue
                 rspec = self._maybeDecompressRSpec(options, origRSpec)
                 if rspec and rspec != origRSpec:
                     self.logger.debug("Decompressed RSpec")
-                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
+                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger, sniff=True ):
                     successCnt += 1
                     doPretty = (slicename is not None) # True on Manifests
                     if doPretty and rspec.count('\n') > 10:
@@ -1438,18 +1457,33 @@ class AMCallHandler(object):
             else:
                 returnedRspecs[url] = rspecStruct
 
-            retVal, filename = _writeRSpec(self.opts, self.logger, rspecOnly, slicename, urn, url, None, len(rspecs))
+            streamed = None
+            if self._streamRSpecs(rspecOnly):
+                # Decode the RSpec straight into the file. Return the filename in place of the RSpec.
+                retVal, filename, streamed = _writeRSpecStream(self.opts, self.logger, rspecOnly, slicename, urn, url, None, len(rspecs))
+                if self.opts.api_version < 2:
+                    returnedRspecs[(urn,url)] = filename
+                elif isinstance(rspecStruct, dict) and rspecStruct.has_key('value'):
+                    rspecStruct['value'] = filename
+            else:
+                retVal, filename = _writeRSpec(self.opts, self.logger, rspecOnly, slicename, urn, url, None, len(rspecs))
             if filename:
                 if not savedFileDesc.endswith(' ') and savedFileDesc != "" and not savedFileDesc.endswith('\n'):
                     savedFileDesc += " "
-                savedFileDesc += "Saved listresources RSpec from '%s' (url '%s') to file %s; " % (amNick, url, filename)
+                if streamed:
+                    savedFileDesc += "Saved listresources RSpec from '%s' (url '%s', %d nodes) to file %s; " % (amNick, url, streamed.nodeCount, filename)
+                else:
+                    savedFileDesc += "Saved listresources RSpec from '%s' (url '%s') to file %s; " % (amNick, url, filename)
 
             if rspecOnly and rspecOnly != "":
                 rspecCtr += 1
                 if slicename:
                     # Try to parse the new sliver expiration from the rspec and print it in the result summary.
                     # Use a helper function in handler_utils that can be used elsewhere.
-                    manExpires = expires_from_rspec(rspecOnly, self.logger)
+                    if streamed:
+                        manExpires = expires_from_rspec_stream(streamed, self.logger)
+                    else:
+                        manExpires = expires_from_rspec(rspecOnly, self.logger)
                     if manExpires is not None:
                         prstr = "Reservation at %s in slice %s expires at %s (UTC)." % (amNick, slicename, manExpires)
                         self.logger.info(prstr)
@@ -1633,15 +1667,20 @@ class AMCallHandler(object):
 # FIXME: Factor this next chunk into helper method?
             # Decompress the RSpec before sticking it in retItem
             rspec = None
+            streamRSpec = False
             if status and isinstance(status, dict) and status.has_key('value') and isinstance(status['value'], dict) and status['value'].has_key('geni_rspec'):
-                rspec = self._maybeDecompressRSpec(options, status['value']['geni_rspec'])
-                if rspec and rspec != status['value']['geni_rspec']:
-                    self.logger.debug("Decompressed RSpec")
-                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
-                    rspec = rspec_util.getPrettyRSpec(rspec)
+                if self._streamRSpecs(status['value']['geni_rspec']):
+                    # Decoded straight into the output file below
+                    streamRSpec = True
                 else:
-                    self.logger.warn("Didn't get a valid RSpec!")
-                status['value']['geni_rspec'] = rspec
+                    rspec = self._maybeDecompressRSpec(options, status['value']['geni_rspec'])
+                    if rspec and rspec != status['value']['geni_rspec']:
+                        self.logger.debug("Decompressed RSpec")
+                    if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger, sniff=True ):
+                        rspec = rspec_util.getPrettyRSpec(rspec)
+                    else:
+                        self.logger.warn("Didn't get a valid RSpec!")
+                    status['value']['geni_rspec'] = rspec
             else:
                 self.logger.warn("Got no resource listing from AM %s", client.str)
                 self.logger.debug("Return struct missing geni_rspec element!")
@@ -1667,6 +1706,22 @@ class AMCallHandler(object):
             for sliver in sliverFails.keys():
                 self.logger.warn("Sliver %s reported error: %s", sliver, sliverFails[sliver])
 
+            if streamRSpec and isinstance(status, dict) and status.has_key('geni_rspec'):
+                # Write the result with the RSpec decoded straight into the file.
+                # Return the filename in place of the RSpec.
+                filename = _construct_output_filename(self.opts, name, client.url, client.urn, "describe", ".json", numClients)
+                header = _getRSpecHeader(name, client.urn, client.url, slivers)
+                streamed = _writeJSONWithRSpecStream(self.opts, self.logger, header, status, 'geni_rspec', filename)
+                if not streamed.isRSpec():
+                    self.logger.warn("Didn't get a valid RSpec! %s", streamed.error)
+                status['geni_rspec'] = filename
+                retVal += "Saved description of %s at AM %s (%d nodes) to file %s. \n" % (descripMsg, client.str, streamed.nodeCount, filename)
+                if len(missingSlivers) == 0 and len(sliverFails.keys()) == 0:
+                    successCnt+=1
+                else:
+                    retVal += " - with %d slivers missing and %d slivers with errors. \n" % (len(missingSlivers), len(sliverFails.keys()))
+                continue
+
             (header, rspeccontent, rVal) = _getRSpecOutput(self.logger, rspec, name, client.urn, client.url, message, slivers)
             self.logger.debug(rVal)
             if status and isinstance(status, dict) and status.has_key('geni_rspec') and rspec and rspeccontent:
@@ -1852,7 +1907,7 @@ class AMCallHandler(object):
         if result:
             self.logger.info("Got return from CreateSliver for slice %s at %s:", slicename, client.str)
 
-            if rspec_util.is_rspec_string( result, None, None, logger=self.logger ):
+            if rspec_util.is_rspec_string( result, None, None, logger=self.logger, sniff=True ):
                 result = rspec_util.getPrettyRSpec(result)
             (retVal, filename) = _writeRSpec(self.opts, self.logger, result, slicename, clienturn, url, message)
             if filename:
@@ -2060,7 +2115,7 @@ class AMCallHandler(object):
             rspec = None
             if result and isinstance(result, dict) and result.has_key('value') and isinstance(result['value'], dict) and result['value'].has_key('geni_rspec'):
                 rspec = result['value']['geni_rspec']
-                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
+                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger, sniff=True ):
                     rspec = rspec_util.getPrettyRSpec(rspec)
                     result['value']['geni_rspec'] = rspec
                 else:
@@ -2310,7 +2365,7 @@ class AMCallHandler(object):
             # Make the RSpec more pretty-printed
             if result and isinstance(result, dict) and result.has_key('value') and isinstance(result['value'], dict) and result['value'].has_key('geni_rspec'):
                 rspec = result['value']['geni_rspec']
-                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
+                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger, sniff=True ):
                     rspec = rspec_util.getPrettyRSpec(rspec)
                     result['value']['geni_rspec'] = rspec
                 else:
@@ -2916,9 +2971,10 @@ class AMCallHandler(object):
                                                     self.logger.debug("Malformed sliver URN '%s'. Assuming this is OK anyhow at this FOAM based am: %s. See http://groups.geni.net/geni/ticket/1294", surn, agg_urn)
                                     # End of loop over status return elems
 
+                            changes = SliverInfoChanges(urn, agg_urn)
                             for sliver_urn in sliver_urns:
-                                self.framework.update_sliver_info(agg_urn, urn, sliver_urn,
-                                                                  newExp)
+                                changes.update(sliver_urn, newExp)
+                            changes.apply(self.framework, self.logger)
                         else:
                             self.logger.info("Not updating recorded sliver expirations - no valid AM URN known")
                     except NotImplementedError, nie:
@@ -3147,6 +3203,7 @@ class AMCallHandler(object):
                     # record results in SA database
                     try:
                         agg_urn = self._getURNForClient(client)
+                        changes = SliverInfoChanges(urn, agg_urn)
                         slivers = self._getSliverResultList(res)
                         for sliver in slivers:
                             if isinstance(sliver, dict) and \
@@ -3165,8 +3222,8 @@ class AMCallHandler(object):
                                     self.logger.debug("Not recording sliver that had renew error: %s", sliver)
                                     continue
 
-                                self.framework.update_sliver_info \
-                                    (agg_urn, urn, sliver['geni_sliver_urn'], sliver['geni_expires'])
+                                changes.update(sliver['geni_sliver_urn'], sliver['geni_expires'])
+                        changes.apply(self.framework, self.logger)
                     except NotImplementedError, nie:
                         self.logger.debug('Framework %s doesnt support recording slivers in SA database', self.config['selected_framework']['type'])
                     except Exception, e:
@@ -3379,74 +3436,18 @@ class AMCallHandler(object):
                                 else:
                                     expI = exps
 
-                                # I'd like to be able to tell the SA to delete all slivers registered for
-                                # this slice/AM, but the API says sliver_urn is required
+                                # Diff the CH list against the AM list, and send the CH
+                                # any creates, updates and deletes in one batch
                                 slivers_by_am = self.framework.list_sliver_infos_for_slice(urn)
-                                if slivers_by_am is None or not slivers_by_am.has_key(agg_urn):
-                                    # CH has no slivers. So all slivers the AM reported must be sent to the CH
-
-                                    # FIXME: status should be a list of structs which each has a geni_urn or geni_sliver_urn
-                                    # So it could be status['geni_resources']. Mostly I think that works.
-                                    s_es = []
-                                    if status.has_key('geni_resources'):
-                                        s_es = status['geni_resources']
-                                        self.logger.debug("CH listed 0 sliver_info records, so creating them all from status info")
-                                        # Create an entry
-                                        self.framework.create_sliver_info(None, urn, 
-                                                                          client.url,
-                                                                          expI,
-                                                                          s_es, agg_urn)
-                                    else:
-                                        # No struct of slivers to report
-                                        pass
-                                else:
-                                    # Need to reconcile the CH list and the AM list
+                                ch_slivers = {}
+                                if slivers_by_am is not None and slivers_by_am.has_key(agg_urn):
                                     ch_slivers = slivers_by_am[agg_urn]
-                                    self.logger.debug("Reconciling %d CH sliver infos against %d AM reported slivers", len(ch_slivers.keys()), len(poss_slivers))
-                                    # For each CH sliver, if not in poss_slivers, then remove it
-                                    # Else if expirations differ, update it
-                                    for sliver in ch_slivers.keys():
-                                        chexpo = None
-                                        if ch_slivers[sliver].has_key('SLIVER_INFO_EXPIRATION'):
-                                            chexp = ch_slivers[sliver]['SLIVER_INFO_EXPIRATION']
-                                            chexpo = naiveUTC(dateutil.parser.parse(chexp, tzinfos=tzd))
-                                        if sliver not in poss_slivers:
-                                            self.logger.debug("CH lists sliver '%s' that is not in AM list; delete", sliver)
-                                            # CH reported a sliver not reported by the AM. Delete it
-                                            self.framework.delete_sliver_info(sliver)
-                                        else:
-                                            if chexpo is None or (expI is not None and abs(chexpo - expI) > datetime.timedelta.resolution):
-                                                self.logger.debug("CH sliver %s expiration %s != AM exp %s; update at CH", sliver, str(chexpo), str(expI))
-                                                # update the recorded expiration time to be accurate
-                                                self.framework.update_sliver_info(agg_urn, urn, sliver,
-                                                                                  expI)
-                                            else:
-                                                # CH has what we have
-#                                                self.logger.debug("CH agrees about expiration of %s: %s", sliver, expI)
-                                                pass
-
-                                    # Then for each AM sliver, if not in ch_slivers, add it
-                                    sliver_statusstruct = []
-                                    for amsliver in poss_slivers:
-                                        if amsliver not in ch_slivers.keys():
-                                            self.logger.debug("AM lists sliver %s not reported by CH", amsliver)
-                                            # AM reported a sliver not reported by the CH
-                                            if status.has_key('geni_resources'):
-                                                s_es = status['geni_resources']
-                                                for resource in status['geni_resources']:
-                                                    if resource and isinstance(resource, dict) and resource.has_key('geni_urn'):
-                                                        gurn = resource['geni_urn']
-                                                        if gurn.strip() == amsliver:
-                                                            sliver_statusstruct.append(resource)
-                                                            break
-                                    if len(sliver_statusstruct) > 0:
-                                        self.logger.debug("Creating %s sliver records at CH", len(sliver_statusstruct))
-                                        # Create an entry for each sliver that was missing
-                                        self.framework.create_sliver_info(None, urn, 
-                                                                          client.url,
-                                                                          expI,
-                                                                          sliver_statusstruct, agg_urn)
-                                # End of else block to reconcile CH vs AM sliver lists
+                                self.logger.debug("Reconciling %d CH sliver infos against %d AM reported slivers", len(ch_slivers.keys()), len(poss_slivers))
+                                am_slivers = {}
+                                for amsliver in poss_slivers:
+                                    am_slivers[amsliver] = (expI, expI)
+                                changes = reconcile(SliverInfoChanges(urn, agg_urn), ch_slivers, am_slivers)
+                                changes.apply(self.framework, self.logger)
                             else:
                                 self.logger.debug("Not syncing slivers with CH - no valid AM URN known")
                         except NotImplementedError, nie:
@@ -3494,11 +3495,7 @@ class AMCallHandler(object):
                         # Get the Agg URN for this client
                         agg_urn = self._getURNForClient(client)
                         if urn_util.is_valid_urn(agg_urn):
-                            # I'd like to be able to tell the SA to delete all slivers registered for
-                            # this slice/AM, but the API says sliver_urn is required
-                            sliver_urns = self.framework.list_sliverinfo_urns(urn, agg_urn)
-                            for sliver_urn in sliver_urns:
-                                self.framework.delete_sliver_info(sliver_urn)
+                            self._deleteSliverInfos(urn, agg_urn)
                         else:
                             self.logger.debug("Not ensuring with CH that AM %s slice %s has no slivers - no valid AM URN known")
                     except NotImplementedError, nie:
@@ -3676,18 +3673,13 @@ class AMCallHandler(object):
                         try:
                             if len(slivers) > 0:
                                 self.logger.debug("Status failed - assuming all %d sliver URNs asked about are invalid and not at this AM - delete from CH", len(slivers))
-                                for sliver in slivers:
-                                    self.framework.delete_sliver_info(sliver)
+                                self._deleteSliverInfos(urn, None, slivers)
                             else:
                                 self.logger.debug("Status failed: assuming this slice has 0 slivers at this AM. Ensure CH lists none.")
                                 # Get the Agg URN for this client
                                 agg_urn = self._getURNForClient(client)
                                 if urn_util.is_valid_urn(agg_urn):
-                                    # I'd like to be able to tell the SA to delete all slivers registered for
-                                    # this slice/AM, but the API says sliver_urn is required
-                                    sliver_urns = self.framework.list_sliverinfo_urns(urn, agg_urn)
-                                    for sliver_urn in sliver_urns:
-                                        self.framework.delete_sliver_info(sliver_urn)
+                                    self._deleteSliverInfos(urn, agg_urn)
                                 else:
                                     self.logger.debug("Not ensuring with CH that AM %s slice %s has no slivers - no valid AM URN known")
                         except NotImplementedError, nie:
@@ -3846,106 +3838,42 @@ class AMCallHandler(object):
                         statuses = self._getSliverAllocStates(status) # Dict by URN of sliver alloc state
                         resultSlivers = statuses.keys()
 
-                        if slivers_by_am is None or not slivers_by_am.has_key(agg_urn):
-                            # CH has no slivers. So all
-                            # slivers the AM reported must be sent
-                            # to the CH
-                            if len(resultSlivers) > 0:
-                                self.logger.debug("CH missing %d slivers at AM - report those that are provisioned", len(resultSlivers))
-                            for sliver in resultSlivers:
-                                if not statuses.has_key(sliver):
-                                    self.logger.debug("No %s key in statuses? %s", sliver, statuses)
-                                elif statuses[sliver] == 'geni_provisioned':
-                                    if not expirations.has_key(sliver):
-                                        self.logger.debug("No %s key in expirations? %s", sliver, expirations)
-                                        expO = None
-                                    else:
-                                        expO = self._datetimeFromString(expirations[sliver])[1]
-                                    if not status_structs.has_key(sliver):
-                                        self.logger.debug("status_structs missing %s: %s", sliver, status_structs)
-                                    else:
-                                    # self.logger.debug("Will create sliver. slice: %s, AMURL: %s, expiration: %s, status_struct: %s, AMURN: %s", urn, client.url, expO, status_structs[sliver], agg_urn)
-                                        self.framework.create_sliver_info(None, urn, 
-                                                                          client.url,
-                                                                          expO,
-                                                                          [status_structs[sliver]], agg_urn)
-                                # else this sliver should not (yet) be recorded at the CH
-                        else:
-                            # Need to reconcile the CH list and the AM list
+                        ch_slivers = {}
+                        if slivers_by_am is not None and slivers_by_am.has_key(agg_urn):
                             ch_slivers = slivers_by_am[agg_urn]
 
-                            # missingSlivers: delete CH record for each
-                            # FIXME: If self.opts.geni_best_effort could an AM not return an entry for a sliver
-                            # you don't have permission to see or something? I don't think I'll
-                            # worry about this now.
-                            if len(missingSlivers) > 0:
-                                self.logger.debug("Ensure %d missing slivers not reported by CH", len(missingSlivers))
-                            for missing in missingSlivers:
-                                if missing in ch_slivers.keys():
-                                    self.framework.delete_sliver_info(missing)
-                                # Else AM didn't list it and neither did CH
-
-                            # sliverFails: If the failed sliver says it is provisioned, it should be at the CH
-                            # If the failed sliver is not provisioned, then it should not be at the CH (yet)
-                            for fail in sliverFails:
-                                if statuses[fail] == 'geni_provisioned' and fail not in ch_slivers.keys():
-                                    expO = self._datetimeFromString(expirations[fail])[1]
-                                    self.logger.debug("Recording failed but provisioned sliver %s at CH (error: %s)", fail, sliverFails[fail])
-                                    self.framework.create_sliver_info(None, urn, 
-                                                                      client.url,
-                                                                      expO,
-                                                                      [status_structs[fail]], agg_urn)
-                                elif statuses[fail] != 'geni_provisioned' and fail in ch_slivers.keys():
-                                    # The AM says the sliver is gone or not yet provisioned: Delete
-                                    self.logger.debug("Deleting CH record of failed and not provisioned sliver %s (error: %s, expiration: %s)", fail, sliverFails[fail], expirations[fail])
-                                    self.framework.delete_sliver_info(fail)
-                                else:
-                                    # Do nothing with this failed sliver - just note it
-                                    if fail in ch_slivers.keys():
-                                        self.logger.debug("Not changing existing CH record of sliver %s that failed: %s", fail, sliverFails[fail])
-                                    else:
-                                        self.logger.debug("Not adding new CH record of sliver %s that failed: %s", fail, sliverFails[fail])
-                            # End of block to handle failed slivers (had a geni_error)
-
-                            # Any in CH not in result (and if we asked for slivers, also in list
-                            # we asked for) - Delete
-                            # Plus any in CH and result that are not geni_provisioned, delete
-                            for ch_sliver in ch_slivers.keys():
-                                if ch_sliver not in resultSlivers:
-                                    if len(slivers) == 0 or ch_sliver in slivers:
-                                        self.logger.debug("Deleting CH record of sliver not at AM: %s", ch_sliver)
-                                        self.framework.delete_sliver_info(ch_sliver)
-                                elif statuses[ch_sliver] != 'geni_provisioned':
-                                    self.logger.debug("Deleting CH record of not provisioned sliver %s (expiration: %s)", ch_sliver, expirations[ch_sliver])
-                                    self.framework.delete_sliver_info(ch_sliver)
-
-                            # All other slivers in result (not in sliverFails):
-                            for sliver in resultSlivers:
-                                if statuses[sliver] == 'geni_provisioned' and sliver not in sliverFails.keys():
-                                    if sliver not in ch_slivers.keys():
-                                        expO = self._datetimeFromString(expirations[sliver])[1]
-                                        self.logger.debug("Recording AM reported sliver %s at CH", sliver)
-                                        self.framework.create_sliver_info(None, urn, 
-                                                                          client.url,
-                                                                          expO,
-                                                                          [status_structs[sliver]], agg_urn)
-                                    else:
-                                        # Now dealing with slivers listed by AM and CH, and provisioned at AM, and not failed
-                                        chexpo = None
-                                        if ch_slivers[sliver].has_key('SLIVER_INFO_EXPIRATION'):
-                                            chexp = ch_slivers[sliver]['SLIVER_INFO_EXPIRATION']
-                                            chexpo = naiveUTC(dateutil.parser.parse(chexp, tzinfos=tzd))
-
-                                        expO, expT, _ = self._datetimeFromString(expirations[sliver])
-                                        if chexpo is None or (expO is not None and abs(chexpo - expO) > datetime.timedelta.resolution):
-                                            self.logger.debug("CH sliver %s expiration %s != AM exp %s; update at CH", sliver, str(chexpo), str(expO))
-                                            # update the recorded expiration time to be accurate
-                                            self.framework.update_sliver_info(agg_urn, urn, sliver,
-                                                                              expT)
-                                        # else CH/AM agree on the time. Nothing to do
-                                # Else the sliver is not yet provisioned or failed. Should already have been handled
-                            # End of loop over slivers in result
-                        # End of block where CH lists slivers in the slice for this AM
+                        # The CH should list exactly the provisioned slivers.
+                        # But leave alone CH records of provisioned slivers
+                        # that failed (had a geni_error).
+                        # FIXME: If self.opts.geni_best_effort could an AM not return an entry for a sliver
+                        # you don't have permission to see or something? I don't think I'll
+                        # worry about this now.
+                        am_slivers = {} # dict by URN of (naive expiration, expiration to record)
+                        keep = set()
+                        for sliver in resultSlivers:
+                            if statuses[sliver] != 'geni_provisioned':
+                                # Not (yet or any longer) recorded at the CH
+                                continue
+                            if sliver in sliverFails.keys():
+                                if sliver in ch_slivers.keys():
+                                    self.logger.debug("Not changing existing CH record of sliver %s that failed: %s", sliver, sliverFails[sliver])
+                                    keep.add(sliver)
+                                    continue
+                                self.logger.debug("Recording failed but provisioned sliver %s at CH (error: %s)", sliver, sliverFails[sliver])
+                            if not expirations.has_key(sliver) or not status_structs.has_key(sliver):
+                                self.logger.debug("No expiration or status for sliver %s", sliver)
+                                continue
+                            expO, expT, _ = self._datetimeFromString(expirations[sliver])
+                            am_slivers[sliver] = (expO, expT)
+
+                        # Only delete CH records of slivers we asked about
+                        scope = set(ch_slivers.keys())
+                        if len(slivers) > 0:
+                            scope = set(slivers) | set(resultSlivers) | set(missingSlivers)
+                        scope = scope - keep
+
+                        changes = reconcile(SliverInfoChanges(urn, agg_urn), ch_slivers, am_slivers, scope)
+                        changes.apply(self.framework, self.logger)
                     except NotImplementedError, nie:
                         self.logger.debug('Framework %s doesnt support recording slivers in SA database', self.config['selected_framework']['type'])
                     except Exception, e:
@@ -4068,11 +3996,7 @@ class AMCallHandler(object):
                         # Get the Agg URN for this client
                         agg_urn = self._getURNForClient(client)
                         if urn_util.is_valid_urn(agg_urn):
-                            # I'd like to be able to tell the SA to delete all slivers registered for
-                            # this slice/AM, but the API says sliver_urn is required
-                            sliver_urns = self.framework.list_sliverinfo_urns(urn, agg_urn)
-                            for sliver_urn in sliver_urns:
-                                self.framework.delete_sliver_info(sliver_urn)
+                            self._deleteSliverInfos(urn, agg_urn)
                         else:
                             self.logger.debug("Not reporting to CH that slivers were deleted - no valid AM URN known")
                     except NotImplementedError, nie:
@@ -4103,11 +4027,7 @@ class AMCallHandler(object):
                         # Get the Agg URN for this client
                         agg_urn = self._getURNForClient(client)
                         if urn_util.is_valid_urn(agg_urn):
-                            # I'd like to be able to tell the SA to delete all slivers registered for
-                            # this slice/AM, but the API says sliver_urn is required
-                            sliver_urns = self.framework.list_sliverinfo_urns(urn, agg_urn)
-                            for sliver_urn in sliver_urns:
-                                self.framework.delete_sliver_info(sliver_urn)
+                            self._deleteSliverInfos(urn, agg_urn)
                         else:
                             self.logger.debug("Not ensuring with CH that AM %s slice %s has no slivers - no valid AM URN known")
                     except NotImplementedError, nie:
@@ -4286,6 +4206,7 @@ class AMCallHandler(object):
                 if not self.opts.noExtraCHCalls:
                     # record results in SA database
                     try:
+                        changes = SliverInfoChanges(urn, None)
                         sliversDict = self._getSliverResultList(realres)
                         for sliver in sliversDict:
                             if isinstance(sliver, dict) and \
@@ -4306,10 +4227,10 @@ class AMCallHandler(object):
                                     self.logger.debug("Skipping noting delete of failed sliver %s", sliver)
                                     continue
                                 self.logger.debug("Recording sliver %s deleted", sliver)
-                                self.framework.delete_sliver_info \
-                                    (sliver['geni_sliver_urn'])
+                                changes.delete(sliver['geni_sliver_urn'])
                             else:
                                 self.logger.debug("Skipping noting delete of malformed sliver %s", sliver)
+                        changes.apply(self.framework, self.logger)
                     except NotImplementedError, nie:
                         self.logger.debug('Framework %s doesnt support recording slivers in SA database', self.config['selected_framework']['type'])
                     except Exception, e:
@@ -4374,18 +4295,13 @@ class AMCallHandler(object):
                         try:
                             if len(slivers) > 0:
                                 self.logger.debug("Delete failed - assuming all %d sliver URNs asked about are invalid and not at this AM - delete from CH", len(slivers))
-                                for sliver in slivers:
-                                    self.framework.delete_sliver_info(sliver)
+                                self._deleteSliverInfos(urn, None, slivers)
                             else:
                                 self.logger.debug("Delete failed: assuming this slice has 0 slivers at this AM. Ensure CH lists none.")
                                 # Get the Agg URN for this client
                                 agg_urn = self._getURNForClient(client)
                                 if urn_util.is_valid_urn(agg_urn):
-                                    # I'd like to be able to tell the SA to delete all slivers registered for
-                                    # this slice/AM, but the API says sliver_urn is required
-                                    sliver_urns = self.framework.list_sliverinfo_urns(urn, agg_urn)
-                                    for sliver_urn in sliver_urns:
-                                        self.framework.delete_sliver_info(sliver_urn)
+                                    self._deleteSliverInfos(urn, agg_urn)
                                 else:
                                     self.logger.debug("Not ensuring with CH that AM %s slice %s has no slivers - no valid AM URN known")
                         except NotImplementedError, nie:
@@ -4683,7 +4599,7 @@ class AMCallHandler(object):
             rspec = None
             if result and isinstance(result, dict) and result.has_key('value') and isinstance(result['value'], dict) and result['value'].has_key('geni_rspec'):
                 rspec = result['value']['geni_rspec']
-                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
+                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger, sniff=True ):
                     rspec = rspec_util.getPrettyRSpec(rspec)
                     result['value']['geni_rspec'] = rspec
                 else:
@@ -4918,7 +4834,7 @@ class AMCallHandler(object):
                 rspec = self._maybeDecompressRSpec(options, result['value']['geni_rspec'])
                 if rspec and rspec != result['value']['geni_rspec']:
                     self.logger.debug("Decompressed RSpec")
-                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger ):
+                if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=self.logger, sniff=True ):
                     rspec = rspec_util.getPrettyRSpec(rspec)
                 else:
                     self.logger.warn("Didn't get a valid RSpec!")
@@ -6586,6 +6502,19 @@ class AMCallHandler(object):
         return creds
 
 
+    def _deleteSliverInfos(self, urn, agg_urn, sliver_urns=None):
+        '''Tell the CH in one batch that the given slivers in this slice
+        are gone. With no slivers, remove every sliver the CH lists for
+        this slice at this AM.'''
+        if sliver_urns is None:
+            # I'd like to be able to tell the SA to delete all slivers registered for
+            # this slice/AM, but the API says sliver_urn is required
+            sliver_urns = self.framework.list_sliverinfo_urns(urn, agg_urn)
+        changes = SliverInfoChanges(urn, agg_urn)
+        for sliver_urn in sliver_urns:
+            changes.delete(sliver_urn)
+        return changes.apply(self.framework, self.logger)
+
     def _getURNForClient(self, client):
         if client is None or client.url is None:
             return None
@@ -26,17 +26,17 @@ from __future__ import absolute_import
 import json
 import logging
 import os
+import re
 import sys
 
-import M2Crypto.SSL
-
 from ..util.paths import getAbsPath
 from ..util import OmniError
 from ..util import credparsing as credutils
 from ..util import json_encoding
 from ..xmlrpc import client as xmlrpcclient
 
-from ...sfa.trust.credential import Credential
+# The value of each sliver_id attribute in a manifest RSpec
+SLIVER_ID_RE = re.compile(r'sliver_id\s*=\s*(["\'])(.*?)\1')
 
 class Framework_Base():
     """
@@ -97,6 +97,7 @@ class Framework_Base():
 #            cred = _load_cred(logger, opts.usercredfile)
             with open(opts.usercredfile, 'r') as f:
                 cred = f.read()
+            from ...sfa.trust.credential import Credential
             try:
                 cred = json.loads(cred, encoding='ascii', cls=json_encoding.DateTimeAwareJSONDecoder)
                 if cred and isinstance(cred, dict) and \
@@ -231,6 +232,7 @@ class Framework_Base():
             logger = logging.getLogger("omni.framework")
         logger.warning("*** Creating an SSL Context! ***")
         if not self.sslctx:
+            import M2Crypto.SSL
             # Initialize the M2Crypto SSL Context
             attempts = 0
             while attempts <= retries:
@@ -348,6 +350,34 @@ class Framework_Base():
     def delete_sliver_info(self, sliver_urn):
         raise NotImplementedError('delete_sliver_info')
 
+    # Record, update and delete many slivers in a slice at the CH at once.
+    # creates and updates are lists of dicts with keys 'sliver_urn',
+    # 'aggregate_urn' and 'expiration'. deletes is a list of sliver URNs.
+    # Return a dict by sliver URN of True or an error message.
+    # This default makes one call per sliver; frameworks whose CH can
+    # take many changes in one call should override it.
+    def apply_sliver_info_changes(self, slice_urn, creates=None, updates=None, deletes=None):
+        results = {}
+        for change in (creates or []):
+            sliver = {'geni_sliver_urn': change['sliver_urn']}
+            if change.get('expiration'):
+                sliver['geni_expires'] = change['expiration']
+            res = self.create_sliver_info(None, slice_urn, None, change.get('expiration'),
+                                          [sliver], change.get('aggregate_urn'))
+            results[change['sliver_urn']] = res in (True, "True") or res
+        for change in (updates or []):
+            results[change['sliver_urn']] = self.update_sliver_info(change.get('aggregate_urn'), slice_urn,
+                                                                    change['sliver_urn'], change.get('expiration'))
+        for sliver_urn in (deletes or []):
+            results[sliver_urn] = self.delete_sliver_info(sliver_urn)
+        return results
+
+    # Return the sliver URNs in the given manifest RSpec, in order
+    def sliver_urns_in_manifest(self, manifest):
+        if not manifest:
+            return []
+        return [match.group(2) for match in SLIVER_ID_RE.finditer(manifest)]
+
     # Find all slivers the SA lists for the given slice
     # Return a struct by AM URN containing a struct: sliver_urn = sliver info struct
     # Compare with list_sliverinfo_urns which only returns the sliver URNs
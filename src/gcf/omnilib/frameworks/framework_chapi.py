@@ -31,6 +31,7 @@ from .framework_base import Framework_Base
 from ..util import OmniError
 from ..util.dates import naiveUTC
 from ..util.dossl import _do_ssl
+from ..util.faultPrinting import cln_xmlrpclib_fault
 from ..util import credparsing as credutils
 #from ..util.handler_utils import _lookupAggURNFromURLInNicknames
 from ..util.handler_utils import _load_cred
@@ -52,6 +53,7 @@ from pprint import pprint
 import string
 import sys
 import uuid
+import xmlrpclib
 
 class Framework(Framework_Base):
     def __init__(self, config, opts):
@@ -96,6 +98,8 @@ class Framework(Framework_Base):
 
         self._sa = None
         self._sa_url = None
+        # Set False once the SA rejects system.multicall
+        self._sa_multicall = True
         if config.has_key('sa') and config['sa'].strip() != "":
             self._sa_url = config['sa']
             self.logger.info("Slice Authority is %s (from config)", self._sa_url)
@@ -1612,12 +1616,31 @@ class Framework(Framework_Base):
             if sc is not None:
                 creds.append(sc)
 
+        options = self._new_sliver_options(sliver_urn, slice_urn, agg_urn,
+                                           creator_urn, expiration)
+        if options is None:
+            return ""
+
+        self.logger.debug("Recording new slivers with options: %s", options)
+        creds, options = self._add_credentials_and_speaksfor(creds, options)
+        if not self.speakV2:
+            res = _do_ssl(self, None, "Recording sliver '%s' creation at %s %s" % (sliver_urn, self.fwtype, self.sa_url()),
+                          self.sa().create_sliver_info, creds, options)
+        else:
+            res = _do_ssl(self, None, "Recording sliver '%s' creation at %s %s" % (sliver_urn, self.fwtype, self.sa_url()),
+                          self.sa().create, "SLIVER_INFO", creds, options)
+        return self._log_results(res, "Record sliver '%s' creation at %s" % (sliver_urn, self.fwtype))
+
+    # Check a new sliver to record, returning the options to pass the SA
+    # to record it, or None if the sliver should not be recorded
+    def _new_sliver_options(self, sliver_urn, slice_urn, agg_urn,
+                            creator_urn, expiration):
         if not is_valid_urn(agg_urn):
             self.logger.debug("Not a valid AM URN: %s", agg_urn)
             agg_urn = None
         if sliver_urn is None or sliver_urn.strip() == "":
             self.logger.warn("Empty sliver urn to record")
-            return ""
+            return None
 
         # The full check punishes the experimenter for an AM's
         # malformed sliver URNs, which I think is wrong and confusing.
@@ -1630,7 +1653,7 @@ class Framework(Framework_Base):
             agg_urn = self._getAggFromSliverURN(sliver_urn)
             if not is_valid_urn(agg_urn):
                 self.logger.warn("Invalid aggregate URN '%s' for recording new sliver from sliver urn '%s'", agg_urn, sliver_urn)
-                return ""
+                return None
         elif sliver_urn.startswith(slice_urn) and ('al2s' in agg_urn or 'foam' in agg_urn):
             # Work around a FOAM/AL2S bug producing bad sliver URNs
             # See http://groups.geni.net/geni/ticket/1294
@@ -1645,7 +1668,7 @@ class Framework(Framework_Base):
             if not auth.startswith(agg_auth):
                 self.logger.debug("Skipping sliver '%s' that doesn't appear to come from the specified AM '%s'", sliver_urn,
                                   agg_urn)
-                return ""
+                return None
         # FIXME: This assumes the sliver was created now, which isn't strictly true on create,
         # and is certainly wrong if we are doing a create because the update failed
         fields = {"SLIVER_INFO_URN": sliver_urn,
@@ -1658,16 +1681,119 @@ class Framework(Framework_Base):
         if (expiration):
             # Note that if no TZ specified, UTC is assumed
             fields["SLIVER_INFO_EXPIRATION"] = str(expiration)
-
-        self.logger.debug("Recording new slivers with options: %s", options)
-        creds, options = self._add_credentials_and_speaksfor(creds, options)
-        if not self.speakV2:
-            res = _do_ssl(self, None, "Recording sliver '%s' creation at %s %s" % (sliver_urn, self.fwtype, self.sa_url()),
-                          self.sa().create_sliver_info, creds, options)
-        else:
-            res = _do_ssl(self, None, "Recording sliver '%s' creation at %s %s" % (sliver_urn, self.fwtype, self.sa_url()),
-                          self.sa().create, "SLIVER_INFO", creds, options)
-        return self._log_results(res, "Record sliver '%s' creation at %s" % (sliver_urn, self.fwtype))
+        return options
+
+    # Build the SA method name and arguments to create, update or delete
+    # one sliver info record
+    def _sliver_info_call(self, operation, sliver_urn, creds, options):
+        creds, options = self._add_credentials_and_speaksfor(list(creds), options)
+        args = [creds, options]
+        if operation != 'create':
+            args.insert(0, sliver_urn)
+        if self.speakV2:
+            return (operation, ["SLIVER_INFO"] + args)
+        return ("%s_sliver_info" % operation, args)
+
+    # Make a list of SA calls, given as (method name, args, reason) tuples.
+    # Where the SA supports it, send them all in one system.multicall;
+    # otherwise make one call at a time.
+    # Return a list of (result, message) tuples as from _do_ssl, in order
+    def _sa_batch(self, calls):
+        if len(calls) > 1 and self._sa_multicall:
+            multicall = xmlrpclib.MultiCall(self.sa())
+            for (method, args, reason) in calls:
+                getattr(multicall, method)(*args)
+            # A server without multicall answers with the standard
+            # method not found fault, or (like python's own XML-RPC
+            # server) a fault naming system.multicall
+            unsupported = ['<Fault %d:' % xmlrpclib.METHOD_NOT_FOUND, 'system.multicall']
+            res, mess = _do_ssl(self, unsupported,
+                                "Recording %d sliver changes at %s %s" % (len(calls), self.fwtype, self.sa_url()),
+                                multicall)
+            if res is not None:
+                results = []
+                for i in range(len(calls)):
+                    try:
+                        results.append((res[i], ""))
+                    except xmlrpclib.Fault, fault:
+                        results.append((None, cln_xmlrpclib_fault(fault)))
+                return results
+            if mess not in unsupported:
+                return [(None, mess)] * len(calls)
+            self.logger.debug("%s %s does not support system.multicall. Recording slivers one at a time.",
+                              self.fwtype, self.sa_url())
+            self._sa_multicall = False
+        results = []
+        for (method, args, reason) in calls:
+            results.append(_do_ssl(self, None, reason, getattr(self.sa(), method), *args))
+        return results
+
+    # Record, update and delete many slivers in a slice at once.
+    # creates and updates are lists of dicts with keys 'sliver_urn',
+    # 'aggregate_urn' and 'expiration'. deletes is a list of sliver URNs.
+    # Return a dict by sliver URN of True or an error message.
+    # Slivers skipped as invalid are not in the result.
+    def apply_sliver_info_changes(self, slice_urn, creates=None, updates=None, deletes=None):
+        results = {}
+        slice_urn = self.slice_name_to_urn(slice_urn)
+        slice_creds = []
+        user_creds = []
+        if self.needcred:
+            if creates or updates:
+                sc = self.get_slice_cred_struct(slice_urn)
+                if sc is not None:
+                    slice_creds.append(sc)
+            if deletes:
+                uc, msg = self.get_user_cred(True)
+                if uc is not None:
+                    user_creds.append(uc)
+
+        calls = []
+        actions = []
+        for change in (creates or []):
+            sliver_urn = change['sliver_urn']
+            options = self._new_sliver_options(sliver_urn, slice_urn, change.get('aggregate_urn'),
+                                               self.user_urn, change.get('expiration'))
+            if options is None:
+                continue
+            method, args = self._sliver_info_call('create', sliver_urn, slice_creds, options)
+            calls.append((method, args, "Recording sliver '%s' creation at %s %s" % (sliver_urn, self.fwtype, self.sa_url())))
+            actions.append(('create', change, "Record sliver '%s' creation at %s" % (sliver_urn, self.fwtype)))
+        for change in (updates or []):
+            sliver_urn = change['sliver_urn']
+            checked = self._update_sliver_options(change.get('aggregate_urn'), slice_urn, sliver_urn,
+                                                  change.get('expiration'))
+            if checked is None:
+                continue
+            agg_urn, options = checked
+            method, args = self._sliver_info_call('update', sliver_urn, slice_creds, options)
+            calls.append((method, args, "Recording sliver '%s' updated expiration" % sliver_urn))
+            actions.append(('update', dict(change, aggregate_urn=agg_urn), "Update sliver '%s' expiration" % sliver_urn))
+        for sliver_urn in (deletes or []):
+            if not self._weakSliverValidCheck(sliver_urn):
+                self.logger.debug("Invalid sliver urn but continuing: %s", sliver_urn)
+            method, args = self._sliver_info_call('delete', sliver_urn, user_creds, {})
+            calls.append((method, args, "Recording sliver '%s' deleted" % sliver_urn))
+            actions.append(('delete', {'sliver_urn': sliver_urn}, "Record sliver '%s' deleted" % sliver_urn))
+
+        unregistered = []
+        for (operation, change, action), res in zip(actions, self._sa_batch(calls)):
+            msg = self._log_results(res, action)
+            if operation == 'update' and "Register the sliver" in str(msg) and "ARGUMENT_ERROR" in str(msg) \
+                    and is_valid_urn(slice_urn) and is_valid_urn(change['aggregate_urn']):
+                # SA didn't know about this sliver: record it instead
+                unregistered.append(change)
+            results[change['sliver_urn']] = msg
+
+        if unregistered:
+            recorded = self.apply_sliver_info_changes(slice_urn, creates=unregistered)
+            for change in unregistered:
+                sliver_urn = change['sliver_urn']
+                if recorded.get(sliver_urn) == True:
+                    results[sliver_urn] = "Recorded sliver '%s' with new expiration" % sliver_urn
+                elif sliver_urn in recorded:
+                    results[sliver_urn] = str(results[sliver_urn]) + str(recorded[sliver_urn])
+        return results
 
     # write new sliver_info to the database using chapi
     # Manifest is the XML when using APIv1&2 and none otherwise
@@ -1703,35 +1829,17 @@ class Framework(Framework_Base):
         if not is_valid_urn(slice_urn):
             self.logger.warn("Invalid slice URN '%s' for recording new slivers", slice_urn)
             return
-        creds = []
         msg = ""
+        # Slivers to record, all in one batch at the end
+        creates = []
 
         if manifest and manifest.strip() != "" and (slivers is None or len(slivers) == 0):
             # APIv1/2: find slivers in manifest
             self.logger.debug("Finding new slivers to record in manifest")
-            # Loop through manifest finding all slivers to record
-            foundSlivers = False
-            while True:
-                idx1 = manifest.find('sliver_id=') # Start of 'sliver_id='
-                if idx1 < 0: break # No more slivers
-                idx2 = manifest.find('"', idx1) + 1 # Start of URN
-                if idx2 == 0:
-                    # didn't find start of sliver id?
-                    self.logger.debug("Malformed sliver_id in rspec? %s", manifest[:30])
-                    manifest = manifest[9:]
-                    continue
-                idx3 = manifest.find('"', idx2) # End of URN
-                if idx3 == 0:
-                    # didn't find end of sliver id?
-                    self.logger.debug("Malformed sliver_id in rspec? %s", manifest[idx2-15:idx2+80])
-                    manifest = manifest[idx2:]
-                    continue
-                sliver_urn = manifest[idx2 : idx3]
-                manifest = manifest[idx3+1:]
-                foundSlivers = True
-                msg = msg + str(self._record_one_new_sliver(sliver_urn,
-                                                        slice_urn, agg_urn, creator_urn, expiration))
-            # End of while loop over slivers in manifest
+            for sliver_urn in self.sliver_urns_in_manifest(manifest):
+                creates.append({'sliver_urn': sliver_urn, 'aggregate_urn': agg_urn,
+                                'expiration': expiration})
+            foundSlivers = len(creates) > 0
 
             # Ticket #574
             # If we have an am_urn and have a manifest and this is a FOAM manifest/AM, then we have no sliver_urns yet probably.
@@ -1749,8 +1857,8 @@ class Framework(Framework_Base):
                 sliver_urn = URN(authority=auth, type="sliver", name=str(sliver_uuid)).urn_string()
                 self.logger.debug("Recording sliver_info had manifest with no sliver_ids (FOAM?). Created a single sliver urn to record: %s", sliver_urn)
                 # Record one new sliver with that
-                msg = msg + str(self._record_one_new_sliver(sliver_urn,
-                                                        slice_urn, agg_urn, creator_urn, expiration))
+                creates.append({'sliver_urn': sliver_urn, 'aggregate_urn': agg_urn,
+                                'expiration': expiration})
 
         elif slivers and len(slivers) > 0:
             # APIv3 style sliver to record
@@ -1766,12 +1874,17 @@ class Framework(Framework_Base):
                 exp = expiration
                 if sliver.has_key('geni_expires'):
                     exp = sliver['geni_expires']
-                msg = msg + str(self._record_one_new_sliver(sliver_urn,
-                                                        slice_urn, agg_urn, creator_urn, exp))
+                creates.append({'sliver_urn': sliver_urn, 'aggregate_urn': agg_urn,
+                                'expiration': exp})
             # End of loop over slivers
         else:
             self.logger.debug("Got no manifest AND no slivers to record")
         # End of if/else block for API Version
+
+        if creates:
+            results = self.apply_sliver_info_changes(slice_urn, creates=creates)
+            for change in creates:
+                msg = msg + str(results.get(change['sliver_urn'], ""))
         return msg
 
     # use the database to convert an aggregate url to the corresponding urn
@@ -1861,28 +1974,11 @@ class Framework(Framework_Base):
     # If we get an argument error indicating the sliver was not yet recorded, try
     # to record it
     def update_sliver_info(self, agg_urn, slice_urn, sliver_urn, expiration):
-        if expiration is None:
-            self.logger.warn("Empty new expiration to record for sliver '%s'", sliver_urn)
-            return None
-        if sliver_urn is None or sliver_urn.strip() == "":
-            self.logger.warn("Empty sliver_urn to update record of sliver expiration")
-            return
-
-        # Just make sure this is a reasonable URN of type sliver,
-        # without validating the name portion - since we really don't
-        # care so much what names the AM uses
-        if not self._weakSliverValidCheck(sliver_urn):
-            if is_valid_urn(agg_urn) and sliver_urn.startswith(slice_urn) and ('al2s' in agg_urn or 'foam' in agg_urn):
-                # Work around a FOAM/AL2S bug producing bad sliver URNs
-                # See http://groups.geni.net/geni/ticket/1294
-                self.logger.debug("Malformed sliver URN '%s'. Assuming this is OK anyhow at this FOAM based am: %s. See http://groups.geni.net/geni/ticket/1294", sliver_urn, agg_urn)
-            else:
-                self.logger.warn("Cannot update sliver expiration record: Invalid sliver urn '%s'", sliver_urn)
-                return
-        if not is_valid_urn(agg_urn):
-            agg_urn = self._getAggFromSliverURN(sliver_urn)
-
         slice_urn = self.slice_name_to_urn(slice_urn)
+        checked = self._update_sliver_options(agg_urn, slice_urn, sliver_urn, expiration)
+        if checked is None:
+            return None
+        agg_urn, options = checked
 
         creds = []
         if self.needcred:
@@ -1894,10 +1990,6 @@ class Framework(Framework_Base):
             if sc is not None:
                 creds.append(sc)
 
-        # Note that if no TZ is specified, UTC is assumed
-        fields = {'SLIVER_INFO_EXPIRATION': str(expiration)}
-
-        options = {'fields' : fields}
         creds, options = self._add_credentials_and_speaksfor(creds, options)
         self.logger.debug("Passing options: %s", options)
         if not self.speakV2:
@@ -1919,6 +2011,34 @@ class Framework(Framework_Base):
                 msg = "Recorded sliver '%s' with new expiration" % sliver_urn
         return msg
 
+    # Check a sliver expiration update, returning the aggregate URN and
+    # the options to pass the SA, or None if the update should be skipped
+    def _update_sliver_options(self, agg_urn, slice_urn, sliver_urn, expiration):
+        if expiration is None:
+            self.logger.warn("Empty new expiration to record for sliver '%s'", sliver_urn)
+            return None
+        if sliver_urn is None or sliver_urn.strip() == "":
+            self.logger.warn("Empty sliver_urn to update record of sliver expiration")
+            return None
+
+        # Just make sure this is a reasonable URN of type sliver,
+        # without validating the name portion - since we really don't
+        # care so much what names the AM uses
+        if not self._weakSliverValidCheck(sliver_urn):
+            if is_valid_urn(agg_urn) and sliver_urn.startswith(slice_urn) and ('al2s' in agg_urn or 'foam' in agg_urn):
+                # Work around a FOAM/AL2S bug producing bad sliver URNs
+                # See http://groups.geni.net/geni/ticket/1294
+                self.logger.debug("Malformed sliver URN '%s'. Assuming this is OK anyhow at this FOAM based am: %s. See http://groups.geni.net/geni/ticket/1294", sliver_urn, agg_urn)
+            else:
+                self.logger.warn("Cannot update sliver expiration record: Invalid sliver urn '%s'", sliver_urn)
+                return None
+        if not is_valid_urn(agg_urn):
+            agg_urn = self._getAggFromSliverURN(sliver_urn)
+
+        # Note that if no TZ is specified, UTC is assumed
+        fields = {'SLIVER_INFO_EXPIRATION': str(expiration)}
+        return (agg_urn, {'fields' : fields})
+
 # Note: Valid 'match' fields for lookup_sliver_info are the same as is
 # passed in create_sliver_info. However, you can only look up by
 # sliver/slice if you are a member of the relevant slice, and only by
@@ -67,6 +67,8 @@ class Framework(Framework_Base):
                                    verbose=config['verbose'], timeout=opts.ssltimeout)
         self.cert_string = file(config['cert'],'r').read()
         self.user_cred = self.init_user_cred( opts )
+        # False once the CH is found not to record slivers (an older GCF CH)
+        self._ch_records_slivers = None
         
     def get_user_cred(self):
         message = ""
@@ -186,6 +188,122 @@ class Framework(Framework_Base):
             _ = message #Appease eclipse
             return None
 
+    def create_sliver_info(self, manifest, slice_urn,
+                              aggregate_url, expiration, slivers, am_urn):
+        """See framework_base for doc. Records all the new slivers at
+        the GCF CH in one call."""
+        slice_urn = self.slice_name_to_urn(slice_urn)
+        agg_urn = None
+        if is_valid_urn(am_urn):
+            agg_urn = am_urn
+        creates = []
+        if slivers:
+            for sliver in slivers:
+                if not isinstance(sliver, dict):
+                    continue
+                sliver_urn = sliver.get('geni_sliver_urn', sliver.get('geni_urn'))
+                if not sliver_urn:
+                    continue
+                creates.append({'sliver_urn': sliver_urn, 'aggregate_urn': agg_urn,
+                                'expiration': sliver.get('geni_expires', expiration)})
+        else:
+            for sliver_urn in self.sliver_urns_in_manifest(manifest):
+                creates.append({'sliver_urn': sliver_urn, 'aggregate_urn': agg_urn,
+                                'expiration': expiration})
+        if not creates:
+            self.logger.debug("Got no slivers to record")
+            return ""
+        results = self.apply_sliver_info_changes(slice_urn, creates=creates)
+        msg = ""
+        for change in creates:
+            msg = msg + str(results.get(change['sliver_urn'], ""))
+        return msg
+
+    def list_sliverinfo_urns(self, slice_urn, aggregate_urn):
+        """See framework_base for doc."""
+        return self.list_sliver_infos_for_slice(slice_urn).get(aggregate_urn, {}).keys()
+
+    def update_sliver_info(self, aggregate_urn, slice_urn, sliver_urn, expiration):
+        """See framework_base for doc."""
+        if expiration is None:
+            self.logger.warn("Empty new expiration to record for sliver '%s'", sliver_urn)
+            return None
+        results = self.apply_sliver_info_changes(slice_urn,
+                                                 updates=[{'sliver_urn': sliver_urn,
+                                                           'aggregate_urn': aggregate_urn,
+                                                           'expiration': expiration}])
+        return results.get(sliver_urn)
+
+    def delete_sliver_info(self, sliver_urn):
+        """See framework_base for doc."""
+        return self.apply_sliver_info_changes(None, deletes=[sliver_urn]).get(sliver_urn)
+
+    def list_sliver_infos_for_slice(self, slice_urn):
+        """See framework_base for doc."""
+        slivers_by_agg = {}
+        slice_urn = self.slice_name_to_urn(slice_urn)
+        if self._ch_records_slivers is False:
+            return slivers_by_agg
+        (slivers, message) = _do_ssl(self, ['ListSliverInfo'], ("List slivers in %s at GCF CH %s" % (slice_urn, self.config['ch'])), self.ch.ListSliverInfo, slice_urn)
+        if slivers is None:
+            if message == 'ListSliverInfo':
+                # Older GCF CHs do not record slivers: don't ask again
+                self.logger.debug("GCF CH %s does not record slivers", self.config['ch'])
+                self._ch_records_slivers = False
+            else:
+                self.logger.debug("Failed to list slivers in %s: %s", slice_urn, message)
+            return slivers_by_agg
+        for sliver_urn, sliver_info in slivers.items():
+            agg_urn = sliver_info.get('SLIVER_INFO_AGGREGATE_URN')
+            slivers_by_agg.setdefault(agg_urn, {})[sliver_urn] = sliver_info
+        return slivers_by_agg
+
+    def apply_sliver_info_changes(self, slice_urn, creates=None, updates=None, deletes=None):
+        """See framework_base for doc. The GCF CH takes all the changes
+        in one UpdateSliverInfo call."""
+        changes = []
+        for change in (creates or []):
+            fields = {'SLIVER_INFO_URN': change['sliver_urn'],
+                      'SLIVER_INFO_SLICE_URN': self.slice_name_to_urn(slice_urn),
+                      'SLIVER_INFO_CREATION': datetime.datetime.utcnow().isoformat()}
+            if change.get('aggregate_urn'):
+                fields['SLIVER_INFO_AGGREGATE_URN'] = change['aggregate_urn']
+            if change.get('expiration'):
+                fields['SLIVER_INFO_EXPIRATION'] = str(change['expiration'])
+            changes.append({'operation': 'create', 'fields': fields})
+        for change in (updates or []):
+            changes.append({'operation': 'update',
+                            'fields': {'SLIVER_INFO_URN': change['sliver_urn'],
+                                       'SLIVER_INFO_EXPIRATION': str(change['expiration'])}})
+        for sliver_urn in (deletes or []):
+            changes.append({'operation': 'delete',
+                            'fields': {'SLIVER_INFO_URN': sliver_urn}})
+        if not changes:
+            return {}
+
+        if self._ch_records_slivers is False:
+            return dict((change['fields']['SLIVER_INFO_URN'], "GCF CH %s does not record slivers" % self.config['ch'])
+                        for change in changes)
+        (rows, message) = _do_ssl(self, ['UpdateSliverInfo'], ("Record %d sliver changes at GCF CH %s" % (len(changes), self.config['ch'])), self.ch.UpdateSliverInfo, changes)
+        if rows is None:
+            if message == 'UpdateSliverInfo':
+                # Older GCF CHs do not record slivers: don't ask again
+                self.logger.debug("GCF CH %s does not record slivers", self.config['ch'])
+                self._ch_records_slivers = False
+                message = "GCF CH %s does not record slivers" % self.config['ch']
+            else:
+                message = "Record sliver changes failed: %s" % message
+            return dict((change['fields']['SLIVER_INFO_URN'], message)
+                        for change in changes)
+        results = {}
+        for row in rows:
+            if row['success']:
+                results[row['sliver_urn']] = True
+            else:
+                self.logger.warn("Record sliver '%s' change failed: %s", row['sliver_urn'], row['output'])
+                results[row['sliver_urn']] = row['output']
+        return results
+
     def get_version(self):
         pl_response = dict()
         versionstruct = dict()
@@ -31,8 +31,6 @@ Calls generally go to the ch-handler or the am-handler as appropriate.
 """ 
 
 from .util import OmniError
-from .amhandler import AMCallHandler
-from .chhandler import CHCallHandler
 
 class CallHandler(object):
     """Handle calls on the framework. Valid calls are all
@@ -57,10 +55,25 @@ class CallHandler(object):
                 self.opts.abac= False
                 self.abac_dir = None
                 self.abac_log = None
-        self.amhandler = AMCallHandler(framework, config, opts);
-        self.chhandler = CHCallHandler(framework, config, opts);
+        # The AM and CH handlers (and the modules they need) are only
+        # loaded when a call needs them
+        self._amhandler = None
+        self._chhandler = None
+
+    @property
+    def amhandler(self):
+        if self._amhandler is None:
+            from .amhandler import AMCallHandler
+            self._amhandler = AMCallHandler(self.framework, self.config, self.opts)
+        return self._amhandler
+
+    @property
+    def chhandler(self):
+        if self._chhandler is None:
+            from .chhandler import CHCallHandler
+            self._chhandler = CHCallHandler(self.framework, self.config, self.opts)
+        return self._chhandler
 
-        
     def _raise_omni_error( self, msg, err=OmniError ):
         self.logger.error( msg )
         raise err, msg
@@ -74,11 +87,12 @@ class CallHandler(object):
         if call.startswith('_'):
             return
     
+        from .chhandler import CHCallHandler
         if hasattr(self, call):
             return getattr(self, call)(args[1:])
-        elif hasattr(self.chhandler, call):
+        elif hasattr(CHCallHandler, call):
             return getattr(self.chhandler, call)(args[1:])
-        elif hasattr(self.amhandler, call):
+        elif self._isAMCall(call):
             # Extract the slice name arg and put it in an option
             self.amhandler.opts.sliceName = self.amhandler._extractSliceArg(args)
 
@@ -94,4 +108,8 @@ class CallHandler(object):
         else:
             self._raise_omni_error('Unknown function: %s' % call)
 
+    def _isAMCall(self, call):
+        from .amhandler import AMCallHandler
+        return hasattr(AMCallHandler, call)
+
 # End of CallHandler
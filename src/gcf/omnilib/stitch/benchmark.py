@@ -0,0 +1,321 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''Benchmark the stitcher on synthetic topologies, replaying canned
+SCS and aggregate results (stitcher fake mode) with no network calls
+and no artificial pauses.
+
+Each topology is a chain of N aggregates with L stitched links, each link
+crossing every aggregate in the chain. For each topology the harness
+writes a canned SCS ComputePath result, then drives the same stitcher
+code a real run uses: reading the SCS result, parsing the expanded RSpec
+and workflow, allocating at each aggregate in dependency order (editing
+the request RSpec and reading the canned manifest), and combining the
+manifests. It reports the wall time of each phase and the peak RSS.
+Each topology runs in its own process, so that peak RSS is per topology.
+
+Usage (from the src directory):
+    python -m gcf.omnilib.stitch.benchmark [--ams 2,5,10,20] [--links 1,10,50]
+'''
+
+from __future__ import absolute_import
+
+import datetime
+import json
+import logging
+import multiprocessing
+import optparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from . import defs
+from . import scs
+from .launcher import Launcher
+from .ManifestRSpecCombiner import combineManifestRSpecs
+from .objects import Aggregate
+from .RSpecParser import RSpecParser
+from .workflow import WorkflowParser
+from ...geni.util import rspec_schema
+
+DEFAULT_AMS = "2,5,10,20"
+DEFAULT_LINKS = "1,10,50"
+FIRST_VLAN = 1000
+
+PHASES = ('scs_parse', 'workflow_parse', 'request_edit', 'allocate', 'manifest_combine')
+
+def am_urn(idx):
+    return "urn:publicid:IDN+am%d.example.net+authority+cm" % idx
+
+def am_url(idx):
+    return "https://am%d.example.net:12369/protogeni/xmlrpc/am/2.0" % idx
+
+def hop_urn(amIdx, linkIdx):
+    return "urn:publicid:IDN+am%d.example.net+interface+am%d:port%d" % (amIdx, amIdx, linkIdx)
+
+def make_expanded_rspec(numAMs, numLinks):
+    '''Return an SCS style expanded request RSpec for a chain of numAMs
+    aggregates with numLinks stitched links, each from the first aggregate
+    to the last.'''
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<rspec xmlns="%s" xmlns:xsi="%s" xsi:schemaLocation="%s %s %s %s" type="request">' %
+             (rspec_schema.GENI_3_NAMESPACE, rspec_schema.XSI, rspec_schema.GENI_3_NAMESPACE, rspec_schema.GENI_3_REQ_SCHEMA,
+              rspec_schema.STITCH_SCHEMA_V2, rspec_schema.STITCH_SCHEMA_V2 + "stitch-schema.xsd")]
+    for link in range(numLinks):
+        for (end, amIdx) in (('a', 0), ('b', numAMs - 1)):
+            lines.append('  <node client_id="n%d-%s" component_manager_id="%s" exclusive="false">' % (link, end, am_urn(amIdx)))
+            lines.append('    <sliver_type name="emulab-xen"/>')
+            lines.append('    <interface client_id="n%d-%s:if0"/>' % (link, end))
+            lines.append('  </node>')
+    for link in range(numLinks):
+        lines.append('  <link client_id="link%d">' % link)
+        for amIdx in range(numAMs):
+            lines.append('    <component_manager name="%s"/>' % am_urn(amIdx))
+        lines.append('    <interface_ref client_id="n%d-a:if0"/>' % link)
+        lines.append('    <interface_ref client_id="n%d-b:if0"/>' % link)
+        lines.append('  </link>')
+    lines.append('  <stitching xmlns="%s" lastUpdateTime="20160101:00:00:00">' % rspec_schema.STITCH_SCHEMA_V2)
+    for link in range(numLinks):
+        vlan = FIRST_VLAN + link
+        lines.append('    <path id="link%d">' % link)
+        for amIdx in range(numAMs):
+            nextHop = 'null'
+            if amIdx < numAMs - 1:
+                nextHop = 'am%d-link%d' % (amIdx + 1, link)
+            lines.extend(['      <hop id="am%d-link%d">' % (amIdx, link),
+                          '        <link id="%s">' % hop_urn(amIdx, link),
+                          '          <trafficEngineeringMetric>10</trafficEngineeringMetric>',
+                          '          <capacity>100000</capacity>',
+                          '          <switchingCapabilityDescriptor>',
+                          '            <switchingcapType>l2sc</switchingcapType>',
+                          '            <encodingType>ethernet</encodingType>',
+                          '            <switchingCapabilitySpecificInfo>',
+                          '              <switchingCapabilitySpecificInfo_L2sc>',
+                          '                <interfaceMTU>9000</interfaceMTU>',
+                          '                <vlanRangeAvailability>%d-%d</vlanRangeAvailability>' % (FIRST_VLAN, FIRST_VLAN + numLinks + 100),
+                          '                <suggestedVLANRange>%d</suggestedVLANRange>' % vlan,
+                          '                <vlanTranslation>false</vlanTranslation>',
+                          '              </switchingCapabilitySpecificInfo_L2sc>',
+                          '            </switchingCapabilitySpecificInfo>',
+                          '          </switchingCapabilityDescriptor>',
+                          '        </link>',
+                          '        <nextHop>%s</nextHop>' % nextHop,
+                          '      </hop>'])
+        lines.append('    </path>')
+    lines.append('  </stitching>')
+    lines.append('</rspec>')
+    return '\n'.join(lines)
+
+def make_workflow(numAMs, numLinks):
+    '''Return SCS workflow data for the chain: on each link, the hop at
+    each aggregate imports its VLAN from the hop at the previous aggregate.'''
+    workflow = dict()
+    for link in range(numLinks):
+        deps = []
+        for amIdx in range(numAMs):
+            dep = {WorkflowParser.HOP_URN_KEY: hop_urn(amIdx, link),
+                   WorkflowParser.AGG_URL_KEY: am_url(amIdx),
+                   WorkflowParser.AGG_URN_KEY: am_urn(amIdx),
+                   WorkflowParser.IMP_VLANS_KEY: amIdx > 0,
+                   WorkflowParser.DEPENDENCIES_KEY: []}
+            if amIdx > 0:
+                dep[WorkflowParser.DEPENDENCIES_KEY].append({WorkflowParser.HOP_URN_KEY: hop_urn(amIdx - 1, link),
+                                                             WorkflowParser.AGG_URL_KEY: am_url(amIdx - 1),
+                                                             WorkflowParser.AGG_URN_KEY: am_urn(amIdx - 1),
+                                                             WorkflowParser.IMP_VLANS_KEY: amIdx > 1})
+            deps.append(dep)
+        workflow["link%d" % link] = {scs.PathInfo.DEPS: deps}
+    return workflow
+
+def make_slice_cred(expires):
+    '''A minimal (unsigned) slice credential: allocate only reads its expiration.'''
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<signed-credential><credential xml:id="ref0">'
+            '<type>privilege</type><target_gid/><expires>%s</expires></credential></signed-credential>' % expires.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+def write_canned_results(fileDir, numAMs, numLinks):
+    '''Write the canned SCS result and the canned manifest (fake mode uses the
+    SCS expanded request as every aggregate's manifest). Return the SCS result filename.'''
+    expanded = make_expanded_rspec(numAMs, numLinks)
+    scsResult = {scs.Result.CODE: {scs.Result.GENI_CODE: 0},
+                 scs.Result.VALUE: {scs.PathInfo.SERVICE_RSPEC: expanded,
+                                    scs.PathInfo.WORKFLOW_DATA: make_workflow(numAMs, numLinks)}}
+    scsFile = os.path.join(fileDir, "scs-result.json")
+    with open(scsFile, 'w') as f:
+        json.dump(scsResult, f)
+    with open(os.path.join(fileDir, os.path.basename(Aggregate.FAKEMODESCSFILENAME)), 'w') as f:
+        f.write(expanded)
+    return scsFile
+
+def make_opts(fileDir):
+    '''Options as the stitcher would have them for a fake mode run.'''
+    # Imported here so just generating topologies does not need the omni framework modules
+    from ... import oscript as omni
+    opts, args = omni.parse_args(['-o'])
+    opts.fakeModeDir = fileDir
+    opts.fileDir = fileDir + os.sep
+    opts.noAvailCheck = True
+    opts.noTransitAMs = False
+    opts.noReservation = False
+    opts.timeout = 0
+    return opts
+
+class PhaseTimer(object):
+    '''Accumulate wall time per phase.'''
+    def __init__(self):
+        self.times = dict((phase, 0.0) for phase in PHASES)
+
+    def add(self, phase, secs):
+        self.times[phase] += secs
+
+    def timed(self, phase, func):
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(phase, time.time() - start)
+        return wrapper
+
+def run_topology(numAMs, numLinks, logger):
+    '''Run one stitching of the given topology from canned results.
+    Return a dict of results.'''
+    fileDir = tempfile.mkdtemp(prefix="stitch-benchmark-")
+    # Never pause to look like a real AM
+    Aggregate.FAKE_ALLOCATE_PAUSE_SECS = None
+    timer = PhaseTimer()
+    # Request editing happens inside allocate, so time it separately
+    getEditedRSpecDom = Aggregate.getEditedRSpecDom
+    Aggregate.getEditedRSpecDom = timer.timed('request_edit', getEditedRSpecDom)
+    try:
+        scsFile = write_canned_results(fileDir, numAMs, numLinks)
+        opts = make_opts(fileDir)
+        defs.DefaultSliverExpirations.getInstance(dict(omni=dict()), logger)
+        slicename = "benchmark"
+        sliceurn = "urn:publicid:IDN+example.net+slice+" + slicename
+        wallStart = time.time()
+
+        start = time.time()
+        scsService = scs.Service("https://scs.example.net/geni/xmlrpc")
+        pathInfo = scsService.ComputePath(sliceurn, None, dict(), savedFile=scsFile, useCache=False)
+        parsedRSpec = RSpecParser(logger).parse(pathInfo.rspec())
+        timer.add('scs_parse', time.time() - start)
+
+        start = time.time()
+        workflowParser = WorkflowParser(logger)
+        workflowParser.parse(pathInfo.workflow_data(), parsedRSpec)
+        timer.add('workflow_parse', time.time() - start)
+
+        ams = workflowParser.aggs
+        sliceCred = make_slice_cred(datetime.datetime.utcnow() + datetime.timedelta(days=7))
+        for am in ams:
+            am.slicecred = sliceCred
+            am.userRequested = True
+
+        start = time.time()
+        launcher = Launcher(opts, slicename, ams, datetime.datetime.max, logger)
+        lastAM = launcher.launch(parsedRSpec, 1)
+        timer.add('allocate', time.time() - start - timer.times['request_edit'])
+
+        start = time.time()
+        combinedDom = combineManifestRSpecs(ams, lastAM.manifestDom)
+        combined = combinedDom.toprettyxml(encoding="utf-8")
+        timer.add('manifest_combine', time.time() - start)
+
+        wall = time.time() - wallStart
+    finally:
+        Aggregate.getEditedRSpecDom = getEditedRSpecDom
+        shutil.rmtree(fileDir, ignore_errors=True)
+
+    hops = sum(len(am.hops) for am in ams)
+    return dict(ams=numAMs, links=numLinks, hops=hops, wall=wall,
+                phases=timer.times, manifest_bytes=len(combined),
+                # ru_maxrss is in KB on Linux, bytes on Mac OS X
+                peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform == 'darwin' else 1))
+
+def _run_in_child(queue, numAMs, numLinks, debug):
+    logging.basicConfig(level=logging.DEBUG if debug else logging.WARN)
+    logger = logging.getLogger('stitch.benchmark')
+    try:
+        queue.put(run_topology(numAMs, numLinks, logger))
+    except Exception, e:
+        logger.exception("Benchmark of %d AMs, %d links failed", numAMs, numLinks)
+        queue.put(dict(ams=numAMs, links=numLinks, error=str(e)))
+
+def run_in_process(numAMs, numLinks, debug=False):
+    '''Run one topology in a fresh process, so aggregate state and
+    peak RSS are per topology.'''
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_run_in_child, args=(queue, numAMs, numLinks, debug))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def format_result(result):
+    if result.has_key('error'):
+        return "%4d %5d  FAILED: %s" % (result['ams'], result['links'], result['error'])
+    phases = result['phases']
+    return "%4d %5d %5d %8.3f %s %9d" % (result['ams'], result['links'], result['hops'], result['wall'],
+                                           " ".join("%8.3f" % phases[phase] for phase in PHASES),
+                                           result['peak_rss_kb'])
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = optparse.OptionParser(usage="python -m gcf.omnilib.stitch.benchmark [options]")
+    parser.add_option("--ams", default=DEFAULT_AMS,
+                      help="Comma separated numbers of aggregates in the chain (default %default)")
+    parser.add_option("--links", default=DEFAULT_LINKS,
+                      help="Comma separated numbers of stitched links (default %default)")
+    parser.add_option("-r", "--repeat", default=1, type="int",
+                      help="Runs per topology, reporting the fastest (default %default)")
+    parser.add_option("--json", default=None, metavar="FILE",
+                      help="Also save all results as JSON to FILE")
+    parser.add_option("--debug", default=False, action="store_true",
+                      help="Log stitcher debug messages")
+    options, args = parser.parse_args(argv)
+
+    results = []
+    print "%4s %5s %5s %8s %s %9s" % ("AMs", "links", "hops", "wall(s)",
+                                      " ".join("%8s" % phase[:8] for phase in PHASES), "peakRSS(KB)")
+    for numAMs in [int(n) for n in options.ams.split(',')]:
+        for numLinks in [int(n) for n in options.links.split(',')]:
+            best = None
+            for i in range(options.repeat):
+                result = run_in_process(numAMs, numLinks, options.debug)
+                if best is None or result.has_key('error') or result['wall'] < best['wall']:
+                    best = result
+                if result.has_key('error'):
+                    break
+            print format_result(best)
+            sys.stdout.flush()
+            results.append(best)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
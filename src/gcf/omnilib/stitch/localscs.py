@@ -0,0 +1,470 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''A local stand in for the Stitching Computation Service (SCS).
+Computes stitching paths and workflows from a static topology file,
+so stitcher can run without a remote SCS (e.g. for testing).
+
+LocalSCS implements the SCS XML-RPC methods (GetVersion, ListAggregates,
+ComputePath). LocalService is an scs.Service that calls a LocalSCS in
+process. gcf-scs.py serves a LocalSCS over XML-RPC.'''
+
+from __future__ import absolute_import
+
+import collections
+import datetime
+import json
+import logging
+import os
+from xml.dom.minidom import parseString
+
+from . import defs
+from . import scs
+from .utils import StitchingError
+from .VLANRange import VLANRange
+from ...gcf_version import GCF_VERSION
+from ...geni.util import rspec_schema
+
+# geni_code the SCS returns when it cannot compute paths for a request
+NO_PATH_CODE = 3
+
+class Topology(object):
+    '''The aggregates, stitching hops (aggregate interfaces) and the wires
+    between hops that the local SCS knows about. Read from a JSON file like:
+
+    {
+      "aggregates": {
+        "urn:publicid:IDN+emulab.net+authority+cm": {
+          "url": "https://www.emulab.net:12369/protogeni/xmlrpc/am/2.0",
+          "nick": "pg-utah",
+          "vlanProducer": false,
+          "vlanTranslation": false
+        }, ...
+      },
+      "hops": {
+        "urn:publicid:IDN+emulab.net+interface+procurve-pgeni-salt:1.19:ion": {
+          "aggregate": "urn:publicid:IDN+emulab.net+authority+cm",
+          "vlans": "3700-3749",
+          "capacity": 1000000,
+          "vlanTranslation": false
+        }, ...
+      },
+      "wires": [
+        ["urn:...emulab.net+interface+...", "urn:...ion.internet2.edu+interface+..."], ...
+      ]
+    }
+
+    nick, vlanProducer, vlanTranslation and capacity are optional. Hops
+    at the same aggregate are assumed to be switched to each other within
+    that aggregate; wires connect hops at different aggregates. An
+    aggregate that does VLAN translation (or a hop that does) may use a
+    different VLAN tag on each side.'''
+
+    def __init__(self, struct):
+        self.aggregates = dict()
+        self.hops = dict()
+        self.wires = collections.defaultdict(set)
+        self.aggHops = collections.defaultdict(list)
+        for (urn, agg) in struct.get("aggregates", {}).items():
+            if not agg.get("url"):
+                raise StitchingError("Topology aggregate %s has no url" % urn)
+            self.aggregates[urn] = agg
+        for (urn, hop) in struct.get("hops", {}).items():
+            aggURN = hop.get("aggregate")
+            if aggURN not in self.aggregates:
+                raise StitchingError("Topology hop %s is at unknown aggregate %s" % (urn, aggURN))
+            self.hops[urn] = dict(hop, vlans=frozenset(VLANRange.fromString(hop.get("vlans", "any"))))
+            self.aggHops[aggURN].append(urn)
+        for wire in struct.get("wires", []):
+            if len(wire) != 2 or wire[0] not in self.hops or wire[1] not in self.hops:
+                raise StitchingError("Topology wire %s must connect 2 known hops" % (wire,))
+            if self.hops[wire[0]]["aggregate"] == self.hops[wire[1]]["aggregate"]:
+                raise StitchingError("Topology wire %s connects hops at the same aggregate" % (wire,))
+            self.wires[wire[0]].add(wire[1])
+            self.wires[wire[1]].add(wire[0])
+        for hops in self.aggHops.values():
+            hops.sort()
+
+    @classmethod
+    def fromFile(cls, filename):
+        filename = os.path.expanduser(filename)
+        try:
+            with open(filename, 'r') as f:
+                struct = json.load(f)
+        except Exception, e:
+            raise StitchingError("Failed to read SCS topology file %s: %s" % (filename, e))
+        return cls(struct)
+
+    def aggregate(self, hopURN):
+        return self.hops[hopURN]["aggregate"]
+
+    def translates(self, fromHop, toHop):
+        '''Can the aggregate of these 2 hops give them different VLAN tags?
+        Hops at different aggregates are wired together, so never can.'''
+        if self.aggregate(fromHop) != self.aggregate(toHop):
+            return False
+        agg = self.aggregates[self.aggregate(fromHop)]
+        return bool(agg.get("vlanTranslation") or self.hops[fromHop].get("vlanTranslation") or
+                    self.hops[toHop].get("vlanTranslation"))
+
+    def isProducer(self, hopURN):
+        return bool(self.aggregates[self.aggregate(hopURN)].get("vlanProducer"))
+
+class _PathState(object):
+    # A partial path in the path search
+    __slots__ = ('hop', 'vlans', 'viaWire', 'included', 'parent', 'translated')
+
+    def __init__(self, hop, vlans, viaWire, included, parent, translated=False):
+        self.hop = hop
+        self.vlans = vlans # VLAN tags still usable on the current VLAN segment
+        self.viaWire = viaWire # Reached this hop over a wire (not within its aggregate)
+        self.included = included # Required hops on the path so far
+        self.parent = parent
+        self.translated = translated # VLAN translated going from the parent hop to this one
+
+    def aggregates(self, topology):
+        state = self
+        while state:
+            yield topology.aggregate(state.hop)
+            state = state.parent
+
+def find_path(topology, srcAgg, dstAgg, excluded=None, unavailable=None, included=None):
+    '''Find a shortest path of hops from aggregate srcAgg to dstAgg (breadth
+    first), with a VLAN tag available on every hop of each untranslated
+    segment of the path.
+    excluded is a set of hop URNs not to use, unavailable maps hop URNs to
+    VLAN tags not to use there, and included is a set of hop URNs the path
+    must use.
+    Return a list of (hop URN, usable VLAN tags, translated from the previous hop),
+    or None if there is no such path.'''
+    excluded = excluded or set()
+    unavailable = unavailable or dict()
+    included = frozenset(included or ())
+
+    def hopVLANs(hop):
+        return topology.hops[hop]["vlans"] - unavailable.get(hop, frozenset())
+
+    # For each (hop, viaWire, included) the VLAN sets already reached there.
+    # A state whose VLANs are a subset of one of those cannot do better.
+    reached = collections.defaultdict(list)
+    def isNew(state):
+        key = (state.hop, state.viaWire, state.included)
+        for vlans in reached[key]:
+            if state.vlans <= vlans:
+                return False
+        reached[key].append(state.vlans)
+        return True
+
+    queue = collections.deque()
+    for hop in topology.aggHops.get(srcAgg, []):
+        vlans = hopVLANs(hop)
+        if hop not in excluded and vlans:
+            state = _PathState(hop, vlans, False, included & frozenset([hop]), None)
+            if isNew(state):
+                queue.append(state)
+
+    while queue:
+        state = queue.popleft()
+        agg = topology.aggregate(state.hop)
+        if state.viaWire and agg == dstAgg:
+            if state.included == included:
+                path = []
+                while state:
+                    path.append(state)
+                    state = state.parent
+                path.reverse()
+                return _segmentVLANs(path)
+            continue
+        nextHops = []
+        if state.viaWire:
+            # Cross this (transit) aggregate to another of its hops
+            if agg != srcAgg:
+                nextHops = [(hop, False) for hop in topology.aggHops[agg] if hop != state.hop]
+        else:
+            # Take a wire to a new aggregate
+            pathAggs = set(state.aggregates(topology))
+            nextHops = [(hop, True) for hop in sorted(topology.wires[state.hop])
+                        if topology.aggregate(hop) not in pathAggs]
+        for (hop, viaWire) in nextHops:
+            if hop in excluded:
+                continue
+            translated = not viaWire and topology.translates(state.hop, hop)
+            if translated:
+                vlans = hopVLANs(hop)
+            else:
+                vlans = state.vlans & hopVLANs(hop)
+            if not vlans:
+                continue
+            newState = _PathState(hop, vlans, viaWire, state.included | (included & frozenset([hop])), state, translated)
+            if isNew(newState):
+                queue.append(newState)
+    return None
+
+def _segmentVLANs(path):
+    # Each hop can use the VLANs usable at the end of its untranslated segment
+    result = []
+    segmentStart = 0
+    for i in range(len(path) + 1):
+        if i == len(path) or path[i].translated:
+            for state in path[segmentStart:i]:
+                result.append((state.hop, path[i-1].vlans, state.translated))
+            segmentStart = i
+    return result
+
+class LocalSCS(object):
+    '''The SCS XML-RPC API, computing paths from a Topology.'''
+
+    def __init__(self, topology, logger=None):
+        self.topology = topology
+        self.logger = logger or logging.getLogger('stitch.localscs')
+
+    def _success(self, value):
+        return {'code': {'geni_code': 0}, 'value': value, 'output': ''}
+
+    def _error(self, msg):
+        self.logger.info("ComputePath failed: %s", msg)
+        return {'code': {'geni_code': NO_PATH_CODE}, 'value': '', 'output': msg}
+
+    def GetVersion(self):
+        return self._success({'code_tag': 'gcf-local-scs-%s' % GCF_VERSION,
+                              'interface_version': '1'})
+
+    def ListAggregates(self):
+        aggs = dict()
+        for (urn, agg) in self.topology.aggregates.items():
+            aggs[agg.get('nick') or urn] = {'urn': urn, 'url': agg['url']}
+        return self._success({'geni_aggregate_list': aggs})
+
+    def ComputePath(self, arg):
+        '''Expand the request RSpec with a stitching path for each link
+        between nodes at 2 different aggregates, and give the workflow
+        (which hops must get their VLAN tag from which others).'''
+        try:
+            dom = parseString(arg['request_rspec'])
+        except Exception, e:
+            return self._error("Request RSpec is not valid XML: %s" % e)
+        options = arg.get('request_options') or {}
+        profile = options.get(scs.GENI_PROFILE_TAG) or {}
+        rspecs = dom.getElementsByTagName(defs.RSPEC_TAG)
+        if not rspecs:
+            return self._error("Request has no rspec element")
+        rspec = rspecs[0]
+
+        # Interface client_id -> aggregate URN of its node
+        ifcAggs = dict()
+        for node in rspec.getElementsByTagName(defs.NODE_TAG):
+            for ifc in node.getElementsByTagName("interface"):
+                ifcAggs[ifc.getAttribute("client_id")] = node.getAttribute("component_manager_id")
+
+        paths = []
+        usedVLANs = collections.defaultdict(set)
+        for link in [child for child in rspec.childNodes if child.localName == defs.LINK_TAG]:
+            linkID = link.getAttribute("client_id")
+            linkType = 'vlan'
+            for child in link.getElementsByTagName("link_type"):
+                linkType = child.getAttribute("name").strip().lower()
+            if linkType != 'vlan':
+                continue
+            aggs = []
+            for ref in link.getElementsByTagName("interface_ref"):
+                agg = ifcAggs.get(ref.getAttribute("client_id"))
+                if agg and agg not in aggs:
+                    aggs.append(agg)
+            if len(aggs) < 2:
+                continue
+            if len(aggs) > 2:
+                return self._error("Link %s connects %d aggregates: only point to point links can be stitched" % (linkID, len(aggs)))
+            for agg in aggs:
+                if agg not in self.topology.aggregates:
+                    return self._error("Link %s: no stitching paths are configured for aggregate %s" % (linkID, agg))
+
+            excluded, unavailable, included = self._pathProfile(profile.get(linkID) or {})
+            path = find_path(self.topology, aggs[0], aggs[1], excluded, unavailable, included)
+            if path is None:
+                return self._error("Cannot find a path with a common VLAN tag for link %s between %s and %s" % (linkID, aggs[0], aggs[1]))
+            self.logger.debug("Link %s path: %s", linkID, [hop for (hop, vlans, translated) in path])
+            paths.append((link, linkID, self._suggestVLANs(path, usedVLANs)))
+
+        if not paths:
+            return self._error("Request has no links between nodes at different aggregates to stitch")
+        workflow = dict()
+        self._addStitching(dom, rspec, paths)
+        for (link, linkID, path) in paths:
+            workflow[linkID] = {scs.PathInfo.DEPS: self._workflow(path)}
+        return self._success({scs.PathInfo.SERVICE_RSPEC: dom.toxml(encoding="utf-8"),
+                              scs.PathInfo.WORKFLOW_DATA: workflow})
+
+    def _pathProfile(self, pathStruct):
+        # The hops to exclude, VLANs to avoid and hops to include on a path,
+        # from its geni_routing_profile entry
+        excluded = set()
+        unavailable = collections.defaultdict(frozenset)
+        for entry in pathStruct.get(scs.HOP_EXCLUSION_TAG) or []:
+            if '=' in entry:
+                (hop, vlans) = entry.split('=', 1)
+                unavailable[hop] = unavailable[hop] | frozenset(VLANRange.fromString(vlans))
+            else:
+                excluded.add(entry)
+        included = set(pathStruct.get(scs.HOP_INCLUSION_TAG) or [])
+        return excluded, unavailable, included
+
+    def _suggestVLANs(self, path, usedVLANs):
+        # Pick a tag per segment, avoiding tags already suggested for
+        # another path on the same hops where possible.
+        # Return a list of (hop URN, usable VLANs, suggested VLAN, translated)
+        result = []
+        segment = []
+        for (i, (hop, vlans, translated)) in enumerate(path):
+            segment.append(hop)
+            if i + 1 < len(path) and not path[i+1][2]:
+                continue
+            used = set()
+            for segHop in segment:
+                used |= usedVLANs[segHop]
+            free = vlans - used
+            suggested = min(free or vlans)
+            for segHop in segment:
+                usedVLANs[segHop].add(suggested)
+                translation = self.topology.hops[segHop].get("vlanTranslation") or \
+                    self.topology.aggregates[self.topology.aggregate(segHop)].get("vlanTranslation")
+                result.append((segHop, vlans, suggested, bool(translation)))
+            segment = []
+        return result
+
+    def _workflow(self, path):
+        # On each untranslated segment, the hop at a VLAN producer aggregate
+        # (or else the first hop) picks the tag. Every other hop imports it from
+        # the nearest hop towards that one that is at a different aggregate.
+        deps = []
+        segments = []
+        for (i, (hop, vlans, suggested, translation)) in enumerate(path):
+            if i == 0 or suggested != path[i-1][2] or self.topology.translates(path[i-1][0], hop):
+                segments.append([])
+            segments[-1].append(i)
+        for segment in segments:
+            producer = segment[0]
+            for i in segment:
+                if self.topology.isProducer(path[i][0]):
+                    producer = i
+                    break
+            for i in segment:
+                hop = path[i][0]
+                agg = self.topology.aggregate(hop)
+                dependency = None
+                if i != producer:
+                    step = 1 if i < producer else -1
+                    j = i + step
+                    while j != producer and self.topology.aggregate(path[j][0]) == agg:
+                        j += step
+                    if self.topology.aggregate(path[j][0]) != agg:
+                        dependency = j
+                dep = self._hopInfo(hop, dependency is not None)
+                dep[scs.Dependency.DEPS] = []
+                if dependency is not None:
+                    dep[scs.Dependency.DEPS].append(self._hopInfo(path[dependency][0], False))
+                deps.append(dep)
+        return deps
+
+    def _hopInfo(self, hop, importVLANs):
+        agg = self.topology.aggregate(hop)
+        return {scs.Dependency.HOP_URN: hop,
+                scs.Dependency.AGG_URN: agg,
+                scs.Dependency.AGG_URL: self.topology.aggregates[agg]['url'],
+                scs.Dependency.IMPORT_VLANS: importVLANs}
+
+    def _addStitching(self, dom, rspec, paths):
+        # Add the transit aggregates to each link, and replace any
+        # stitching extension with one for the computed paths
+        for child in list(rspec.childNodes):
+            if child.localName == defs.STITCHING_TAG:
+                rspec.removeChild(child)
+        schemaAttr = "xsi:schemaLocation"
+        for attr in rspec.attributes.keys():
+            if attr.endswith(":schemaLocation"):
+                schemaAttr = attr
+        schemaLocation = rspec.getAttribute(schemaAttr)
+        if rspec_schema.STITCH_SCHEMA_V2 not in schemaLocation:
+            rspec.setAttribute(schemaAttr, ("%s %s %s" % (schemaLocation, rspec_schema.STITCH_SCHEMA_V2,
+                                                           rspec_schema.STITCH_SCHEMA_V2 + "stitch-schema.xsd")).strip())
+            if not rspec.hasAttribute("xmlns:" + schemaAttr.split(':')[0]):
+                rspec.setAttribute("xmlns:" + schemaAttr.split(':')[0], rspec_schema.XSI)
+
+        def addText(parent, tag, text):
+            element = dom.createElement(tag)
+            element.appendChild(dom.createTextNode(str(text)))
+            parent.appendChild(element)
+            return element
+
+        stitching = dom.createElement(defs.STITCHING_TAG)
+        stitching.setAttribute("xmlns", rspec_schema.STITCH_SCHEMA_V2)
+        stitching.setAttribute(defs.LAST_UPDATE_TIME_TAG, datetime.datetime.utcnow().strftime("%Y%m%d:%H:%M:%S"))
+        for (link, linkID, path) in paths:
+            linkAggs = [cm.getAttribute("name") for cm in link.getElementsByTagName("component_manager")]
+            for (hop, vlans, suggested, translation) in path:
+                agg = self.topology.aggregate(hop)
+                if agg not in linkAggs:
+                    cm = dom.createElement("component_manager")
+                    cm.setAttribute("name", agg)
+                    link.insertBefore(cm, link.firstChild)
+                    linkAggs.append(agg)
+
+            pathElement = dom.createElement(defs.PATH_TAG)
+            pathElement.setAttribute("id", linkID)
+            for (i, (hop, vlans, suggested, translation)) in enumerate(path):
+                hopElement = dom.createElement("hop")
+                hopElement.setAttribute("id", str(i + 1))
+                linkElement = dom.createElement("link")
+                linkElement.setAttribute("id", hop)
+                addText(linkElement, "trafficEngineeringMetric", 10)
+                if self.topology.hops[hop].get("capacity"):
+                    addText(linkElement, "capacity", self.topology.hops[hop]["capacity"])
+                scd = dom.createElement("switchingCapabilityDescriptor")
+                addText(scd, "switchingcapType", "l2sc")
+                addText(scd, "encodingType", "ethernet")
+                scsi = dom.createElement("switchingCapabilitySpecificInfo")
+                l2sc = dom.createElement("switchingCapabilitySpecificInfo_L2sc")
+                addText(l2sc, "interfaceMTU", 9000)
+                addText(l2sc, "vlanRangeAvailability", VLANRange(set(vlans)))
+                addText(l2sc, "suggestedVLANRange", suggested)
+                addText(l2sc, "vlanTranslation", str(bool(translation)).lower())
+                scsi.appendChild(l2sc)
+                scd.appendChild(scsi)
+                linkElement.appendChild(scd)
+                hopElement.appendChild(linkElement)
+                nextHop = "null"
+                if i + 1 < len(path):
+                    nextHop = str(i + 2)
+                addText(hopElement, "nextHop", nextHop)
+                pathElement.appendChild(hopElement)
+            stitching.appendChild(pathElement)
+        rspec.appendChild(stitching)
+
+class LocalService(scs.Service):
+    '''An scs.Service that computes paths in process from a topology
+    file, instead of calling a remote SCS.'''
+
+    def __init__(self, topologyFile, cache=None, logger=None):
+        self.localSCS = LocalSCS(Topology.fromFile(topologyFile), logger)
+        scs.Service.__init__(self, "file://" + os.path.abspath(os.path.expanduser(topologyFile)), cache=cache)
+
+    def _server(self):
+        return self.localSCS
@@ -36,7 +36,9 @@ import os
 import random
 import string
 import time
+from StringIO import StringIO
 from xml.dom.minidom import parseString, Node as XMLNode
+from xml.etree.cElementTree import iterparse, tostring
 
 from . import defs
 from .GENIObject import *
@@ -53,6 +55,18 @@ from ..util.credparsing import get_cred_exp
 from ..util.omnierror import OmniError, AMAPIError
 from ...geni.util import rspec_schema, rspec_util, urn_util
 
+def _local_name(tag):
+    '''Return the given ElementTree tag without any {namespace}'''
+    return tag.rsplit('}', 1)[-1]
+
+def _element_to_dom(element):
+    '''Convert the given ElementTree element to a minidom element,
+    dropping namespaces from tag names (as the stitching code matches
+    on plain tag names)'''
+    for child in element.iter():
+        child.tag = _local_name(child.tag)
+    return parseString(tostring(element)).documentElement
+
 # Seconds to pause between calls to a DCN AM (ie ION)
 DCN_AM_RETRY_INTERVAL_SECS = 10 * 60 # Xi and Chad say ION routers take a long time to reset
 
@@ -191,6 +205,9 @@ class Aggregate(object):
     PAUSE_FOR_DCN_AM_TO_FREE_RESOURCES_SECS = DCN_AM_RETRY_INTERVAL_SECS # Xi and Chad say ION routers take a long time to reset
     MAX_AGG_NEW_VLAN_TRIES = 50 # Max times to locally pick a new VLAN
     MAX_DCN_AGG_NEW_VLAN_TRIES = 3 # Max times to locally pick a new VLAN
+    # Fake mode allocate with no canned results pauses a random number of seconds in this range,
+    # to look like a real AM. Set to None for no pause (e.g. when benchmarking)
+    FAKE_ALLOCATE_PAUSE_SECS = (1, 6)
 
     # Constant name of SCS expanded request (for use here and elsewhere)
     FAKEMODESCSFILENAME = os.path.normpath(os.path.join(os.getenv("TMPDIR", os.getenv("TMP", "/tmp")), 'stitching-scs-expanded-request.xml'))
@@ -1797,7 +1814,7 @@ class Aggregate(object):
                 requestString = self.editEGRequest(requestString)
 
         header = "<!-- Resource request for stitching for:\n\tSlice: %s\n\t at AM:\n\tURN: %s\n\tURL: %s\n -->" % (slicename, self.urn, self.url)
-        if requestString and rspec_util.is_rspec_string( requestString, None, None, logger=self.logger ):
+        if requestString and rspec_util.is_rspec_string( requestString, None, None, logger=self.logger, sniff=True ):
             content = stripBlankLines(string.replace(requestString, "\\n", '\n'))
         else:
             self.lastError = "%s: Constructed request RSpec malformed? Begins: %s" % (self, requestString[:100])
@@ -4156,9 +4173,10 @@ class Aggregate(object):
         # This should be cases where all hops at this AM are requesting 'any' or import from another hop at the same AM
         return False
 
-    def updateWithAvail(self, opts):
-        # Update our hops availRange based on what is currently avail
-        # Return True if updated some avail Ranges
+    def getAvailHopLinks(self, opts):
+        # Get the currently available VLAN tags for the hops at this AM.
+        # This only queries the AM, so can be run for several AMs at once.
+        # Return the HopLinks from the advertisement for our hops, or None on failure
 
         self.logger.info("Gathering currently available VLAN tags at %s...", self)
         rspec = None
@@ -4167,62 +4185,64 @@ class Aggregate(object):
         except StitchingError, se:
             self.logger.debug("Failed to list avail resources: %s", se)
         if rspec is None:
-            return False
+            return None
         try:
-            from xml.dom.minidom import parseString
-            dom = parseString(rspec)
+            return HopLink.fromAvailRSpec(rspec, set([hop._hop_link.urn for hop in self._hops]))
         except Exception, e:
             self.logger.debug("Failed to parse rspec: %s", e)
+            return None
+
+    def updateWithAvail(self, opts, hops=None):
+        # Update our hops availRange based on what is currently avail
+        # hops are the HopLinks from getAvailHopLinks; if not given, get them now
+        # Return True if updated some avail Ranges
+
+        if hops is None:
+            hops = self.getAvailHopLinks(opts)
+        if hops is None:
             return False
         self.lastAvailCheck = datetime.datetime.utcnow()
-        ports = dom.getElementsByTagName(defs.PORT_TAG)
-        if not ports or len(ports) == 0:
-            self.logger.debug("No stitching ports found")
-            return False
-        hops = []
+        if len(hops) == 0:
+            self.logger.debug("No stitching ports found for our hops")
         failToSCS = False
         didUpdates = False
-        for port in ports:
-            for child in port.childNodes:
-                if child.localName == defs.LINK_TAG:
-                    hLink = HopLink.fromDOM(child)
-                    hops.append(hLink)
-                    foundHop = False
-                    for myHop in self._hops:
-                        if myHop._hop_link.urn == hLink.urn:
-                            foundHop = True
-                            self.logger.debug("Found current available tags for %s", myHop)
-                            newAvail = hLink.vlan_range_request
-                            oldAvail = myHop._hop_link.vlan_range_request
-                            if newAvail == oldAvail:
-                                self.logger.debug("Availability is unchanged")
-                                continue
+        for hLink in hops:
+            foundHop = False
+            for myHop in self._hops:
+                if myHop._hop_link.urn == hLink.urn:
+                    foundHop = True
+                    self.logger.debug("Found current available tags for %s", myHop)
+                    newAvail = hLink.vlan_range_request
+                    oldAvail = myHop._hop_link.vlan_range_request
+                    if newAvail == oldAvail:
+                        self.logger.debug("Availability is unchanged")
+                        continue
 
-                            revisedAvail = newAvail.intersection(oldAvail)
-                            if len(revisedAvail) > 0:
-                                self.logger.debug("Revised available range: '%s' from intersection of old '%s' and new '%s'", revisedAvail, oldAvail, newAvail)
-                                if revisedAvail != oldAvail:
-                                    myHop._hop_link.vlan_range_request = revisedAvail
-                                    didUpdates = True
-#                                else:
-#                                    self.logger.debug("No change: All calculated request range tags still available: %s", revisedAvail)
-                            else:
-                                self.logger.debug("New available range is disjoint from old! Intersection is empty! New: %s; Old: %s", newAvail, oldAvail)
-                                # Back to the SCS
-                                failToSCS = True
-
-                            markUnavail = oldAvail - newAvail
-                            if len(markUnavail) > 0:
-                                # Each of these tags is locally unavailable. Add them to the unavail list
-                                self.logger.debug("Noting unavailable tags: '%s'", markUnavail)
-                                myHop.vlans_unavailable = myHop.vlans_unavailable.union(markUnavail)
-                            else:
-                                self.logger.debug("All calculated available tags still available: %s", revisedAvail)
-                            # Cannot break here; If same hop is used by 2 paths, we need to update the range for both
-                        # End of block to check if this hop is the one from the Ad
-                    # End of loop over hops on this AM
-                    if not foundHop:
-                        self.logger.debug("Ignoring avail for unused hop %s", hLink.urn)
+                    revisedAvail = newAvail.intersection(oldAvail)
+                    if len(revisedAvail) > 0:
+                        self.logger.debug("Revised available range: '%s' from intersection of old '%s' and new '%s'", revisedAvail, oldAvail, newAvail)
+                        if revisedAvail != oldAvail:
+                            myHop._hop_link.vlan_range_request = revisedAvail
+                            didUpdates = True
+#                        else:
+#                            self.logger.debug("No change: All calculated request range tags still available: %s", revisedAvail)
+                    else:
+                        self.logger.debug("New available range is disjoint from old! Intersection is empty! New: %s; Old: %s", newAvail, oldAvail)
+                        # Back to the SCS
+                        failToSCS = True
+
+                    markUnavail = oldAvail - newAvail
+                    if len(markUnavail) > 0:
+                        # Each of these tags is locally unavailable. Add them to the unavail list
+                        self.logger.debug("Noting unavailable tags: '%s'", markUnavail)
+                        myHop.vlans_unavailable = myHop.vlans_unavailable.union(markUnavail)
+                    else:
+                        self.logger.debug("All calculated available tags still available: %s", revisedAvail)
+                    # Cannot break here; If same hop is used by 2 paths, we need to update the range for both
+                # End of block to check if this hop is the one from the Ad
+            # End of loop over hops on this AM
+            if not foundHop:
+                self.logger.debug("Ignoring avail for unused hop %s", hLink.urn)
         for myHop in self._hops:
             foundHop = False
             for hopLink in hops:
@@ -4368,7 +4388,8 @@ class Aggregate(object):
         if not resultPath or not os.path.exists(resultPath):
             if opName in ("allocate", "createsliver"):
                 # Fallback fake mode behavior
-                time.sleep(random.randrange(1, 6))
+                if self.FAKE_ALLOCATE_PAUSE_SECS:
+                    time.sleep(random.randrange(*self.FAKE_ALLOCATE_PAUSE_SECS))
                 for hop in self.hops:
                     hop._hop_link.vlan_suggested_manifest = hop._hop_link.vlan_suggested_request
                     hop._hop_link.vlan_range_manifest = hop._hop_link.vlan_range_request
@@ -4376,7 +4397,7 @@ class Aggregate(object):
                 msg = "Did fallback fake %s" % opName
                 return (msg, msg)
             else:
-                raise StitchingError("Failed to find fake results file using %s" % resultFileName)
+                raise StitchingError("Failed to find fake results file using %s" % resultPath)
 
         self.logger.info("Reading FAKE %s results from %s", opName, resultPath)
         resultJSON = None
@@ -4912,6 +4933,37 @@ class HopLink(object):
 
         return hoplink
 
+    @classmethod
+    def fromAvailRSpec(cls, rspec, urns=None):
+        """Parse the stitching hop links (link elements in port elements)
+        from an advertisement RSpec string, keeping only those whose URN is
+        in urns if given. The RSpec is parsed incrementally, discarding
+        everything else as it goes, so that large advertisements are never
+        held in memory whole."""
+        if isinstance(rspec, unicode):
+            rspec = rspec.encode('utf-8')
+        hoplinks = []
+        open_elements = []
+        link = None # The link element we are in, if any
+        for (event, element) in iterparse(StringIO(rspec), events=("start", "end")):
+            if event == "start":
+                if link is None and open_elements and _local_name(element.tag) == defs.LINK_TAG and \
+                        _local_name(open_elements[-1].tag) == defs.PORT_TAG:
+                    link = element
+                open_elements.append(element)
+                continue
+            open_elements.pop()
+            if link is not None and element is not link:
+                # Keep the contents of the link until we have it all
+                continue
+            if element is link:
+                link = None
+                if urns is None or element.get(cls.ID_TAG) in urns:
+                    hoplinks.append(cls.fromDOM(_element_to_dom(element)))
+            if open_elements:
+                open_elements[-1].remove(element)
+        return hoplinks
+
     def __init__(self, urn):
         self.urn = urn
         self.vlan_xlate = False
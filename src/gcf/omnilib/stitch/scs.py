@@ -26,10 +26,16 @@
 
 from __future__ import absolute_import
 
+import hashlib
 import json
+import logging
+import os
 import os.path
 import pprint
+import re
 import sys
+import tempfile
+import time
 import urllib
 import xmlrpclib
 
@@ -37,12 +43,14 @@ try:
     from .utils import StitchingError, StitchingServiceFailedError
     from ..xmlrpc.client import make_client
 
-    from ..util.json_encoding import DateTimeAwareJSONDecoder
+    from ..util.json_encoding import DateTimeAwareJSONDecoder, DateTimeAwareJSONEncoder
+    from ..util.files import replaceFile
 except:
     from gcf.omnilib.stitch.utils import StitchingError, StitchingServiceFailedError
     from gcf.omnilib.xmlrpc.client import make_client
 
-    from gcf.omnilib.util.json_encoding import DateTimeAwareJSONDecoder
+    from gcf.omnilib.util.json_encoding import DateTimeAwareJSONDecoder, DateTimeAwareJSONEncoder
+    from gcf.omnilib.util.files import replaceFile
 
 # Tags used in the options to the SCS
 HOP_EXCLUSION_TAG = 'hop_exclusion_list'
@@ -77,9 +85,78 @@ class Result(object):
             ret +=" %s" % self.result[self.OUTPUT]
         return ret
 
+class ComputePathCache(object):
+    '''On disk cache of successful SCS ComputePath results.
+    Each result is saved in its own file, named by a hash of the SCS URL,
+    slice URN, request RSpec and request options. Entries older than the TTL
+    are ignored (and removed).'''
+
+    def __init__(self, directory, ttl):
+        self.directory = os.path.normpath(os.path.expanduser(directory))
+        self.ttl = ttl # seconds
+        self.logger = logging.getLogger('stitch.scs')
+
+    @staticmethod
+    def _canonical_rspec(request_rspec):
+        # Whitespace between elements (as from toprettyxml) does not change the request
+        return re.sub(r'>\s+<', '><', request_rspec.strip())
+
+    def key(self, url, slice_urn, request_rspec, options):
+        '''Return the cache key for a ComputePath call with these arguments'''
+        canonical = json.dumps(dict(url=url, slice_urn=slice_urn,
+                                    request_rspec=self._canonical_rspec(request_rspec),
+                                    request_options=options),
+                               sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        '''Return the cached raw SCS result for this key, or None if there is no fresh entry'''
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return None
+        if age < 0 or age > self.ttl:
+            self.logger.debug("Cached SCS result %s is stale (%d seconds old)", path, age)
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        try:
+            with open(path, 'r') as cfP:
+                return json.loads(str(cfP.read()), encoding='ascii', cls=DateTimeAwareJSONDecoder)
+        except Exception, e:
+            self.logger.debug("Failed to read cached SCS result %s: %s", path, e)
+            return None
+
+    def put(self, key, result):
+        '''Save the given raw SCS result under this key'''
+        tmpPath = None
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            # Write a temp file and rename it, so a concurrent stitcher never reads a partial entry
+            fd, tmpPath = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, 'w') as cfP:
+                cfP.write(json.dumps(result, encoding='ascii', cls=DateTimeAwareJSONEncoder))
+            replaceFile(tmpPath, self._path(key))
+        except Exception, e:
+            self.logger.debug("Failed to cache SCS result in %s: %s", self.directory, e)
+            if tmpPath is not None and os.path.exists(tmpPath):
+                try:
+                    os.unlink(tmpPath)
+                except OSError:
+                    pass
+
 class Service(object):
-    def __init__(self, url, key=None, cert=None, timeout=None, verbose=False):
+    def __init__(self, url, key=None, cert=None, timeout=None, verbose=False, cache=None):
         self.url = url
+        self.cache = cache
+        self.fromCache = False
         self.timeout=timeout
         self.verbose=verbose
         if isinstance(url, unicode):
@@ -94,8 +171,12 @@ class Service(object):
             self.key=None
             self.cert=None
 
+    def _server(self):
+        '''Return the XML-RPC proxy to call the SCS with.'''
+        return make_client(self.url, keyfile=self.key, certfile=self.cert, verbose=self.verbose, timeout=self.timeout)
+
     def GetVersion(self, printResult=True):
-        server = make_client(self.url, keyfile=self.key, certfile=self.cert, verbose=self.verbose, timeout=self.timeout)
+        server = self._server()
 
         # As a sample of how to do make_client specifying the SSL version / ciphers (these are the defaults though):
 #        import ssl
@@ -119,7 +200,7 @@ class Service(object):
         return result
 
     def ListAggregates(self, printResult=True):
-        server = make_client(self.url, keyfile=self.key, certfile=self.cert, verbose=self.verbose, timeout=self.timeout)
+        server = self._server()
         try:
             result = server.ListAggregates()
         except xmlrpclib.Error as v:
@@ -132,11 +213,16 @@ class Service(object):
             print pp.pformat(result)
         return result
 
-    def ComputePath(self, slice_urn, request_rspec, options, savedFile=None):
+    def ComputePath(self, slice_urn, request_rspec, options, savedFile=None, useCache=True):
         """Invoke the XML-RPC service with the request rspec.
         Create an SCS PathInfo from the result.
+        If this Service has a cache, use a fresh cached result for the same
+        arguments instead of calling the SCS, unless useCache is False.
+        Successful results from the SCS are always saved to the cache.
         """
         result = None
+        cacheKey = None
+        self.fromCache = False
         if savedFile and os.path.exists(savedFile) and os.path.getsize(savedFile) > 0:
             # read it in
             try:
@@ -148,8 +234,14 @@ class Service(object):
                 import traceback
                 print "ERROR", e, traceback.format_exc()
                 raise
+        if result is None and self.cache:
+            cacheKey = self.cache.key(self.url, slice_urn, request_rspec, options)
+            if useCache:
+                result = self.cache.get(cacheKey)
+                if result is not None:
+                    self.fromCache = True
         if result is None:
-            server = make_client(self.url, keyfile=self.key, certfile=self.cert, verbose=self.verbose, timeout=self.timeout)
+            server = self._server()
             arg = dict(slice_urn=slice_urn, request_rspec=request_rspec,
                        request_options=options)
 #        import json
@@ -165,6 +257,8 @@ class Service(object):
         self.result = result # save the raw result for stitchhandler to print
         geni_result = Result(result) # parse result
         if geni_result.isSuccess():
+            if cacheKey and not self.fromCache:
+                self.cache.put(cacheKey, result)
             return PathInfo(geni_result.value())
         else:
                 # when there is no route I seem to get:
@@ -31,8 +31,10 @@ import datetime
 import json
 import logging
 import os
+import Queue
 import string
 import sys
+import threading
 import time
 
 from .. import oscript as omni
@@ -47,6 +49,7 @@ from .stitch import defs
 from .stitch.ManifestRSpecCombiner import combineManifestRSpecs
 from .stitch.objects import Aggregate, Link, Node, LinkProperty
 from .stitch.RSpecParser import RSpecParser
+from .stitch import localscs
 from .stitch import scs
 from .stitch.workflow import WorkflowParser
 from .stitch.utils import StitchingError, StitchingCircuitFailedError, stripBlankLines, isRSpecStitchingSchemaV2, prependFilePrefix, StitchingStoppedError
@@ -69,6 +72,9 @@ OESS_AM_TYPE = 'oess' # geni_am_type value from AMs that use the OESS codebase
 # Max # of times to call the stitching service
 MAX_SCS_CALLS = 5
 
+# Max # of AMs to query at once when looking up AM info or current VLAN availability
+MAX_AM_QUERY_THREADS = 8
+
 # File in which we save the slice cred so omni calls don't have to keep re-fetching it
 # Valid substitutions: %username, %slicename, %slicehrn
 SLICECRED_FILENAME = 'slice-%slicehrn-for-%username-cred.xml'
@@ -94,6 +100,7 @@ class StitchingHandler(object):
         self.slicecred = None # Cached slice credential to avoid re-fetching
         self.savedSliceCred = None # path to file with slice cred if any
         self.parsedURNNewAggs = [] # Aggs added from parsed URNs
+        self.amGetVersions = {} # AM URL -> (text, version, exception) from prefetch_am_versions
 
         # Get the framework
         if not self.opts.debug:
@@ -333,10 +340,20 @@ class StitchingHandler(object):
         # longer necessary (nor a good idea).
 
         # Create the SCS instance if it will be needed
-        if self.isStitching and not self.opts.noSCS:
+        if self.isStitching and not self.opts.noSCS and self.opts.localSCS:
+            # Compute paths in process from a topology file (no cache: the file may change)
+            self.logger.info("Using local SCS with topology from %s", self.opts.localSCS)
+            try:
+                self.scsService = localscs.LocalService(self.opts.localSCS)
+            except StitchingError, se:
+                raise OmniError(str(se))
+        elif self.isStitching and not self.opts.noSCS:
             if not "geni-scs.net.internet2.edu:8443" in self.opts.scsURL:
                 self.logger.info("Using SCS at %s", self.opts.scsURL)
-            self.scsService = scs.Service(self.opts.scsURL, key=self.framework.key, cert=self.framework.cert, timeout=self.opts.ssltimeout, verbose=self.opts.verbosessl)
+            scsCache = None
+            if self.opts.scsCacheTTL > 0 and not self.opts.noCacheFiles and not self.opts.savedSCSResults:
+                scsCache = scs.ComputePathCache(self.opts.scsCacheDir, self.opts.scsCacheTTL * 60)
+            self.scsService = scs.Service(self.opts.scsURL, key=self.framework.key, cert=self.framework.cert, timeout=self.opts.ssltimeout, verbose=self.opts.verbosessl, cache=scsCache)
         self.scsCalls = 0
         if self.isStitching and self.opts.noSCS:
             self.logger.info("Not calling SCS on stitched topology per commandline option.")
@@ -1843,17 +1860,23 @@ class StitchingHandler(object):
 
     def updateAvailRanges(self, sliceurn, requestDOM):
         # Check current VLAN tag availability before doing allocations
-        # Loop over AMs. If I update an AM, then go to AMs that depend on it and intersect there (but don't redo avail query), and recurse.
+        # Query all the AMs where that could help at once. Then
+        # loop over AMs. If I update an AM, then go to AMs that depend on it and intersect there (but don't redo avail query), and recurse.
+        # If doing the avail query at an AM doesn't work or wouldn't help or we did it recently, skip it
+        availHopLinks = self.getAvailHopLinks([am for am in self.ams_to_process if am.doAvail(self.opts)])
         for am in self.ams_to_process:
-            # If doing the avail query at this AM doesn't work or wouldn't help or we did it recently, move on
-            if not am.doAvail(self.opts):
+            if not availHopLinks.has_key(am):
                 self.logger.debug("Not checking VLAN availability at %s", am)
                 continue
 
             self.logger.debug("Checking current availabilty at %s", am)
             madeChange = False
             try:
-                madeChange = am.updateWithAvail(self.opts)
+                (hopLinks, excInfo) = availHopLinks[am]
+                if excInfo is not None:
+                    raise excInfo[0], excInfo[1], excInfo[2]
+                if hopLinks is not None:
+                    madeChange = am.updateWithAvail(self.opts, hopLinks)
 
                 if madeChange:
                     # Must intersect the new ranges with others in the chain
@@ -1910,6 +1933,35 @@ class StitchingHandler(object):
         # End of loop over AMs getting current availability
         return None # Not an AM return so don't return it in the main block
 
+    def getAvailHopLinks(self, ams):
+        '''Get the currently available VLAN tags at all the given AMs at once, up to MAX_AM_QUERY_THREADS at a time.
+        Return a dict by AM of (HopLinks from Aggregate.getAvailHopLinks, or None on failure; exc_info of any error raised)'''
+        results = {}
+        pending = Queue.Queue()
+        for am in ams:
+            pending.put(am)
+
+        def avail_worker():
+            while True:
+                try:
+                    am = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[am] = (am.getAvailHopLinks(self.opts), None)
+                except Exception:
+                    results[am] = (None, sys.exc_info())
+
+        threads = []
+        for i in range(min(MAX_AM_QUERY_THREADS, len(ams))):
+            thread = threading.Thread(target=avail_worker, name="avail-%d" % i)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return results
+
     def changeRequestsToAny(self):
         # Change requested VLAN tags to 'any' where appropriate
 
@@ -2095,18 +2147,23 @@ class StitchingHandler(object):
             else:
                 raise OmniError("%s RSpec file did not contain a %s RSpec (wrong type or schema)" % (typeStr, typeStr))
 
-        # Run rspeclint
+        # Validate against the schema (in process, or with rspeclint)
         if doRSpecLint:
             try:
                 rspeclint_exists()
             except:
-                self.logger.debug("No rspeclint found")
+                self.logger.debug("No lxml or rspeclint found: cannot validate RSpec")
                 return
             # FIXME: Make this support GENIv4+? PGv2?
             schema = rspec_schema.GENI_3_REQ_SCHEMA
             if rspecType == rspec_schema.MANIFEST:
                 schema = rspec_schema.GENI_3_MAN_SCHEMA
-            if not validate_rspec(requestString, rspec_schema.GENI_3_NAMESPACE, schema):
+            try:
+                valid = validate_rspec(requestString, rspec_schema.GENI_3_NAMESPACE, schema, logger=self.logger)
+            except Exception, e:
+                self.logger.debug("Cannot validate RSpec: %s", e)
+                return
+            if not valid:
                 raise OmniError("%s RSpec does not validate against its schemas" % typeStr)
 
     def confirmSliceOK(self):
@@ -2483,8 +2540,11 @@ class StitchingHandler(object):
         self.logger.debug("Calling SCS with options %s", scsOptions)
         if self.opts.savedSCSResults:
             self.logger.debug("** Not actually calling SCS, using results from '%s'", self.opts.savedSCSResults)
+        # Only the first SCS call may use a cached result. Later calls are
+        # retries that must get fresh paths from the SCS (e.g. after excluding
+        # VLAN tags that failed).
         try:
-            scsResponse = self.scsService.ComputePath(sliceurn, requestString, scsOptions, self.opts.savedSCSResults)
+            scsResponse = self.scsService.ComputePath(sliceurn, requestString, scsOptions, self.opts.savedSCSResults, useCache=(self.scsCalls == 1))
         except StitchingError as e:
             self.logger.debug("Error from slice computation service: %s", e)
             raise 
@@ -2525,7 +2585,10 @@ class StitchingHandler(object):
             raise StitchingError("SCS gave error: %s" % strE)
         # Done SCS call error handling
 
-        self.logger.debug("SCS successfully returned.");
+        if self.scsService.fromCache:
+            self.logger.info("Using cached SCS result for this request (up to %d minutes old)", self.opts.scsCacheTTL)
+        else:
+            self.logger.debug("SCS successfully returned.");
 
         if self.opts.debug:
             scsresfile = prependFilePrefix(self.opts.fileDir, "scs-result.json")
@@ -2760,7 +2823,7 @@ class StitchingHandler(object):
 
             # Write the RSpec the SCS gave us to a file
             header = "<!-- SCS expanded stitching request for:\n\tSlice: %s\n -->" % (self.slicename)
-            if expandedRSpec and is_rspec_string( expandedRSpec, None, None, logger=self.logger ):
+            if expandedRSpec and is_rspec_string( expandedRSpec, None, None, logger=self.logger, sniff=True ):
                 content = stripBlankLines(string.replace(expandedRSpec, "\\n", '\n'))
             else:
                 content = "<!-- No valid RSpec returned. -->"
@@ -3072,87 +3135,32 @@ class StitchingHandler(object):
 
         aggsc = copy.copy(aggs)
 
+        # Settle the URL of each AM first, so we can do GetVersion
+        # at all of them at once
+        prepared = set()
+        for agg in aggsc:
+            if agg.urn in self.amURNsAddedInfo:
+                continue
+            self.add_am_url_info(agg)
+            prepared.add(id(agg))
+        self.prefetch_am_versions([agg.url for agg in aggsc if id(agg) in prepared], options_copy)
+
         for agg in aggsc:
             # Don't do an aggregate twice
             if agg.urn in self.amURNsAddedInfo:
                 continue
 #            self.logger.debug("add_am_info looking at %s", agg)
 
-            # Note which AMs were user requested
-            if self.parsedUserRequest and agg.urn in self.parsedUserRequest.amURNs:
-                agg.userRequested = True
-            elif self.parsedUserRequest:
-                for urn2 in agg.urn_syns:
-                    if urn2 in self.parsedUserRequest.amURNs:
-                        agg.userRequested = True
-
-            # FIXME: Better way to detect this?
-            if handler_utils._extractURL(self.logger, agg.url) in defs.EXOSM_URL:
-                agg.isExoSM = True
-#                self.logger.debug("%s is the ExoSM cause URL is %s", agg, agg.url)
-
-            # EG AMs in particular have 2 URLs in some sense - ExoSM and local
-            # So note the other one, since VMs are split between the 2
-            for (amURN, amURL) in self.config['aggregate_nicknames'].values():
-                if amURN.strip() in agg.urn_syns:
-                    hadURL = handler_utils._extractURL(self.logger, agg.url)
-                    newURL = handler_utils._extractURL(self.logger, amURL)
-                    if hadURL != newURL and not hadURL in newURL and not newURL in hadURL and not newURL.strip == '':
-                        agg.alt_url = amURL.strip()
-                        break
-#                    else:
-#                        self.logger.debug("Not setting alt_url for %s. URL is %s, alt candidate was %s with URN %s", agg, hadURL, newURL, amURN)
-#                elif "exogeni" in amURN and "exogeni" in agg.urn:
-#                    self.logger.debug("Config had URN %s URL %s, but that URN didn't match our URN synonyms for %s", amURN, newURL, agg)
-
-            if "exogeni" in agg.urn and not agg.alt_url:
-#                self.logger.debug("No alt url for Orca AM %s (URL %s) with URN synonyms:", agg, agg.url)
-#                for urn in agg.urn_syns:
-#                    self.logger.debug("\t%s", urn)
-                if not agg.isExoSM:
-                    agg.alt_url = defs.EXOSM_URL
-
-            # Try to get a URL from the CH? Do we want/need this
-            # expense? This is a call to the CH....
-            # Comment this out - takes too long, not clear
-            # it is needed.
-#            if not agg.alt_url:
-#                fw_ams = dict()
-#                try:
-#                    fw_ams = self.framework.list_aggregates()
-#                    for fw_am_urn in fw_ams.keys():
-#                        if fw_am_urn and fw_am_urn.strip() in am.urn_syns and fw_ams[fw_am_urn].strip() != '':
-#                            cand_url = fw_ams[fw_am_urn]
-#                            if cand_url != am.url and not am.url in cand_url and not cand_url in am.url:
-#                                am.alt_url = cand_url
-#                                self.logger.debug("Found AM %s alternate URL from CH ListAggs: %s", am.urn, am.alt_url)
-#                                break
-#                except:
-#                    pass
-
-            # If --noExoSM then ensure this is not the ExoSM
-            if agg.isExoSM and agg.alt_url and self.opts.noExoSM:
-                self.logger.warn("%s used ExoSM URL. Changing to %s", agg, agg.alt_url)
-                amURL = agg.url
-                agg.url = agg.alt_url
-                agg.alt_url = amURL
-                agg.isExoSM = False
-
-# For using the test ION AM
-#            if 'alpha.dragon' in agg.url:
-#                agg.url =  'http://alpha.dragon.maxgigapop.net:12346/'
-
-            # Use GetVersion to determine AM type, AM API versions spoken, etc
-            # Hack: Here we hard-code using APIv2 always to call getversion, assuming that v2 is the AM default
-            # and so the URLs are v2 URLs.
-            if options_copy.warn:
-                omniargs = ['--ForceUseGetVersionCache', '-V2', '-a', agg.url, 'getversion']
+            if id(agg) in prepared:
+                prepared.remove(id(agg))
             else:
-                omniargs = ['--ForceUseGetVersionCache', '-o', '--warn', '-V2', '-a', agg.url, 'getversion']
+                # An EG AM we switched to the ExoSM below
+                self.add_am_url_info(agg)
 
+            # Use GetVersion to determine AM type, AM API versions spoken, etc
             try:
                 self.logger.debug("Getting extra AM info from Omni for AM %s", agg)
-                (text, version) = omni.call(omniargs, options_copy)
+                (text, version) = self.get_am_version(agg.url, options_copy)
                 aggurl = agg.url
                 if isinstance (version, dict) and version.has_key(aggurl) and isinstance(version[aggurl], dict) \
                         and version[aggurl].has_key('value') and isinstance(version[aggurl]['value'], dict):
@@ -3363,6 +3371,131 @@ class StitchingHandler(object):
         # Done loop over aggs
     # End add_am_info
 
+    def add_am_url_info(self, agg):
+        '''Note whether the given AM was user requested and is the ExoSM, and settle its URL and alternate URL'''
+        # Note which AMs were user requested
+        if self.parsedUserRequest and agg.urn in self.parsedUserRequest.amURNs:
+            agg.userRequested = True
+        elif self.parsedUserRequest:
+            for urn2 in agg.urn_syns:
+                if urn2 in self.parsedUserRequest.amURNs:
+                    agg.userRequested = True
+
+        # FIXME: Better way to detect this?
+        if handler_utils._extractURL(self.logger, agg.url) in defs.EXOSM_URL:
+            agg.isExoSM = True
+#                self.logger.debug("%s is the ExoSM cause URL is %s", agg, agg.url)
+
+        # EG AMs in particular have 2 URLs in some sense - ExoSM and local
+        # So note the other one, since VMs are split between the 2
+        for (amURN, amURL) in self.config['aggregate_nicknames'].values():
+            if amURN.strip() in agg.urn_syns:
+                hadURL = handler_utils._extractURL(self.logger, agg.url)
+                newURL = handler_utils._extractURL(self.logger, amURL)
+                if hadURL != newURL and not hadURL in newURL and not newURL in hadURL and not newURL.strip == '':
+                    agg.alt_url = amURL.strip()
+                    break
+#                    else:
+#                        self.logger.debug("Not setting alt_url for %s. URL is %s, alt candidate was %s with URN %s", agg, hadURL, newURL, amURN)
+#                elif "exogeni" in amURN and "exogeni" in agg.urn:
+#                    self.logger.debug("Config had URN %s URL %s, but that URN didn't match our URN synonyms for %s", amURN, newURL, agg)
+
+        if "exogeni" in agg.urn and not agg.alt_url:
+#                self.logger.debug("No alt url for Orca AM %s (URL %s) with URN synonyms:", agg, agg.url)
+#                for urn in agg.urn_syns:
+#                    self.logger.debug("\t%s", urn)
+            if not agg.isExoSM:
+                agg.alt_url = defs.EXOSM_URL
+
+        # Try to get a URL from the CH? Do we want/need this
+        # expense? This is a call to the CH....
+        # Comment this out - takes too long, not clear
+        # it is needed.
+#            if not agg.alt_url:
+#                fw_ams = dict()
+#                try:
+#                    fw_ams = self.framework.list_aggregates()
+#                    for fw_am_urn in fw_ams.keys():
+#                        if fw_am_urn and fw_am_urn.strip() in am.urn_syns and fw_ams[fw_am_urn].strip() != '':
+#                            cand_url = fw_ams[fw_am_urn]
+#                            if cand_url != am.url and not am.url in cand_url and not cand_url in am.url:
+#                                am.alt_url = cand_url
+#                                self.logger.debug("Found AM %s alternate URL from CH ListAggs: %s", am.urn, am.alt_url)
+#                                break
+#                except:
+#                    pass
+
+        # If --noExoSM then ensure this is not the ExoSM
+        if agg.isExoSM and agg.alt_url and self.opts.noExoSM:
+            self.logger.warn("%s used ExoSM URL. Changing to %s", agg, agg.alt_url)
+            amURL = agg.url
+            agg.url = agg.alt_url
+            agg.alt_url = amURL
+            agg.isExoSM = False
+
+# For using the test ION AM
+#            if 'alpha.dragon' in agg.url:
+#                agg.url =  'http://alpha.dragon.maxgigapop.net:12346/'
+
+    def getversion_args(self, opts):
+        '''Return the Omni args to get AM info from GetVersion (without the -a)'''
+        # Hack: Here we hard-code using APIv2 always to call getversion, assuming that v2 is the AM default
+        # and so the URLs are v2 URLs.
+        if opts.warn:
+            return ['--ForceUseGetVersionCache', '-V2', 'getversion']
+        else:
+            return ['--ForceUseGetVersionCache', '-o', '--warn', '-V2', 'getversion']
+
+    def prefetch_am_versions(self, urls, opts):
+        '''Do GetVersion at all the given AM URLs at once, up to MAX_AM_QUERY_THREADS at a time,
+        saving the results for get_am_version. The calls share one Omni session (framework and config).'''
+        urls = [url for url in set(urls) if url not in self.amGetVersions]
+        if len(urls) == 0:
+            return
+        (framework, config, args, sessionOpts) = omni.initialize(self.getversion_args(opts), copy.deepcopy(opts))
+        self.logger.debug("Getting GetVersion from %d AMs at once", len(urls))
+
+        pending = Queue.Queue()
+        for url in urls:
+            pending.put(url)
+
+        def getversion_worker():
+            while True:
+                try:
+                    url = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                callOpts = copy.deepcopy(sessionOpts)
+                callOpts.aggregate = [url]
+                try:
+                    (text, version) = omni.API_call(framework, config, args, callOpts)
+                    self.amGetVersions[url] = (text, version, None)
+                except Exception, e:
+                    self.amGetVersions[url] = (None, None, e)
+
+        threads = []
+        for i in range(min(MAX_AM_QUERY_THREADS, len(urls))):
+            thread = threading.Thread(target=getversion_worker, name="getversion-%d" % i)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def get_am_version(self, url, opts):
+        '''Return Omni's (text, version) result from GetVersion at the given AM URL,
+        from prefetch_am_versions if we have it. Raise any error from the call.'''
+        if self.amGetVersions.has_key(url):
+            (text, version, exc) = self.amGetVersions[url]
+            if exc is not None:
+                # Let a later call try again
+                del self.amGetVersions[url]
+                raise exc
+            return (text, version)
+        callOpts = copy.deepcopy(opts)
+        callOpts.aggregate = [url]
+        return omni.call(self.getversion_args(callOpts), callOpts)
+
     def dump_objects(self, rspec, aggs):
         '''Print out the hops, aggregates, and dependencies'''
         if rspec and rspec.stitching:
@@ -24,4 +24,3 @@ from __future__ import absolute_import
 
 from .omnierror import OmniError, NoSliceCredError, RefusedError, AMAPIError
 from .dates import naiveUTC
-from . import handler_utils
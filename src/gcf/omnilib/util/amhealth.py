@@ -0,0 +1,253 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''Remember how the AMs and CHs omni calls have been behaving, across
+omni invocations: how many busy retries calls needed, and which servers
+keep timing out or staying busy, so _do_ssl can stop calling them for
+a while (a circuit breaker).'''
+
+from __future__ import absolute_import
+
+import copy
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import xmlrpclib
+
+from .files import replaceFile
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: the state file is still re-read before each write, but
+    # not locked
+    fcntl = None
+
+# Seconds to pause before the first retry of a busy call. Each later
+# retry waits twice as long, up to BUSY_PAUSE_MAX_SECONDS, less a
+# random amount so that many clients do not retry in step.
+BUSY_PAUSE_SECONDS = 5
+BUSY_PAUSE_MAX_SECONDS = 60
+
+# Stop calling a server for OPEN_SECONDS after FAILURE_THRESHOLD
+# failures in a row (time outs, or still busy after all retries), each
+# within FAILURE_WINDOW_SECONDS of the last
+FAILURE_THRESHOLD = 3
+FAILURE_WINDOW_SECONDS = 15 * 60
+OPEN_SECONDS = 5 * 60
+
+# How many recent busy calls to use in picking a server's retry budget
+RETRY_HISTORY = 5
+
+def busy_pause(attempt):
+    '''Seconds to wait before retrying a busy call the given attempt
+    number (1 for the first try) got a busy reply to.'''
+    pause = min(BUSY_PAUSE_MAX_SECONDS, BUSY_PAUSE_SECONDS * (2 ** (attempt - 1)))
+    return random.uniform(pause / 2.0, pause)
+
+def server_name(fn):
+    '''Return the host and path of the XML-RPC server that fn calls,
+    or None if fn is not a call on an xmlrpclib ServerProxy.'''
+    proxy = None
+    if isinstance(fn, xmlrpclib.MultiCall):
+        proxy = fn._MultiCall__server
+    elif isinstance(fn, xmlrpclib._Method):
+        proxy = getattr(fn._Method__send, 'im_self', None)
+    if not isinstance(proxy, xmlrpclib.ServerProxy):
+        return None
+    return "%s%s" % (proxy._ServerProxy__host, proxy._ServerProxy__handler)
+
+class ServerHealth(object):
+    '''Busy retry history and circuit breaker state by server, saved
+    as JSON in the given file.
+
+    The file is shared by all omni processes: it is re-read whenever
+    another process has changed it, and each change is made to the
+    latest contents under a lock on filename.lock, so that concurrent
+    omni runs do not undo each other's changes. Calls that change
+    nothing (a server answering at once, as usual) do not write it.'''
+
+    # Shared instances by file name
+    _instances = dict()
+    _instances_lock = threading.Lock()
+
+    def __init__(self, filename, logger=None):
+        self.filename = filename
+        self.logger = logger or logging.getLogger("omni.amhealth")
+        self._lock = threading.Lock()
+        self._servers = dict()
+        # (inode, mtime, size) of the file when last read
+        self._stamp = None
+        self._refresh()
+
+    @classmethod
+    def forFramework(cls, framework):
+        '''Return the ServerHealth for the file named in the framework's
+        options, or None if there are no options to say where.'''
+        opts = getattr(framework, 'opts', None)
+        filename = getattr(opts, 'amHealthCacheName', None)
+        if not filename:
+            return None
+        filename = os.path.normcase(os.path.expanduser(filename))
+        with cls._instances_lock:
+            if filename not in cls._instances:
+                cls._instances[filename] = cls(filename, getattr(framework, 'logger', None))
+            return cls._instances[filename]
+
+    def _refresh(self):
+        # Re-read the file if it changed since last read. Caller holds
+        # self._lock (or is __init__).
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return
+        stamp = (st.st_ino, st.st_mtime, st.st_size)
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.filename, 'r') as f:
+                servers = json.load(f)
+        except IOError:
+            return
+        except ValueError, e:
+            self.logger.debug("Ignoring unreadable server health file %s: %s", self.filename, e)
+            return
+        if isinstance(servers, dict):
+            self._servers = servers
+        self._stamp = stamp
+
+    def _save(self):
+        # Write a new file and rename it into place, so a crash or a
+        # concurrent omni never leaves a partial file behind
+        dirname = os.path.dirname(self.filename)
+        fd, tmpname = tempfile.mkstemp(dir=dirname or None, prefix='.amhealth')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._servers, f, indent=2)
+            replaceFile(tmpname, self.filename)
+        except:
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+            raise
+        st = os.stat(self.filename)
+        self._stamp = (st.st_ino, st.st_mtime, st.st_size)
+
+    def _update(self, server, change):
+        '''Apply change(state) to the server's state, saving the file if
+        it returns True (the state changed). The change is tried on the
+        state as last read first, and only if that changes something is
+        the file locked, re-read and the change made to the latest
+        state.'''
+        with self._lock:
+            self._refresh()
+            trial = copy.deepcopy(self._servers.get(server, dict(failures=0)))
+            if not change(trial):
+                return
+            lockfile = None
+            try:
+                dirname = os.path.dirname(self.filename)
+                if dirname and not os.path.exists(dirname):
+                    os.makedirs(dirname)
+                if fcntl is not None:
+                    lockfile = open(self.filename + '.lock', 'a')
+                    fcntl.flock(lockfile, fcntl.LOCK_EX)
+                self._stamp = None
+                self._refresh()
+                if change(self._servers.setdefault(server, dict(failures=0))):
+                    self._save()
+            except (IOError, OSError), e:
+                self.logger.debug("Failed to save server health to %s: %s", self.filename, e)
+            finally:
+                if lockfile is not None:
+                    lockfile.close()
+
+    def blocked(self, server):
+        '''If calls to the server should fail fast, return a message
+        saying why. Else return None.'''
+        with self._lock:
+            self._refresh()
+            state = self._servers.get(server)
+            if not state or state.get('openUntil', 0) <= time.time():
+                return None
+            return "%s failed %d times in a row, most recently at %s. Not calling it again until %s (or use --noCircuitBreaker)." % \
+                (server, state['failures'], time.ctime(state['lastFailure']),
+                 time.ctime(state['openUntil']))
+
+    def retryBudget(self, server, max_retries):
+        '''Return how many busy retries to allow a call to the server.
+        That is max_retries, unless the server's last calls failed (the
+        circuit breaker is tripping). Then each failure in a row halves
+        the budget, to at least 1, but it stays above the retries that
+        recent busy calls which did get an answer needed.'''
+        with self._lock:
+            self._refresh()
+            state = self._servers.get(server)
+            if not state or not state.get('failures') or \
+                    time.time() - state.get('lastFailure', 0) > FAILURE_WINDOW_SECONDS:
+                return max_retries
+            budget = max(1, max_retries >> state['failures'])
+            history = state.get('retries')
+            if history:
+                budget = max(budget, max(history) + 1)
+            return min(max_retries, budget)
+
+    def responded(self, server, retries):
+        '''The server answered after the given number of busy retries.'''
+        def change(state):
+            changed = False
+            if retries:
+                # Only calls that were busy say anything about the budget
+                history = state.setdefault('retries', [])
+                history.append(retries)
+                del history[:-RETRY_HISTORY]
+                changed = True
+            if state.get('failures') or 'openUntil' in state:
+                state['failures'] = 0
+                state.pop('openUntil', None)
+                changed = True
+            return changed
+        self._update(server, change)
+
+    def failed(self, server, retries):
+        '''A call to the server timed out (retries is None), or was
+        still busy after the given number of retries.'''
+        now = time.time()
+        def change(state):
+            if now - state.get('lastFailure', 0) > FAILURE_WINDOW_SECONDS:
+                state['failures'] = 0
+            state['failures'] = state.get('failures', 0) + 1
+            state['lastFailure'] = now
+            if state['failures'] >= FAILURE_THRESHOLD:
+                state['openUntil'] = now + OPEN_SECONDS
+            return True
+        self._update(server, change)
+        with self._lock:
+            state = self._servers.get(server, {})
+            if state.get('openUntil', 0) > now:
+                self.logger.info("%s failed %d times in a row. Will not call it again for %d seconds.",
+                                 server, state['failures'], OPEN_SECONDS)
@@ -0,0 +1,231 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''Trace the AM and CH calls omni makes through _do_ssl, when the
+--traceFile option is given. For each call this records the server,
+method, TLS connect time, request and response bytes, time waiting on
+the server, busy retries and outcome. The trace is saved as a Chrome
+trace (load it in chrome://tracing), with latency percentiles per
+server, once when the process exits (or when save_trace is called),
+not after each omni command: a stitcher run makes many of them.'''
+
+from __future__ import absolute_import
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import xmlrpclib
+
+from .amhealth import server_name
+
+# The call being made by this thread, for the transport to add to
+_current = threading.local()
+
+class CallRecord(object):
+    '''One AM or CH call, including any busy retries.'''
+
+    def __init__(self, server, method, reason):
+        self.server = server
+        self.method = method
+        self.reason = reason
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.duration = None
+        self.connect = 0.0
+        self.connects = 0
+        self.server_time = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.outcome = None
+        self.message = None
+        # When the request was last sent
+        self._sent = None
+
+    def toDict(self):
+        return dict(server=self.server, method=self.method, reason=self.reason,
+                    thread=self.thread, start=self.start, duration=self.duration,
+                    connect=self.connect, connects=self.connects,
+                    server_time=self.server_time, request_bytes=self.request_bytes,
+                    response_bytes=self.response_bytes, retries=self.retries,
+                    outcome=self.outcome, message=self.message)
+
+def current():
+    '''Return the CallRecord for the call this thread is making, or None.'''
+    return getattr(_current, 'record', None)
+
+def note_connect(seconds):
+    record = current()
+    if record is not None:
+        record.connect += seconds
+        record.connects += 1
+
+def note_request(nbytes):
+    record = current()
+    if record is not None:
+        record.request_bytes += nbytes
+        record._sent = time.time()
+
+def note_response(nbytes):
+    '''The response headers arrived, giving the response length.'''
+    record = current()
+    if record is not None:
+        if nbytes:
+            record.response_bytes += nbytes
+        if record._sent is not None:
+            record.server_time += time.time() - record._sent
+            record._sent = None
+
+def note_retry():
+    record = current()
+    if record is not None:
+        record.retries += 1
+
+def percentile(values, pct):
+    '''Return the given percentile of the sorted list of values, by the
+    nearest rank method.'''
+    if not values:
+        return None
+    rank = int(round(pct / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(len(values) - 1, rank))]
+
+class CallTracer(object):
+    '''The calls made by this process.'''
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def begin(self, fn, reason):
+        server = server_name(fn)
+        method = getattr(fn, '_Method__name', None)
+        if method is None and isinstance(fn, xmlrpclib.MultiCall):
+            method = 'system.multicall'
+        record = CallRecord(server or 'local', method or getattr(fn, '__name__', str(fn)), reason)
+        _current.record = record
+        return record
+
+    def end(self, record, outcome, message=None):
+        '''Finish the call: outcome is ok, busy, failed or exception.'''
+        record.duration = time.time() - record.start
+        record.outcome = outcome
+        record.message = message
+        _current.record = None
+        with self._lock:
+            self.calls.append(record)
+
+    def summary(self):
+        '''Return a dict by server of call count, failures, busy retries,
+        and latency percentiles in seconds.'''
+        by_server = dict()
+        with self._lock:
+            calls = list(self.calls)
+        for record in calls:
+            by_server.setdefault(record.server, []).append(record)
+        result = dict()
+        for server, records in by_server.items():
+            durations = sorted(r.duration for r in records)
+            result[server] = dict(calls=len(records),
+                                  failures=len([r for r in records if r.outcome != 'ok']),
+                                  retries=sum(r.retries for r in records),
+                                  total=sum(durations),
+                                  p50=percentile(durations, 50),
+                                  p90=percentile(durations, 90),
+                                  p99=percentile(durations, 99),
+                                  max=durations[-1])
+        return result
+
+    def summaryText(self):
+        lines = ["AM and CH call latency (seconds):"]
+        summary = self.summary()
+        for server in sorted(summary.keys(), key=lambda s: -summary[s]['total']):
+            stats = summary[server]
+            lines.append("  %s: %d calls (%d failed, %d busy retries), total %.2f, p50 %.2f, p90 %.2f, p99 %.2f, max %.2f" %
+                         (server, stats['calls'], stats['failures'], stats['retries'], stats['total'],
+                          stats['p50'], stats['p90'], stats['p99'], stats['max']))
+        return "\n".join(lines)
+
+    def chromeTrace(self):
+        '''Return the calls as a Chrome trace event structure.'''
+        with self._lock:
+            calls = list(self.calls)
+        events = []
+        pid = os.getpid()
+        for record in calls:
+            events.append({"name": record.method, "cat": record.server, "ph": "X",
+                           "ts": int(record.start * 1000000),
+                           "dur": int(record.duration * 1000000),
+                           "pid": pid, "tid": record.thread,
+                           "args": record.toDict()})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"summary": self.summary()}}
+
+    def save(self, filename):
+        filename = os.path.expanduser(filename)
+        with open(filename, 'w') as f:
+            json.dump(self.chromeTrace(), f, indent=1)
+
+# The tracer for this process, once --traceFile is seen
+_tracer = None
+_tracer_lock = threading.Lock()
+# How many calls the trace file held when last saved
+_saved_calls = 0
+
+def tracerForFramework(framework):
+    '''Return the process CallTracer if the framework's options ask
+    for a trace, else None.'''
+    global _tracer
+    opts = getattr(framework, 'opts', None)
+    if not getattr(opts, 'traceFile', None):
+        return None
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = CallTracer()
+            logger = getattr(framework, 'logger', None) or logging.getLogger('omni')
+            atexit.register(save_trace, opts, logger)
+        return _tracer
+
+def save_trace(opts, logger, summarize=True):
+    '''If --traceFile was given, write the trace of the calls so far
+    there, and log the per server summary (at debug unless summarize).
+    Does nothing if no call was made since the last save.'''
+    global _saved_calls
+    if _tracer is None or not getattr(opts, 'traceFile', None):
+        return
+    with _tracer._lock:
+        count = len(_tracer.calls)
+    if count == _saved_calls:
+        return
+    try:
+        _tracer.save(opts.traceFile)
+    except (IOError, OSError), e:
+        logger.warn("Failed to save call trace to %s: %s", opts.traceFile, e)
+        return
+    _saved_calls = count
+    if summarize:
+        logger.info(_tracer.summaryText())
+        logger.info("Saved trace of %d AM and CH calls to %s", len(_tracer.calls), opts.traceFile)
+    else:
+        logger.debug(_tracer.summaryText())
@@ -34,9 +34,6 @@ import logging
 import traceback
 import xml.dom.minidom as md
 
-from ...sfa.trust.credential import Credential
-from ...sfa.trust.abac_credential import ABACCredential
-from ...sfa.trust.credential_factory import CredentialFactory
 from ...geni.util.tz_util import tzd
 
 # FIXME: Doesn't distinguish v2 vs v3 yet
@@ -107,6 +104,12 @@ def is_valid_v3(logger, credString):
 # return cred_type and cred_version
 # Currently we only recognize two types: SFA (version 3) and ABAC (version 1)
 def get_cred_type(cred):
+    # Loaded here, as they load the SSL libraries, which commands that
+    # only read a saved credential do not need
+    from ...sfa.trust.credential import Credential
+    from ...sfa.trust.abac_credential import ABACCredential
+    from ...sfa.trust.credential_factory import CredentialFactory
+
     is_abac = False
     is_sfa = False
     try:
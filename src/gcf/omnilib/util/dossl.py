@@ -30,16 +30,16 @@
 from __future__ import absolute_import
 
 import logging
-import OpenSSL
 import socket
 import ssl
 import time
 import traceback
 import xmlrpclib
 
+from . import calltrace
+from .amhealth import ServerHealth, busy_pause, server_name
 from .omnierror import OmniError
 from .faultPrinting import cln_xmlrpclib_fault
-from ...sfa.trust import gid
 
 def is_busy_reply(result):
     """Examines the result to see if it is a V2 style result and
@@ -52,11 +52,43 @@ def is_busy_reply(result):
                      (isinstance(result["code"], dict) and result["code"].has_key("geni_code") \
                           and isinstance(result["code"]["geni_code"], int) and result["code"]["geni_code"] == 14)))
 
+def _is_timeout(err):
+    return isinstance(err, socket.timeout) or getattr(err, 'errno', None) == 115 or \
+        'timed out' in str(err)
+
 def _do_ssl(framework, suppresserrors, reason, fn, *args):
     """ Attempts to make an xmlrpc call, and will repeat the attempt
     if it failed due to a bad passphrase for the ssl key.  Also does some
     exception handling.  Returns: (1) the xmlrpc return if everything went okay,
-    otherwise returns None. And (2) A message explaining any errors."""
+    otherwise returns None. And (2) A message explaining any errors.
+
+    Busy calls are retried with jittered exponential backoff, up to
+    --maxBusyRetries times, or fewer if the same server's last calls
+    failed. A server that keeps timing out or staying busy is not called
+    again for a while (see amhealth). With --traceFile, each call is timed (see
+    calltrace)."""
+    tracer = calltrace.tracerForFramework(framework)
+    if tracer is None:
+        return _do_ssl_call(framework, suppresserrors, reason, fn, *args)
+    record = tracer.begin(fn, reason)
+    try:
+        (result, message) = _do_ssl_call(framework, suppresserrors, reason, fn, *args)
+    except Exception, e:
+        tracer.end(record, 'exception', str(e))
+        raise
+    if result is None:
+        tracer.end(record, 'failed', message)
+    elif is_busy_reply(result):
+        tracer.end(record, 'busy')
+    else:
+        tracer.end(record, 'ok')
+    return (result, message)
+
+def _do_ssl_call(framework, suppresserrors, reason, fn, *args):
+    # Loaded here rather than with this module, so that commands that
+    # make no calls (like reading a saved credential) do not load them
+    import OpenSSL
+    from ...sfa.trust import gid
 
     # Change exception name?
 
@@ -67,7 +99,21 @@ def _do_ssl(framework, suppresserrors, reason, fn, *args):
             max_attempts = framework.opts.maxBusyRetries
             framework.logger.debug("Resetting max retries based on option to %d", max_attempts)
     attempt = 0
-    retry_pause_seconds = 20
+
+    server = server_name(fn)
+    health = None
+    if server is not None:
+        health = ServerHealth.forFramework(framework)
+    if health is not None:
+        if not getattr(framework.opts, 'noCircuitBreaker', False):
+            blockedMsg = health.blocked(server)
+            if blockedMsg:
+                framework.logger.warn("Not doing %s: %s", reason, blockedMsg)
+                return (None, blockedMsg)
+        budget = health.retryBudget(server, max_attempts)
+        if budget != max_attempts:
+            framework.logger.debug("Allowing %d busy retries of %s based on recent calls to %s", budget, reason, server)
+            max_attempts = budget
 
     failMsg = "Call for %s failed." % reason
     while(attempt <= max_attempts):
@@ -75,11 +121,18 @@ def _do_ssl(framework, suppresserrors, reason, fn, *args):
         try:
             result = fn(*args)
             if is_busy_reply(result) and attempt <= max_attempts:
+                retry_pause_seconds = busy_pause(attempt)
+                calltrace.note_retry()
                 framework.logger.info('Detected busy result for %s. Retrying in %d seconds.',
                                       reason, retry_pause_seconds)
                 time.sleep(retry_pause_seconds)
                 continue
             else:
+                if health is not None:
+                    if is_busy_reply(result):
+                        health.failed(server, attempt - 1)
+                    else:
+                        health.responded(server, attempt - 1)
                 return (result, "")
         except OpenSSL.crypto.Error, err:
             if str(err).find('bad decrypt') > -1:
@@ -99,6 +152,8 @@ def _do_ssl(framework, suppresserrors, reason, fn, *args):
 
                 return (None, "Unknown OpenSSL error %s" % err)
         except ssl.SSLError, exc:
+            if health is not None and _is_timeout(exc):
+                health.failed(server, None)
             if exc.errno == 336265225:
                 framework.logger.debug("Doing %s got %s", reason, exc)
                 framework.logger.error('Wrong pass phrase for private key.')
@@ -176,12 +231,21 @@ def _do_ssl(framework, suppresserrors, reason, fn, *args):
             clnfault = cln_xmlrpclib_fault(fault)
             framework.logger.error("%s Server says: %s" % (failMsg, clnfault))
             if str(fault).find("try again later") > -1 and attempt <= max_attempts:
+                retry_pause_seconds = busy_pause(attempt)
+                calltrace.note_retry()
                 framework.logger.info(" ... pausing %d seconds and retrying ...." % retry_pause_seconds)
                 time.sleep(retry_pause_seconds)
                 continue
             else:
+                if health is not None:
+                    if str(fault).find("try again later") > -1:
+                        health.failed(server, attempt - 1)
+                    else:
+                        health.responded(server, attempt - 1)
                 return (None, clnfault)
         except socket.error, sock_err:
+            if health is not None and _is_timeout(sock_err):
+                health.failed(server, None)
             if suppresserrors:
                 for suppresserror in suppresserrors:
                     if suppresserror and str(sock_err).find(suppresserror) > -1:
@@ -46,4 +46,13 @@ def readFromURL( url ):
     u = urllib2.urlopen(url) 
     readstr = u.read()
     return readstr
- 
+
+def replaceFile( src, dst ):
+    """Rename file src to dst, replacing dst if it exists. Windows will
+    not rename onto an existing file, so there dst is removed first."""
+    if os.name == 'nt':
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+    os.rename(src, dst)
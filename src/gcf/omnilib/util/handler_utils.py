@@ -24,6 +24,7 @@
 
 from __future__ import absolute_import
 
+import codecs
 import datetime
 import dateutil
 import json
@@ -33,14 +34,14 @@ import re
 import string
 
 from . import json_encoding
-from . import credparsing as credutils
-from .dossl import _do_ssl
 from .dates import naiveUTC
 from .files import *
-from ...geni.util import rspec_util
-from ...geni.util.tz_util import tzd
-from ...sfa.trust.gid import GID
-from ...sfa.trust.credential import Credential
+from .rspec_stream import RSpecDecoder, RSpecStreamWriter
+
+# Functions that talk to the clearinghouse, parse credentials or use
+# gcf.geni (whose package loads the reference CH and AM) import those
+# modules when called, so that loading this module (eg for omni
+# nicknames) does not load the SSL and SFA trust libraries.
 
 def _derefAggNick(handler, aggregateNickname):
     """Check if the given aggregate string is a nickname defined
@@ -395,6 +396,7 @@ def _listaggregates(handler):
         return (aggs, "")
     elif not handler.opts.noExtraCHCalls:
         handler.logger.debug("Querying clearinghouse for all aggregates")
+        from .dossl import _do_ssl
         (aggs, message) =  _do_ssl(handler.framework, None, "List Aggregates from control framework", handler.framework.list_aggregates)
         if aggs is None:
             # FIXME: Return the message?
@@ -411,6 +413,7 @@ def _load_cred(handler, filename):
     Based on AM API version, returned cred will be a struct or raw XML.
     In dev mode, file contents are returned as is.
     '''
+    from . import credparsing as credutils
     if not filename:
         handler.logger.debug("No filename provided for credential")
         return None
@@ -449,7 +452,6 @@ def _get_slice_cred(handler, urn):
     Return the slice credential, and a string message of any error.
     Returned credential will be a struct in AM API v3+.
     """
-
     cred = _load_cred(handler, handler.opts.slicecredfile)
     if cred is not None:
         msg = "Read slice cred from %s" % handler.opts.slicecredfile
@@ -475,6 +477,10 @@ def _get_slice_cred(handler, urn):
         handler.logger.warn(msg)
         return (None, msg)
 
+    # Only needed to fetch the credential, not to read it from a file
+    from .dossl import _do_ssl
+    from ...sfa.trust.credential import Credential
+
     # Check that the return is either None or a valid slice cred
     # Callers handle None - usually by raising an error
     if handler.opts.api_version < 3:
@@ -515,6 +521,7 @@ def _get_slice_cred(handler, urn):
 def _print_slice_expiration(handler, urn, sliceCred=None):
     """Check when the slice expires. Print varying warning notices
     and the expiration date"""
+    from . import credparsing as credutils
     # FIXME: push this to config?
     shorthours = 3
     middays = 1
@@ -705,9 +712,8 @@ def _construct_output_filename(opts, slicename, clienturl, clienturn, methodname
             filename  = opts.prefix.strip() + filename
     return filename
 
-def _getRSpecOutput(logger, rspec, slicename, urn, url, message, slivers=None):
-    '''Get the header, rspec content, and retVal for writing the given RSpec to a file'''
-    # Create HEADER
+def _getRSpecHeader(slicename, urn, url, slivers=None):
+    '''Get the header comment for writing an RSpec from the given AM to a file'''
     if slicename:
         if slivers and len(slivers) > 0:
             header = "Reserved resources for:\n\tSlice: %s\n\tSlivers: %s\n\tat AM:\n\tURN: %s\n\tURL: %s\n" % (slicename, slivers, urn, url)
@@ -715,12 +721,18 @@ def _getRSpecOutput(logger, rspec, slicename, urn, url, message, slivers=None):
             header = "Reserved resources for:\n\tSlice: %s\n\tat AM:\n\tURN: %s\n\tURL: %s\n" % (slicename, urn, url)
     else:
         header = "Resources at AM:\n\tURN: %s\n\tURL: %s\n" % (urn, url)
-    header = "<!-- "+header+" -->"
+    return "<!-- "+header+" -->"
+
+def _getRSpecOutput(logger, rspec, slicename, urn, url, message, slivers=None):
+    '''Get the header, rspec content, and retVal for writing the given RSpec to a file'''
+    # Create HEADER
+    header = _getRSpecHeader(slicename, urn, url, slivers)
 
     server = _get_server_name(url, urn)
 
     # Create BODY
-    if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=logger ):
+    from ...geni.util import rspec_util
+    if rspec and rspec_util.is_rspec_string( rspec, None, None, logger=logger, sniff=True ):
         # This line seems to insert extra \ns - GCF ticket #202
 #        content = rspec_util.getPrettyRSpec(rspec)
         content = string.replace(rspec, "\\n", '\n')
@@ -783,6 +795,97 @@ def _writeRSpec(opts, logger, rspec, slicename, urn, url, message=None, clientco
     return retVal, filename
 # End of _writeRSpec
 
+def _openOutputFile(logger, filename):
+    '''Open the given output file for writing, creating its directory if needed'''
+    fdir = os.path.dirname(filename)
+    if fdir and fdir != "":
+        if not os.path.exists(fdir):
+            os.makedirs(fdir)
+    logger.info( "Writing to '%s'"%(filename))
+    return open(filename, 'w')
+
+def _streamRSpec(logger, rspec, outfile, header):
+    '''Decode (and decompress if needed) the given RSpec a chunk at a time
+    into the given file, pretty printing it if it has few newlines (like
+    listresources does with getPrettyRSpec).
+    Return the RSpecStreamWriter, which summarizes the RSpec.'''
+    chunks = iter(RSpecDecoder(rspec))
+    first = next(chunks, '')
+    writer = RSpecStreamWriter(outfile, header, pretty=(first.count('\n') <= 10))
+    writer.feed(first)
+    for chunk in chunks:
+        writer.feed(chunk)
+    writer.close()
+    if writer.header is not None:
+        # No XML declaration to put the header after; log it like _printResults
+        logger.info(writer.header)
+    if writer.error:
+        logger.debug("RSpec parse error: %s", writer.error)
+    return writer
+
+def _writeRSpecStream(opts, logger, rspec, slicename, urn, url, message=None, clientcount=1):
+    '''Like _writeRSpec, but for use with -o: decode (and decompress) the
+    given RSpec straight into the output file, so the whole decoded RSpec
+    is never in memory.
+    Return the retVal, the filename, and the RSpecStreamWriter
+    that summarizes the RSpec (see expires_from_rspec_stream).
+    '''
+    mname = "rspec"
+    if slicename:
+        mname = "manifest-rspec"
+    filename = _construct_output_filename(opts, slicename, url, urn, mname, ".xml", clientcount)
+    server = _get_server_name(url, urn)
+    with _openOutputFile(logger, filename) as file:
+        writer = _streamRSpec(logger, rspec, file, _getRSpecHeader(slicename, urn, url))
+    if writer.isRSpec():
+        if slicename:
+            retVal = "Got Reserved resources RSpec from %s" % server
+        else:
+            retVal = "Got RSpec from %s" % server
+        logger.debug("RSpec from %s has %d node(s)", server, writer.nodeCount)
+    else:
+        logger.warn("No valid RSpec returned: Invalid RSpec? %s", writer.error)
+        if slicename:
+            retVal = "Invalid RSpec returned for slice %s from %s (saved anyway)" % (slicename, server)
+        else:
+            retVal = "Invalid RSpec returned from %s (saved anyway)" % server
+        if message:
+            logger.warn("Server said: %s", message)
+            retVal += "; Server said: %s" % message
+    return retVal, filename, writer
+# End of _writeRSpecStream
+
+class _JSONStringFile(object):
+    '''File-like wrapper that writes UTF-8 text as the inside of a JSON string'''
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    def write(self, data):
+        text = self.decoder.decode(data)
+        if text:
+            self.outfile.write(json.encoder.encode_basestring_ascii(text)[1:-1])
+
+def _writeJSONWithRSpecStream(opts, logger, header, struct, key, filename):
+    '''Write the given struct as JSON (as json.dumps with indent 2) to the given
+    file, decoding (and decompressing if needed) the RSpec in struct[key]
+    a chunk at a time straight into the file.
+    Return the RSpecStreamWriter that summarizes the RSpec.'''
+    marker = "@@omni-streamed-rspec@@"
+    rspec = struct[key]
+    struct[key] = marker
+    try:
+        prettyResult = json.dumps(struct, ensure_ascii=True, indent=2)
+    finally:
+        struct[key] = rspec
+    (before, after) = prettyResult.split('"%s"' % marker, 1)
+    with _openOutputFile(logger, filename) as file:
+        file.write(before + '"')
+        writer = _streamRSpec(logger, rspec, _JSONStringFile(file), None)
+        file.write('"' + after + '\n')
+    # Like _printResults, the header is logged for non-XML files
+    logger.info(header)
+    return writer
+
 def _printResults(opts, logger, header, content, filename=None):
     """Print header string and content string to file of given
     name. If filename is none, then log to info.
@@ -837,12 +940,7 @@ def _printResults(opts, logger, header, content, filename=None):
             else:
                 print content[cstart:] + "\n"
     else:
-        fdir = os.path.dirname(filename)
-        if fdir and fdir != "":
-            if not os.path.exists(fdir):
-                os.makedirs(fdir)
-        with open(filename,'w') as file:
-            logger.info( "Writing to '%s'"%(filename))
+        with _openOutputFile(logger, filename) as file:
             if header is not None:
                 if cstart > 0:
                     file.write (content[:cstart] + '\n')
@@ -878,6 +976,7 @@ def _maybe_save_slicecred(handler, name, slicecred):
     --slicecredfile if supplied
     else [<--p value>-]-<slicename>-cred.[xml or json, depending on credential format]
     """
+    from . import credparsing as credutils
     if name is None or name.strip() == "" or slicecred is None or (credutils.is_cred_xml(slicecred) and slicecred.strip() is None):
         return None
 
@@ -902,6 +1001,7 @@ def _save_cred(handler, name, cred):
     Infer an appropriate file extension from the file type.
     If we are using APIv3+ and the credential is not a struct, wrap it before saving.
     '''
+    from . import credparsing as credutils
     ftype = ".xml"
     # FIXME: Do this?
     if credutils.is_cred_xml(cred) and handler.opts.api_version >= 3:
@@ -933,6 +1033,7 @@ def _save_cred(handler, name, cred):
     return filename
 
 def _is_user_cert_expired(handler):
+    from ...sfa.trust.gid import GID
     # create a gid
     usergid = None
     try:
@@ -945,6 +1046,7 @@ def _is_user_cert_expired(handler):
     return False
 
 def _get_user_urn(logger, config):
+    from ...sfa.trust.gid import GID
     # create a gid
     usergid = None
     try:
@@ -1072,7 +1174,15 @@ def expires_from_rspec(result, logger=None):
 
     # Got no good expires so far. Look for the EG geni_sliver_info attribute
     # FIXME: This is really per node, and here we're returning just one.
-    match = re.search("<rspec\s+.+\s+<node\s+.+\s+<.*geni_sliver_info\s+[^>]*expiration_time\s*=\s*[\'\"]([^\'\"]+)[\'\"]", rspec, re.DOTALL)
+    # Use the last such element after the first node (a single regex for all this backtracks
+    # badly on large RSpecs with no sliver info)
+    match = None
+    rspecStart = re.search("<rspec\s", rspec)
+    if rspecStart:
+        nodeStart = re.compile("<node\s").search(rspec, rspecStart.end())
+        if nodeStart:
+            for match in re.compile("<[^<>]*geni_sliver_info\s+[^>]*expiration_time\s*=\s*[\'\"]([^\'\"]+)[\'\"]").finditer(rspec, nodeStart.end()):
+                pass
     if match:
         expStr = match.group(1).strip()
         if logger:
@@ -1090,7 +1200,24 @@ def expires_from_rspec(result, logger=None):
     # If no expires found, return None
     return None
 
+def expires_from_rspec_stream(writer, logger=None):
+    '''Like expires_from_rspec, but using the summary of an RSpec
+    from an RSpecStreamWriter.'''
+    if writer.expires:
+        expObj = _naiveUTCFromString(writer.expires)
+        if expObj is not None:
+            genObj = _naiveUTCFromString(writer.generated)
+            if genObj is not None and expObj - genObj <= datetime.timedelta.resolution:
+                if logger:
+                    logger.debug("Expires %s same as generated %s, pretend got no expires", writer.expires, writer.generated)
+                return None
+            return expObj
+    if writer.sliverInfoExpires:
+        return _naiveUTCFromString(writer.sliverInfoExpires)
+    return None
+
 def _naiveUTCFromString(timeStr):
+    from ...geni.util.tz_util import tzd
     if not timeStr:
         return None
     try:
@@ -0,0 +1,266 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''Decode, pretty print and summarize large RSpecs a chunk at a time,
+so that writing an RSpec to a file never needs more than a buffer's
+worth of memory beyond the (possibly compressed) RSpec as received.'''
+
+from __future__ import absolute_import
+
+import binascii
+import re
+import string
+import xml.parsers.expat
+from xml.sax.saxutils import escape, quoteattr
+import zlib
+
+# Size of the chunks RSpecs are decoded and written in
+CHUNK_SIZE = 64 * 1024
+
+def _local_name(qname):
+    return qname.split(':')[-1]
+
+class RSpecDecoder(object):
+    '''Iterate over an RSpec string a chunk at a time. If the string is
+    base64 encoded zlib compressed data (as for geni_compressed), decode
+    and decompress it incrementally.'''
+
+    def __init__(self, data, chunkSize=CHUNK_SIZE):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.data = data
+        self.chunkSize = chunkSize
+        # A compressed RSpec is base64, so cannot start with an element
+        self.compressed = not re.match(r'\s*<', data)
+
+    def __iter__(self):
+        if not self.compressed:
+            for i in xrange(0, len(self.data), self.chunkSize):
+                yield self.data[i:i+self.chunkSize]
+            return
+
+        decompressor = zlib.decompressobj()
+        pending = ''
+        for i in xrange(0, len(self.data), self.chunkSize):
+            # Decode only whole base64 quanta, ignoring line breaks
+            encoded = pending + self.data[i:i+self.chunkSize].translate(None, string.whitespace)
+            usable = len(encoded) - len(encoded) % 4
+            pending = encoded[usable:]
+            compressed = binascii.a2b_base64(encoded[:usable])
+            # Bound each decompressed chunk, however well the data compressed
+            while compressed:
+                chunk = decompressor.decompress(compressed, self.chunkSize)
+                if chunk:
+                    yield chunk
+                compressed = decompressor.unconsumed_tail
+        if pending:
+            raise binascii.Error("Truncated base64 data")
+        chunk = decompressor.flush()
+        if chunk:
+            yield chunk
+
+class RSpecStreamWriter(object):
+    '''Write an RSpec to a file as it is fed, a chunk at a time.
+    The given header (an XML comment) goes right after any XML declaration.
+    If pretty, re-indent the RSpec (like getPrettyRSpec), else copy it
+    as is. Either way the RSpec is parsed as it goes by, noting the root
+    element, its expires and generated attributes, any ExoGENI sliver_info
+    expiration_time, and the number of nodes.'''
+
+    def __init__(self, outfile, header=None, pretty=False, indent='  '):
+        self.outfile = outfile
+        self.header = header
+        self.pretty = pretty
+        self.indent = indent
+
+        self.rootTag = None
+        self.expires = None
+        self.generated = None
+        self.sliverInfoExpires = None
+        self.nodeCount = 0
+        self.error = None # Parse error, if any
+
+        self._started = False
+        self._head = ''
+        self._fed = 0 # Bytes given to the parser so far
+        self._rawFrom = None
+        self._tail = '' # Possible start of a literal \n split across chunks
+        self._depth = 0
+        self._openTag = False # Pretty: start tag written without its closing '>'
+        self._hasChildren = []
+        self._text = []
+
+        self._parser = xml.parsers.expat.ParserCreate()
+        self._parser.ordered_attributes = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        if pretty:
+            self._parser.CharacterDataHandler = self._chars
+            self._parser.CommentHandler = self._comment
+            self._parser.ProcessingInstructionHandler = self._pi
+
+    def isRSpec(self):
+        return self.rootTag in ('rspec', 'resv_rspec') and self.error is None
+
+    def feed(self, data):
+        # Like _getRSpecOutput, turn literal \n into newlines
+        data = self._tail + data
+        if data.endswith('\\'):
+            self._tail = '\\'
+            data = data[:-1]
+        else:
+            self._tail = ''
+        data = data.replace('\\n', '\n')
+
+        if not self._started:
+            # Hold the start until we can see the whole XML declaration, if any
+            self._head += data
+            if len(self._head) < 1024:
+                return
+            data = self._writeStart()
+        self._write_data(data)
+
+    def close(self):
+        data = self._tail
+        self._tail = ''
+        if not self._started:
+            data = self._writeStart() + data
+        self._write_data(data, True)
+        if self.error is None and self.rootTag is None:
+            self.error = "No XML element"
+        if not self.pretty or self.error is not None:
+            self.outfile.write('\n')
+
+    def _writeStart(self):
+        # Write any XML declaration and the header. Return the rest of the start.
+        self._started = True
+        data = self._head
+        self._head = ''
+        match = re.match(r'\s*<\?xml\s[^>]*\?>', data)
+        if self.pretty:
+            self.outfile.write('<?xml version="1.0" ?>\n')
+        elif match:
+            self.outfile.write(data[:match.end()] + '\n')
+        if self.header is not None and (match or self.pretty):
+            self.outfile.write('  ' + self.header + '\n')
+            self.header = None
+            if not self.pretty:
+                self.outfile.write('  ')
+        if match:
+            self._parse(data[:match.end()])
+            data = data[match.end():]
+            if not self.pretty:
+                data = data.lstrip('\n')
+        return data
+
+    def _write_data(self, data, final=False):
+        self._parse(data, final)
+        if not self.pretty or self._rawFrom is not None:
+            # Copy as is (pretty printing stopped at a parse error)
+            self.outfile.write(data[self._rawFrom or 0:])
+            self._rawFrom = 0
+
+    def _parse(self, data, final=False):
+        if self.error is None:
+            try:
+                self._parser.Parse(data, final)
+            except xml.parsers.expat.ExpatError, e:
+                self.error = str(e)
+                if self.pretty:
+                    self._closeOpenTag()
+                    self._flushText()
+                    # Copy the rest as is, from the tag with the bad spot if it is in this chunk
+                    errorAt = max(0, self._parser.ErrorByteIndex - self._fed)
+                    self._rawFrom = max(0, data.rfind('<', 0, errorAt + 1))
+        self._fed += len(data)
+
+    def _start(self, name, attrs):
+        local = _local_name(name)
+        attrDict = dict(zip(attrs[::2], attrs[1::2]))
+        if self._depth == 0:
+            self.rootTag = local
+            self.expires = attrDict.get('expires')
+            self.generated = attrDict.get('generated')
+        elif self._depth == 1 and local == 'node':
+            self.nodeCount += 1
+        elif local == 'geni_sliver_info' and self.sliverInfoExpires is None:
+            self.sliverInfoExpires = attrDict.get('expiration_time')
+
+        if self.pretty:
+            self._closeOpenTag()
+            if self._hasChildren:
+                self._hasChildren[-1] = True
+            self._flushText()
+            attrStr = ''.join(' %s=%s' % (attrs[i], quoteattr(attrs[i+1])) for i in xrange(0, len(attrs), 2))
+            self._write('%s<%s%s' % (self.indent * self._depth, name, attrStr))
+            self._openTag = True
+            self._hasChildren.append(False)
+        self._depth += 1
+
+    def _end(self, name):
+        self._depth -= 1
+        if not self.pretty:
+            return
+        hasChildren = self._hasChildren.pop()
+        text = ''.join(self._text).strip()
+        self._text = []
+        if self._openTag and not text:
+            self._write('/>\n')
+        elif self._openTag:
+            self._write('>%s</%s>\n' % (escape(text), name))
+        else:
+            if text:
+                self._write('%s%s\n' % (self.indent * (self._depth + 1), escape(text)))
+            self._write('%s</%s>\n' % (self.indent * self._depth, name))
+        self._openTag = False
+
+    def _chars(self, data):
+        self._text.append(data)
+
+    def _comment(self, data):
+        self._closeOpenTag()
+        self._flushText()
+        self._write('%s<!--%s-->\n' % (self.indent * self._depth, data))
+
+    def _pi(self, target, data):
+        self._closeOpenTag()
+        self._flushText()
+        self._write('%s<?%s %s?>\n' % (self.indent * self._depth, target, data))
+
+    def _closeOpenTag(self):
+        if self._openTag:
+            self._write('>\n')
+            self._openTag = False
+            if self._hasChildren:
+                self._hasChildren[-1] = True
+
+    def _flushText(self):
+        text = ''.join(self._text).strip()
+        self._text = []
+        if text:
+            self._closeOpenTag()
+            self._write('%s%s\n' % (self.indent * self._depth, escape(text)))
+
+    def _write(self, s):
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        self.outfile.write(s)
@@ -0,0 +1,117 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+'''Reconcile the sliver records at the clearinghouse with the slivers
+an aggregate reports, sending the CH only the records that changed,
+in one batch.'''
+
+from __future__ import absolute_import
+
+import datetime
+import dateutil.parser
+
+from .dates import naiveUTC
+from ...geni.util.tz_util import tzd
+
+def recorded_expiration(sliver_info):
+    '''Return the expiration in the given CH sliver info struct as a
+    naive UTC datetime, or None if there is none.'''
+    if not sliver_info or not sliver_info.get('SLIVER_INFO_EXPIRATION'):
+        return None
+    return naiveUTC(dateutil.parser.parse(sliver_info['SLIVER_INFO_EXPIRATION'],
+                                          tzinfos=tzd))
+
+class SliverInfoChanges(object):
+    '''The sliver records to create, update and delete at the CH for
+    one slice at one aggregate. Only the first change given for a
+    sliver is kept.'''
+
+    def __init__(self, slice_urn, agg_urn):
+        self.slice_urn = slice_urn
+        self.agg_urn = agg_urn
+        self.creates = []
+        self.updates = []
+        self.deletes = []
+        self._slivers = set()
+
+    def _add(self, sliver_urn):
+        if sliver_urn in self._slivers:
+            return False
+        self._slivers.add(sliver_urn)
+        return True
+
+    def create(self, sliver_urn, expiration):
+        if self._add(sliver_urn):
+            self.creates.append(dict(sliver_urn=sliver_urn, aggregate_urn=self.agg_urn,
+                                     expiration=expiration))
+
+    def update(self, sliver_urn, expiration):
+        if self._add(sliver_urn):
+            self.updates.append(dict(sliver_urn=sliver_urn, aggregate_urn=self.agg_urn,
+                                     expiration=expiration))
+
+    def delete(self, sliver_urn):
+        if self._add(sliver_urn):
+            self.deletes.append(sliver_urn)
+
+    def __len__(self):
+        return len(self._slivers)
+
+    def apply(self, framework, logger):
+        '''Send all the changes to the CH in one batch. Return a dict
+        by sliver URN of True or an error message. May raise
+        NotImplementedError if the framework does not record slivers.'''
+        if len(self) == 0:
+            logger.debug("CH sliver records for %s at %s already match the AM",
+                         self.slice_urn, self.agg_urn)
+            return {}
+        logger.debug("Sending CH %d new, %d updated and %d deleted sliver records for %s at %s",
+                     len(self.creates), len(self.updates), len(self.deletes),
+                     self.slice_urn, self.agg_urn)
+        return framework.apply_sliver_info_changes(self.slice_urn, creates=self.creates,
+                                                   updates=self.updates, deletes=self.deletes)
+
+def reconcile(changes, ch_slivers, am_slivers, scope=None):
+    '''Add to changes what the CH needs so its records match the AM.
+
+    ch_slivers is a dict by sliver URN of the sliver info structs the CH
+    has for this slice at this AM. am_slivers is a dict by sliver URN of
+    (naive UTC expiration or None, expiration to record) for the slivers
+    the AM says should be recorded. CH records of other slivers are
+    deleted, but only those in scope, if a scope is given. Slivers the
+    CH does not know are created, and those whose recorded expiration
+    differs are updated.
+    Return changes.'''
+    if ch_slivers is None:
+        ch_slivers = {}
+    for sliver_urn in sorted(set(ch_slivers.keys()) - set(am_slivers.keys())):
+        if scope is None or sliver_urn in scope:
+            changes.delete(sliver_urn)
+    for sliver_urn in sorted(am_slivers.keys()):
+        (exp, recordExp) = am_slivers[sliver_urn]
+        if sliver_urn not in ch_slivers:
+            changes.create(sliver_urn, recordExp)
+            continue
+        chexp = recorded_expiration(ch_slivers[sliver_urn])
+        if chexp is None or (exp is not None and abs(chexp - exp) > datetime.timedelta.resolution):
+            changes.update(sliver_urn, recordExp)
+    return changes
@@ -25,10 +25,33 @@ import httplib
 import os
 import socket
 import ssl
+import time
 import urllib
 import xmlrpclib
 
-class SafeTransportWithCert(xmlrpclib.SafeTransport):
+from ..util import calltrace
+
+class TracingTransport:
+    '''Note request and response sizes, and time spent waiting on the
+    server, for the call trace (see calltrace). Mix in before the
+    xmlrpclib Transport class.'''
+
+    def send_content(self, connection, request_body):
+        xmlrpclib.Transport.send_content(self, connection, request_body)
+        calltrace.note_request(len(request_body))
+
+    def parse_response(self, response):
+        length = None
+        if hasattr(response, 'getheader'):
+            length = response.getheader('content-length')
+        calltrace.note_response(int(length) if length and length.isdigit() else None)
+        return xmlrpclib.Transport.parse_response(self, response)
+
+class PlainTransport(TracingTransport, xmlrpclib.Transport):
+    '''The standard http Transport, with call tracing.'''
+    pass
+
+class SafeTransportWithCert(TracingTransport, xmlrpclib.SafeTransport):
     '''Sample client for talking XMLRPC over SSL supplying
     a client X509 identity certificate.'''
 
@@ -95,6 +118,11 @@ class TLS1HTTPSConnection(httplib.HTTPSConnection):
         self.ciphers = ciphers
 
     def connect(self):
+        start = time.time()
+        self._connect()
+        calltrace.note_connect(time.time() - start)
+
+    def _connect(self):
         import sys
         if sys.version_info >= (2,7,0):
             sock = socket.create_connection((self.host, self.port), self.timeout, self.source_address)
@@ -134,7 +162,7 @@ class TLS1P26HTTPS(httplib.HTTPS):
                  strict=None):
         httplib.HTTPS.__init__(self, host, port, key_file, cert_file, strict)
 
-class SafeTransportNoCert(xmlrpclib.SafeTransport):
+class SafeTransportNoCert(TracingTransport, xmlrpclib.SafeTransport):
     # A standard SafeTransport that honors the requested SSL timeout
     def __init__(self, use_datetime=0, timeout=None, ssl_version=ssl.PROTOCOL_TLS, ciphers=None):
         # Ticket #776: As of Python 2.7.9, server certs are verified by default.
@@ -217,6 +245,8 @@ def make_client(url, keyfile, certfile, verbose=False, timeout=None,
         type, uri = urllib.splittype(url2.lower())
         if type == "https":
             cert_transport = SafeTransportNoCert(timeout=timeout, ssl_version=ssl_version, ciphers=ciphers)
+        elif type == "http":
+            cert_transport = PlainTransport()
 
     return xmlrpclib.ServerProxy(url, transport=cert_transport,
                                  verbose=verbose, allow_none=allow_none)
@@ -239,10 +269,11 @@ def make_client(url, keyfile, certfile, verbose=False, timeout=None,
 # rely on.
 #
 #----------------------------------------------------------------------
+# M2Crypto is imported where it is used, so that loading this module to
+# make an ordinary client does not load it.
 import httplib
 import socket
 import sys
-import M2Crypto.SSL
 
 class SafeTransportWithCertM2Crypto(xmlrpclib.SafeTransport):
 
@@ -290,10 +321,12 @@ class ContextHTTPSConnectionM2Crypto(httplib.HTTPSConnection):
         self.ssl_context = context
         self.sockTimeout = None
         if timeout != socket._GLOBAL_DEFAULT_TIMEOUT:
+            import M2Crypto.SSL
             self.sockTimeout = M2Crypto.SSL.timeout(sec=float(timeout))
 
     def connect(self):
         "Connect to a host on a given (SSL) port."
+        import M2Crypto.SSL
         if not self.ssl_context:
             # Initialize the M2Crypto SSL Context
             self.ssl_context = M2Crypto.SSL.Context()
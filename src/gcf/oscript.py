@@ -115,25 +115,22 @@ import optparse
 import os
 import shutil
 import sys
+import threading
 import urllib2
 
 from .omnilib.util import OmniError, AMAPIError
-from .omnilib.handler import CallHandler
-from .omnilib.util.handler_utils import validate_url, printNicknames
-
-# Explicitly import framework files so py2exe is happy
-from .omnilib.frameworks import framework_apg
-from .omnilib.frameworks import framework_base
-from .omnilib.frameworks import framework_gcf
-from .omnilib.frameworks import framework_gch
-from .omnilib.frameworks import framework_gib
-from .omnilib.frameworks import framework_of
-from .omnilib.frameworks import framework_pg
-from .omnilib.frameworks import framework_pgch
-from .omnilib.frameworks import framework_sfa
-from .omnilib.frameworks import framework_chapi
 from .gcf_version import GCF_VERSION
 
+# The call handlers, the control framework and the SSL and SFA trust
+# modules they use are imported only when a command needs them, so
+# that omni starts quickly. Commands that need no framework:
+LOCAL_COMMANDS = ('nicknames',)
+
+# Omni initialization (logging and config setup) is not thread safe, so
+# calls made from several threads at once (eg by stitcher) initialize
+# one at a time. The calls themselves then run concurrently.
+_initialize_lock = threading.Lock()
+
 #DEFAULT_RSPEC_LOCATION = "http://www.gpolab.bbn.com/experiment-support"               
 #DEFAULT_RSPEC_EXTENSION = "xml"                
 
@@ -404,6 +401,7 @@ def load_aggregate_nicknames( config, confparser, filename, logger, opts ):
                 continue
             if len(temp) == 1:
                 # Got 1 entry - if its a valid URL, use it
+                from .omnilib.util.handler_utils import validate_url
                 res = validate_url(temp[0])
                 if res is None or res.startswith("WARN:"):
                     t = temp[0]
@@ -571,7 +569,8 @@ def initialize(argv, options=None, dictLoggingConfig=None ):
     (Supplying an existing options object allows pre-setting certain values not in argv.)
     Then configure logging per those options.
     Then load the omni_config file
-    Then initialize the control framework.
+    Then initialize the control framework, unless the command does not
+    use one (see LOCAL_COMMANDS), in which case the framework is None.
     Return the framework, config, args list, and optparse.Values struct."""
 
     opts, args = parse_args(argv, options)
@@ -583,6 +582,9 @@ def initialize(argv, options=None, dictLoggingConfig=None ):
     # which also sets omni_defaults
     config = load_config(opts, logger, config)
     checkForUpdates(config, logger)
+    if len(args) > 0 and args[0].lower() in LOCAL_COMMANDS:
+        logger.debug("Not loading a control framework for command %s", args[0])
+        return None, config, args, opts
     framework = load_framework(config, opts)
     logger.debug('User Cert File: %s', framework.cert)
     return framework, config, args, opts
@@ -770,7 +772,8 @@ if __name__ == "__main__":
     if argv is None or not type(argv) == list:
         raise OmniError("Invalid argv argument to call: must be a list")
 
-    framework, config, args, opts = initialize(argv, options, dictLoggingConfig)
+    with _initialize_lock:
+        framework, config, args, opts = initialize(argv, options, dictLoggingConfig)
     # process the user's call
     return API_call( framework, config, args, opts, verbose=verbose )
 
@@ -841,9 +844,11 @@ def API_call( framework, config, args, opts, verbose=False ):
         logger.info(getSystemInfo() + "\nOmni: " + getOmniVersion())
 
     if len(args) > 0 and args[0].lower() == "nicknames":
+        from .omnilib.util.handler_utils import printNicknames
         result = printNicknames(config, opts)
     else:
         # Process the user's call
+        from .omnilib.handler import CallHandler
         handler = CallHandler(framework, config, opts)
     #    Returns string, item
         result = handler._handle(args)
@@ -1150,6 +1155,9 @@ def getParser():
     # If this next is set, then options.output is also set
     filegroup.add_option("--outputfile",  default=None, metavar="OUTPUT_FILENAME",
                       help="Name of file to write output to (instead of Omni picked name). '%a' will be replaced by servername, '%s' by slicename if any. Implies -o. Note that for multiple aggregates, without a '%a' in the name, only the last aggregate output will remain in the file. Will ignore -p.")
+    filegroup.add_option("--streamRSpecs", default=False, action="store_true",
+                      help="With -o, decode (and decompress) ListResources and Describe RSpecs straight into the output files, " + \
+                          "without holding the whole RSpec in memory. The RSpec in the returned result is then the name of the file it was saved to.")
     filegroup.add_option("--usercredfile", default=os.getenv("GENI_USERCRED", None), metavar="USER_CRED_FILENAME",
                       help="Name of user credential file to read from if it exists, or save to when running like '--usercredfile " + 
                          "myUserCred.xml -o getusercred'. Defaults to value of 'GENI_USERCRED' environment variable if defined.")
@@ -1221,6 +1229,13 @@ def getParser():
                       help="In AM API v2, if an AM returns a non-0 (failure) result code, raise an AMAPIError. Default is %default. For use by scripts.")
     devgroup.add_option("--maxBusyRetries", default=4, action="store", type="int",
                       help="Max times to retry AM or CH calls on getting a 'busy' error. Default: %default")
+    devgroup.add_option("--AMHealthCacheName", dest='amHealthCacheName',
+                      default="~/.gcf/am_health.json",
+                      help="File where Omni remembers how many busy retries recent AM and CH calls needed, and which servers keep timing out. Default is %default")
+    devgroup.add_option("--noCircuitBreaker", default=False, action="store_true",
+                      help="Call AMs and CHs even if they have recently timed out or stayed busy several times in a row. Default is %default.")
+    devgroup.add_option("--traceFile", metavar="FILE",
+                      help="Time each AM and CH call, and save the calls as a Chrome trace (JSON) to this file, with latency percentiles by server.")
     devgroup.add_option("--no-compress", dest='geni_compressed', 
                       default=True, action="store_false",
                       help="Do not compress returned values")
@@ -48,9 +48,10 @@ from ..util.faults import CredentialNotVerifiable, ChildRightsNotSubsetOfParent
 from ..util.sfalogging import logger
 from ..util.sfatime import utcparse
 from ..util.xrn import urn_to_hrn, hrn_authfor_hrn
+from ..util.xmlschema import get_schema
 from .credential_legacy import CredentialLegacy
 from .rights import Right, Rights, determine_rights
-from .gid import GID
+from .gid import GID, get_cached_gid, get_verified_gid, load_trusted_gid
 
 # 2 weeks, in seconds 
 DEFAULT_CREDENTIAL_LIFETIME = 86400 * 31
@@ -145,6 +146,25 @@ def append_sub(doc, parent, element, text):
     ele.appendChild(doc.createTextNode(text))
     parent.appendChild(ele)
 
+##
+# Find the xmlsec1 binary. The search is done once per process; the
+# result is remembered for every later Credential.
+
+_xmlsec_path = None
+
+def find_xmlsec_path():
+    global _xmlsec_path
+    if _xmlsec_path is None:
+        _xmlsec_path = ''
+        paths = ['/usr/bin','/usr/local/bin','/bin','/opt/bin','/opt/local/bin']
+        for path in paths:
+            if os.path.isfile(path + '/' + 'xmlsec1'):
+                _xmlsec_path = path + '/' + 'xmlsec1'
+                break
+        if not _xmlsec_path:
+            logger.warn("Could not locate binary for xmlsec1 - SFA will be unable to sign stuff !!")
+    return _xmlsec_path
+
 ##
 # Signature contains information about an xmlsec1 signature
 # for a signed-credential
@@ -213,7 +233,7 @@ class Signature(object):
                         gids += "\n" + szgid
         if gids is None:
             raise CredentialNotVerifiable("Malformed XML: No certificate found in signature")
-        self.set_issuer_gid(GID(string=gids))
+        self.set_issuer_gid(get_cached_gid(gids))
         
     def encode(self):
         self.xml = signature_template % (self.get_refid(), self.get_refid())
@@ -292,15 +312,7 @@ class Credential(object):
                 self.xml = str
                 self.decode()
 
-        # Find an xmlsec1 path
-        self.xmlsec_path = ''
-        paths = ['/usr/bin','/usr/local/bin','/bin','/opt/bin','/opt/local/bin']
-        for path in paths:
-            if os.path.isfile(path + '/' + 'xmlsec1'):
-                self.xmlsec_path = path + '/' + 'xmlsec1'
-                break
-        if not self.xmlsec_path:
-            logger.warn("Could not locate binary for xmlsec1 - SFA will be unable to sign stuff !!")
+        self.xmlsec_path = find_xmlsec_path()
 
     def get_cred_type(self): 
         return self.cred_type
@@ -660,8 +672,14 @@ class Credential(object):
     # In general, a signed credential obtained externally should
     # not be changed else the signature is no longer valid.  So, once
     # you have loaded an existing signed credential, do not call encode() or sign() on it.
+    #
+    # @param signer If supplied, a CredentialSigner (see credential_signer.py)
+    #    that signs in process with its already loaded issuer key, instead
+    #    of calling out to xmlsec1 with the issuer key and GID files.
 
-    def sign(self):
+    def sign(self, signer=None):
+        if signer is not None:
+            self.set_issuer_keys(signer.privkey_file, signer.gid_file)
         if not self.issuer_privkey:
             logger.warn("Cannot sign credential (no private key)")
             return
@@ -680,7 +698,24 @@ class Credential(object):
 
         self.xml = doc.toxml("utf-8")
 
+        ref = 'Sig_%s' % self.get_refid()
+        if signer is not None:
+            self.xml = signer.sign_xml(self.xml, ref)
+        else:
+            self.xml = self._sign_with_xmlsec(ref)
+
+        # This is no longer a legacy credential
+        if self.legacy:
+            self.legacy = None
+
+        # Update signatures
+        self.decode()       
+
+    ##
+    # Sign the given Signature node of self.xml by calling out to xmlsec1,
+    # returning the signed XML.
 
+    def _sign_with_xmlsec(self, ref):
         # Split the issuer GID into multiple certificates if it's a chain
         chain = GID(filename=self.issuer_gid)
         gid_files = []
@@ -693,7 +728,6 @@ class Credential(object):
 
 
         # Call out to xmlsec1 to sign it
-        ref = 'Sig_%s' % self.get_refid()
         filename = self.save_to_random_tmp_file()
         command='%s --sign --node-id "%s" --privkey-pem %s,%s %s' \
             % (self.xmlsec_path, ref, self.issuer_privkey, ",".join(gid_files), filename)
@@ -704,14 +738,7 @@ class Credential(object):
         for gid_file in gid_files:
             os.remove(gid_file)
 
-        self.xml = signed
-
-        # This is no longer a legacy credential
-        if self.legacy:
-            self.legacy = None
-
-        # Update signatures
-        self.decode()       
+        return signed
 
 
     ##
@@ -849,11 +876,9 @@ class Credential(object):
         if HAVELXML and not self.legacy:
             if schema and os.path.exists(schema):
                 tree = etree.parse(StringIO(self.xml))
-                schema_doc = etree.parse(schema)
-                xmlschema = etree.XMLSchema(schema_doc)
-                if not xmlschema.validate(tree):
-                    error = xmlschema.error_log.last_error
-                    message = "%s: %s (line %s)" % (self.get_summary_tostring(), error.message, error.line)
+                valid, message = get_schema(schema).validate(tree)
+                if not valid:
+                    message = "%s: %s" % (self.get_summary_tostring(), message)
                     raise CredentialNotVerifiable(message)
 
         if trusted_certs_required and trusted_certs is None:
@@ -869,7 +894,7 @@ class Credential(object):
                 try:
                     # Failures here include unreadable files
                     # or non PEM files
-                    trusted_cert_objects.append(GID(filename=f))
+                    trusted_cert_objects.append(load_trusted_gid(f))
                     ok_trusted_certs.append(f)
                 except Exception, exc:
                     logger.error("Failed to load trusted cert from %s: %r", f, exc)
@@ -896,10 +921,12 @@ class Credential(object):
         # If caller explicitly passed in None that means skip cert chain validation.
         # - Strange and not typical
         if trusted_certs is not None:
-            # Verify the gids of this cred and of its parents
+            # Verify the gids of this cred and of its parents. The same
+            # caller and slice GIDs arrive on every call, so each chain
+            # is only verified once per set of trusted roots.
             for cur_cred in self.get_credential_list():
-                cur_cred.get_gid_object().verify_chain(trusted_cert_objects)
-                cur_cred.get_gid_caller().verify_chain(trusted_cert_objects)
+                get_verified_gid(cur_cred.get_gid_object().save_to_string(), trusted_cert_objects)
+                get_verified_gid(cur_cred.get_gid_caller().save_to_string(), trusted_cert_objects)
 
         refs = []
         refs.append("Sig_%s" % self.get_refid())
@@ -0,0 +1,293 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# In-process XML digital signatures for credentials.
+#
+# Credential.sign() normally writes the credential and the issuer's
+# certificate chain to temp files and calls out to xmlsec1. That costs a
+# fork and several file writes per credential. A CredentialSigner loads
+# the issuer key and GID chain once and then produces the same enveloped
+# RSA-SHA1 signature that xmlsec1 would, using lxml for the
+# canonicalization (C14N) and pyOpenSSL for the RSA signature.
+# Signatures produced here verify with xmlsec1 --verify as usual, and
+# a CredentialSigner can check its own credentials in process too.
+
+from __future__ import absolute_import
+
+import base64
+import copy
+import datetime
+import hashlib
+import threading
+
+from OpenSSL import crypto
+
+from .certificate import Keypair
+from .gid import GID
+from ..util.faults import CredentialNotVerifiable
+from ..util.sfalogging import logger
+
+HAVELXML = False
+try:
+    from lxml import etree
+    HAVELXML = True
+except:
+    pass
+
+DSIG_NS = "http://www.w3.org/2000/09/xmldsig#"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+
+def _dsig(tag):
+    return "{%s}%s" % (DSIG_NS, tag)
+
+##
+# Return the given big-endian integer bytes from M2Crypto (an OpenSSL
+# MPINT: 4 byte length then the value) as an XML-DSig CryptoBinary.
+
+def _mpint_to_b64(mpint):
+    return base64.b64encode(mpint[4:].lstrip('\x00'))
+
+class CredentialSigner(object):
+
+    ##
+    # Create a signer for the given issuer.
+    #
+    # @param privkey_file Filename of the issuer's PEM private key
+    # @param gid_file Filename of the issuer's GID (cert chain), in the
+    #    same form as passed to Credential.set_issuer_keys
+
+    def __init__(self, privkey_file, gid_file):
+        if not HAVELXML:
+            raise Exception("CredentialSigner requires lxml")
+        self.privkey_file = privkey_file
+        self.gid_file = gid_file
+        self.keypair = Keypair(filename=privkey_file)
+        self.issuer_gid = GID(filename=gid_file)
+        self._pkey = self.keypair.get_openssl_pkey()
+        self._x509_data = self._make_x509_data()
+        self._key_value = self._make_key_value()
+        # pyOpenSSL key objects are not documented as thread safe
+        self._lock = threading.Lock()
+        # Trusted root GIDs by tuple of root filenames, for which the
+        # issuer chain has been verified
+        self._trusted = dict()
+        logger.debug("Loaded credential signer for %s" % self.issuer_gid.get_urn())
+
+    ##
+    # Build the KeyInfo/X509Data children listing every cert in the
+    # issuer chain, as xmlsec1 does for a --privkey-pem key,cert,... list.
+
+    def _make_x509_data(self):
+        entries = []
+        chain = self.issuer_gid
+        while chain:
+            x509 = chain.cert
+            pem = crypto.dump_certificate(crypto.FILETYPE_PEM, x509)
+            body = "".join(line for line in pem.strip().split("\n")
+                           if not line.startswith("-----"))
+            entries.append((self._name_string(x509.get_subject()),
+                            self._name_string(x509.get_issuer()),
+                            str(x509.get_serial_number()),
+                            body))
+            chain = chain.get_parent()
+        return entries
+
+    def _make_key_value(self):
+        try:
+            e, n = self.keypair.get_m2_pkey().get_rsa().pub()
+        except Exception, exc:
+            logger.debug("No RSA KeyValue for credential signer: %s" % exc)
+            return None
+        return (_mpint_to_b64(n), _mpint_to_b64(e))
+
+    @staticmethod
+    def _name_string(name):
+        return ",".join("%s=%s" % (k, v) for (k, v) in
+                        reversed(name.get_components()))
+
+    ##
+    # Return the inclusive C14N 1.0 (without comments) of the subtree at
+    # the given element, as used by the signature template's
+    # CanonicalizationMethod and (after the enveloped-signature transform)
+    # the Reference.
+    #
+    # lxml's C14N of a non-root element is not a proper document subset
+    # (it can emit spurious xmlns="" on descendants), so copy the subtree
+    # into its own document and canonicalize that. The new root declares
+    # every namespace in scope at the element, and carries the xml:*
+    # attributes of its ancestors (notably the Signature's xml:id onto
+    # SignedInfo), as C14N 1.0 requires for a document subset.
+
+    @staticmethod
+    def _c14n(element):
+        attrib = dict(element.attrib)
+        xml_prefix = "{%s}" % XML_NS
+        for ancestor in element.iterancestors():
+            for (name, value) in ancestor.attrib.items():
+                if name.startswith(xml_prefix) and name not in attrib:
+                    attrib[name] = value
+        root = etree.Element(element.tag, attrib, nsmap=element.nsmap)
+        root.text = element.text
+        root.extend(copy.deepcopy(child) for child in element)
+        return etree.tostring(etree.ElementTree(root), method="c14n",
+                              exclusive=False, with_comments=False)
+
+    ##
+    # Fill in the Signature element with the given xml:id in the XML
+    # string and return the signed document as a string.
+
+    def sign_xml(self, xml, sig_id):
+        doc = etree.fromstring(xml)
+        sigs = doc.xpath("//ds:Signature[@xml:id=$sid]",
+                         namespaces={'ds': DSIG_NS}, sid=sig_id)
+        if not sigs:
+            raise Exception("No Signature with id %s to sign" % sig_id)
+        sig = sigs[-1]
+        signed_info = sig.find(_dsig("SignedInfo"))
+
+        # Digest the referenced element. The enveloped-signature
+        # transform is a no-op: credential signatures live in
+        # <signatures>, outside the referenced <credential>.
+        reference = signed_info.find(_dsig("Reference"))
+        ref_id = reference.get("URI").lstrip("#")
+        targets = doc.xpath("//*[@xml:id=$rid]", rid=ref_id)
+        if not targets:
+            raise Exception("No element with id %s to sign" % ref_id)
+        digest = hashlib.sha1(self._c14n(targets[0])).digest()
+        reference.find(_dsig("DigestValue")).text = base64.b64encode(digest)
+
+        with self._lock:
+            signature = crypto.sign(self._pkey, self._c14n(signed_info), "sha1")
+        sig.find(_dsig("SignatureValue")).text = base64.b64encode(signature)
+
+        self._fill_key_info(sig.find(_dsig("KeyInfo")))
+        return etree.tostring(doc.getroottree(), encoding="utf-8",
+                              xml_declaration=True)
+
+    def _fill_key_info(self, key_info):
+        if key_info is None:
+            return
+        x509_data = key_info.find(_dsig("X509Data"))
+        if x509_data is not None:
+            for child in list(x509_data):
+                x509_data.remove(child)
+            for (subject, issuer, serial, body) in self._x509_data:
+                etree.SubElement(x509_data, _dsig("X509SubjectName")).text = subject
+                issuer_serial = etree.SubElement(x509_data, _dsig("X509IssuerSerial"))
+                etree.SubElement(issuer_serial, _dsig("X509IssuerName")).text = issuer
+                etree.SubElement(issuer_serial, _dsig("X509SerialNumber")).text = serial
+                etree.SubElement(x509_data, _dsig("X509Certificate")).text = body
+        key_value = key_info.find(_dsig("KeyValue"))
+        if key_value is not None:
+            if self._key_value is None:
+                key_info.remove(key_value)
+            else:
+                rsa = etree.SubElement(key_value, _dsig("RSAKeyValue"))
+                etree.SubElement(rsa, _dsig("Modulus")).text = self._key_value[0]
+                etree.SubElement(rsa, _dsig("Exponent")).text = self._key_value[1]
+
+    ##
+    # Check the Signature with the given xml:id in the XML string
+    # against this issuer's certificate, as xmlsec1 --verify would: the
+    # digest of the referenced element, and the RSA signature over
+    # SignedInfo. Raise CredentialNotVerifiable if either does not match.
+
+    def verify_xml(self, xml, sig_id):
+        doc = etree.fromstring(xml)
+        sigs = doc.xpath("//ds:Signature[@xml:id=$sid]",
+                         namespaces={'ds': DSIG_NS}, sid=sig_id)
+        if not sigs:
+            raise CredentialNotVerifiable("No Signature with id %s" % sig_id)
+        sig = sigs[-1]
+        signed_info = sig.find(_dsig("SignedInfo"))
+        reference = signed_info.find(_dsig("Reference"))
+        ref_id = reference.get("URI").lstrip("#")
+        targets = doc.xpath("//*[@xml:id=$rid]", rid=ref_id)
+        if not targets:
+            raise CredentialNotVerifiable("No element with id %s to verify" % ref_id)
+        digest = hashlib.sha1(self._c14n(targets[0])).digest()
+        if base64.b64decode(reference.findtext(_dsig("DigestValue")) or "") != digest:
+            raise CredentialNotVerifiable("Digest of %s does not match Signature %s" % (ref_id, sig_id))
+        signature = base64.b64decode(sig.findtext(_dsig("SignatureValue")) or "")
+        try:
+            with self._lock:
+                crypto.verify(self.issuer_gid.cert, signature,
+                              self._c14n(signed_info), "sha1")
+        except crypto.Error, exc:
+            raise CredentialNotVerifiable("Signature %s is not by %s: %s" % (sig_id, self.issuer_gid.get_urn(), exc))
+
+    ##
+    # Return the GIDs of the given trusted root files, having checked
+    # that the issuer chains to one of them. Both are done once per set
+    # of roots.
+
+    def trusted_gids(self, trusted_roots):
+        key = tuple(trusted_roots)
+        with self._lock:
+            gids = self._trusted.get(key)
+        if gids is not None:
+            return gids
+        gids = []
+        for f in trusted_roots:
+            try:
+                gids.append(GID(filename=f))
+            except Exception, exc:
+                logger.error("Failed to load trusted cert from %s: %r", f, exc)
+        self.issuer_gid.verify_chain(gids)
+        with self._lock:
+            self._trusted[key] = gids
+        return gids
+
+    ##
+    # Verify a Credential signed by this issuer against the given trusted
+    # root files, as Credential.verify does but without calling out to
+    # xmlsec1: the signature is checked in process, and the issuer chain
+    # once per set of roots. Delegated credentials (signed in part by
+    # others) go to Credential.verify.
+
+    def verify(self, cred, trusted_roots):
+        if cred.parent:
+            return cred.verify(trusted_roots)
+        trusted_gids = self.trusted_gids(trusted_roots)
+        if cred.get_expiration() < datetime.datetime.utcnow():
+            raise CredentialNotVerifiable("Credential %s expired at %s" % (cred.get_summary_tostring(), cred.get_expiration().isoformat()))
+        cred.get_gid_object().verify_chain(trusted_gids)
+        cred.get_gid_caller().verify_chain(trusted_gids)
+        self.verify_xml(cred.save_to_string(),
+                        "Sig_%s" % cred.get_refid())
+        cred.verify_issuer(trusted_gids)
+        return True
+
+    ##
+    # Sign the given (encoded) Credential with this issuer.
+
+    def sign(self, cred):
+        cred.sign(signer=self)
+        return cred
+
+    ##
+    # Sign each of the given Credentials with this issuer, returning the
+    # list. The issuer key and chain are loaded once for the whole batch.
+
+    def sign_all(self, creds):
+        return [self.sign(cred) for cred in creds]
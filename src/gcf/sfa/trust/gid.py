@@ -27,8 +27,12 @@
 
 from __future__ import absolute_import
 
+import datetime
+import hashlib
+import threading
 import xmlrpclib
 import uuid
+from collections import OrderedDict
 
 from .certificate import Certificate
 from ..util.faults import GidInvalidParentHrn, GidParentHrn
@@ -244,7 +248,7 @@ class GID(Certificate):
             self.parent.verify_chain(trusted_certs)
         else:
             # make sure that the trusted root's hrn is a prefix of the child's
-            trusted_gid = GID(string=trusted_root.save_to_string())
+            trusted_gid = get_cached_gid(trusted_root.save_to_string())
             trusted_type = trusted_gid.get_type()
             trusted_hrn = trusted_gid.get_hrn()
             #if trusted_type == 'authority':
@@ -258,3 +262,254 @@ class GID(Certificate):
                 raise GidInvalidParentHrn("This cert %s's trusted root signer %s is not an authority (is a %s)" % (self.get_hrn(), trusted_hrn, trusted_type))
 
         return
+
+
+##
+# An ImmutableGID is a GID parsed once from a PEM string and then shared
+# between callers (see get_cached_gid below). The URN, HRN, UUID, email
+# and X509 extensions are still decoded lazily on first access, but
+# once loaded the object may not be modified: the setters raise.
+
+class ImmutableGID(GID):
+
+    def __init__(self, string=None):
+        self._frozen = False
+        self._extensions = {}
+        self._pubkey = None
+        GID.__init__(self, string=string)
+
+    def _check_mutable(self):
+        if getattr(self, '_frozen', False):
+            raise TypeError("Cannot modify a shared ImmutableGID")
+
+    ##
+    # Load the GID chain from a string. Parents are created via
+    # self.__class__(), so they become immutable once loaded as well.
+
+    def load_from_string(self, string):
+        self._check_mutable()
+        GID.load_from_string(self, string)
+        if self.cert is not None:
+            self._frozen = True
+
+    def load_from_file(self, filename):
+        self._check_mutable()
+        GID.load_from_file(self, filename)
+
+    def create(self, lifeDays=1825):
+        self._check_mutable()
+        GID.create(self, lifeDays)
+
+    def set_uuid(self, uuid):
+        self._check_mutable()
+        GID.set_uuid(self, uuid)
+
+    def set_hrn(self, hrn):
+        self._check_mutable()
+        GID.set_hrn(self, hrn)
+
+    def set_urn(self, urn):
+        self._check_mutable()
+        GID.set_urn(self, urn)
+
+    def set_email(self, email):
+        self._check_mutable()
+        GID.set_email(self, email)
+
+    def encode(self):
+        self._check_mutable()
+        GID.encode(self)
+
+    def set_data(self, str, field='subjectAltName'):
+        self._check_mutable()
+        GID.set_data(self, str, field)
+
+    def add_extension(self, name, critical, value):
+        self._check_mutable()
+        GID.add_extension(self, name, critical, value)
+
+    def set_subject(self, name):
+        self._check_mutable()
+        GID.set_subject(self, name)
+
+    def set_pubkey(self, key):
+        self._check_mutable()
+        GID.set_pubkey(self, key)
+
+    def set_issuer(self, key, subject=None, cert=None):
+        self._check_mutable()
+        GID.set_issuer(self, key, subject, cert)
+
+    def set_is_ca(self, val):
+        self._check_mutable()
+        GID.set_is_ca(self, val)
+
+    def set_parent(self, p):
+        self._check_mutable()
+        GID.set_parent(self, p)
+
+    def sign(self):
+        self._check_mutable()
+        GID.sign(self)
+
+    ##
+    # Extensions and the public key are read out of the certificate via
+    # M2Crypto on every call in the base class. The certificate can't
+    # change here, so remember the answers.
+
+    def get_extension(self, name):
+        if name not in self._extensions:
+            self._extensions[name] = GID.get_extension(self, name)
+        return self._extensions[name]
+
+    def get_pubkey(self):
+        if self._pubkey is None:
+            self._pubkey = GID.get_pubkey(self)
+        return self._pubkey
+
+##
+# A thread-safe LRU cache of ImmutableGIDs, keyed by the SHA-256 digest of
+# the (stripped) PEM chain they were parsed from. The same caller cert
+# arrives as a string on every request; with this cache each distinct
+# chain is parsed by pyOpenSSL only once per process.
+
+class GIDCache(object):
+
+    def __init__(self, max_size=1024):
+        self._max_size = max_size
+        self._gids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(string):
+        if isinstance(string, unicode):
+            string = string.encode('utf-8')
+        return hashlib.sha256(string.strip()).hexdigest()
+
+    ##
+    # Return the ImmutableGID for the given PEM string, parsing it only
+    # if it is not already in the cache.
+
+    def get(self, string):
+        key = self.digest(string)
+        with self._lock:
+            cached = self._gids.pop(key, None)
+            if cached is not None:
+                # Re-insert to mark as most recently used
+                self._gids[key] = cached
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        # Parse outside the lock; two threads racing on the same new
+        # cert both parse, and one result wins.
+        parsed = ImmutableGID(string=string)
+
+        with self._lock:
+            cached = self._gids.setdefault(key, parsed)
+            while len(self._gids) > self._max_size:
+                self._gids.popitem(last=False)
+            return cached
+
+    def clear(self):
+        with self._lock:
+            self._gids.clear()
+
+    def __len__(self):
+        return len(self._gids)
+
+_gid_cache = GIDCache()
+
+##
+# Return a shared, immutable GID for the given PEM string (a cert or
+# cert chain). Callers that need to modify the GID must construct their
+# own with GID(string=...).
+
+def get_cached_gid(string):
+    return _gid_cache.get(string)
+
+##
+# Return a shared, immutable GID for the trusted root cert in the given
+# file. The file is read on each call, so a replaced root is picked up,
+# but each distinct cert is parsed only once.
+
+def load_trusted_gid(filename):
+    with open(filename) as f:
+        return get_cached_gid(f.read())
+
+##
+# A thread-safe LRU cache of the GIDs whose chains have been verified
+# against a set of trusted roots. Entries are keyed by the SHA-256
+# digest of the PEM chain and of each trusted root, so a changed trust
+# store means a fresh verification. An entry lapses once any cert in its
+# chain has expired, so the next check re-verifies (and fails). Only
+# successful verifications are cached.
+
+class VerifiedGIDCache(object):
+
+    def __init__(self, max_size=1024):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    ##
+    # Return the earliest notAfter (naive UTC) in the GID's chain.
+
+    @staticmethod
+    def _not_after(gid):
+        expires = None
+        while gid:
+            not_after = datetime.datetime.strptime(gid.cert.get_notAfter(),
+                                                   '%Y%m%d%H%M%SZ')
+            if expires is None or not_after < expires:
+                expires = not_after
+            gid = gid.get_parent()
+        return expires
+
+    ##
+    # Return the shared ImmutableGID for the given PEM string, verifying
+    # its chain against trusted_roots unless that was already done.
+    # Raises the usual verify_chain exceptions on failure.
+
+    def get(self, string, trusted_roots):
+        key = (GIDCache.digest(string),
+               tuple(GIDCache.digest(root.save_to_string(save_parents=False))
+                     for root in trusted_roots))
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[1] > now:
+                self._entries[key] = entry
+                return entry[0]
+
+        verified = get_cached_gid(string)
+        verified.verify_chain(trusted_roots)
+
+        with self._lock:
+            self._entries[key] = (verified, self._not_after(verified))
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return verified
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+_verified_gid_cache = VerifiedGIDCache()
+
+##
+# Return a shared, immutable GID for the given PEM string, with its
+# chain verified against the given trusted root certs. Each distinct
+# chain is only verified once per set of roots (until it expires).
+
+def get_verified_gid(string, trusted_roots):
+    return _verified_gid_cache.get(string, trusted_roots)
+
+def clear_gid_cache():
+    _gid_cache.clear()
+    _verified_gid_cache.clear()
@@ -0,0 +1,175 @@
+#----------------------------------------------------------------------
+# Copyright (c) 2016 Raytheon BBN Technologies
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and/or hardware specification (the "Work") to
+# deal in the Work without restriction, including without limitation the
+# rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Work, and to permit persons to whom the Work
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Work.
+#
+# THE WORK IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+# WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE WORK OR THE USE OR OTHER DEALINGS
+# IN THE WORK.
+#----------------------------------------------------------------------
+
+# In-process XML schema validation.
+#
+# Compiling an XSD with lxml is far more expensive than validating a
+# document against it, so compiled schemas are kept in a process-wide
+# registry, keyed by (namespace, schema location), and each is compiled
+# only once.
+#
+# Schemas named by http(s) URL (like the GENI RSpec schemas) are never
+# fetched from the network: they are read from local copies under
+# SCHEMA_DIR mirroring the URL, e.g.
+# SCHEMA_DIR/www.geni.net/resources/rspec/3/request.xsd, with the files
+# they include. gcf does not ship these schemas: copy the published ones
+# there to validate in process. Validating against a schema with no local
+# copy raises SchemaError, and callers fall back to rspeclint (or to no
+# schema validation).
+
+from __future__ import absolute_import
+
+import os
+import threading
+import urlparse
+from StringIO import StringIO
+
+HAVELXML = False
+try:
+    from lxml import etree
+    HAVELXML = True
+except:
+    pass
+
+from .sfalogging import logger
+
+SCHEMA_DIR = os.path.join(os.path.expanduser("~"), ".gcf", "schemas")
+
+class SchemaError(Exception):
+    pass
+
+##
+# Return the filename of the local copy of the given schema URL or
+# filename, under schema_dir (default SCHEMA_DIR). Raise SchemaError if
+# there is no local copy.
+
+def local_schema_file(url, schema_dir=None):
+    scheme, host, path = urlparse.urlparse(url)[:3]
+    if scheme not in ('http', 'https'):
+        if scheme == 'file':
+            return path
+        return url
+    if schema_dir is None:
+        schema_dir = SCHEMA_DIR
+    parts = [p for p in path.split('/') if p not in ('', '.', '..')]
+    filename = os.path.join(schema_dir, host, *parts)
+    if not os.path.exists(filename):
+        raise SchemaError("No local copy of schema %s (looked for %s)" % (url, filename))
+    return filename
+
+if HAVELXML:
+    class _LocalSchemaResolver(etree.Resolver):
+        # Resolve included and imported schemas to their local copies,
+        # keeping the original URL as the base for their own includes.
+        def __init__(self, schema_dir):
+            etree.Resolver.__init__(self)
+            self.schema_dir = schema_dir
+
+        def resolve(self, url, pubid, context):
+            if urlparse.urlparse(url)[0] not in ('http', 'https'):
+                return None
+            with open(local_schema_file(url, self.schema_dir)) as f:
+                return self.resolve_string(f.read(), context, base_url=url)
+
+class _CompiledSchema(object):
+    def __init__(self, xmlschema):
+        self.xmlschema = xmlschema
+        # A schema's error_log is reset by each validation
+        self.lock = threading.Lock()
+
+    ##
+    # Return (True, None) if the given lxml tree is valid, else
+    # (False, error message).
+
+    def validate(self, tree):
+        with self.lock:
+            if self.xmlschema.validate(tree):
+                return True, None
+            error = self.xmlschema.error_log.last_error
+            return False, "%s (line %s)" % (error.message, error.line)
+
+class SchemaRegistry(object):
+
+    def __init__(self, schema_dir=None):
+        self.schema_dir = schema_dir
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    ##
+    # Return the compiled schema for the given schema location (URL or
+    # filename), compiling it on first use. If a namespace is given, the
+    # schema must have that target namespace.
+
+    def get(self, location, namespace=None):
+        if not HAVELXML:
+            raise SchemaError("Schema validation requires lxml")
+        key = (namespace, location)
+        with self._lock:
+            schema = self._schemas.get(key)
+            if schema is None:
+                schema = _CompiledSchema(self._compile(location, namespace))
+                self._schemas[key] = schema
+        return schema
+
+    def _compile(self, location, namespace):
+        schema_dir = self.schema_dir or SCHEMA_DIR
+        parser = etree.XMLParser()
+        parser.resolvers.add(_LocalSchemaResolver(schema_dir))
+        try:
+            filename = local_schema_file(location, schema_dir)
+            with open(filename) as f:
+                doc = etree.parse(f, parser, base_url=location)
+            if namespace and doc.getroot().get('targetNamespace') != namespace:
+                raise SchemaError("Schema %s is not for namespace %s" % (location, namespace))
+            xmlschema = etree.XMLSchema(doc)
+        except SchemaError:
+            raise
+        except Exception, exc:
+            raise SchemaError("Failed to compile schema %s: %s" % (location, exc))
+        logger.debug("Compiled schema %s" % location)
+        return xmlschema
+
+    ##
+    # Validate the given XML string against the given schema.
+    # Return (True, None) if valid, else (False, error message).
+    # Raise SchemaError if the schema cannot be loaded.
+
+    def validate(self, xml, location, namespace=None):
+        schema = self.get(location, namespace)
+        try:
+            tree = etree.parse(StringIO(xml))
+        except etree.XMLSyntaxError, exc:
+            return False, "Not well formed XML: %s" % exc
+        return schema.validate(tree)
+
+    def clear(self):
+        with self._lock:
+            self._schemas.clear()
+
+_registry = SchemaRegistry()
+
+def get_schema(location, namespace=None):
+    return _registry.get(location, namespace)
+
+def validate(xml, location, namespace=None):
+    return _registry.validate(xml, location, namespace)
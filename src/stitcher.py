@@ -68,6 +68,7 @@ import sys
 
 import gcf.oscript as omni
 from gcf.omnilib.util import OmniError, AMAPIError
+from gcf.omnilib.util import calltrace
 from gcf.omnilib.stitchhandler import StitchingHandler
 from gcf.omnilib.stitch.utils import StitchingError, prependFilePrefix
 from gcf.omnilib.stitch.objects import Aggregate
@@ -146,6 +147,12 @@ def call(argv, options=None):
                       help="Do not reserve resources at intermediate / transit aggregates; allow experimenter to manually complete the circuit (default %default).")
     parser.add_option("--noSCS", default=False, action="store_true",
                       help="Do not call the SCS to expand or add a stitching extension. Use this only if supplying any needed stitching extension and the SCS would fail your request. (default %default).")
+    parser.add_option("--scsCacheTTL", default=30, type="int",
+                      help="Minutes to reuse a saved SCS result for an identical request, 0 to always call the SCS (default %default). Retries always call the SCS.")
+    parser.add_option("--scsCacheDir", default="~/.gcf/scs_cache",
+                      help="Directory for saved SCS results (default %default)")
+    parser.add_option("--localSCS", default=None, metavar="TOPOLOGY_FILE",
+                      help="Compute stitching paths locally from this JSON topology file, instead of calling the SCS (see gcf-scs.py).")
     parser.add_option("--fakeModeDir",
                       help="Developers only: If supplied, use canned server responses from this directory",
                       default=None)
@@ -446,7 +453,10 @@ def call(argv, options=None):
             logger.debug(" ... therefore setting noDeleteAtEnd")
             options.noDeleteAtEnd = True
     handler = StitchingHandler(options, config, logger)
-    return handler.doStitching(args)
+    try:
+        return handler.doStitching(args)
+    finally:
+        calltrace.save_trace(options, logger)
 
 # Goal of main is to call the 'call' method and print the result
 def main(argv=None):
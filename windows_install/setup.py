@@ -45,6 +45,7 @@ setup(console=['..\src\omni.py','..\src\omni-configure.py', '..\src\stitcher.py'
 gcf.omnilib.frameworks.framework_gcf, gcf.omnilib.frameworks.framework_gch,\
 gcf.omnilib.frameworks.framework_gib, gcf.omnilib.frameworks.framework_of,\
 gcf.omnilib.frameworks.framework_pg, gcf.omnilib.frameworks.framework_pgch,\
+gcf.omnilib.frameworks.framework_chapi, gcf.omnilib.handler,\
  gcf.omnilib.frameworks.framework_sfa,gcf.omnilib,gcf.sfa,dateutil,gcf.geni,\
  copy,ConfigParser,logging,optparse,os,sys,string,re,platform,shutil,zipfile,logging,subprocess',
               }